@@ -1,8 +1,10 @@
 # app.py (mejorado)
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from config.db import init_db_pool, close_db_pool
+from config.db import init_db_pool, close_db_pool, get_pool
+import config.db as db
 import time
 import json
 from dotenv import load_dotenv
@@ -15,6 +17,18 @@ from routes import (
     importar, reportes, justificantes, observaciones,
     info, tabla_dashboard, calificaciones, papelera
 )
+from utils.cola_asistencias import cola_asistencias, WRITE_BEHIND_ACTIVO
+from utils.escritura_asistencia import escritura_asistencia
+from utils.cache_roster import roster_cache
+from utils.bus_ws import bus_ws
+from utils.metricas_sql import metricas_sql
+from utils.monitor_pool import monitor_pool
+from utils.metricas_app import metricas_app, MiddlewareMetricas
+from utils.log_peticiones import MiddlewareLog
+from utils.trabajos_reportes import cola_reportes
+from utils.resumen_asistencia import resumen_asistencia
+from routes.ws_manager import manager
+from routes.ws_manager_tabla import tabla_manager
 
 # Manejo del ciclo de vida de la aplicación
 @asynccontextmanager
@@ -23,11 +37,32 @@ async def lifespan(app: FastAPI):
     print("🚀 Iniciando aplicación...")
     await init_db_pool()
     print("✅ Base de datos conectada")
+    if not await escritura_asistencia.verificar() and WRITE_BEHIND_ACTIVO:
+        # La cola escribe con ON DUPLICATE KEY UPDATE: sin la llave duplicaría filas
+        raise RuntimeError(
+            "ASISTENCIA_WRITE_BEHIND=1 requiere migrations/002_asistencia_unica.sql"
+        )
+    roster_cache.iniciar()
+    monitor_pool.iniciar(get_pool, roster_cache.horario_de_hoy)
+    await bus_ws.iniciar()
+    await cola_reportes.iniciar()
+    resumen_asistencia.iniciar()
+    if WRITE_BEHIND_ACTIVO:
+        await cola_asistencias.iniciar()
     
     yield
     
     # Shutdown
     print("🔄 Cerrando aplicación...")
+    if WRITE_BEHIND_ACTIVO:
+        # Primero vaciar la cola: necesita el pool abierto
+        await cola_asistencias.detener()
+    # Después de la cola: recalcula lo que marcó su último vaciado
+    await resumen_asistencia.detener()
+    await roster_cache.detener()
+    await monitor_pool.detener()
+    await cola_reportes.detener()
+    await bus_ws.detener()
     await close_db_pool()
     print("✅ Aplicación cerrada correctamente")
 
@@ -47,37 +82,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Middleware de logging mejorado
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    
-    # Log de request
-    if request.method == "GET":
-        query_params = dict(request.query_params)
-        print(f"🔍 [{request.method}] {request.url.path} - query: {query_params}")
-    else:
-        try:
-            body = await request.body()
-            if body:
-                body_str = body.decode('utf-8')
-                # Truncar body muy largo para logs
-                if len(body_str) > 500:
-                    body_str = body_str[:500] + "..."
-                print(f"📝 [{request.method}] {request.url.path} - body: {body_str}")
-            else:
-                print(f"📝 [{request.method}] {request.url.path} - (sin body)")
-        except Exception as e:
-            print(f"📝 [{request.method}] {request.url.path} - (error leyendo body: {e})")
-    
-    # Procesar request
-    response = await call_next(request)
-    
-    # Log de response
-    process_time = time.time() - start_time
-    print(f"⚡ Completado en {process_time:.3f}s - Status: {response.status_code}")
-    
-    return response
+# Log estructurado de peticiones (JSON, con muestreo y redacción; no lee bodies binarios)
+app.add_middleware(MiddlewareLog)
+
+# Métricas de Prometheus (/metrics): va por fuera del log para medir todo
+app.add_middleware(MiddlewareMetricas)
 
 # Manejo global de errores
 @app.exception_handler(500)
@@ -132,6 +141,7 @@ async def health_check():
         return {
             "status": "healthy",
             "database": "connected" if result else "disconnected",
+            "pool": monitor_pool.obtener_metricas(await get_pool()),
             "timestamp": time.time()
         }
     except Exception as e:
@@ -141,3 +151,43 @@ async def health_check():
             "error": str(e),
             "timestamp": time.time()
         }
+
+@app.get("/metricas/pool")
+async def metricas_pool():
+    """Estado del pool de MySQL: conexiones, esperas en acquire y edad"""
+    return monitor_pool.obtener_metricas(await get_pool())
+
+@app.get("/metricas/sql")
+async def metricas_sql_endpoint(top: int = 20, orden: str = "total_ms", reiniciar: bool = False):
+    """
+    Consultas más costosas desde el arranque (o el último reinicio).
+
+    orden: total_ms, p95_ms, max_ms, promedio_ms, llamadas, espera_pool_promedio_ms...
+    """
+    datos = metricas_sql.obtener_metricas(top, orden)
+    if reiniciar:
+        metricas_sql.reiniciar()
+    return datos
+
+# ✅ Métricas para Prometheus
+metricas_app.registrar_medidor(
+    "ws_tabla_conexiones", "Dashboards de tabla conectados por clase", "id_clase",
+    lambda: {id_clase: len(conexiones) for id_clase, conexiones in tabla_manager.active_connections.items()},
+)
+metricas_app.registrar_medidor(
+    "ws_general_conexiones", "Clientes del WebSocket general de asistencias", "",
+    lambda: {"": len(manager.active_connections)},
+)
+metricas_app.registrar_medidor(
+    "db_pool_conexiones", "Conexiones del pool de MySQL por estado", "estado",
+    lambda: {k: v for k, v in monitor_pool.obtener_metricas(db.pool).items() if k in ("tamano", "libres", "en_uso", "esperando")},
+)
+metricas_app.registrar_medidor(
+    "reportes_trabajos", "Trabajos de reportes en memoria por estado", "estado",
+    lambda: cola_reportes.obtener_metricas()["por_estado"],
+)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas en formato de texto de Prometheus (no consulta la BD)"""
+    return PlainTextResponse(metricas_app.exponer(), media_type="text/plain; version=0.0.4")
@@ -1,10 +1,15 @@
 import aiomysql
 import asyncio
-from typing import Optional
+from typing import Awaitable, Optional
 import logging
 from typing import AsyncGenerator
 import os
 import ssl
+import time
+from contextlib import asynccontextmanager
+
+from utils.metricas_sql import metricas_sql
+from utils.monitor_pool import monitor_pool, POOL_MIN, POOL_MAX
 
 ssl_ctx = ssl.create_default_context(
     cafile=os.path.join(os.path.dirname(__file__), "ca.pem")
@@ -29,8 +34,8 @@ async def init_db_pool() -> aiomysql.Pool:
                 password=os.getenv("DB_PASSWORD"),
                 db=os.getenv("DB_NAME"),
                 autocommit=True,
-                minsize=1,
-                maxsize=10,
+                minsize=POOL_MIN,
+                maxsize=POOL_MAX,
                 echo=False,
                 pool_recycle=3600,
                 charset='utf8mb4',
@@ -58,55 +63,178 @@ async def get_pool() -> aiomysql.Pool:
         await init_db_pool()
     return pool
 
+@asynccontextmanager
+async def _adquirir(medicion=None):
+    """Conexión del pool, midiendo la espera para monitor_pool (y metricas_sql)."""
+    pool_instance = await get_pool()
+    inicio = time.perf_counter()
+    monitor_pool.al_pedir()
+    obtenida = False
+    try:
+        async with pool_instance.acquire() as conn:
+            obtenida = True
+            monitor_pool.al_obtener(conn, time.perf_counter() - inicio)
+            if medicion is not None:
+                medicion.conexion_obtenida()
+            yield conn
+    finally:
+        if not obtenida:
+            monitor_pool.al_obtener(None, None)
+
 # Funciones helper para op
+# Cada helper se mide con metricas_sql (latencia, filas y espera del pool, ver utils/metricas_sql.py)
 async def fetch_one(query: str, params=None):
     """Ejecuta una query y retorna un solo resultado"""
-    pool_instance = await get_pool()
-    async with pool_instance.acquire() as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cur:
-            await cur.execute(query, params)
-            return await cur.fetchone()
+    with metricas_sql.medir(query) as medicion:
+        async with _adquirir(medicion) as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(query, params)
+                result = await cur.fetchone()
+                medicion.filas = 1 if result else 0
+                return result
 
 async def fetch_all(query: str, params=None):
     """Ejecuta una query y retorna todos los resultados"""
-    pool_instance = await get_pool()
-    async with pool_instance.acquire() as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cur:
-            await cur.execute(query, params)
-            results = await cur.fetchall()
-            # 🔧 DEBUGGING: Agregar log para verificar tipo
-            if results:
-                logger.info(f"📊 Tipo de resultado: {type(results[0])}")
-                logger.info(f"📊 Primer resultado: {results[0]}")
-            return results
+    with metricas_sql.medir(query) as medicion:
+        async with _adquirir(medicion) as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(query, params)
+                results = await cur.fetchall()
+                medicion.filas = len(results)
+                return results
 
 async def execute_query(query: str, params=None):
     """Ejecuta una query que no retorna resultados (INSERT, UPDATE, DELETE)"""
-    pool_instance = await get_pool()
-    async with pool_instance.acquire() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute(query, params)
-            await conn.commit()
-            # Para INSERT devuelve lastrowid, para UPDATE/DELETE rowcount
-            if query.strip().lower().startswith("insert"):
-                return cur.lastrowid
-            else:
-                return cur.rowcount
+    with metricas_sql.medir(query) as medicion:
+        async with _adquirir(medicion) as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                await conn.commit()
+                medicion.filas = max(cur.rowcount, 0)
+                # Para INSERT devuelve lastrowid, para UPDATE/DELETE rowcount
+                if query.strip().lower().startswith("insert"):
+                    return cur.lastrowid
+                else:
+                    return cur.rowcount
 
 async def execute_many(query: str, params_list):
     """Ejecuta una query múltiples veces con diferentes parámetros"""
-    pool_instance = await get_pool()
-    async with pool_instance.acquire() as conn:
-        async with conn.cursor() as cur:
-            await cur.executemany(query, params_list)
-            await conn.commit()
-            return cur.rowcount
+    with metricas_sql.medir(query) as medicion:
+        async with _adquirir(medicion) as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(query, params_list)
+                await conn.commit()
+                medicion.filas = max(cur.rowcount, 0)
+                return cur.rowcount
         
 
+# ===============================
+# 📌 CURSOR DEL SERVIDOR (lotes)
+# ===============================
+# fetch_all trae todo el resultado a memoria como dicts. Para exportaciones
+# y reportes de semestre se lee con SSCursor/SSDictCursor (sin buffer): las
+# filas se piden a MySQL por lotes mientras se procesan.
+STREAM_LOTE = int(os.getenv("DB_STREAM_LOTE", "2000"))
+# Segundos que MySQL espera a que leamos el siguiente lote (el consumidor
+# puede ser una descarga lenta)
+STREAM_NET_WRITE_TIMEOUT = int(os.getenv("DB_STREAM_NET_WRITE_TIMEOUT", "600"))
+
+
+@asynccontextmanager
+async def cursor_servidor(query: str, params=None, dict_rows: bool = True, medicion=None):
+    """
+    Cursor sin buffer ya ejecutado. La conexión queda ocupada hasta salir
+    del bloque; si se sale con filas pendientes por un error o una
+    cancelación (cliente que corta la descarga) la conexión se cierra en
+    lugar de regresar al pool, porque no se puede reusar a medias.
+    """
+    async with _adquirir(medicion) as conn:
+        terminado = False
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute(f"SET SESSION net_write_timeout = {STREAM_NET_WRITE_TIMEOUT}")
+            cur = await conn.cursor(aiomysql.SSDictCursor if dict_rows else aiomysql.SSCursor)
+            await cur.execute(query, params)
+            yield cur
+            # close() descarta lo que falte por leer
+            await cur.close()
+            async with conn.cursor() as cur:
+                await cur.execute("SET SESSION net_write_timeout = DEFAULT")
+            terminado = True
+        finally:
+            if not terminado:
+                logger.warning("⚠️ Lectura por lotes interrumpida: se cierra la conexión")
+                conn.close()
+
+
+async def stream_rows(query: str, params=None, batch_size: int = STREAM_LOTE, dict_rows: bool = True):
+    """
+    Ejecuta una query y regresa sus resultados por lotes de batch_size
+    filas (dicts, o tuplas con dict_rows=False), con memoria constante.
+    """
+    with metricas_sql.medir(query) as medicion:
+        async with cursor_servidor(query, params, dict_rows, medicion) as cur:
+            while True:
+                filas = await cur.fetchmany(batch_size)
+                if not filas:
+                    break
+                medicion.filas += len(filas)
+                # El tiempo del consumidor no es latencia de la consulta
+                with medicion.pausa():
+                    yield filas
+
+
+# ===============================
+# 📌 CONSULTAS EN PARALELO
+# ===============================
+# Cada consulta de gather_queries usa su propia conexión del pool. Una
+# petición ocupa como mucho DB_GATHER_CONEXIONES a la vez (sin pasar de
+# la mitad del pool), y solo una si ya hay peticiones esperando conexión.
+GATHER_CONEXIONES = min(int(os.getenv("DB_GATHER_CONEXIONES", "3")), max(1, POOL_MAX // 2))
+
+
+async def gather_queries(*consultas: Awaitable, max_conexiones: Optional[int] = None) -> list:
+    """
+    Corre consultas independientes a la vez y regresa sus resultados en
+    el mismo orden:
+
+        clase, alumnos = await gather_queries(
+            fetch_one(query_clase, (id_clase,)),
+            fetch_all(query_alumnos, (id_grupo,)),
+        )
+
+    Las consultas se pasan sin await (fetch_one/fetch_all/...) y empiezan
+    cuando hay lugar en el presupuesto de conexiones. Si una falla se
+    cancelan las demás y se propaga el error.
+    """
+    limite = max_conexiones or GATHER_CONEXIONES
+    if monitor_pool.esperando:
+        # El pool ya está saturado: abrir más conexiones solo alarga la fila
+        limite = 1
+    semaforo = asyncio.Semaphore(limite)
+
+    async def correr(consulta):
+        try:
+            async with semaforo:
+                return await consulta
+        finally:
+            # Si se canceló antes de empezar, evita el aviso de "never awaited"
+            if asyncio.iscoroutine(consulta):
+                consulta.close()
+
+    tareas = [asyncio.ensure_future(correr(consulta)) for consulta in consultas]
+    try:
+        return await asyncio.gather(*tareas)
+    except BaseException:
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        raise
+
+
 async def get_db_connection() -> AsyncGenerator[aiomysql.Connection, None]:
     """
     Devuelve una conexión de la pool para usar con Depends.
     """
-    pool_instance = await get_pool()
-    async with pool_instance.acquire() as conn:
+    async with _adquirir() as conn:
         yield conn
\ No newline at end of file
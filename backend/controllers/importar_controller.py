@@ -4,6 +4,8 @@ from utils.excel_utils import convertir_hora_excel
 import logging
 from datetime import datetime, time
 from bcrypt import hashpw, gensalt
+from utils.cache_roster import roster_cache
+from utils.resumen_asistencia import resumen_asistencia
 
 logger = logging.getLogger(__name__)
 
@@ -113,6 +115,10 @@ async def insertar_estudiantes(estudiantes):
     if errores:
         logger.warning(f"⚠️ {len(errores)} errores encontrados")
 
+    # Alumnos, grupos o clases cambiaron: los rosters en memoria ya no sirven
+    roster_cache.invalidar()
+    resumen_asistencia.reconciliar()
+
     return {
         "estudiantes_insertados": estudiantes_insertados,
         "estudiantes_actualizados": estudiantes_actualizados,
@@ -298,6 +304,10 @@ async def insertar_grupos(grupos):
     if errores:
         logger.warning(f"⚠️ {len(errores)} errores encontrados")
     
+    # Alumnos, grupos o clases cambiaron: los rosters en memoria ya no sirven
+    roster_cache.invalidar()
+    resumen_asistencia.reconciliar()
+
     return {
         "grupos_insertados": grupos_insertados,
         "grupos_actualizados": grupos_actualizados,
@@ -389,6 +399,10 @@ async def insertar_materias(materias):
     if errores:
         logger.warning(f"⚠️ {len(errores)} errores encontrados")
     
+    # Alumnos, grupos o clases cambiaron: los rosters en memoria ya no sirven
+    roster_cache.invalidar()
+    resumen_asistencia.reconciliar()
+
     return {
         "materias_insertadas": materias_insertadas,
         "materias_actualizadas": materias_actualizadas,
@@ -559,6 +573,10 @@ async def insertar_clases(clases):
     if errores:
         logger.warning(f"⚠️ {len(errores)} errores encontrados")
 
+    # Alumnos, grupos o clases cambiaron: los rosters en memoria ya no sirven
+    roster_cache.invalidar()
+    resumen_asistencia.reconciliar()
+
     return {
         "clases_insertadas": clases_insertadas,
         "horarios_insertados": horarios_insertados,
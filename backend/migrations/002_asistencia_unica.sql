@@ -0,0 +1,31 @@
+-- =====================================================================
+-- Migración 002: Llave única de asistencia por alumno, clase y día
+--
+-- Los escaneos (utils/escritura_asistencia.py) y la cola de escritura
+-- diferida (utils/cola_asistencias.py) escriben con INSERT ... ON
+-- DUPLICATE KEY UPDATE, que necesita esta llave para actualizar la fila
+-- existente en lugar de duplicarla.
+--
+-- Requisito: con ASISTENCIA_WRITE_BEHIND=1 la aplicación no arranca sin
+-- esta llave. Sin write-behind arranca, avisa en el log y escribe cada
+-- escaneo con SELECT + UPDATE/INSERT (más lento en la hora pico).
+--
+-- Ejecutar UNA sola vez. Si ya hay filas repetidas, primero se conserva
+-- la más reciente (id_asistencia mayor) y se borran las demás.
+-- =====================================================================
+
+-- Revisar antes cuántas filas repetidas hay:
+-- SELECT id_estudiante, id_clase, fecha, COUNT(*) AS repetidas
+-- FROM asistencia
+-- GROUP BY id_estudiante, id_clase, fecha
+-- HAVING COUNT(*) > 1;
+
+DELETE a FROM asistencia a
+JOIN asistencia b
+  ON a.id_estudiante = b.id_estudiante
+ AND a.id_clase = b.id_clase
+ AND a.fecha = b.fecha
+ AND a.id_asistencia < b.id_asistencia;
+
+CREATE UNIQUE INDEX uq_asistencia_estudiante_clase_fecha
+    ON asistencia (id_estudiante, id_clase, fecha);
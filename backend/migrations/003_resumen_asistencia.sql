@@ -0,0 +1,85 @@
+-- =====================================================================
+-- Migración 003: Resumen diario de asistencias (rollup)
+--
+-- Las estadísticas (routes/estadisticas.py y las clases de hoy en
+-- routes/clases.py) volvían a sumar todas las filas de asistencia desde
+-- el inicio del ciclo en cada petición. Estas tablas guardan los
+-- conteos ya sumados por día:
+--
+--   resumen_asistencia_clase   una fila por clase y día
+--   resumen_asistencia_alumno  una fila por alumno, grupo de la clase y día
+--
+-- Solo cuentan alumnos activos (estado_actual = 'activo', eliminado = 0)
+-- de clases no eliminadas, igual que las consultas de estadísticas.
+--
+-- Las mantiene utils/resumen_asistencia.py: cada escritura de asistencia
+-- marca su (clase, día) y un worker recalcula esos días; una
+-- reconciliación nocturna recalcula el ciclo completo.
+--
+-- Ejecutar UNA sola vez ANTES de desplegar el código que las lee. Los
+-- INSERT del final llenan las tablas con lo que ya hay en asistencia.
+-- =====================================================================
+
+CREATE TABLE IF NOT EXISTS resumen_asistencia_clase (
+    fecha DATE NOT NULL,
+    id_clase INT NOT NULL,
+    id_grupo INT NOT NULL,
+    id_materia INT NULL,
+    presentes INT NOT NULL DEFAULT 0,
+    ausentes INT NOT NULL DEFAULT 0,
+    justificantes INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, id_clase),
+    INDEX idx_resumen_clase_grupo_fecha (id_grupo, fecha),
+    INDEX idx_resumen_clase_clase_fecha (id_clase, fecha)
+);
+
+CREATE TABLE IF NOT EXISTS resumen_asistencia_alumno (
+    fecha DATE NOT NULL,
+    id_grupo INT NOT NULL,
+    id_estudiante INT NOT NULL,
+    presentes INT NOT NULL DEFAULT 0,
+    ausentes INT NOT NULL DEFAULT 0,
+    justificantes INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, id_grupo, id_estudiante),
+    INDEX idx_resumen_alumno_grupo_estudiante (id_grupo, id_estudiante)
+);
+
+-- El recálculo de un día lee asistencia por clase y fecha; la llave
+-- única de 002 empieza por id_estudiante y no sirve para eso.
+-- (Error 1061 Duplicate key name si ya existen: se puede ignorar.)
+CREATE INDEX idx_asistencia_clase_fecha ON asistencia (id_clase, fecha);
+CREATE INDEX idx_asistencia_fecha ON asistencia (fecha);
+
+-- ------------------------- Carga inicial -------------------------
+INSERT INTO resumen_asistencia_clase (fecha, id_clase, id_grupo, id_materia, presentes, ausentes, justificantes)
+SELECT a.fecha, c.id_clase, c.id_grupo, c.id_materia,
+       SUM(CASE WHEN a.estado = 'presente' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN a.estado = 'ausente' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN a.estado = 'justificante' THEN 1 ELSE 0 END)
+FROM asistencia a
+JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
+JOIN estudiante e ON a.id_estudiante = e.id_estudiante AND e.estado_actual = 'activo' AND e.eliminado = 0
+GROUP BY a.fecha, c.id_clase, c.id_grupo, c.id_materia
+ON DUPLICATE KEY UPDATE
+    presentes = VALUES(presentes), ausentes = VALUES(ausentes), justificantes = VALUES(justificantes);
+
+INSERT INTO resumen_asistencia_alumno (fecha, id_grupo, id_estudiante, presentes, ausentes, justificantes)
+SELECT a.fecha, c.id_grupo, a.id_estudiante,
+       SUM(CASE WHEN a.estado = 'presente' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN a.estado = 'ausente' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN a.estado = 'justificante' THEN 1 ELSE 0 END)
+FROM asistencia a
+JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
+JOIN estudiante e ON a.id_estudiante = e.id_estudiante AND e.estado_actual = 'activo' AND e.eliminado = 0
+GROUP BY a.fecha, c.id_grupo, a.id_estudiante
+ON DUPLICATE KEY UPDATE
+    presentes = VALUES(presentes), ausentes = VALUES(ausentes), justificantes = VALUES(justificantes);
+
+-- =====================================================================
+-- Verificación: los totales del resumen deben coincidir con asistencia.
+-- =====================================================================
+-- SELECT SUM(presentes + ausentes + justificantes) FROM resumen_asistencia_clase;
+-- SELECT COUNT(*) FROM asistencia a
+--   JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
+--   JOIN estudiante e ON a.id_estudiante = e.id_estudiante
+--  WHERE e.estado_actual = 'activo' AND e.eliminado = 0;
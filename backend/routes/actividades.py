@@ -3,7 +3,7 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 from routes.ws_manager import manager
 import json
-from config.db import fetch_one, fetch_all, execute_query
+from config.db import fetch_one, fetch_all, execute_query, gather_queries
 import pytz
 from utils.fecha import obtener_fecha_hora_cdmx_completa, convertir_fecha_a_cdmx
 import os
@@ -12,6 +12,9 @@ from cryptography.fernet import Fernet, InvalidToken
 from typing import List, Optional
 import json
 from routes.ws_manager_tabla import tabla_manager
+from utils.cache_roster import roster_cache
+from utils.snapshot_tabla import snapshots_tabla
+from utils.metricas_app import metricas_app
 
 router = APIRouter()
 
@@ -172,6 +175,7 @@ async def actualizar_actividad(id_actividad: int, data: ActividadCreate):
         if rowcount == 0:
             raise HTTPException(status_code=404, detail="Actividad no encontrada")
 
+        snapshots_tabla.invalidar_actividad(id_actividad)
         return {"mensaje": "Actividad actualizada con éxito"}
 
     except Exception as e:
@@ -188,6 +192,7 @@ async def eliminar_actividad(id_actividad: int):
         if rowcount == 0:
             raise HTTPException(status_code=404, detail="Actividad no encontrada")
 
+        snapshots_tabla.invalidar_actividad(id_actividad)
         return {"mensaje": "Actividad eliminada con éxito"}
 
     except Exception as e:
@@ -273,29 +278,23 @@ async def registrar_entrega(request: EntregaQRRequest):
         if not actividad:
             raise HTTPException(status_code=400, detail="Actividad inválida o vencida")
 
-        # 2️⃣ Buscar estudiante por matrícula
-        estudiante = await fetch_one(
-            "SELECT id_estudiante, nombre, id_grupo FROM estudiante WHERE matricula=%s AND eliminado = 0",
-            (matricula,)
-        )
-        if not estudiante:
-            raise HTTPException(status_code=404, detail="Estudiante no encontrado")
-
-        # 3️⃣ Validar grupo
-        grupo_estudiante = await fetch_one(
-            "SELECT nombre FROM grupo WHERE id_grupo=%s AND eliminado = 0",
-            (estudiante["id_grupo"],)
-        )
-        if grupo_estudiante["nombre"].lower() != grupo_qr.lower():
+        # 2️⃣-4️⃣ Alumno, grupo y relación clase ↔ grupo desde el roster en memoria
+        roster, alumno = await roster_cache.buscar_alumno(actividad["id_clase"], matricula)
+        if not roster:
+            raise HTTPException(status_code=400, detail="La actividad no corresponde al grupo del estudiante")
+        if not alumno:
+            # El alumno no está en el grupo de la clase: distinguir si existe o no
+            existe = await fetch_one(
+                "SELECT id_estudiante FROM estudiante WHERE matricula=%s AND eliminado = 0",
+                (matricula,)
+            )
+            if not existe:
+                raise HTTPException(status_code=404, detail="Estudiante no encontrado")
+            raise HTTPException(status_code=400, detail="La actividad no corresponde al grupo del estudiante")
+        if not roster.grupo_coincide(grupo_qr):
             raise HTTPException(status_code=400, detail="El grupo del estudiante no coincide con el grupo del QR")
 
-        # 4️⃣ Validar relación clase ↔ grupo
-        clase = await fetch_one(
-            "SELECT id_grupo FROM clase WHERE id_clase=%s AND eliminado = 0",
-            (actividad["id_clase"],)
-        )
-        if not clase or clase["id_grupo"] != estudiante["id_grupo"]:
-            raise HTTPException(status_code=400, detail="La actividad no corresponde al grupo del estudiante")
+        estudiante = {"id_estudiante": alumno["id_estudiante"], "nombre": alumno["nombre"], "id_grupo": roster.id_grupo}
 
         fecha_entrega_real = obtener_fecha_hora_cdmx_completa()
         if isinstance(fecha_entrega_real, str):
@@ -419,6 +418,7 @@ async def registrar_entrega(request: EntregaQRRequest):
         }
     
     except InvalidToken:
+        metricas_app.contar_qr_fallido("actividades_entrega")
         raise HTTPException(status_code=400, detail="QR inválido o expirado")
     except Exception as e:
         logger.error(f"❌ Error en registrar_entrega: {e}", exc_info=True)
@@ -528,7 +528,7 @@ async def actualizar_estado_estudiante(payload: EstadoEstudianteRequest):
 
     try:
         # 🔹 Obtener tipo de actividad y valor máximo
-        actividad_query = "SELECT tipo_actividad, valor_maximo FROM actividad WHERE id_actividad = %s"
+        actividad_query = "SELECT id_clase, tipo_actividad, valor_maximo FROM actividad WHERE id_actividad = %s"
         actividad = await fetch_one(actividad_query, (actividad_id,))
         if not actividad:
             raise HTTPException(status_code=404, detail="Actividad no encontrada")
@@ -574,6 +574,10 @@ async def actualizar_estado_estudiante(payload: EstadoEstudianteRequest):
                 WHERE id_actividad = %s AND id_estudiante = %s
             """
             await execute_query(update_query, (nuevo_estado, fecha_entrega, calificacion_final, actividad_id, estudiante_id))
+            tabla_manager.publicar({
+                "tipo": "entrega_actualizada",
+                "data": {"id_actividad": actividad_id, "id_estudiante": estudiante_id, "estado": nuevo_estado}
+            }, id_clase=actividad["id_clase"])
 
             data_resp = {
                 "id_actividad_estudiante": existente.get("id_actividad_estudiante"),
@@ -611,6 +615,10 @@ async def actualizar_estado_estudiante(payload: EstadoEstudianteRequest):
                 VALUES (%s, %s, %s, %s, %s, %s)
             """
             await execute_query(insert_query, (actividad_id, estudiante_id, nuevo_estado, fecha_entrega, fecha_registro, calificacion_final))
+            tabla_manager.publicar({
+                "tipo": "entrega_actualizada",
+                "data": {"id_actividad": actividad_id, "id_estudiante": estudiante_id, "estado": nuevo_estado}
+            }, id_clase=actividad["id_clase"])
 
             data_resp = {
                 "estado": nuevo_estado,
@@ -853,24 +861,25 @@ async def get_detalle_alumno(id_estudiante: int, id_clase: int):
     incluyendo actividades con calificación real y estado de entrega.
     """
     try:
-        query = """
+        # Alumno, clase y actividades son independientes: van en paralelo
+        query_alumno = """
+            SELECT e.id_estudiante, e.nombre, e.apellido, e.matricula, e.correo,
+                   g.nombre AS grupo, g.turno
+            FROM estudiante e
+            JOIN grupo g ON e.id_grupo = g.id_grupo
+            WHERE e.id_estudiante = %s AND e.eliminado = 0 AND g.eliminado = 0
+        """
+
+        query_clase = """
+            SELECT c.id_clase, c.nombre_clase, m.nombre AS materia, p.nombre AS profesor
+            FROM clase c
+            JOIN materia m ON c.id_materia = m.id_materia
+            JOIN profesor p ON c.id_profesor = p.id_profesor
+            WHERE c.id_clase = %s AND c.eliminado = 0
+        """
+
+        query_actividades = """
             SELECT 
-                -- Datos del alumno
-                e.id_estudiante,
-                e.nombre AS nombre_alumno,
-                e.apellido AS apellido_alumno,
-                e.matricula,
-                e.correo,
-                g.nombre AS grupo,
-                g.turno,
-
-                -- Datos de la clase
-                c.id_clase,
-                c.nombre_clase,
-                m.nombre AS materia,
-                p.nombre AS profesor,
-
-                -- Datos de las actividades
                 a.id_actividad,
                 a.titulo AS titulo_actividad,
                 a.descripcion AS descripcion_actividad,
@@ -880,42 +889,22 @@ async def get_detalle_alumno(id_estudiante: int, id_clase: int):
                 ae.estado AS estado_entrega,
                 ae.fecha_entrega_real,
                 ae.calificacion
-            FROM estudiante e
-            JOIN grupo g ON e.id_grupo = g.id_grupo
-            JOIN clase c ON c.id_clase = %s AND c.eliminado = 0
-            JOIN materia m ON c.id_materia = m.id_materia
-            JOIN profesor p ON c.id_profesor = p.id_profesor
-            LEFT JOIN actividad a ON a.id_clase = c.id_clase
+            FROM actividad a
             LEFT JOIN actividad_estudiante ae
-                ON a.id_actividad = ae.id_actividad AND ae.id_estudiante = e.id_estudiante
-            WHERE e.id_estudiante = %s AND e.eliminado = 0 AND g.eliminado = 0
+                ON a.id_actividad = ae.id_actividad AND ae.id_estudiante = %s
+            WHERE a.id_clase = %s
             ORDER BY a.fecha_creacion ASC
         """
 
-        rows = await fetch_all(query, (id_clase, id_estudiante))
+        alumno_info, clase_info, rows = await gather_queries(
+            fetch_one(query_alumno, (id_estudiante,)),
+            fetch_one(query_clase, (id_clase,)),
+            fetch_all(query_actividades, (id_estudiante, id_clase)),
+        )
 
-        if not rows:
+        if not alumno_info or not clase_info:
             raise HTTPException(status_code=404, detail="No se encontró información para este alumno en esta clase")
 
-        # Alumno
-        alumno_info = {
-            "id_estudiante": rows[0]["id_estudiante"],
-            "nombre": rows[0]["nombre_alumno"],
-            "apellido": rows[0]["apellido_alumno"],
-            "matricula": rows[0]["matricula"],
-            "correo": rows[0]["correo"],
-            "grupo": rows[0]["grupo"],
-            "turno": rows[0]["turno"]
-        }
-
-        # Clase
-        clase_info = {
-            "id_clase": rows[0]["id_clase"],
-            "nombre_clase": rows[0]["nombre_clase"],
-            "materia": rows[0]["materia"],
-            "profesor": rows[0]["profesor"]
-        }
-
         # Actividades
         actividades = [
             {
@@ -929,7 +918,7 @@ async def get_detalle_alumno(id_estudiante: int, id_clase: int):
                 "fecha_entrega_real": convertir_fecha_a_cdmx(r["fecha_entrega_real"]),
                 "calificacion": int(r["calificacion"]) if r["calificacion"] is not None else None
             }
-            for r in rows if r["id_actividad"] is not None
+            for r in rows
         ]
 
         return {
@@ -967,6 +956,7 @@ async def validar_entrega(data: ValidarEntregaRequest):
         decrypted = decrypted_bytes.decode()
         logger.info(f"QR desencriptado exitosamente: {decrypted}")
     except InvalidToken:
+        metricas_app.contar_qr_fallido("actividades_validar_entrega")
         logger.error("QR inválido o malformado")
         raise HTTPException(status_code=400, detail="QR inválido")
 
@@ -1,8 +1,8 @@
 import os
+import asyncio
 from datetime import datetime, date
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import logging
-import json
 from fastapi import APIRouter, HTTPException, Response, Query, Depends
 from pydantic import BaseModel
 import aiomysql
@@ -13,11 +13,19 @@ import pytz
 from io import BytesIO
 from routes.ws_manager import manager
 from routes.ws_manager_tabla import tabla_manager
+from utils.cola_asistencias import cola_asistencias, WRITE_BEHIND_ACTIVO
+from utils.escritura_asistencia import escritura_asistencia
+from utils.cache_roster import roster_cache
+from utils.resumen_asistencia import resumen_asistencia
+from utils.cache_estadisticas import cache_estadisticas
+from utils.metricas_app import metricas_app
+from utils.pivote_asistencias import pivotar_asistencias
+from utils.reporte_excel import ReporteExcel, respuesta_excel
 # Importar la configuración de base de datos
-from config.db import get_pool, fetch_one, fetch_all, execute_query, get_db_connection, get_pool
+from config.db import get_pool, fetch_one, fetch_all, execute_query, get_db_connection, get_pool, stream_rows, gather_queries
 
 # Importar funciones de fecha
-from utils.fecha import obtener_fecha_hora_cdmx, convertir_fecha_a_cdmx
+from utils.fecha import obtener_fecha_hora_cdmx, convertir_fecha_a_cdmx, CDMX
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
@@ -34,6 +42,11 @@ fernet_cipher = Fernet(FERNET_KEY.encode())
 
 # Constantes
 FECHA_INICIO_CICLO = '2025-08-04'
+LIMITE_LOTE = 1000
+# scanned_at aceptado en /lote: hasta LOTE_ATRASO_MAX_H horas atrás y
+# LOTE_DESFASE_MAX_S segundos adelante (reloj del celular desfasado)
+LOTE_ATRASO_MAX_H = float(os.getenv("ASISTENCIA_LOTE_ATRASO_MAX_H", "12"))
+LOTE_DESFASE_MAX_S = float(os.getenv("ASISTENCIA_LOTE_DESFASE_MAX_S", "120"))
 
 # Modelos Pydantic
 class EscaneoQRRequest(BaseModel):
@@ -41,6 +54,12 @@ class EscaneoQRRequest(BaseModel):
     id_clase: int
     estado: str
 
+class EscaneoLoteItem(BaseModel):
+    qr: str
+    id_clase: int
+    estado: str
+    scanned_at: Optional[datetime] = None  # hora en que se escaneó sin conexión
+
 class ActualizarAsistenciaRequest(BaseModel):
     matricula: str
     id_clase: int
@@ -118,10 +137,24 @@ async def inicializar_asistencias(id_clase: int, connection: aiomysql.Connection
         logger.error(f"❌ Error en inicializar_asistencias: {error}")
         await connection.rollback()
 
+def _publicar_asistencia(id_clase: int, id_estudiante: int, estado: str, hora_entrada):
+    """Avisa a la tabla dinámica (y a su foto en memoria) de un cambio hecho a mano."""
+    if hasattr(hora_entrada, "total_seconds"):
+        segundos = int(hora_entrada.total_seconds())
+        hora = f"{segundos // 3600:02d}:{segundos % 3600 // 60:02d}:{segundos % 60:02d}"
+    elif hora_entrada is not None:
+        hora = hora_entrada.strftime('%H:%M:%S')
+    else:
+        hora = ""
+    tabla_manager.publicar({
+        "tipo": "asistencia",
+        "data": {"id_estudiante": id_estudiante, "estado": estado, "hora": hora}
+    }, id_clase=id_clase)
+
 # ENDPOINTS
 
 @router.post("/")
-async def escanear_qr(request: EscaneoQRRequest, connection: aiomysql.Connection = Depends(get_db_connection)):
+async def escanear_qr(request: EscaneoQRRequest):
     """Escanear código QR para registrar asistencia"""
     start_time = datetime.now()
     logger.info(f"📥 Petición recibida: {request.estado}, {request.id_clase}, QR recibido")
@@ -131,6 +164,7 @@ async def escanear_qr(request: EscaneoQRRequest, connection: aiomysql.Connection
         try:
             decrypted = fernet_cipher.decrypt(request.qr.encode()).decode()
         except Exception:
+            metricas_app.contar_qr_fallido("asistencias")
             raise HTTPException(status_code=400, detail="QR inválido o expirado")
 
         partes = [p.strip() for p in decrypted.split('|')]
@@ -149,142 +183,270 @@ async def escanear_qr(request: EscaneoQRRequest, connection: aiomysql.Connection
         hoy = fecha.strftime('%Y-%m-%d')
         hora_actual = hora.strftime('%H:%M:%S')
 
-        async with connection.cursor() as cursor:
-            # Consulta optimizada con JOINs
-            consulta_completa = """
-                SELECT 
-                    e.id_estudiante,
-                    g.id_grupo,
-                    c.id_clase,
-                    e.nombre,
-                    e.apellido,
-                    a.id_asistencia,
-                    a.estado as estado_actual
-                FROM estudiante e
-                JOIN grupo g ON g.nombre = %s AND g.eliminado = 0
-                JOIN clase c ON c.id_grupo = g.id_grupo AND c.eliminado = 0
-                LEFT JOIN asistencia a ON a.id_estudiante = e.id_estudiante
-                    AND a.id_clase = c.id_clase
-                    AND a.fecha = %s
-                WHERE e.matricula = %s
-                    AND c.id_clase = %s
-                    AND e.eliminado = 0
-                LIMIT 1
-            """
+        # Roster en memoria: en un acierto no hay ninguna lectura a la BD
+        roster, alumno = await roster_cache.buscar_alumno(request.id_clase, matricula)
+        if not alumno or not roster.grupo_coincide(grupo_texto):
+            raise HTTPException(
+                status_code=404,
+                detail="Estudiante no encontrado o no hay clase activa para este grupo"
+            )
 
-            await cursor.execute(consulta_completa, (grupo_texto, hoy, matricula, request.id_clase))
-            resultado = await cursor.fetchone()
+        id_estudiante = alumno["id_estudiante"]
+        nombre, apellido = alumno["nombre"], alumno["apellido"]
+        # Con write-behind el último escaneo puede seguir en la cola
+        estado_actual = (
+            WRITE_BEHIND_ACTIVO and cola_asistencias.estado_pendiente(id_estudiante, request.id_clase, hoy)
+        ) or roster.estados.get(id_estudiante)
+
+        # ============================
+        # Caso: escaneo repetido
+        # ============================
+        if estado_actual == request.estado:
+            response_time = (datetime.now() - start_time).total_seconds() * 1000
+            logger.warning(f"⚠️ Escaneo repetido ({response_time:.0f}ms). Estado: {estado_actual}")
+            return {
+                "success": True,
+                "mensaje": f"{nombre} {apellido} ya estaba registrado como '{estado_actual}'",
+                "duplicado": True
+            }
 
-            if not resultado:
-                raise HTTPException(
-                    status_code=404,
-                    detail="Estudiante no encontrado o no hay clase activa para este grupo"
-                )
+        # ============================
+        # Escritura: diferida (cola) o directa (upsert)
+        # ============================
+        # (con write-behind el estado en memoria se anota al escribir el lote)
+        if WRITE_BEHIND_ACTIVO:
+            cola_asistencias.encolar(id_estudiante, request.id_clase, request.estado, hoy, hora_actual)
+            await cola_asistencias.sincronizar()
+        else:
+            await escritura_asistencia.guardar([(id_estudiante, request.id_clase, request.estado, hoy, hora_actual)])
+            resumen_asistencia.marcar(request.id_clase, hoy)
+            roster_cache.registrar_estado(request.id_clase, id_estudiante, request.estado)
+
+        # 🔔 Difusión WebSocket
+        # (se junta con los demás escaneos de la clase en un solo frame "lote")
+        tabla_manager.publicar({
+            "tipo": "asistencia",
+            "data": {
+                "id_estudiante": id_estudiante,
+                "estado": request.estado,
+                "hora": hora_actual
+            }
+        }, id_clase=request.id_clase)
 
-            (id_estudiante, id_grupo, id_clase_datos, nombre, apellido,
-             id_asistencia, estado_actual) = resultado
+        response_time = (datetime.now() - start_time).total_seconds() * 1000
 
-            # ✅ NUEVO: Obtener información de grupo y materia para WebSocket
-            await cursor.execute("""
-                SELECT g.nombre, m.nombre
-                FROM grupo g
-                JOIN clase c ON c.id_grupo = g.id_grupo
-                JOIN materia m ON c.id_materia = m.id_materia
-                WHERE c.id_clase = %s AND c.eliminado = 0 AND g.eliminado = 0
-            """, (request.id_clase,))
-            info_clase = await cursor.fetchone()
-            nombre_grupo, nombre_materia = info_clase if info_clase else ("", "")
-
-            # ============================
-            # Caso: ya existe asistencia
-            # ============================
-            if id_asistencia:
-                if estado_actual == request.estado:
-                    response_time = (datetime.now() - start_time).total_seconds() * 1000
-                    logger.warning(f"⚠️ Escaneo repetido ({response_time:.0f}ms). Estado: {estado_actual}")
-                    return {
-                        "success": True,
-                        "mensaje": f"{nombre} {apellido} ya estaba registrado como '{estado_actual}'",
-                        "duplicado": True
-                    }
+        if estado_actual:
+            logger.info(f"🔄 Asistencia actualizada ({response_time:.0f}ms): {nombre} {apellido} -> '{request.estado}'")
+            return {
+                "success": True,
+                "mensaje": f"{nombre} {apellido} actualizado a '{request.estado}'",
+                "actualizado": True
+            }
 
-                # Actualizar estado existente
-                await cursor.execute(
-                    "UPDATE asistencia SET estado = %s, hora_entrada = %s WHERE id_asistencia = %s",
-                    (request.estado, hora_actual, id_asistencia)
-                )
-                await connection.commit()
-
-                # 🔔 Difusión WebSocket - ✅ CON INFORMACIÓN COMPLETA
-                # ✅ DESPUÉS - Cambia a este formato:
-                mensaje_ws = json.dumps({
-                    "tipo": "asistencia",
-                    "data": {
-                        "id_estudiante": id_estudiante,
-                        "estado": request.estado,
-                        "hora": hora_actual
-                    }
-                })
-                
-                logger.info(f"📡 Enviando WebSocket: {mensaje_ws[:150]}...")
-                logger.info(f"👥 Clientes conectados: {len(manager.active_connections)}")
-                
-                await tabla_manager.broadcast(mensaje_ws, id_clase=request.id_clase)
-
-                response_time = (datetime.now() - start_time).total_seconds() * 1000
-                logger.info(f"🔄 Asistencia actualizada ({response_time:.0f}ms): {nombre} {apellido} -> '{request.estado}'")
-                return {
-                    "success": True,
-                    "mensaje": f"{nombre} {apellido} actualizado a '{request.estado}'",
-                    "actualizado": True
+        logger.info(f"✅ Asistencia registrada ({response_time:.0f}ms): {nombre} {apellido} como '{request.estado}'")
+        return {
+            "success": True,
+            "mensaje": f"{nombre} {apellido} registrado como '{request.estado}'",
+            "nuevo": True
+        }
+
+    except HTTPException:
+        raise
+    except Exception as error:
+        response_time = (datetime.now() - start_time).total_seconds() * 1000
+        logger.error(f"❌ Error ({response_time:.0f}ms): {error}")
+        raise HTTPException(status_code=500, detail="Error del servidor")
+
+
+def _desencriptar_lote(qrs: List[str]) -> List[Optional[str]]:
+    """Desencripta varios QR; None para los inválidos. Se corre en un hilo."""
+    textos = []
+    for qr in qrs:
+        try:
+            textos.append(fernet_cipher.decrypt(qr.encode()).decode())
+        except Exception:
+            textos.append(None)
+    return textos
+
+
+def _momento_cdmx(scanned_at: Optional[datetime], ahora: datetime) -> datetime:
+    """Hora del escaneo en CDMX; sin zona se asume que ya es hora local."""
+    if scanned_at is None:
+        return ahora
+    if scanned_at.tzinfo is None:
+        return CDMX.localize(scanned_at)
+    return scanned_at.astimezone(CDMX)
+
+
+def _momento_fuera_de_rango(momento: datetime, ahora: datetime) -> Optional[str]:
+    """Error si la hora del escaneo está en el futuro o es demasiado vieja."""
+    segundos = (ahora - momento).total_seconds()
+    if segundos < -LOTE_DESFASE_MAX_S:
+        return "La hora de escaneo está en el futuro"
+    if segundos > LOTE_ATRASO_MAX_H * 3600:
+        return f"El escaneo tiene más de {LOTE_ATRASO_MAX_H:g} horas"
+    return None
+
+
+@router.post("/lote")
+async def escanear_qr_lote(escaneos: List[EscaneoLoteItem]):
+    """
+    Registrar de una sola vez los escaneos que la app juntó sin conexión.
+
+    Desencripta todo el lote, resuelve a los alumnos con los rosters de las
+    clases (una sola consulta para las que no estén en memoria), escribe
+    con un único INSERT ... ON DUPLICATE KEY UPDATE (utils/escritura_asistencia.py) y manda un solo mensaje
+    WebSocket por clase. Regresa un resultado por cada escaneo, en el mismo
+    orden en que llegaron; los que traen un scanned_at en el futuro o de
+    hace más de ASISTENCIA_LOTE_ATRASO_MAX_H horas se rechazan.
+    """
+    start_time = datetime.now()
+    if not escaneos:
+        raise HTTPException(status_code=400, detail="No se recibió ningún escaneo")
+    if len(escaneos) > LIMITE_LOTE:
+        raise HTTPException(status_code=400, detail=f"Máximo {LIMITE_LOTE} escaneos por lote")
+
+    try:
+        textos = await asyncio.to_thread(_desencriptar_lote, [e.qr for e in escaneos])
+        invalidos = textos.count(None)
+        if invalidos:
+            metricas_app.contar_qr_fallido("asistencias_lote", invalidos)
+        rosters = await roster_cache.obtener_varios(e.id_clase for e in escaneos)
+
+        ahora = datetime.now(CDMX)
+        hoy = ahora.strftime('%Y-%m-%d')
+        momentos = [_momento_cdmx(e.scanned_at, ahora) for e in escaneos]
+
+        resultados: List[Optional[Dict[str, Any]]] = [None] * len(escaneos)
+        # (id_estudiante, id_clase, fecha) -> fila a escribir; gana el escaneo más reciente
+        filas: Dict[tuple, Dict[str, Any]] = {}
+        estados: Dict[tuple, str] = {}
+
+        # Se procesan en orden cronológico para que un re-escaneo posterior gane
+        for i in sorted(range(len(escaneos)), key=lambda i: momentos[i]):
+            item, texto = escaneos[i], textos[i]
+            fuera_de_rango = _momento_fuera_de_rango(momentos[i], ahora)
+            if fuera_de_rango:
+                resultados[i] = {"indice": i, "success": False, "error": fuera_de_rango}
+                continue
+            if texto is None:
+                resultados[i] = {"indice": i, "success": False, "error": "QR inválido o expirado"}
+                continue
+
+            partes = [p.strip() for p in texto.split('|')]
+            if len(partes) < 4:
+                resultados[i] = {"indice": i, "success": False, "error": "Formato QR inválido"}
+                continue
+
+            roster = rosters.get(item.id_clase)
+            alumno = roster.alumnos.get(partes[1]) if roster else None
+            if not alumno or not roster.grupo_coincide(partes[2]):
+                resultados[i] = {
+                    "indice": i, "success": False,
+                    "error": "Estudiante no encontrado o no hay clase activa para este grupo"
                 }
+                continue
 
-            # ============================
-            # Caso: nueva asistencia
-            # ============================
-            await cursor.execute(
-                "INSERT INTO asistencia (id_estudiante, id_clase, hora_entrada, estado, fecha) VALUES (%s, %s, %s, %s, %s)",
-                (id_estudiante, request.id_clase, hora_actual, request.estado, hoy)
+            id_estudiante = alumno["id_estudiante"]
+            fecha = momentos[i].strftime('%Y-%m-%d')
+            clave = (id_estudiante, item.id_clase, fecha)
+            nombre = f"{alumno['nombre']} {alumno['apellido']}"
+
+            # El estado previo solo se conoce en memoria para el día de hoy
+            estado_actual = (
+                estados.get(clave)
+                or (WRITE_BEHIND_ACTIVO and cola_asistencias.estado_pendiente(*clave))
+                or (roster.estados.get(id_estudiante) if fecha == hoy else None)
             )
-            await connection.commit()
+            if estado_actual == item.estado:
+                resultados[i] = {
+                    "indice": i, "success": True, "duplicado": True,
+                    "mensaje": f"{nombre} ya estaba registrado como '{estado_actual}'"
+                }
+                continue
 
-            # 🔔 Difusión WebSocket - ✅ CON INFORMACIÓN COMPLETA
-            # ✅ DESPUÉS:
-            mensaje_ws = json.dumps({
+            estados[clave] = item.estado
+            filas[clave] = {
+                "id_estudiante": id_estudiante,
+                "id_clase": item.id_clase,
+                "estado": item.estado,
+                "fecha": fecha,
+                "hora": momentos[i].strftime('%H:%M:%S'),
+            }
+            resultados[i] = {
+                "indice": i, "success": True,
+                "actualizado" if estado_actual else "nuevo": True,
+                "mensaje": f"{nombre} registrado como '{item.estado}'"
+            }
+
+        if filas:
+            if WRITE_BEHIND_ACTIVO:
+                for f in filas.values():
+                    cola_asistencias.encolar(f["id_estudiante"], f["id_clase"], f["estado"], f["fecha"], f["hora"])
+                await cola_asistencias.sincronizar()
+            else:
+                await escritura_asistencia.guardar(
+                    (f["id_estudiante"], f["id_clase"], f["estado"], f["fecha"], f["hora"]) for f in filas.values()
+                )
+                resumen_asistencia.marcar_varias((f["id_clase"], f["fecha"]) for f in filas.values())
+                roster_cache.registrar_estados(
+                    (f["id_clase"], f["id_estudiante"], f["estado"], f["fecha"]) for f in filas.values()
+                )
+
+        # 🔔 Un solo mensaje WebSocket por clase con los cambios de hoy
+        cambios_por_clase: Dict[int, List[Dict[str, Any]]] = {}
+        for f in filas.values():
+            if f["fecha"] != hoy:
+                continue
+            cambios_por_clase.setdefault(f["id_clase"], []).append({
                 "tipo": "asistencia",
-                "data": {
-                    "id_estudiante": id_estudiante,
-                    "estado": request.estado,
-                    "hora": hora_actual
-                }
+                "data": {"id_estudiante": f["id_estudiante"], "estado": f["estado"], "hora": f["hora"]}
             })
-                        
-            logger.info(f"📡 Enviando WebSocket: {mensaje_ws[:150]}...")
-            logger.info(f"👥 Clientes conectados: {len(manager.active_connections)}")
-            await tabla_manager.broadcast(mensaje_ws, id_clase=request.id_clase)
+        for id_clase, cambios in cambios_por_clase.items():
+            tabla_manager.publicar({"tipo": "lote", "cambios": cambios}, id_clase=id_clase)
 
-            response_time = (datetime.now() - start_time).total_seconds() * 1000
-            logger.info(f"✅ Asistencia registrada ({response_time:.0f}ms): {nombre} {apellido} como '{request.estado}'")
+        errores = sum(1 for r in resultados if not r["success"])
+        response_time = (datetime.now() - start_time).total_seconds() * 1000
+        logger.info(
+            f"📦 Lote de {len(escaneos)} escaneos ({response_time:.0f}ms): "
+            f"{len(filas)} escritos, {errores} con error"
+        )
 
-            return {
-                "success": True,
-                "mensaje": f"{nombre} {apellido} registrado como '{request.estado}'",
-                "nuevo": True
-            }
+        return {
+            "success": True,
+            "total": len(escaneos),
+            "escritos": len(filas),
+            "errores": errores,
+            "resultados": resultados
+        }
 
     except HTTPException:
         raise
     except Exception as error:
         response_time = (datetime.now() - start_time).total_seconds() * 1000
-        logger.error(f"❌ Error ({response_time:.0f}ms): {error}")
+        logger.error(f"❌ Error en lote ({response_time:.0f}ms): {error}")
         raise HTTPException(status_code=500, detail="Error del servidor")
 
 
+@router.get("/cola/metricas")
+async def metricas_cola():
+    """Profundidad de la cola write-behind y latencia de escritura por lotes"""
+    return cola_asistencias.obtener_metricas()
+
+
+@router.get("/roster/metricas")
+async def metricas_roster():
+    """Aciertos, fallos y tamaño de la caché de rosters por clase"""
+    return roster_cache.obtener_metricas()
+
+
+def _hoy_cdmx() -> str:
+    return obtener_fecha_hora_cdmx()["fecha"].strftime('%Y-%m-%d')
+
+
 @router.get("/resumen")
-async def obtener_resumen(
-    turno: str = Query("matutino"),
-    connection: aiomysql.Connection = Depends(get_db_connection)
-):
+@cache_estadisticas.cachear(lambda turno="matutino": {"turno": "M" if turno.lower() == "matutino" else "V", "fecha": _hoy_cdmx()})
+async def obtener_resumen(turno: str = Query("matutino")):
     """Obtener resumen de asistencias del día por turno"""
     try:
         datos = obtener_fecha_hora_cdmx()
@@ -294,61 +456,49 @@ async def obtener_resumen(
 
         # Construimos patrón seguro para LIKE
         like_turno = f"%{sufijo_turno}%"
-        
-        async with connection.cursor() as cursor:
-            # Total alumnos en el turno
-            await cursor.execute(
-                "SELECT COUNT(*) FROM estudiante e JOIN grupo g ON e.id_grupo = g.id_grupo WHERE g.nombre LIKE %s AND e.eliminado = 0 AND g.eliminado = 0",
-                (like_turno,)
-            )
-            total_alumnos = (await cursor.fetchone())[0]
 
-            # Alumnos presentes hoy
-            await cursor.execute(
-                """
-                SELECT COUNT(DISTINCT a.id_estudiante) FROM asistencia a
+        # Alumnos del turno con ese estado hoy
+        def query_estado(estado):
+            return f"""
+                SELECT COUNT(DISTINCT a.id_estudiante) AS total FROM asistencia a
                 JOIN estudiante e ON a.id_estudiante = e.id_estudiante
                 JOIN grupo g ON e.id_grupo = g.id_grupo
-                WHERE a.estado = 'presente'
+                WHERE a.estado = '{estado}'
                     AND a.fecha = %s
                     AND g.nombre LIKE %s
                     AND e.eliminado = 0 AND g.eliminado = 0
-                """,
-                (hoy, like_turno)
-            )
-            presentes = (await cursor.fetchone())[0]
+            """
 
-            # Alumnos con justificante hoy
-            await cursor.execute(
-                """
-                SELECT COUNT(DISTINCT a.id_estudiante) FROM asistencia a
-                JOIN estudiante e ON a.id_estudiante = e.id_estudiante
-                JOIN grupo g ON e.id_grupo = g.id_grupo
-                WHERE a.estado = 'justificante'
-                    AND a.fecha = %s
-                    AND g.nombre LIKE %s
-                    AND e.eliminado = 0 AND g.eliminado = 0
-                """,
-                (hoy, like_turno)
-            )
-            justificantes = (await cursor.fetchone())[0]
+        # Total alumnos en el turno, presentes y con justificante (en paralelo)
+        total, con_presente, con_justificante = await gather_queries(
+            fetch_one(
+                "SELECT COUNT(*) AS total FROM estudiante e JOIN grupo g ON e.id_grupo = g.id_grupo WHERE g.nombre LIKE %s AND e.eliminado = 0 AND g.eliminado = 0",
+                (like_turno,)
+            ),
+            fetch_one(query_estado("presente"), (hoy, like_turno)),
+            fetch_one(query_estado("justificante"), (hoy, like_turno)),
+        )
+        total_alumnos = total["total"]
+        presentes = con_presente["total"]
+        justificantes = con_justificante["total"]
 
-            ausentes = max(0, total_alumnos - presentes - justificantes)
-            porcentaje = round((presentes / total_alumnos) * 100) if total_alumnos > 0 else 0
+        ausentes = max(0, total_alumnos - presentes - justificantes)
+        porcentaje = round((presentes / total_alumnos) * 100) if total_alumnos > 0 else 0
 
-            return {
-                "totalAlumnos": total_alumnos,
-                "presentes": presentes,
-                "justificantes": justificantes,
-                "ausentes": ausentes,
-                "porcentaje": porcentaje
-            }
+        return {
+            "totalAlumnos": total_alumnos,
+            "presentes": presentes,
+            "justificantes": justificantes,
+            "ausentes": ausentes,
+            "porcentaje": porcentaje
+        }
 
     except Exception as error:
         logger.error(f"❌ Error al obtener resumen del día: {error}")
         raise HTTPException(status_code=500, detail="Error al obtener resumen de asistencia diaria")
     
 @router.get("/por-clase")
+@cache_estadisticas.cachear(lambda fecha=None: {"fecha": fecha or _hoy_cdmx()})
 async def obtener_por_clase(fecha: Optional[str] = Query(None)):
     try:
         datos_fecha = obtener_fecha_hora_cdmx()
@@ -443,6 +593,7 @@ async def obtener_por_clase(fecha: Optional[str] = Query(None)):
         raise HTTPException(status_code=500, detail=f"Error al obtener resumen por clase: {str(error)}")
 
 @router.get("/alumnos/clase/{id_clase}/excel")
+@metricas_app.medir_reporte("asistencias_clase")
 async def generar_excel_clase(id_clase: int):
     """Generar Excel con asistencias de una clase específica"""
     try:
@@ -482,24 +633,9 @@ async def generar_excel_clase(id_clase: int):
             ORDER BY e.nombre, e.apellido, a.fecha
         """, (id_grupo, id_materia))
         
-        # Resto del código de generación de Excel se queda igual...
-        fechas_unicas = sorted(list(set(
-            r['fecha'].strftime('%Y-%m-%d') for r in resultado 
-            if r['fecha'] is not None
-        )))
-        
-        estudiantes_map = {}
-        for row in resultado:
-            id_estudiante = row['id_estudiante']
-            if id_estudiante not in estudiantes_map:
-                estudiantes_map[id_estudiante] = {
-                    'nombre': row['nombre'],
-                    'matricula': row['matricula'],
-                    'estados_por_fecha': {}
-                }
-            if row['fecha']:
-                fecha_str = row['fecha'].strftime('%Y-%m-%d')
-                estudiantes_map[id_estudiante]['estados_por_fecha'][fecha_str] = row['estado']
+        # Alumnos × fechas únicas, en una pasada
+        matriz = pivotar_asistencias(resultado)
+        fechas_unicas = matriz.fechas
         
         # Crear workbook y worksheet
         workbook = openpyxl.Workbook()
@@ -519,17 +655,15 @@ async def generar_excel_clase(id_clase: int):
                 'justificante': {'letra':'J','color':'FFFFC000'}
             }.get(estado_lower, {'letra':'A','color':'FFFF0000'})
         
-        for estudiante_data in estudiantes_map.values():
+        letras = matriz.mapear(lambda estado: estado_to_letra_color(estado)['letra'])
+        for id_estudiante, estudiante_data in matriz:
             fila = [
                 estudiante_data['nombre'],
                 estudiante_data['matricula'],
                 nombre_grupo,
                 nombre_materia
             ]
-            for fecha in fechas_unicas:
-                estado = estudiante_data['estados_por_fecha'].get(fecha)
-                letra = estado_to_letra_color(estado)['letra']
-                fila.append(letra)
+            fila.extend(letras.fila(id_estudiante))
             worksheet.append(fila)
         
         # Formato
@@ -589,6 +723,9 @@ async def actualizar_asistencia(request: ActualizarAsistenciaRequest):
         
         id_estudiante = estudiante_result['id_estudiante']
 
+        # Un escaneo de la misma fila que siga en la cola va antes que este cambio
+        await cola_asistencias.adelantar(id_estudiante, request.id_clase, fecha)
+
         # Verificar si ya existe registro
         asistencia_result = await fetch_one(
             "SELECT id_asistencia FROM asistencia WHERE id_estudiante = %s AND id_clase = %s AND fecha = %s",
@@ -608,6 +745,12 @@ async def actualizar_asistencia(request: ActualizarAsistenciaRequest):
                 (id_estudiante, request.id_clase, request.estado, fecha)
             )
 
+        resumen_asistencia.marcar(request.id_clase, fecha)
+        roster_cache.registrar_estado(request.id_clase, id_estudiante, request.estado)
+        tabla_manager.publicar({
+            "tipo": "asistencia",
+            "data": {"id_estudiante": id_estudiante, "estado": request.estado}
+        }, id_clase=request.id_clase)
         return {"success": True, "mensaje": "Estado actualizado"}
 
     except HTTPException:
@@ -624,6 +767,9 @@ async def actualizar_estado(request: ActualizarEstadoRequest):
         fecha = fecha_hora['fecha']
         hora = fecha_hora['hora']
 
+        # Un escaneo de la misma fila que siga en la cola va antes que este cambio
+        await cola_asistencias.adelantar(request.id_estudiante, request.id_clase, fecha)
+
         # Verificar si existe registro
         existing = await fetch_one(
             "SELECT * FROM asistencia WHERE id_estudiante = %s AND id_clase = %s AND fecha = %s",
@@ -642,6 +788,9 @@ async def actualizar_estado(request: ActualizarEstadoRequest):
                 """,
                 (request.estado, hora_entrada, request.id_estudiante, request.id_clase, fecha)
             )
+            resumen_asistencia.marcar(request.id_clase, fecha)
+            roster_cache.registrar_estado(request.id_clase, request.id_estudiante, request.estado)
+            _publicar_asistencia(request.id_clase, request.id_estudiante, request.estado, hora_entrada)
             return {"message": "Estado de asistencia actualizado"}
 
         # Insertar nuevo registro
@@ -651,6 +800,9 @@ async def actualizar_estado(request: ActualizarEstadoRequest):
             (request.id_estudiante, request.id_clase, request.estado, hora_entrada, fecha)
         )
 
+        resumen_asistencia.marcar(request.id_clase, fecha)
+        roster_cache.registrar_estado(request.id_clase, request.id_estudiante, request.estado)
+        _publicar_asistencia(request.id_clase, request.id_estudiante, request.estado, hora_entrada)
         return {"message": "Asistencia registrada correctamente"}
 
     except Exception as error:
@@ -665,6 +817,9 @@ async def actualizar_estado_alt(request: ActualizarEstadoRequest):
         hoy = fecha_hora['fecha']
         hora = fecha_hora['hora']
 
+        # Un escaneo de la misma fila que siga en la cola va antes que este cambio
+        await cola_asistencias.adelantar(request.id_estudiante, request.id_clase, hoy)
+
         # Verificar que existe el registro
         existing = await fetch_one(
             "SELECT * FROM asistencia WHERE id_estudiante = %s AND id_clase = %s AND fecha = %s",
@@ -686,6 +841,9 @@ async def actualizar_estado_alt(request: ActualizarEstadoRequest):
             (request.estado, hora_entrada, request.id_estudiante, request.id_clase, hoy)
         )
 
+        resumen_asistencia.marcar(request.id_clase, hoy)
+        roster_cache.registrar_estado(request.id_clase, request.id_estudiante, request.estado)
+        _publicar_asistencia(request.id_clase, request.id_estudiante, request.estado, hora_entrada)
         return {"message": "Estado actualizado correctamente"}
 
     except HTTPException:
@@ -695,10 +853,8 @@ async def actualizar_estado_alt(request: ActualizarEstadoRequest):
         raise HTTPException(status_code=500, detail="Error interno al actualizar estado")
 
 @router.get("/resumen-general")
-async def obtener_resumen_general(
-    turno: Optional[str] = Query(None),
-    connection: aiomysql.Connection = Depends(get_db_connection)
-):
+@cache_estadisticas.cachear(lambda turno=None: {"desde": FECHA_INICIO_CICLO, "hasta": _hoy_cdmx()})
+async def obtener_resumen_general(turno: Optional[str] = Query(None)):
     try:
         fecha_hora = obtener_fecha_hora_cdmx()
         hoy = fecha_hora['fecha']
@@ -710,30 +866,29 @@ async def obtener_resumen_general(
             hora_inicio_turno = "13:35:00"
             hora_fin_turno = "19:20:00"
 
-        async with connection.cursor(aiomysql.DictCursor) as cursor:
-            # Total alumnos
-            await cursor.execute("SELECT COUNT(*) AS total FROM estudiante WHERE eliminado = 0")
-            total_result = await cursor.fetchone()
-            total_alumnos = total_result['total'] if total_result else 0
+        # Contar ausentes, presentes y justificantes
+        query = """
+            SELECT
+                COUNT(DISTINCT CASE WHEN a.estado = 'ausente' THEN a.id_estudiante END) AS ausentes,
+                COUNT(DISTINCT CASE WHEN a.estado = 'presente' THEN a.id_estudiante END) AS presentes,
+                COUNT(DISTINCT CASE WHEN a.estado = 'justificante' THEN a.id_estudiante END) AS justificantes
+            FROM asistencia a
+            JOIN estudiante e ON e.id_estudiante = a.id_estudiante
+            JOIN clase c ON a.id_clase = c.id_clase
+            JOIN horario_clase hc ON hc.id_clase = c.id_clase
+            WHERE a.fecha BETWEEN %s AND %s
+              AND hc.hora_inicio >= %s
+              AND hc.hora_inicio <= %s
+              AND LOWER(hc.dia) = %s
+              AND e.eliminado = 0 AND c.eliminado = 0 AND hc.eliminado = 0
+        """
 
-            # Contar ausentes, presentes y justificantes
-            query = """
-                SELECT
-                    COUNT(DISTINCT CASE WHEN a.estado = 'ausente' THEN a.id_estudiante END) AS ausentes,
-                    COUNT(DISTINCT CASE WHEN a.estado = 'presente' THEN a.id_estudiante END) AS presentes,
-                    COUNT(DISTINCT CASE WHEN a.estado = 'justificante' THEN a.id_estudiante END) AS justificantes
-                FROM asistencia a
-                JOIN estudiante e ON e.id_estudiante = a.id_estudiante
-                JOIN clase c ON a.id_clase = c.id_clase
-                JOIN horario_clase hc ON hc.id_clase = c.id_clase
-                WHERE a.fecha BETWEEN %s AND %s
-                  AND hc.hora_inicio >= %s
-                  AND hc.hora_inicio <= %s
-                  AND LOWER(hc.dia) = %s
-                  AND e.eliminado = 0 AND c.eliminado = 0 AND hc.eliminado = 0
-            """
-            await cursor.execute(query, (FECHA_INICIO_CICLO, hoy, hora_inicio_turno, hora_fin_turno, dia.lower()))
-            result = await cursor.fetchone()
+        # Total alumnos y conteos, en paralelo
+        total_result, result = await gather_queries(
+            fetch_one("SELECT COUNT(*) AS total FROM estudiante WHERE eliminado = 0"),
+            fetch_one(query, (FECHA_INICIO_CICLO, hoy, hora_inicio_turno, hora_fin_turno, dia.lower())),
+        )
+        total_alumnos = total_result['total'] if total_result else 0
 
         ausentes_num = int(result['ausentes']) if result and result['ausentes'] else 0
         presentes_num = int(result['presentes']) if result and result['presentes'] else 0
@@ -804,10 +959,8 @@ async def obtener_lista_alumnos(
         raise HTTPException(status_code=500, detail="Error al obtener lista de alumnos")
     
 @router.get("/excel-general")
-async def generar_excel_general(
-    turno: Optional[str] = Query(None),
-    connection: aiomysql.Connection = Depends(get_db_connection)
-):
+@metricas_app.medir_reporte("asistencias_general")
+async def generar_excel_general(turno: Optional[str] = Query(None)):
     """Generar Excel con resumen general acumulado"""
     try:
         fecha_hora = obtener_fecha_hora_cdmx()
@@ -821,74 +974,43 @@ async def generar_excel_general(
             hora_inicio_turno = "13:35:00"
             hora_fin_turno = "19:20:00"
         
-        async with connection.cursor(aiomysql.DictCursor) as cursor:
-            await cursor.execute("""
-                SELECT
-                    e.nombre,
-                    e.apellido,
-                    e.matricula,
-                    g.nombre AS grupo,
-                    SUM(CASE WHEN a.estado = 'presente' THEN 1 ELSE 0 END) AS presentes,
-                    SUM(CASE WHEN a.estado = 'ausente' THEN 1 ELSE 0 END) AS ausentes,
-                    SUM(CASE WHEN a.estado = 'justificante' THEN 1 ELSE 0 END) AS justificantes
-                FROM asistencia a
-                JOIN estudiante e ON e.id_estudiante = a.id_estudiante
-                JOIN grupo g ON g.id_grupo = e.id_grupo
-                JOIN clase c ON a.id_clase = c.id_clase
-                JOIN horario_clase hc ON hc.id_clase = c.id_clase
-                WHERE a.fecha BETWEEN %s AND %s
-                    AND LOWER(hc.dia) = %s
-                    AND hc.hora_inicio >= %s
-                    AND hc.hora_inicio <= %s
-                    AND e.eliminado = 0 AND g.eliminado = 0
-                    AND c.eliminado = 0 AND hc.eliminado = 0
-                GROUP BY e.nombre, e.apellido, e.matricula, g.nombre
-                ORDER BY e.apellido, e.nombre
-            """, (FECHA_INICIO_CICLO, hoy, dia_semana_texto, hora_inicio_turno, hora_fin_turno))
-            
-            result = await cursor.fetchall()
-        
-        # Crear workbook
-        workbook = openpyxl.Workbook()
-        worksheet = workbook.active
-        worksheet.title = "Asistencia General"
+        # Hoja write-only con anchos fijos
+        reporte = ReporteExcel()
+        hoja = reporte.hoja("Asistencia General", [20, 20, 15, 10, 12, 12, 15])
         
         # Definir encabezados
         encabezados = ["Nombre", "Apellido", "Matrícula", "Grupo", "Presentes", "Ausentes", "Justificantes"]
-        worksheet.append(encabezados)
-        
-        # Agregar datos
-        for row in result:
-            worksheet.append([
-                row['nombre'],
-                row['apellido'],
-                row['matricula'],
-                row['grupo'],
-                row['presentes'],
-                row['ausentes'],
-                row['justificantes']
-            ])
-        
-        # Aplicar formato a encabezados
-        for cell in worksheet[1]:
-            cell.font = Font(bold=True)
-        
-        # Ajustar ancho de columnas
-        column_widths = [20, 20, 15, 10, 12, 12, 15]
-        for i, width in enumerate(column_widths, 1):
-            col_letter = openpyxl.utils.get_column_letter(i)
-            worksheet.column_dimensions[col_letter].width = width
+        hoja.encabezado(encabezados, "negrita")
         
-        # Guardar en memoria
-        output = BytesIO()
-        workbook.save(output)
-        output.seek(0)
+        # Agregar datos conforme llegan los lotes (tuplas en el orden de los encabezados)
+        async for lote in stream_rows("""
+            SELECT
+                e.nombre,
+                e.apellido,
+                e.matricula,
+                g.nombre AS grupo,
+                SUM(CASE WHEN a.estado = 'presente' THEN 1 ELSE 0 END) AS presentes,
+                SUM(CASE WHEN a.estado = 'ausente' THEN 1 ELSE 0 END) AS ausentes,
+                SUM(CASE WHEN a.estado = 'justificante' THEN 1 ELSE 0 END) AS justificantes
+            FROM asistencia a
+            JOIN estudiante e ON e.id_estudiante = a.id_estudiante
+            JOIN grupo g ON g.id_grupo = e.id_grupo
+            JOIN clase c ON a.id_clase = c.id_clase
+            JOIN horario_clase hc ON hc.id_clase = c.id_clase
+            WHERE a.fecha BETWEEN %s AND %s
+                AND LOWER(hc.dia) = %s
+                AND hc.hora_inicio >= %s
+                AND hc.hora_inicio <= %s
+                AND e.eliminado = 0 AND g.eliminado = 0
+                AND c.eliminado = 0 AND hc.eliminado = 0
+            GROUP BY e.nombre, e.apellido, e.matricula, g.nombre
+            ORDER BY e.apellido, e.nombre
+        """, (FECHA_INICIO_CICLO, hoy, dia_semana_texto, hora_inicio_turno, hora_fin_turno), dict_rows=False):
+            for row in lote:
+                hoja.fila(row)
         
-        return Response(
-            content=output.getvalue(),
-            media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={'Content-Disposition': f'attachment; filename=asistencia_{turno}.xlsx'}
-        )
+        # Guardar y mandar el archivo en trozos
+        return respuesta_excel(None, f'asistencia_{turno}.xlsx', reporte)
         
     except Exception as error:
         logger.error(f"❌ Error en excel-general: {error}")
@@ -928,6 +1050,8 @@ async def inicializar_asistencias(id_clase: int):
             est["id_estudiante"], id_clase, hoy, "ausente",
             est["id_estudiante"], id_clase, hoy
         ))
+    if estudiantes:
+        resumen_asistencia.marcar(id_clase, hoy)
 
 # ✅ Endpoint: /api/asistencia/clase/{id_clase}
 @router.get("/clase/{id_clase}")
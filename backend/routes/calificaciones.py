@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel
-from config.db import fetch_one, fetch_all
+from config.db import fetch_one, fetch_all, gather_queries
 from typing import List, Optional
 import logging
 import math
@@ -215,27 +215,16 @@ async def obtener_calificaciones_clase(id_clase: int):
             FROM clase c
             WHERE c.id_clase = %s AND c.eliminado = 0
         """
-        clase = await fetch_one(query_clase, (id_clase,))
-        
-        if not clase:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Clase con ID {id_clase} no encontrada"
-            )
         
-        # Obtener estudiantes del grupo
+        # Obtener estudiantes del grupo (por id_clase, para no esperar a la clase)
         query_estudiantes = """
             SELECT e.id_estudiante, e.matricula,
                    CONCAT(e.nombre, ' ', e.apellido) as nombre_completo
             FROM estudiante e
-            WHERE e.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
+            JOIN clase c ON e.id_grupo = c.id_grupo
+            WHERE c.id_clase = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
             ORDER BY e.no_lista, e.apellido, e.nombre
         """
-        estudiantes = await fetch_all(query_estudiantes, (clase['id_grupo'],))
-        
-        if not estudiantes:
-            logger.info(f"No hay estudiantes en el grupo de la clase {id_clase}")
-            return []
         
         # 🔥 CORREGIDO: Usar %% para escapar el % en DATE_FORMAT
         query_calificaciones = """
@@ -247,7 +236,23 @@ async def obtener_calificaciones_clase(id_clase: int):
             FROM calificacion_parcial
             WHERE id_clase = %s
         """
-        calificaciones = await fetch_all(query_calificaciones, (id_clase,))
+
+        # Las tres consultas son independientes: van en paralelo
+        clase, estudiantes, calificaciones = await gather_queries(
+            fetch_one(query_clase, (id_clase,)),
+            fetch_all(query_estudiantes, (id_clase,)),
+            fetch_all(query_calificaciones, (id_clase,)),
+        )
+        
+        if not clase:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Clase con ID {id_clase} no encontrada"
+            )
+        
+        if not estudiantes:
+            logger.info(f"No hay estudiantes en el grupo de la clase {id_clase}")
+            return []
         
         # 🔥 MANEJO DE TABLA VACÍA
         if not calificaciones:
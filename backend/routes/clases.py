@@ -4,7 +4,7 @@ from utils.fecha import obtener_fecha_hora_cdmx
 from config.db import fetch_all, fetch_one
 from datetime import datetime, timedelta
 from routes.ws_manager import manager
-import asyncio
+from routes.ws_conexion import escuchar
 from pydantic import BaseModel   # ✅ <--- ESTA LÍNEA ES LA CLAVE
 
 router = APIRouter()
@@ -71,23 +71,27 @@ async def obtener_clases_hoy(turno: Optional[str] = None):
                 g.id_grupo,
                 hc.hora_inicio,
                 hc.hora_fin,
-                COUNT(DISTINCT e.id_estudiante) AS total_estudiantes,
-                COALESCE(SUM(CASE WHEN a.estado = 'presente' THEN 1 ELSE 0 END), 0) AS presentes,
-                COALESCE(SUM(CASE WHEN a.estado = 'justificante' THEN 1 ELSE 0 END), 0) AS justificantes,
-                COUNT(DISTINCT e.id_estudiante) - 
-                COALESCE(SUM(CASE WHEN a.estado IN ('presente','justificante') THEN 1 ELSE 0 END), 0) AS ausentes
+                t.total AS total_estudiantes,
+                COALESCE(r.presentes, 0) AS presentes,
+                COALESCE(r.justificantes, 0) AS justificantes,
+                t.total - COALESCE(r.presentes, 0) - COALESCE(r.justificantes, 0) AS ausentes
             FROM horario_clase hc
             JOIN clase c ON hc.id_clase = c.id_clase
             JOIN grupo g ON c.id_grupo = g.id_grupo
             JOIN materia m ON c.id_materia = m.id_materia
-            JOIN estudiante e ON e.id_grupo = g.id_grupo AND e.estado_actual = 'activo' AND e.eliminado = 0
-            LEFT JOIN asistencia a 
-                ON a.id_clase = c.id_clase AND a.id_estudiante = e.id_estudiante AND a.fecha = %s
+            JOIN (
+                SELECT id_grupo, COUNT(*) AS total
+                FROM estudiante
+                WHERE estado_actual = 'activo' AND eliminado = 0
+                GROUP BY id_grupo
+            ) t ON t.id_grupo = g.id_grupo
+            -- Conteos de hoy del resumen diario (utils/resumen_asistencia.py)
+            LEFT JOIN resumen_asistencia_clase r
+                ON r.id_clase = c.id_clase AND r.fecha = %s
             WHERE hc.dia = %s
               AND hc.hora_inicio < %s
               AND hc.hora_fin   > %s
               AND hc.eliminado = 0 AND c.eliminado = 0 AND g.eliminado = 0
-            GROUP BY c.id_clase, m.nombre, c.nrc, g.nombre, g.id_grupo, hc.hora_inicio, hc.hora_fin
             ORDER BY hc.hora_inicio ASC
         """
         result = await fetch_all(query, (fecha_hoy, dia_semana, hora_fin_turno, hora_inicio_turno))
@@ -426,13 +430,16 @@ async def clases_por_grupo(grupo: str = Query(...)):
 async def websocket_endpoint(websocket: WebSocket):
     """
     WebSocket que envía actualizaciones de asistencia en tiempo real.
+
+    Espera lo que mande el cliente (ping) sin timers: el cierre se detecta
+    en cuanto llega (ver routes/ws_conexion.py).
     """
-    await manager.connect(websocket)
+    conexion = await manager.connect(websocket)
     try:
-        while True:
-            # Solo mantén la conexión viva, sin bloquear
-            await asyncio.sleep(1)  # ✅ Evita CPU al 100%
+        await escuchar(websocket, conexion)
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 # Schema de respuesta
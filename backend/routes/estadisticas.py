@@ -4,7 +4,11 @@ import aiomysql
 from pydantic import BaseModel
 from datetime import date
 from utils.fecha import obtener_fecha_hora_cdmx, convertir_fecha_a_cdmx, obtener_fecha_hora_cdmx_completa
-from config.db import fetch_one, fetch_all, execute_query
+from config.db import fetch_one, fetch_all, execute_query, gather_queries
+from utils.resumen_asistencia import resumen_asistencia
+from utils.estadisticas_grupo import CONSULTA_DETALLE_GRUPO, derivar_detalle
+from utils.cache_estadisticas import cache_estadisticas
+from utils.analitica_calificaciones import FILTRO_CLASE, FILTRO_PROFESOR, cargar_calificaciones, resumir
 import logging
 
 
@@ -12,34 +16,62 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def construir_condicion_fecha(fecha_inicio: Optional[str], fecha_fin: Optional[str]):
+def construir_condicion_fecha(fecha_inicio: Optional[str], fecha_fin: Optional[str], columna: str = "a.fecha"):
     condicion = ""
     if fecha_inicio and fecha_fin:
-        condicion = f"AND a.fecha BETWEEN '{fecha_inicio}' AND '{fecha_fin}'"
+        condicion = f"AND {columna} BETWEEN '{fecha_inicio}' AND '{fecha_fin}'"
     elif fecha_inicio:
-        condicion = f"AND a.fecha >= '{fecha_inicio}'"
+        condicion = f"AND {columna} >= '{fecha_inicio}'"
     elif fecha_fin:
-        condicion = f"AND a.fecha <= '{fecha_fin}'"
+        condicion = f"AND {columna} <= '{fecha_fin}'"
     return condicion
 
+# Las estadísticas de asistencia leen el resumen diario (una fila por clase
+# o por alumno y día, ver utils/resumen_asistencia.py), ya filtrado a
+# alumnos activos y clases no eliminadas.
+TOTAL_RESUMEN = "(r.presentes + r.ausentes + r.justificantes)"
+
+
+@router.get("/resumen/metricas")
+async def metricas_resumen():
+    """Días pendientes, recálculos y última reconciliación del resumen diario"""
+    return resumen_asistencia.obtener_metricas()
+
+
+@router.post("/resumen/reconciliar")
+async def reconciliar_resumen():
+    """Adelanta la reconciliación completa del resumen diario"""
+    resumen_asistencia.reconciliar()
+    return {"message": "Reconciliación programada"}
+
+
+@router.get("/cache/metricas")
+async def metricas_cache():
+    """Aciertos, fallos, cálculos compartidos e invalidaciones de la caché de estadísticas"""
+    return cache_estadisticas.obtener_metricas()
+
+
+def _alcance_grupo(id_grupo: int, fechaInicio: Optional[str] = None, fechaFin: Optional[str] = None):
+    return {"grupo": id_grupo, "desde": convertir_fecha_a_cdmx(fechaInicio), "hasta": convertir_fecha_a_cdmx(fechaFin)}
+
+
 # Estadísticas generales por grupo
 @router.get("/grupo/{id_grupo}")
+@cache_estadisticas.cachear(_alcance_grupo)
 async def estadisticas_grupo(id_grupo: int, fechaInicio: Optional[str] = None, fechaFin: Optional[str] = None):
     fecha_inicio = convertir_fecha_a_cdmx(fechaInicio) if fechaInicio else None
     fecha_fin = convertir_fecha_a_cdmx(fechaFin) if fechaFin else None
-    condicion_fecha = construir_condicion_fecha(fecha_inicio, fecha_fin)
+    condicion_fecha = construir_condicion_fecha(fecha_inicio, fecha_fin, "r.fecha")
 
     query = f"""
         SELECT
-            SUM(CASE WHEN a.estado = 'presente' THEN 1 ELSE 0 END) AS presentes,
-            SUM(CASE WHEN a.estado = 'justificante' THEN 1 ELSE 0 END) AS justificantes,
-            SUM(CASE WHEN a.estado = 'ausente' THEN 1 ELSE 0 END) AS ausentes,
-            COUNT(*) AS total_registros,
-            ROUND(SUM(CASE WHEN a.estado IN ('presente', 'justificante') THEN 1 ELSE 0 END) / COUNT(*) * 100, 2) AS porcentaje_asistencia
-        FROM asistencia a
-        JOIN estudiante e ON a.id_estudiante = e.id_estudiante
-        JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
-        WHERE c.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
+            SUM(r.presentes) AS presentes,
+            SUM(r.justificantes) AS justificantes,
+            SUM(r.ausentes) AS ausentes,
+            CAST(COALESCE(SUM({TOTAL_RESUMEN}), 0) AS UNSIGNED) AS total_registros,
+            ROUND(SUM(r.presentes + r.justificantes) / SUM({TOTAL_RESUMEN}) * 100, 2) AS porcentaje_asistencia
+        FROM resumen_asistencia_clase r
+        WHERE r.id_grupo = %s
         {condicion_fecha}
     """
     try:
@@ -57,26 +89,26 @@ async def estadisticas_grupo(id_grupo: int, fechaInicio: Optional[str] = None, f
 
 # Detalle por materias dentro del grupo
 @router.get("/grupo/{id_grupo}/materias")
+@cache_estadisticas.cachear(_alcance_grupo)
 async def estadisticas_grupo_materias(id_grupo: int, fechaInicio: Optional[str] = None, fechaFin: Optional[str] = None):
     fecha_inicio = convertir_fecha_a_cdmx(fechaInicio) if fechaInicio else None
     fecha_fin = convertir_fecha_a_cdmx(fechaFin) if fechaFin else None
-    condicion_fecha = construir_condicion_fecha(fecha_inicio, fecha_fin)
+    condicion_fecha = construir_condicion_fecha(fecha_inicio, fecha_fin, "r.fecha")
 
     query = f"""
         SELECT
             m.nombre AS materia,
-            SUM(CASE WHEN a.estado = 'presente' THEN 1 ELSE 0 END) AS presentes,
-            SUM(CASE WHEN a.estado = 'justificante' THEN 1 ELSE 0 END) AS justificantes,
-            SUM(CASE WHEN a.estado = 'ausente' THEN 1 ELSE 0 END) AS ausentes,
-            COUNT(*) AS total_registros,
-            ROUND(SUM(CASE WHEN a.estado IN ('presente', 'justificante') THEN 1 ELSE 0 END) / COUNT(*) * 100, 2) AS porcentaje_asistencia
-        FROM asistencia a
-        JOIN estudiante e ON a.id_estudiante = e.id_estudiante
-        JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
-        JOIN materia m ON c.id_materia = m.id_materia
-        WHERE c.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
+            SUM(r.presentes) AS presentes,
+            SUM(r.justificantes) AS justificantes,
+            SUM(r.ausentes) AS ausentes,
+            CAST(SUM({TOTAL_RESUMEN}) AS UNSIGNED) AS total_registros,
+            ROUND(SUM(r.presentes + r.justificantes) / SUM({TOTAL_RESUMEN}) * 100, 2) AS porcentaje_asistencia
+        FROM resumen_asistencia_clase r
+        JOIN materia m ON r.id_materia = m.id_materia
+        WHERE r.id_grupo = %s
         {condicion_fecha}
         GROUP BY m.id_materia, m.nombre
+        HAVING total_registros > 0
         ORDER BY m.nombre
     """
     try:
@@ -89,31 +121,37 @@ async def estadisticas_grupo_materias(id_grupo: int, fechaInicio: Optional[str]
 
 # Tendencia de asistencias por fecha
 @router.get("/tendencia")
+@cache_estadisticas.cachear(lambda id_grupo, id_clase=None: {"grupo": id_grupo, "clase": id_clase})
 async def tendencia(id_grupo: int = Query(...), id_clase: Optional[int] = Query(None)):
     params = [id_grupo]
     filtro_clase = ""
     if id_clase:
-        filtro_clase = "AND a.id_clase = %s"
+        filtro_clase = "AND r.id_clase = %s"
         params.append(id_clase)
 
     query = f"""
-        SELECT a.fecha, a.estado, COUNT(*) AS cantidad
-        FROM asistencia a
-        JOIN estudiante e ON a.id_estudiante = e.id_estudiante
-        JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
-        WHERE c.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
+        SELECT r.fecha,
+               SUM(r.presentes) AS presente,
+               SUM(r.ausentes) AS ausente,
+               SUM(r.justificantes) AS justificante
+        FROM resumen_asistencia_clase r
+        WHERE r.id_grupo = %s
         {filtro_clase}
-        GROUP BY a.fecha, a.estado
-        ORDER BY a.fecha ASC
+        GROUP BY r.fecha
+        HAVING SUM({TOTAL_RESUMEN}) > 0
+        ORDER BY r.fecha ASC
     """
     try:
         rows = await fetch_all(query, params)
         datos_por_fecha = {}
         for row in rows:
             fecha = convertir_fecha_a_cdmx(row["fecha"].strftime("%Y-%m-%d"))
-            if fecha not in datos_por_fecha:
-                datos_por_fecha[fecha] = {"fecha": fecha, "presente": 0, "ausente": 0, "justificante": 0}
-            datos_por_fecha[fecha][row["estado"]] = int(row["cantidad"])
+            datos_por_fecha[fecha] = {
+                "fecha": fecha,
+                "presente": int(row["presente"]),
+                "ausente": int(row["ausente"]),
+                "justificante": int(row["justificante"]),
+            }
         return list(datos_por_fecha.values())
     except Exception as e:
         print("Error en /tendencia:", e)
@@ -122,124 +160,13 @@ async def tendencia(id_grupo: int = Query(...), id_clase: Optional[int] = Query(
 
 # Detalle completo de un grupo
 @router.get("/detalle-grupo/{id_grupo}")
+@cache_estadisticas.cachear(lambda id_grupo: {"grupo": id_grupo})
 async def detalle_grupo(id_grupo: int):
     try:
-        top_faltas_query = """
-            SELECT CONCAT(e.nombre, ' ', e.apellido) AS nombre,
-                   COUNT(*) AS faltas
-            FROM asistencia a
-            JOIN estudiante e ON a.id_estudiante = e.id_estudiante
-            JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
-            WHERE a.estado = 'ausente' AND c.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
-            GROUP BY e.id_estudiante, e.nombre, e.apellido
-            ORDER BY faltas DESC
-            LIMIT 5
-        """
-        top_faltas = await fetch_all(top_faltas_query, (id_grupo,))
-
-        top_asistencias_query = """
-            SELECT CONCAT(e.nombre, ' ', e.apellido) AS nombre,
-                   COUNT(*) AS asistencias
-            FROM asistencia a
-            JOIN estudiante e ON a.id_estudiante = e.id_estudiante
-            JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
-            WHERE a.estado = 'presente' AND c.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
-            GROUP BY e.id_estudiante, e.nombre, e.apellido
-            ORDER BY asistencias DESC
-            LIMIT 5
-        """
-        top_asistencias = await fetch_all(top_asistencias_query, (id_grupo,))
-
-        top_justificantes_query = """
-            SELECT CONCAT(e.nombre, ' ', e.apellido) AS nombre,
-                   COUNT(*) AS justificantes
-            FROM asistencia a
-            JOIN estudiante e ON a.id_estudiante = e.id_estudiante
-            JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
-            WHERE a.estado = 'justificante' AND c.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
-            GROUP BY e.id_estudiante, e.nombre, e.apellido
-            ORDER BY justificantes DESC
-            LIMIT 5
-        """
-        top_justificantes = await fetch_all(top_justificantes_query, (id_grupo,))
-
-        ranking_query = """
-            SELECT e.id_estudiante AS id,
-                   CONCAT(e.nombre, ' ', e.apellido) AS nombre,
-                   SUM(CASE WHEN a.estado='presente' THEN 1 ELSE 0 END) AS asistencias,
-                   SUM(CASE WHEN a.estado='ausente' THEN 1 ELSE 0 END) AS faltas,
-                   SUM(CASE WHEN a.estado='justificante' THEN 1 ELSE 0 END) AS justificantes,
-                   ROUND(SUM(CASE WHEN a.estado='presente' THEN 1 ELSE 0 END)/COUNT(*)*100,1) AS asistencia_porcentaje,
-                   ROUND(SUM(CASE WHEN a.estado='ausente' THEN 1 ELSE 0 END)/COUNT(*)*100,1) AS faltas_porcentaje,
-                   ROUND(SUM(CASE WHEN a.estado='justificante' THEN 1 ELSE 0 END)/COUNT(*)*100,1) AS justificantes_porcentaje
-            FROM asistencia a
-            JOIN estudiante e ON a.id_estudiante = e.id_estudiante
-            JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
-            WHERE c.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
-            GROUP BY e.id_estudiante, e.nombre, e.apellido
-            ORDER BY asistencia_porcentaje DESC
-        """
-        ranking = await fetch_all(ranking_query, (id_grupo,))
-
-        materia_mas_faltada_query = """
-            SELECT m.nombre, COUNT(*) AS total
-            FROM asistencia a
-            JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
-            JOIN materia m ON c.id_materia = m.id_materia
-            JOIN estudiante e ON a.id_estudiante = e.id_estudiante
-            WHERE a.estado='ausente' AND c.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
-            GROUP BY m.id_materia, m.nombre
-            ORDER BY total DESC
-            LIMIT 2
-        """
-        materia_mas_faltada = await fetch_all(materia_mas_faltada_query, (id_grupo,))
-
-        materia_mas_asistida_query = """
-            SELECT m.nombre
-            FROM asistencia a
-            JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
-            JOIN materia m ON c.id_materia = m.id_materia
-            JOIN estudiante e ON a.id_estudiante = e.id_estudiante
-            WHERE a.estado='presente' AND c.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
-            GROUP BY m.id_materia, m.nombre
-            ORDER BY COUNT(*) DESC
-            LIMIT 1
-        """
-        materia_mas_asistida = await fetch_all(materia_mas_asistida_query, (id_grupo,))
-
-        asistencia_perfecta_query = """
-            SELECT CONCAT(e.nombre, ' ', e.apellido) AS nombre
-            FROM estudiante e
-            WHERE e.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0 AND NOT EXISTS (
-                SELECT 1 FROM asistencia a
-                JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
-                WHERE a.id_estudiante = e.id_estudiante AND a.estado = 'ausente' AND c.id_grupo = %s
-            )
-        """
-        asistencia_perfecta = await fetch_all(asistencia_perfecta_query, (id_grupo, id_grupo))
-
-        promedios_query = """
-            SELECT
-                ROUND(AVG(CASE WHEN a.estado='presente' THEN 1 ELSE 0 END)*100,1) AS asistencia,
-                ROUND(AVG(CASE WHEN a.estado='ausente' THEN 1 ELSE 0 END)*100,1) AS faltas,
-                ROUND(AVG(CASE WHEN a.estado='justificante' THEN 1 ELSE 0 END)*100,1) AS justificantes
-            FROM asistencia a
-            JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
-            JOIN estudiante e ON a.id_estudiante = e.id_estudiante
-            WHERE c.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
-        """
-        promedios = await fetch_one(promedios_query, (id_grupo,))
-
-        return {
-            "topFaltas": top_faltas,
-            "topAsistencias": top_asistencias,
-            "topJustificantes": top_justificantes,
-            "ranking": ranking,
-            "materiaMasFaltada": [r["nombre"] for r in materia_mas_faltada],
-            "materiaMasAsistida": materia_mas_asistida[0]["nombre"] if materia_mas_asistida else None,
-            "asistenciaPerfecta": [r["nombre"] for r in asistencia_perfecta],
-            "promedios": promedios if promedios else {"asistencia": 0, "faltas": 0, "justificantes": 0}
-        }
+        # Una consulta (alumnos, materias y lista del grupo); las vistas se
+        # arman en utils/estadisticas_grupo.py
+        filas = await fetch_all(CONSULTA_DETALLE_GRUPO, (id_grupo, id_grupo, id_grupo))
+        return derivar_detalle(filas)
     except Exception as e:
         print("Error en /detalle-grupo/:", e)
         raise HTTPException(status_code=500, detail="Error al obtener estadísticas del grupo")
@@ -293,6 +220,7 @@ async def progreso_materias(id_alumno: int):
 
 # Resumen de clase para docente
 @router.get("/estadisticas-asistencias/{id_clase}")
+@cache_estadisticas.cachear(lambda id_clase: {"clase": id_clase})
 async def resumen_clase(id_clase: int):
     try:
         fecha_actual = obtener_fecha_hora_cdmx()["fecha"]
@@ -304,15 +232,6 @@ async def resumen_clase(id_clase: int):
             WHERE id_clase = %s AND fecha = %s
             GROUP BY estado
         """
-        rows_hoy = await fetch_all(query_hoy, (id_clase, fecha_actual))
-        hoy = {"presentes": 0, "ausentes": 0, "justificantes": 0}
-        for row in rows_hoy:
-            if row["estado"] == "presente":
-                hoy["presentes"] = int(row["cantidad"])
-            elif row["estado"] == "ausente":
-                hoy["ausentes"] = int(row["cantidad"])
-            elif row["estado"] == "justificante":
-                hoy["justificantes"] = int(row["cantidad"])
 
         # Resumen histórico
         query_hist = """
@@ -321,18 +240,6 @@ async def resumen_clase(id_clase: int):
             WHERE id_clase = %s
             GROUP BY estado
         """
-        rows_hist = await fetch_all(query_hist, (id_clase,))
-        historial = {"presentes": 0, "ausentes": 0, "justificantes": 0}
-        for row in rows_hist:
-            if row["estado"] == "presente":
-                historial["presentes"] = int(row["cantidad"])
-            elif row["estado"] == "ausente":
-                historial["ausentes"] = int(row["cantidad"])
-            elif row["estado"] == "justificante":
-                historial["justificantes"] = int(row["cantidad"])
-
-        total_registros = historial["presentes"] + historial["ausentes"] + historial["justificantes"]
-        porcentaje_asistencia = round(((historial["presentes"] + historial["justificantes"]) / total_registros) * 100) if total_registros > 0 else 0
 
         # Estudiantes únicos
         query_estudiantes = """
@@ -341,8 +248,6 @@ async def resumen_clase(id_clase: int):
             JOIN clase c ON e.id_grupo = c.id_grupo AND c.eliminado = 0
             WHERE c.id_clase = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
         """
-        res_estudiantes = await fetch_one(query_estudiantes, (id_clase,))
-        total_estudiantes = int(res_estudiantes["total_estudiantes"]) if res_estudiantes else 0
 
         # Ranking
         def ranking_query(estado):
@@ -356,9 +261,38 @@ async def resumen_clase(id_clase: int):
                 LIMIT 3
             """
 
-        mas_asisten = await fetch_all(ranking_query("presente"), (id_clase,))
-        mas_faltan = await fetch_all(ranking_query("ausente"), (id_clase,))
-        mas_justifican = await fetch_all(ranking_query("justificante"), (id_clase,))
+        # Las seis consultas son independientes: van en paralelo
+        rows_hoy, rows_hist, res_estudiantes, mas_asisten, mas_faltan, mas_justifican = await gather_queries(
+            fetch_all(query_hoy, (id_clase, fecha_actual)),
+            fetch_all(query_hist, (id_clase,)),
+            fetch_one(query_estudiantes, (id_clase,)),
+            fetch_all(ranking_query("presente"), (id_clase,)),
+            fetch_all(ranking_query("ausente"), (id_clase,)),
+            fetch_all(ranking_query("justificante"), (id_clase,)),
+        )
+
+        hoy = {"presentes": 0, "ausentes": 0, "justificantes": 0}
+        for row in rows_hoy:
+            if row["estado"] == "presente":
+                hoy["presentes"] = int(row["cantidad"])
+            elif row["estado"] == "ausente":
+                hoy["ausentes"] = int(row["cantidad"])
+            elif row["estado"] == "justificante":
+                hoy["justificantes"] = int(row["cantidad"])
+
+        historial = {"presentes": 0, "ausentes": 0, "justificantes": 0}
+        for row in rows_hist:
+            if row["estado"] == "presente":
+                historial["presentes"] = int(row["cantidad"])
+            elif row["estado"] == "ausente":
+                historial["ausentes"] = int(row["cantidad"])
+            elif row["estado"] == "justificante":
+                historial["justificantes"] = int(row["cantidad"])
+
+        total_registros = historial["presentes"] + historial["ausentes"] + historial["justificantes"]
+        porcentaje_asistencia = round(((historial["presentes"] + historial["justificantes"]) / total_registros) * 100) if total_registros > 0 else 0
+
+        total_estudiantes = int(res_estudiantes["total_estudiantes"]) if res_estudiantes else 0
 
         return {
             "hoy": hoy,
@@ -384,100 +318,34 @@ async def resumen_clase(id_clase: int):
 async def resumen_clase(id_clase: int):
     """
     Devuelve un resumen analítico de actividades de una clase
-    en formato estructurado.
-    """
-    # 🔹 Totales de actividades
-    query_totales = """
-        SELECT COUNT(*) AS total_actividades, MAX(valor_maximo) AS max_valor
-        FROM actividad
-        WHERE id_clase=%s
-    """
-    totales = await fetch_one(query_totales, (id_clase,))
-    if not totales:
-        raise HTTPException(status_code=404, detail="Clase no encontrada")
-
-    # 🔹 Estado de entregas
-    query_entregas = """
-        SELECT ae.estado, COUNT(*) AS cantidad
-        FROM actividad_estudiante ae
-        INNER JOIN actividad a ON ae.id_actividad = a.id_actividad
-        WHERE a.id_clase=%s
-        GROUP BY ae.estado
-    """
-    entregas_raw = await fetch_all(query_entregas, (id_clase,))
-    entregas = {row["estado"]: row["cantidad"] for row in entregas_raw}
-
-    # 🔹 Calificaciones
-    query_calif = """
-        SELECT ae.calificacion
-        FROM actividad_estudiante ae
-        INNER JOIN actividad a ON ae.id_actividad = a.id_actividad
-        WHERE a.id_clase=%s AND ae.calificacion IS NOT NULL
+    en formato estructurado (ver utils/analitica_calificaciones.py).
     """
-    calif_rows = await fetch_all(query_calif, (id_clase,))
-    calificaciones = [row["calificacion"] for row in calif_rows]
-
-    if calificaciones:
-        promedio = sum(calificaciones) / len(calificaciones)
-        distribucion = {
-            "0-5": sum(1 for c in calificaciones if c <= 5),
-            "6-7": sum(1 for c in calificaciones if 6 <= c <= 7),
-            "8-10": sum(1 for c in calificaciones if c >= 8)
-        }
-    else:
-        promedio, distribucion = 0, {"0-5": 0, "6-7": 0, "8-10": 0}
-
-    # 🔹 Actividades más y menos entregadas
-    query_entregadas = """
-        SELECT a.titulo, COUNT(*) AS total
-        FROM actividad_estudiante ae
-        INNER JOIN actividad a ON ae.id_actividad = a.id_actividad
-        WHERE a.id_clase=%s AND ae.estado='entregado'
-        GROUP BY a.titulo
-        ORDER BY total DESC
+    datos = await cargar_calificaciones(FILTRO_CLASE, (id_clase,))
+    return {"fecha_consulta": _fecha_legible(), **resumir(datos)}
+
+
+# Resumen de actividades de todas las clases de un profesor
+@router.get("/clases-actividades/profesor/{id_profesor}/resumen")
+async def resumen_profesor(id_profesor: int):
     """
-    entregadas = await fetch_all(query_entregadas, (id_clase,))
-    mas_entregada = entregadas[0]["titulo"] if entregadas else None
-    menos_entregada = entregadas[-1]["titulo"] if entregadas else None
-
-    # 🔹 Actividad con mayor y menor promedio
-    query_promedios = """
-        SELECT a.titulo, AVG(ae.calificacion) AS promedio
-        FROM actividad_estudiante ae
-        INNER JOIN actividad a ON ae.id_actividad = a.id_actividad
-        WHERE a.id_clase=%s AND ae.calificacion IS NOT NULL
-        GROUP BY a.titulo
-        ORDER BY promedio DESC
+    El mismo resumen para el conjunto de clases del profesor y para
+    cada una, con una sola lectura de sus actividades.
     """
-    promedios = await fetch_all(query_promedios, (id_clase,))
-    mayor_promedio = promedios[0]["titulo"] if promedios else None
-    menor_promedio = promedios[-1]["titulo"] if promedios else None
-    fecha_info = obtener_fecha_hora_cdmx()
-    fecha_legible = f"{fecha_info['dia']}, {fecha_info['fecha'].strftime('%d/%m/%Y')} {fecha_info['hora']}"
-
+    datos = await cargar_calificaciones(FILTRO_PROFESOR, (id_profesor,))
     return {
-        "fecha_consulta": fecha_legible,
-        "totales": {
-            "actividades": totales["total_actividades"],
-            "valor_maximo_promedio": totales["max_valor"],
-        },
-        "estado_entregas": {
-            "pendiente": entregas.get("pendiente", 0),
-            "entregado": entregas.get("entregado", 0),
-            "no_entregado": entregas.get("no_entregado", 0),
-        },
-        "calificaciones": {
-            "promedio_general": round(promedio, 2),
-            "distribucion": distribucion,
-        },
-        "mejores_peores": {
-            "mas_entregada": mas_entregada,
-            "menos_entregada": menos_entregada,
-            "mayor_promedio": mayor_promedio,
-            "menor_promedio": menor_promedio,
-        }
+        "fecha_consulta": _fecha_legible(),
+        **resumir(datos),
+        "clases": [
+            {"id_clase": id_clase, **resumir(datos, [id_clase])}
+            for id_clase in dict.fromkeys(datos.clases)
+        ],
     }
 
+
+def _fecha_legible() -> str:
+    fecha_info = obtener_fecha_hora_cdmx()
+    return f"{fecha_info['dia']}, {fecha_info['fecha'].strftime('%d/%m/%Y')} {fecha_info['hora']}"
+
 # ============================================
 # MODELOS PYDANTIC
 # ============================================
@@ -3,6 +3,8 @@ from pydantic import BaseModel
 from typing import Optional
 import aiomysql
 from config.db import fetch_one, fetch_all, execute_query
+from utils.cache_roster import roster_cache
+from utils.resumen_asistencia import resumen_asistencia
 
 router = APIRouter()
 
@@ -88,6 +90,11 @@ async def crear_estudiante(data: EstudianteNuevo):
             raise HTTPException(status_code=400, detail="Grupo no encontrado")
         id_grupo = grupo["id_grupo"]
 
+        # Si ya existe (quizá en la papelera o en otro grupo)
+        previo = await fetch_one(
+            "SELECT id_grupo, eliminado FROM estudiante WHERE matricula = %s", (matricula,)
+        )
+
         # 2. Insertar o actualizar estudiante (usar 0 temporal en no_lista)
         query_insert = """
             INSERT INTO estudiante (matricula, nombre, apellido, correo, id_grupo, estado_actual, foto_url, no_lista)
@@ -119,6 +126,14 @@ async def crear_estudiante(data: EstudianteNuevo):
         """
         await execute_query(query_reordenar, (id_grupo,))
 
+        # El roster del grupo cambió (y el del grupo anterior si se movió)
+        roster_cache.invalidar(id_grupo=id_grupo)
+        if previo and previo["id_grupo"] != id_grupo:
+            roster_cache.invalidar(id_grupo=previo["id_grupo"])
+        # Reactivar o cambiar de grupo cambia las filas que cuenta el resumen diario
+        if previo and (previo["eliminado"] or previo["id_grupo"] != id_grupo):
+            resumen_asistencia.reconciliar()
+
         return {"message": "Estudiante agregado y lista reordenada"}
     except Exception as e:
         print("Error en /nuevo:", e)
@@ -6,6 +6,8 @@ from pydantic import BaseModel
 from typing import List, Optional
 from config.db import fetch_one, fetch_all, execute_query
 from utils.fecha import obtener_fecha_hora_cdmx_completa
+from utils.cache_roster import roster_cache
+from utils.resumen_asistencia import resumen_asistencia
 import logging
 
 router = APIRouter()
@@ -451,6 +453,9 @@ async def editar_estudiante(id_estudiante: int, datos: EstudianteEditar):
     valores.append(id_estudiante)
     query = f"UPDATE estudiante SET {', '.join(campos)} WHERE id_estudiante = %s"
     await execute_query(query, valores)
+    # La matrícula, el nombre o el grupo pudieron cambiar
+    roster_cache.invalidar()
+    resumen_asistencia.reconciliar()
     return {"message": "Estudiante actualizado correctamente", "id_estudiante": id_estudiante}
 
 
@@ -478,6 +483,8 @@ async def eliminar_estudiante(id_estudiante: int):
         """,
         (obtener_fecha_hora_cdmx_completa(), id_estudiante)
     )
+    roster_cache.invalidar()
+    resumen_asistencia.reconciliar()
 
     return {
         "message": "Estudiante enviado a la papelera",
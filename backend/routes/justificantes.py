@@ -5,6 +5,10 @@ from datetime import datetime
 import os
 from config.db import execute_query, fetch_all, fetch_one
 from utils.fecha import convertir_fecha_a_cdmx
+from utils.cache_roster import roster_cache
+from utils.cola_asistencias import cola_asistencias
+from utils.resumen_asistencia import resumen_asistencia
+from utils.snapshot_tabla import snapshots_tabla
 
 router = APIRouter()
 
@@ -110,6 +114,9 @@ async def registrar_justificante(
     for clase in clases:
         fecha_clase = clase["fecha"]
 
+        # Un escaneo de esa clase que siga en la cola va antes que el justificante
+        await cola_asistencias.adelantar(id_estudiante, clase["id_clase"], fecha_clase)
+
         asistencia = await fetch_one(
             "SELECT id_asistencia FROM asistencia WHERE id_estudiante=%s AND id_clase=%s AND fecha=%s",
             (id_estudiante, clase["id_clase"], fecha_clase)
@@ -126,4 +133,9 @@ async def registrar_justificante(
                 (id_estudiante, clase["id_clase"], "justificante", fecha_clase)
             )
 
+        # El estado de hoy en memoria ya no coincide con la BD
+        resumen_asistencia.marcar(clase["id_clase"], fecha_clase)
+        roster_cache.invalidar(id_clase=clase["id_clase"])
+        snapshots_tabla.invalidar(clase["id_clase"])
+
     return JSONResponse({"message": "✅ Justificante registrado correctamente y asistencia actualizada"})
\ No newline at end of file
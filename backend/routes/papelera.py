@@ -19,6 +19,8 @@ import logging
 
 from config.db import fetch_one, fetch_all, get_pool
 from utils.fecha import obtener_fecha_hora_cdmx_completa
+from utils.cache_roster import roster_cache
+from utils.resumen_asistencia import resumen_asistencia
 
 logger = logging.getLogger(__name__)
 
@@ -166,6 +168,9 @@ async def eliminar_grupo(id_grupo: int, data: Optional[EliminarRequest] = None):
                 logger.error(f"❌ Error al eliminar grupo {id_grupo}: {e}")
                 raise HTTPException(status_code=500, detail="Error al eliminar el grupo")
 
+    roster_cache.invalidar(id_grupo=id_grupo)
+    resumen_asistencia.reconciliar()
+
     logger.info(
         f"🗑️ Grupo '{grupo['nombre']}' eliminado por {usuario}: "
         f"{alumnos} alumnos, {clases} clases, {horarios} horarios"
@@ -245,6 +250,9 @@ async def _eliminar_estudiantes(ids: List[int], usuario: str, reordenar: bool):
                 logger.error(f"❌ Error al eliminar estudiantes {ids_validos}: {e}")
                 raise HTTPException(status_code=500, detail="Error al eliminar los estudiantes")
 
+    roster_cache.invalidar_grupos(grupos_afectados)
+    resumen_asistencia.reconciliar()
+
     logger.info(f"🗑️ {eliminados} estudiante(s) eliminados por {usuario}")
 
     return {
@@ -331,6 +339,9 @@ async def restaurar_grupo(id_grupo: int):
                 logger.error(f"❌ Error al restaurar grupo {id_grupo}: {e}")
                 raise HTTPException(status_code=500, detail="Error al restaurar el grupo")
 
+    roster_cache.invalidar(id_grupo=id_grupo)
+    resumen_asistencia.reconciliar()
+
     logger.info(f"♻️ Grupo '{grupo['nombre']}' restaurado: {alumnos} alumnos, {clases} clases")
 
     return {
@@ -406,6 +417,9 @@ async def restaurar_estudiantes(data: RestaurarEstudiantesRequest):
                 logger.error(f"❌ Error al restaurar estudiantes {ids_validos}: {e}")
                 raise HTTPException(status_code=500, detail="Error al restaurar los estudiantes")
 
+    roster_cache.invalidar_grupos(grupos_afectados)
+    resumen_asistencia.reconciliar()
+
     logger.info(f"♻️ {restaurados} estudiante(s) restaurados")
 
     return {
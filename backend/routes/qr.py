@@ -1,9 +1,15 @@
 # backend/routes/qr.py
 from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel, validator
-from config.db import fetch_one, fetch_all, execute_query
+from config.db import fetch_one, fetch_all
 from utils.fernet import decrypt_qr, encrypt_qr
 from utils.fecha import obtener_fecha_hora_cdmx
+from utils.cache_roster import roster_cache
+from utils.resumen_asistencia import resumen_asistencia
+from utils.escritura_asistencia import escritura_asistencia
+from utils.cola_asistencias import cola_asistencias
+from utils.metricas_app import metricas_app
+from routes.ws_manager_tabla import tabla_manager
 import aiomysql
 import qrcode
 import base64
@@ -72,6 +78,7 @@ async def registrar_asistencia(req: AsistenciaQRRequest):
         try:
             texto_plano = decrypt_qr(req.qrData)
         except Exception as decrypt_error:
+            metricas_app.contar_qr_fallido("qr_asistencia")
             print(f"Error desencriptando QR: {decrypt_error}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -88,35 +95,6 @@ async def registrar_asistencia(req: AsistenciaQRRequest):
         
         nombre_completo, matricula, grupo_qr, clave_unica = partes
 
-        # Buscar estudiante y validar grupo
-        estudiante = await fetch_one("""
-            SELECT 
-                e.id_estudiante, 
-                e.id_grupo,
-                e.nombre,
-                e.apellido,
-                g.nombre as grupo_nombre
-            FROM estudiante e
-            JOIN grupo g ON e.id_grupo = g.id_grupo
-            WHERE e.matricula = %s AND e.eliminado = 0 AND g.eliminado = 0
-        """, (matricula,))
-        
-        if not estudiante:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Estudiante no encontrado"
-            )
-
-        # Validar que el grupo del QR coincida con el de la BD
-        if grupo_qr.upper() != estudiante['grupo_nombre'].upper():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El grupo en el QR no coincide con el registrado"
-            )
-
-        id_estudiante = estudiante["id_estudiante"]
-        id_grupo = estudiante["id_grupo"]
-
         # Obtener fecha y hora actual
         datos_fecha = obtener_fecha_hora_cdmx()
         fecha = datos_fecha["fecha"]
@@ -140,57 +118,100 @@ async def registrar_asistencia(req: AsistenciaQRRequest):
         else:
             hora_obj = hora
 
-        # Buscar clase activa CORREGIDA
-        clase = await fetch_one("""
-            SELECT 
-                c.id_clase,
-                c.nombre_clase,
-                m.nombre as materia,
-                hc.hora_inicio,
-                hc.hora_fin
-            FROM horario_clase hc
-            JOIN clase c ON hc.id_clase = c.id_clase
-            JOIN materia m ON c.id_materia = m.id_materia
-            WHERE c.id_grupo = %s
-              AND hc.dia = %s
-              AND hc.hora_inicio <= %s
-              AND hc.hora_fin > %s
-              AND c.eliminado = 0 AND hc.eliminado = 0
-            LIMIT 1
-        """, (id_grupo, dia, hora_obj, hora_obj))
-        
-        if not clase:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No hay clase activa para este grupo en este horario"
-            )
-
-        id_clase = clase["id_clase"]
+        # Roster en memoria: alumno, grupo y clase activa sin consultas
+        roster, alumno = None, None
+        encontrado = roster_cache.grupo_de_matricula(matricula)
+        if encontrado:
+            id_clase_activa = roster_cache.clase_activa(encontrado[0].id_grupo, hora_obj)
+            if id_clase_activa:
+                roster, alumno = await roster_cache.buscar_alumno(id_clase_activa, matricula)
 
-        # Verificar si ya existe asistencia para hoy
-        asistencia_existente = await fetch_one("""
-            SELECT id_asistencia, estado 
-            FROM asistencia 
-            WHERE id_estudiante = %s AND id_clase = %s AND fecha = %s
-        """, (id_estudiante, id_clase, fecha))
-
-        if asistencia_existente:
-            # Actualizar estado existente
-            await execute_query("""
-                UPDATE asistencia 
-                SET estado = %s, hora_entrada = %s 
-                WHERE id_asistencia = %s
-            """, (req.estado, hora_obj, asistencia_existente['id_asistencia']))
-            
-            accion = "actualizada"
+        if alumno:
+            if not roster.grupo_coincide(grupo_qr):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="El grupo en el QR no coincide con el registrado"
+                )
+            estudiante = {**alumno, "grupo_nombre": roster.grupo}
+            id_estudiante = alumno["id_estudiante"]
+            clase = {"id_clase": roster.id_clase, "materia": roster.materia}
+            ya_registrada = id_estudiante in roster.estados
         else:
-            # Insertar nueva asistencia
-            await execute_query("""
-                INSERT INTO asistencia (id_estudiante, id_clase, estado, fecha, hora_entrada) 
-                VALUES (%s, %s, %s, %s, %s)
-            """, (id_estudiante, id_clase, req.estado, fecha, hora_obj))
+            # Buscar estudiante y validar grupo
+            estudiante = await fetch_one("""
+                SELECT 
+                    e.id_estudiante, 
+                    e.id_grupo,
+                    e.nombre,
+                    e.apellido,
+                    g.nombre as grupo_nombre
+                FROM estudiante e
+                JOIN grupo g ON e.id_grupo = g.id_grupo
+                WHERE e.matricula = %s AND e.eliminado = 0 AND g.eliminado = 0
+            """, (matricula,))
+            
+            if not estudiante:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Estudiante no encontrado"
+                )
+
+            # Validar que el grupo del QR coincida con el de la BD
+            if grupo_qr.upper() != estudiante['grupo_nombre'].upper():
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="El grupo en el QR no coincide con el registrado"
+                )
+
+            id_estudiante = estudiante["id_estudiante"]
+            id_grupo = estudiante["id_grupo"]
+
+            # Buscar clase activa CORREGIDA
+            clase = await fetch_one("""
+                SELECT 
+                    c.id_clase,
+                    c.nombre_clase,
+                    m.nombre as materia,
+                    hc.hora_inicio,
+                    hc.hora_fin
+                FROM horario_clase hc
+                JOIN clase c ON hc.id_clase = c.id_clase
+                JOIN materia m ON c.id_materia = m.id_materia
+                WHERE c.id_grupo = %s
+                  AND hc.dia = %s
+                  AND hc.hora_inicio <= %s
+                  AND hc.hora_fin > %s
+                  AND c.eliminado = 0 AND hc.eliminado = 0
+                LIMIT 1
+            """, (id_grupo, dia, hora_obj, hora_obj))
             
-            accion = "registrada"
+            if not clase:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="No hay clase activa para este grupo en este horario"
+                )
+
+            # Verificar si ya existe asistencia para hoy
+            asistencia_existente = await fetch_one("""
+                SELECT id_asistencia, estado 
+                FROM asistencia 
+                WHERE id_estudiante = %s AND id_clase = %s AND fecha = %s
+            """, (id_estudiante, clase["id_clase"], fecha))
+            ya_registrada = asistencia_existente is not None
+
+        id_clase = clase["id_clase"]
+
+        # Insertar o actualizar la asistencia de hoy (después de lo que siga en la cola)
+        await cola_asistencias.adelantar(id_estudiante, id_clase, fecha)
+        await escritura_asistencia.guardar([(id_estudiante, id_clase, req.estado, fecha, hora_obj)])
+        resumen_asistencia.marcar(id_clase, fecha)
+        roster_cache.registrar_estado(id_clase, id_estudiante, req.estado)
+        tabla_manager.publicar({
+            "tipo": "asistencia",
+            "data": {"id_estudiante": id_estudiante, "estado": req.estado, "hora": hora_obj.strftime('%H:%M:%S')}
+        }, id_clase=id_clase)
+
+        accion = "actualizada" if ya_registrada else "registrada"
 
         return {
             "success": True,
@@ -338,6 +359,7 @@ async def info_qr(req: QRInfoRequest):
         try:
             texto_plano = decrypt_qr(req.qrData)
         except Exception as decrypt_error:
+            metricas_app.contar_qr_fallido("qr_info")
             print(f"Error desencriptando QR: {decrypt_error}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
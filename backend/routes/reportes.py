@@ -1,23 +1,24 @@
 from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment
+from fastapi.responses import FileResponse
 from datetime import datetime, timedelta
-import io
 from typing import Optional
-from config.db import fetch_all, fetch_one
+from config.db import fetch_all, fetch_one, stream_rows
 from utils.fecha import obtener_fecha_hora_cdmx
+from utils.metricas_app import metricas_app
+from utils.reporte_excel import ReporteExcel, respuesta_excel, estilo_estado, estimar_ancho, MEDIA_TYPE_XLSX
+from utils.hojas_reportes import (
+    escribir_reporte_profesor, escribir_reporte_profesor_completo, escribir_reporte_clase_completo,
+)
+from utils.pivote_asistencias import LETRA_ESTADO, MatrizAsistencia, formato_fecha, pivotar_lotes
+from utils.trabajos_reportes import cola_reportes
+from utils.exportar_datos import respuesta_datos, PATRON_FORMATO
 import traceback
 
 router = APIRouter()
 
-# Colores para estados
-COLOR_PRESENTE = PatternFill(start_color="90EE90", end_color="90EE90", fill_type="solid")
-COLOR_AUSENTE = PatternFill(start_color="FF7F7F", end_color="FF7F7F", fill_type="solid")
-COLOR_JUSTIFICANTE = PatternFill(start_color="FFFF99", end_color="FFFF99", fill_type="solid")
-COLOR_ENTREGADO = PatternFill(start_color="90EE90", end_color="90EE90", fill_type="solid")
-COLOR_PENDIENTE = PatternFill(start_color="FFFF99", end_color="FFFF99", fill_type="solid")
-COLOR_NO_ENTREGADO = PatternFill(start_color="FF7F7F", end_color="FF7F7F", fill_type="solid")
+# Colores y estilos de los estados: ver utils/reporte_excel.py (ESTILOS)
+
+INICIO_CURSO = "2025-08-04"
 
 def generar_rango_fechas(fecha_inicio: str, fecha_fin: str):
     """Genera lista de fechas entre inicio y fin"""
@@ -38,20 +39,58 @@ def limpiar_nombre_hoja(nombre: str, max_length: int = 31) -> str:
         nombre = nombre.replace(char, '_')
     return nombre[:max_length]
 
-def formato_fecha(fecha):
-    """Convierte fecha a string YYYY-MM-DD"""
-    if isinstance(fecha, datetime):
-        return fecha.strftime("%Y-%m-%d")
-    elif isinstance(fecha, str):
-        return fecha
-    return str(fecha)
+# ==================== EXPORTACIÓN CSV / PARQUET ====================
+# Con ?formato=csv|parquet los endpoints mandan los registros sin pivotear
+# (una fila por asistencia o por alumno × actividad), leídos con un cursor
+# del servidor. Ver utils/exportar_datos.py. El default sigue siendo xlsx.
+
+DESCRIPCION_FORMATO = "xlsx (default), csv o parquet"
+
+SQL_EXPORTAR_ASISTENCIAS = """
+    SELECT
+        c.id_clase, m.nombre AS materia, g.nombre AS grupo,
+        e.id_estudiante, e.no_lista, e.matricula, e.nombre, e.apellido,
+        a.fecha, a.hora_entrada, a.estado
+    FROM asistencia a
+    JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
+    JOIN estudiante e ON a.id_estudiante = e.id_estudiante AND e.eliminado = 0
+    LEFT JOIN materia m ON c.id_materia = m.id_materia
+    LEFT JOIN grupo g ON c.id_grupo = g.id_grupo
+    WHERE {filtro}
+    ORDER BY m.nombre, g.nombre, e.no_lista, a.fecha
+"""
+
+SQL_EXPORTAR_ENTREGAS = """
+    SELECT
+        ac.id_actividad, ac.titulo, ac.fecha_entrega, ac.valor_maximo,
+        e.id_estudiante, e.no_lista, e.matricula, e.nombre, e.apellido,
+        COALESCE(ae.estado, 'pendiente') AS estado, ae.calificacion, ae.fecha_entrega_real
+    FROM actividad ac
+    JOIN clase c ON ac.id_clase = c.id_clase AND c.eliminado = 0
+    JOIN estudiante e ON e.id_grupo = c.id_grupo AND e.eliminado = 0
+    LEFT JOIN actividad_estudiante ae
+        ON ae.id_actividad = ac.id_actividad AND ae.id_estudiante = e.id_estudiante
+    WHERE ac.id_clase = %s
+    ORDER BY ac.fecha_entrega, ac.id_actividad, e.no_lista
+"""
+
+# Todas las clases con el mismo grupo y materia que la clase dada
+FILTRO_GRUPO_MATERIA = "(c.id_grupo, c.id_materia) = (SELECT id_grupo, id_materia FROM clase WHERE id_clase = %s)"
+
+def exportar_asistencias(filtro: str, params: tuple, formato: str, nombre: str):
+    return respuesta_datos(SQL_EXPORTAR_ASISTENCIAS.format(filtro=filtro), params, formato, nombre)
+
+def exportar_entregas(id_clase: int, formato: str, nombre: str):
+    return respuesta_datos(SQL_EXPORTAR_ENTREGAS, (id_clase,), formato, nombre)
 
 # ==================== REPORTE DE ASISTENCIAS POR GRUPO ====================
 @router.get("/excel")
+@metricas_app.medir_reporte("asistencias_grupo")
 async def generar_reporte_grupo(
     id_grupo: int = Query(..., description="ID del grupo"),
     fechaInicio: Optional[str] = Query(None, description="Fecha inicio YYYY-MM-DD"),
-    fechaFin: Optional[str] = Query(None, description="Fecha fin YYYY-MM-DD")
+    fechaFin: Optional[str] = Query(None, description="Fecha fin YYYY-MM-DD"),
+    formato: str = Query("xlsx", pattern=PATRON_FORMATO, description=DESCRIPCION_FORMATO)
 ):
     """Genera reporte Excel de asistencias por grupo con filtros de fecha"""
     try:
@@ -65,6 +104,12 @@ async def generar_reporte_grupo(
         
         print(f"📅 Rango usado: {fechaInicio} a {fechaFin}")
         
+        if formato != "xlsx":
+            return exportar_asistencias(
+                "e.id_grupo = %s AND c.id_grupo = %s AND a.fecha BETWEEN %s AND %s",
+                (id_grupo, id_grupo, fechaInicio, fechaFin), formato, f"asistencias_grupo_{id_grupo}",
+            )
+        
         # Generar lista de fechas
         fechas = generar_rango_fechas(fechaInicio, fechaFin)
         
@@ -92,105 +137,37 @@ async def generar_reporte_grupo(
             ORDER BY m.nombre, e.no_lista, a.fecha
         """
         
-        datos = await fetch_all(query, (fechaInicio, fechaFin, id_grupo, id_grupo))
+        # Un pivote (alumnos × fechas del rango) por materia, conforme llegan los lotes
+        matrices = await pivotar_lotes(
+            stream_rows(query, (fechaInicio, fechaFin, id_grupo, id_grupo)), "materia", fechas, campo_id="matricula"
+        )
         
-        if not datos:
+        if not matrices:
             raise HTTPException(status_code=404, detail="No se encontraron datos para este grupo")
         
-        # Crear workbook
-        wb = Workbook()
-        wb.remove(wb.active)
-        
-        # Agrupar por materia
-        materias = {}
-        for row in datos:
-            mat = row["materia"]
-            if mat not in materias:
-                materias[mat] = []
-            materias[mat].append(row)
-        
-        # Crear hoja por materia
-        for materia, rows in materias.items():
-            ws = wb.create_sheet(limpiar_nombre_hoja(materia))
-            
-            # Encabezados
-            headers = ["No. Lista", "Nombre", "Apellido", "Matrícula", *fechas]
-            ws.append(headers)
-            
-            # Aplicar estilo al encabezado
-            for cell in ws[1]:
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal="center")
-            
-            # Agrupar por alumno
-            alumnos = {}
-            for row in rows:
-                key = row["matricula"]
-                if key not in alumnos:
-                    alumnos[key] = {
-                        "nombre": row["nombre"],
-                        "apellido": row["apellido"],
-                        "matricula": row["matricula"],
-                        "no_lista": row["no_lista"],
-                        "asistencias": {}
-                    }
-                if row["fecha"]:
-                    fecha_str = formato_fecha(row["fecha"])
-                    alumnos[key]["asistencias"][fecha_str] = row["estado"]
-            
-            # Ordenar alumnos por no_lista
-            alumnos_ordenados = sorted(alumnos.values(), key=lambda x: x["no_lista"])
-            
-            # Agregar filas
-            for alumno in alumnos_ordenados:
-                row_data = [
-                    alumno["no_lista"],
-                    alumno["nombre"],
-                    alumno["apellido"],
-                    alumno["matricula"]
-                ]
-                
-                # Agregar estados por fecha
-                for fecha in fechas:
-                    estado = alumno["asistencias"].get(fecha, "")
-                    row_data.append(estado.capitalize() if estado else "")
+        def construir(reporte: ReporteExcel):
+            # Crear hoja por materia
+            for materia, matriz in matrices.items():
+                textos = matriz.mapear(lambda estado: estado.capitalize() if estado else "")
+                estilos_celda = matriz.mapear(estilo_estado)
+                alumnos_ordenados = sorted(matriz, key=lambda x: x[1]["no_lista"])
                 
-                ws.append(row_data)
+                hoja = reporte.hoja(limpiar_nombre_hoja(materia), [10, 20, 20, 15] + [12] * len(fechas))
+                hoja.encabezado(["No. Lista", "Nombre", "Apellido", "Matrícula", *fechas])
                 
-                # Colorear celdas de estado
-                current_row = ws.max_row
-                for col_idx, fecha in enumerate(fechas, start=5):
-                    cell = ws.cell(row=current_row, column=col_idx)
-                    estado = cell.value.lower() if cell.value else ""
+                for matricula, alumno in alumnos_ordenados:
+                    row_data = [
+                        alumno["no_lista"],
+                        alumno["nombre"],
+                        alumno["apellido"],
+                        alumno["matricula"]
+                    ]
                     
-                    if estado == "presente":
-                        cell.fill = COLOR_PRESENTE
-                        cell.alignment = Alignment(horizontal="center")
-                    elif estado == "ausente":
-                        cell.fill = COLOR_AUSENTE
-                        cell.alignment = Alignment(horizontal="center")
-                    elif estado == "justificante":
-                        cell.fill = COLOR_JUSTIFICANTE
-                        cell.alignment = Alignment(horizontal="center")
-            
-            # Ajustar ancho de columnas
-            ws.column_dimensions['A'].width = 10
-            ws.column_dimensions['B'].width = 20
-            ws.column_dimensions['C'].width = 20
-            ws.column_dimensions['D'].width = 15
-            for i in range(5, 5 + len(fechas)):
-                ws.column_dimensions[chr(64 + i)].width = 12
-        
-        # Guardar en buffer
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+                    # Agregar estados por fecha (coloreados)
+                    row_data.extend(textos.fila(matricula))
+                    hoja.fila(row_data, [None] * 4 + estilos_celda.fila(matricula))
         
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename=asistencias_grupo_{id_grupo}.xlsx"}
-        )
+        return respuesta_excel(construir, f"asistencias_grupo_{id_grupo}.xlsx")
         
     except HTTPException:
         raise
@@ -202,15 +179,23 @@ async def generar_reporte_grupo(
 
 # ==================== REPORTE INDIVIDUAL DE ESTUDIANTE ====================
 @router.get("/excel/individual")
+@metricas_app.medir_reporte("asistencias_individual")
 async def generar_reporte_individual(
     id_estudiante: int = Query(..., description="ID del estudiante"),
     fechaInicio: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
-    fechaFin: str = Query(..., description="Fecha fin YYYY-MM-DD")
+    fechaFin: str = Query(..., description="Fecha fin YYYY-MM-DD"),
+    formato: str = Query("xlsx", pattern=PATRON_FORMATO, description=DESCRIPCION_FORMATO)
 ):
     """Genera reporte individual de un estudiante"""
     try:
         print(f"📅 Rango usado: {fechaInicio} a {fechaFin}")
         
+        if formato != "xlsx":
+            return exportar_asistencias(
+                "a.id_estudiante = %s AND a.fecha BETWEEN %s AND %s",
+                (id_estudiante, fechaInicio, fechaFin), formato, f"asistencias_alumno_{id_estudiante}",
+            )
+        
         # Obtener datos del estudiante
         estudiante = await fetch_one(
             "SELECT nombre, apellido, matricula FROM estudiante WHERE id_estudiante = %s AND eliminado = 0",
@@ -251,62 +236,25 @@ async def generar_reporte_individual(
         if not materias:
             raise HTTPException(status_code=404, detail="No se encontraron asistencias para este estudiante en el rango de fechas")
         
-        # Crear workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Asistencias"
-        
-        # Encabezados
-        headers = ["Materia", *fechas]
-        ws.append(headers)
-        
-        for cell in ws[1]:
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal="center")
-        
-        # Agregar filas por materia
-        for materia, asist_fechas in sorted(materias.items()):
-            row_data = [materia]
-            
-            for fecha in fechas:
-                estado = asist_fechas.get(fecha, "")
-                row_data.append(estado.capitalize() if estado else "")
+        def construir(reporte: ReporteExcel):
+            hoja = reporte.hoja("Asistencias", [estimar_ancho(materias, minimo=25)] + [12] * len(fechas))
+            hoja.encabezado(["Materia", *fechas])
             
-            ws.append(row_data)
-            
-            # Colorear celdas
-            current_row = ws.max_row
-            for col_idx in range(2, len(fechas) + 2):
-                cell = ws.cell(row=current_row, column=col_idx)
-                estado = cell.value.lower() if cell.value else ""
+            # Agregar filas por materia (estados coloreados)
+            for materia, asist_fechas in sorted(materias.items()):
+                row_data = [materia]
+                estilos = [None]
                 
-                if estado == "presente":
-                    cell.fill = COLOR_PRESENTE
-                    cell.alignment = Alignment(horizontal="center")
-                elif estado == "ausente":
-                    cell.fill = COLOR_AUSENTE
-                    cell.alignment = Alignment(horizontal="center")
-                elif estado == "justificante":
-                    cell.fill = COLOR_JUSTIFICANTE
-                    cell.alignment = Alignment(horizontal="center")
-        
-        # Ajustar columnas
-        ws.column_dimensions['A'].width = 25
-        for i in range(2, 2 + len(fechas)):
-            ws.column_dimensions[chr(64 + i)].width = 12
-        
-        # Guardar
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+                for fecha in fechas:
+                    estado = asist_fechas.get(fecha, "")
+                    row_data.append(estado.capitalize() if estado else "")
+                    estilos.append(estilo_estado(estado))
+                
+                hoja.fila(row_data, estilos)
         
         filename = f"reporte_alumno_{estudiante['matricula']}.xlsx"
         
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        return respuesta_excel(construir, filename)
         
     except HTTPException:
         raise
@@ -318,8 +266,14 @@ async def generar_reporte_individual(
 
 # ==================== REPORTE DE ACTIVIDADES POR CLASE ====================
 @router.get("/excel/clase/{id_clase}")
-async def generar_reporte_actividades_clase(id_clase: int):
+@metricas_app.medir_reporte("actividades_clase")
+async def generar_reporte_actividades_clase(
+    id_clase: int,
+    formato: str = Query("xlsx", pattern=PATRON_FORMATO, description=DESCRIPCION_FORMATO)
+):
     """Genera reporte Excel con actividades de una clase (una hoja por actividad)"""
+    if formato != "xlsx":
+        return exportar_entregas(id_clase, formato, f"actividades_clase_{id_clase}")
     try:
         # 1. Obtener datos de la clase
         clase = await fetch_one("""
@@ -358,82 +312,51 @@ async def generar_reporte_actividades_clase(id_clase: int):
             ORDER BY apellido, nombre
         """, (id_clase,))
         
-        # 4. Crear workbook
-        wb = Workbook()
-        wb.remove(wb.active)
-        
-        # 5. Crear una hoja por cada actividad
+        # 4. Obtener entregas de cada actividad (antes de escribir: la hoja se arma en un hilo)
+        entregas_por_actividad = {}
         for act in actividades:
-            ws = wb.create_sheet(limpiar_nombre_hoja(act["titulo"]))
-            
-            # Información de la actividad
-            ws.append([f"Actividad: {act['titulo']}"])
-            ws.append([f"Fecha entrega: {formato_fecha(act['fecha_entrega'])}"])
-            ws.append([f"Valor máximo: {act['valor_maximo']}"])
-            ws.append([])
-            
-            # Encabezados
-            ws.append(["Alumno", "Matrícula", "Estado", "Fecha entrega real", "Calificación"])
-            for cell in ws[5]:
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal="center")
-            
-            # 6. Obtener entregas de la actividad
             entregas = await fetch_all("""
                 SELECT id_estudiante, estado, fecha_entrega_real, calificacion
                 FROM actividad_estudiante
                 WHERE id_actividad = %s
             """, (act["id_actividad"],))
-            
-            entregas_map = {e["id_estudiante"]: e for e in entregas}
-            
-            # 7. Agregar fila por cada alumno
-            for alumno in alumnos:
-                entrega = entregas_map.get(alumno["id_estudiante"])
-                estado = entrega["estado"] if entrega else "pendiente"
+            entregas_por_actividad[act["id_actividad"]] = {e["id_estudiante"]: e for e in entregas}
+        
+        def construir(reporte: ReporteExcel):
+            # 5. Crear una hoja por cada actividad
+            for act in actividades:
+                hoja = reporte.hoja(limpiar_nombre_hoja(act["titulo"]), [30, 15, 15, 20, 12])
                 
-                row_data = [
-                    f"{alumno['apellido']} {alumno['nombre']}",
-                    alumno["matricula"],
-                    estado.capitalize(),
-                    formato_fecha(entrega["fecha_entrega_real"]) if entrega and entrega.get("fecha_entrega_real") else "",
-                    entrega["calificacion"] if entrega and entrega.get("calificacion") is not None else ""
-                ]
+                # Información de la actividad
+                hoja.fila([f"Actividad: {act['titulo']}"])
+                hoja.fila([f"Fecha entrega: {formato_fecha(act['fecha_entrega'])}"])
+                hoja.fila([f"Valor máximo: {act['valor_maximo']}"])
+                hoja.fila([])
                 
-                ws.append(row_data)
+                # Encabezados
+                hoja.encabezado(["Alumno", "Matrícula", "Estado", "Fecha entrega real", "Calificación"])
                 
-                # 🎨 Colorear celda de estado
-                current_row = ws.max_row
-                estado_cell = ws.cell(row=current_row, column=3)
-                estado_cell.alignment = Alignment(horizontal="center")
+                entregas_map = entregas_por_actividad[act["id_actividad"]]
                 
-                estado_lower = estado.lower()
-                if estado_lower == "entregado":
-                    estado_cell.fill = COLOR_ENTREGADO
-                elif estado_lower == "pendiente":
-                    estado_cell.fill = COLOR_PENDIENTE
-                elif estado_lower == "no entregado":
-                    estado_cell.fill = COLOR_NO_ENTREGADO
-            
-            # Ajustar ancho de columnas
-            ws.column_dimensions['A'].width = 30
-            ws.column_dimensions['B'].width = 15
-            ws.column_dimensions['C'].width = 15
-            ws.column_dimensions['D'].width = 20
-            ws.column_dimensions['E'].width = 12
-        
-        # 8. Generar archivo y enviarlo
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+                # 6. Agregar fila por cada alumno, con la celda de estado coloreada
+                for alumno in alumnos:
+                    entrega = entregas_map.get(alumno["id_estudiante"])
+                    estado = entrega["estado"] if entrega else "pendiente"
+                    
+                    row_data = [
+                        f"{alumno['apellido']} {alumno['nombre']}",
+                        alumno["matricula"],
+                        estado.capitalize(),
+                        formato_fecha(entrega["fecha_entrega_real"]) if entrega and entrega.get("fecha_entrega_real") else "",
+                        entrega["calificacion"] if entrega and entrega.get("calificacion") is not None else ""
+                    ]
+                    
+                    hoja.fila(row_data, [None, None, estilo_estado(estado) or "centrado"])
         
+        # 7. Generar archivo y enviarlo
         filename = f"Actividades_{clase['materia']}_{clase['grupo']}.xlsx"
         
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        return respuesta_excel(construir, filename)
         
     except HTTPException:
         raise
@@ -445,8 +368,14 @@ async def generar_reporte_actividades_clase(id_clase: int):
 
 # ==================== REPORTE GENERAL DE ACTIVIDADES ====================
 @router.get("/excel/clase/general/{id_clase}")
-async def generar_reporte_general_actividades(id_clase: int):
+@metricas_app.medir_reporte("actividades_general")
+async def generar_reporte_general_actividades(
+    id_clase: int,
+    formato: str = Query("xlsx", pattern=PATRON_FORMATO, description=DESCRIPCION_FORMATO)
+):
     """Genera reporte general con todas las actividades en una sola hoja"""
+    if formato != "xlsx":
+        return exportar_entregas(id_clase, formato, f"actividades_clase_{id_clase}")
     try:
         # Obtener clase
         clase = await fetch_one("""
@@ -494,89 +423,46 @@ async def generar_reporte_general_actividades(id_clase: int):
             key = f"{e['id_estudiante']}_{e['id_actividad']}"
             entregas_map[key] = e
         
-        # Crear workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = limpiar_nombre_hoja(f"{clase['materia']}-{clase['grupo']}")
-        
-        # Encabezados
-        headers = ["No Lista", "Matrícula", "Nombre", "Grupo"]
-        for act in actividades:
-            headers.append(f"{act['titulo']}")
-            headers.append(f"Cal")
-        
-        ws.append(headers)
-        for cell in ws[1]:
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal="center")
-        
-        # Agregar filas de alumnos
-        for alumno in alumnos:
-            row_data = [
-                alumno["no_lista"],
-                alumno["matricula"],
-                f"{alumno['apellido']} {alumno['nombre']}",
-                clase["grupo"]
-            ]
+        def construir(reporte: ReporteExcel):
+            hoja = reporte.hoja(
+                limpiar_nombre_hoja(f"{clase['materia']}-{clase['grupo']}"),
+                [10, 15, 30, 10] + [15, 8] * len(actividades)
+            )
             
+            # Encabezados
+            headers = ["No Lista", "Matrícula", "Nombre", "Grupo"]
             for act in actividades:
-                key = f"{alumno['id_estudiante']}_{act['id_actividad']}"
-                entrega = entregas_map.get(key)
-                
-                estado = entrega["estado"].capitalize() if entrega else "Pendiente"
-                calificacion = entrega["calificacion"] if entrega and entrega["calificacion"] is not None else 0
-                
-                row_data.append(estado)
-                row_data.append(calificacion)
-            
-            ws.append(row_data)
+                headers.append(f"{act['titulo']}")
+                headers.append(f"Cal")
+            hoja.encabezado(headers)
             
-            # Colorear estados
-            current_row = ws.max_row
-            col_idx = 5  # Empieza después de No Lista, Matrícula, Nombre, Grupo
-            for _ in actividades:
-                estado_cell = ws.cell(row=current_row, column=col_idx)
-                estado_cell.alignment = Alignment(horizontal="center")
-                estado = estado_cell.value.lower() if estado_cell.value else ""
-                
-                if estado == "entregado":
-                    estado_cell.fill = COLOR_ENTREGADO
-                elif estado == "pendiente":
-                    estado_cell.fill = COLOR_PENDIENTE
-                elif estado == "no entregado":
-                    estado_cell.fill = COLOR_NO_ENTREGADO
+            # Agregar filas de alumnos (estado coloreado y calificación centrada)
+            for alumno in alumnos:
+                row_data = [
+                    alumno["no_lista"],
+                    alumno["matricula"],
+                    f"{alumno['apellido']} {alumno['nombre']}",
+                    clase["grupo"]
+                ]
+                estilos = [None] * 4
                 
-                # Centrar también la calificación
-                cal_cell = ws.cell(row=current_row, column=col_idx + 1)
-                cal_cell.alignment = Alignment(horizontal="center")
+                for act in actividades:
+                    key = f"{alumno['id_estudiante']}_{act['id_actividad']}"
+                    entrega = entregas_map.get(key)
+                    
+                    estado = entrega["estado"].capitalize() if entrega else "Pendiente"
+                    calificacion = entrega["calificacion"] if entrega and entrega["calificacion"] is not None else 0
+                    
+                    row_data.append(estado)
+                    row_data.append(calificacion)
+                    estilos.append(estilo_estado(estado) or "centrado")
+                    estilos.append("centrado")
                 
-                col_idx += 2  # Siguiente par Estado/Calificación
-        
-        # Ajustar columnas
-        ws.column_dimensions['A'].width = 10
-        ws.column_dimensions['B'].width = 15
-        ws.column_dimensions['C'].width = 30
-        ws.column_dimensions['D'].width = 10
-        
-        col_letra = 'E'
-        for _ in actividades:
-            ws.column_dimensions[col_letra].width = 15
-            col_letra = chr(ord(col_letra) + 1)
-            ws.column_dimensions[col_letra].width = 8
-            col_letra = chr(ord(col_letra) + 1)
-        
-        # Guardar
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+                hoja.fila(row_data, estilos)
         
         filename = f"Actividades_General_{clase['materia']}_{clase['grupo']}.xlsx"
         
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        return respuesta_excel(construir, filename)
         
     except HTTPException:
         raise
@@ -586,144 +472,107 @@ async def generar_reporte_general_actividades(id_clase: int):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error generando Excel: {str(e)}")
 
+# ==================== CONSULTAS COMPARTIDAS ====================
+# Los reportes de varias clases consultan una vez para todas; las
+# asistencias se leen por lotes (config.db.stream_rows) y el pivote
+# (utils/pivote_asistencias.py) las separa por id_clase conforme llegan.
+
+async def consultar_estudiantes_grupos(ids_grupo):
+    """Alumnos de varios grupos en una consulta: id_grupo -> alumnos por no_lista."""
+    por_grupo = {id_grupo: [] for id_grupo in ids_grupo}
+    if not por_grupo:
+        return por_grupo
+    placeholders = ','.join(['%s'] * len(por_grupo))
+    estudiantes = await fetch_all(f"""
+        SELECT e.id_grupo, e.id_estudiante, e.nombre, e.apellido, e.matricula,
+               e.no_lista, g.nombre AS grupo
+        FROM estudiante e
+        JOIN grupo g ON e.id_grupo = g.id_grupo
+        WHERE e.id_grupo IN ({placeholders}) AND e.eliminado = 0 AND g.eliminado = 0
+        ORDER BY e.id_grupo, e.no_lista
+    """, tuple(por_grupo))
+    for est in estudiantes:
+        por_grupo[est["id_grupo"]].append(est)
+    return por_grupo
+
+async def consultar_asistencias_clases(ids_clase, fechaInicio, fechaFin):
+    """
+    Asistencias de varias clases en un rango, en una consulta leída por
+    lotes y pivoteada conforme llega: id_clase -> MatrizAsistencia (solo
+    las clases con registros).
+    """
+    ids_clase = list(dict.fromkeys(ids_clase))
+    if not ids_clase:
+        return {}
+    placeholders = ','.join(['%s'] * len(ids_clase))
+    return await pivotar_lotes(stream_rows(f"""
+        SELECT id_clase, id_estudiante, fecha, estado
+        FROM asistencia
+        WHERE id_clase IN ({placeholders})
+            AND fecha BETWEEN %s AND %s
+    """, (*ids_clase, fechaInicio, fechaFin)), "id_clase")
+
 # ==================== REPORTE DE PROFESOR ====================
+async def consultar_reporte_profesor(id_profesor: int, fechaInicio: str, fechaFin: str, avance=None):
+    """Consultas del reporte de profesor; regresa (datos, filename) para escribir_reporte_profesor."""
+    print(f"📅 Generando reporte para profesor {id_profesor}: {fechaInicio} a {fechaFin}")
+    
+    # Obtener clases del profesor
+    clases = await fetch_all("""
+        SELECT c.id_clase, c.nombre_clase,
+               m.nombre AS materia, g.nombre AS grupo, c.id_grupo
+        FROM clase c
+        LEFT JOIN materia m ON c.id_materia = m.id_materia
+        LEFT JOIN grupo g ON c.id_grupo = g.id_grupo
+        WHERE c.id_profesor = %s AND c.eliminado = 0
+        ORDER BY m.nombre, g.nombre
+    """, (id_profesor,))
+    
+    if not clases:
+        raise HTTPException(status_code=404, detail="El profesor no tiene clases asignadas")
+    
+    # Alumnos y asistencias de todas las clases en dos consultas (antes eran
+    # tres por clase), ya pivoteadas por clase
+    estudiantes_por_grupo = await consultar_estudiantes_grupos(c["id_grupo"] for c in clases)
+    if avance:
+        avance(0.5)
+    matrices = await consultar_asistencias_clases([c["id_clase"] for c in clases], fechaInicio, fechaFin)
+    
+    hojas = []
+    for clase in clases:
+        nombre_hoja = limpiar_nombre_hoja(f"{clase['materia']} - {clase['grupo']}")
+        estudiantes = estudiantes_por_grupo[clase["id_grupo"]]
+        
+        if not estudiantes:
+            hojas.append((nombre_hoja, "No hay estudiantes en este grupo", None, None))
+        elif clase["id_clase"] not in matrices:
+            hojas.append((nombre_hoja, "No hay registros de asistencia en este rango de fechas", None, None))
+        else:
+            hojas.append((nombre_hoja, None, estudiantes, clase["id_clase"]))
+    
+    return {"hojas": hojas, "matrices": matrices}, f"Reporte_Profesor_{id_profesor}.xlsx"
+
 @router.get("/excel/profesor/{id_profesor}")
+@metricas_app.medir_reporte("profesor")
 async def generar_reporte_profesor(
     id_profesor: int,
     fechaInicio: Optional[str] = Query("2025-08-04"),
-    fechaFin: Optional[str] = Query(None)
+    fechaFin: Optional[str] = Query(None),
+    formato: str = Query("xlsx", pattern=PATRON_FORMATO, description=DESCRIPCION_FORMATO)
 ):
     """Genera reporte de todas las clases de un profesor"""
     try:
         if not fechaFin:
             fechaFin = obtener_fecha_hora_cdmx()["fecha"]
         
-        print(f"📅 Generando reporte para profesor {id_profesor}: {fechaInicio} a {fechaFin}")
-        
-        # Obtener clases del profesor
-        clases = await fetch_all("""
-            SELECT c.id_clase, c.nombre_clase,
-                   m.nombre AS materia, g.nombre AS grupo, c.id_grupo
-            FROM clase c
-            LEFT JOIN materia m ON c.id_materia = m.id_materia
-            LEFT JOIN grupo g ON c.id_grupo = g.id_grupo
-            WHERE c.id_profesor = %s AND c.eliminado = 0
-            ORDER BY m.nombre, g.nombre
-        """, (id_profesor,))
-        
-        if not clases:
-            raise HTTPException(status_code=404, detail="El profesor no tiene clases asignadas")
-        
-        # Crear workbook
-        wb = Workbook()
-        wb.remove(wb.active)
-        
-        for clase in clases:
-            nombre_hoja = f"{clase['materia']} - {clase['grupo']}"
-            ws = wb.create_sheet(limpiar_nombre_hoja(nombre_hoja))
-            
-            # Obtener estudiantes del grupo
-            estudiantes = await fetch_all("""
-                SELECT e.id_estudiante, e.nombre, e.apellido, e.matricula, 
-                       e.no_lista, g.nombre AS grupo
-                FROM estudiante e
-                JOIN grupo g ON e.id_grupo = g.id_grupo
-                WHERE e.id_grupo = %s AND e.eliminado = 0 AND g.eliminado = 0
-                ORDER BY e.no_lista
-            """, (clase["id_grupo"],))
-            
-            if not estudiantes:
-                ws.append(["No hay estudiantes en este grupo"])
-                continue
-            
-            # Obtener solo fechas donde hubo clase (registros de asistencia)
-            fechas_clase = await fetch_all("""
-                SELECT DISTINCT fecha
-                FROM asistencia
-                WHERE id_clase = %s
-                    AND fecha BETWEEN %s AND %s
-                ORDER BY fecha
-            """, (clase["id_clase"], fechaInicio, fechaFin))
-            
-            fechas = [formato_fecha(f["fecha"]) for f in fechas_clase]
-            
-            if not fechas:
-                ws.append(["No hay registros de asistencia en este rango de fechas"])
-                continue
-            
-            # Obtener asistencias
-            asistencias = await fetch_all("""
-                SELECT id_estudiante, fecha, estado
-                FROM asistencia
-                WHERE id_clase = %s
-                    AND fecha BETWEEN %s AND %s
-            """, (clase["id_clase"], fechaInicio, fechaFin))
-            
-            asist_map = {}
-            for a in asistencias:
-                fecha_str = formato_fecha(a["fecha"])
-                key = f"{a['id_estudiante']}_{fecha_str}"
-                asist_map[key] = a["estado"]
-            
-            # Encabezados
-            headers = ["No Lista", "Matrícula", "Nombre", "Grupo", *fechas]
-            ws.append(headers)
-            for cell in ws[1]:
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal="center")
-            
-            # Agregar filas de estudiantes
-            for est in estudiantes:
-                row_data = [
-                    est["no_lista"],
-                    est["matricula"],
-                    f"{est['apellido']} {est['nombre']}",
-                    est["grupo"]
-                ]
-                
-                for fecha in fechas:
-                    key = f"{est['id_estudiante']}_{fecha}"
-                    estado = asist_map.get(key, "")
-                    row_data.append(estado.capitalize() if estado else "")
-                
-                ws.append(row_data)
-                
-                # Colorear
-                current_row = ws.max_row
-                for col_idx in range(5, 5 + len(fechas)):
-                    cell = ws.cell(row=current_row, column=col_idx)
-                    cell.alignment = Alignment(horizontal="center")
-                    estado = cell.value.lower() if cell.value else ""
-                    
-                    if estado == "presente":
-                        cell.fill = COLOR_PRESENTE
-                    elif estado == "ausente":
-                        cell.fill = COLOR_AUSENTE
-                    elif estado == "justificante":
-                        cell.fill = COLOR_JUSTIFICANTE
-            
-            # Ajustar columnas
-            ws.column_dimensions['A'].width = 10
-            ws.column_dimensions['B'].width = 15
-            ws.column_dimensions['C'].width = 30
-            ws.column_dimensions['D'].width = 10
-            for i in range(5, 5 + len(fechas)):
-                if i <= 26:
-                    col_letra = chr(64 + i)
-                else:
-                    col_letra = chr(64 + (i // 26)) + chr(64 + (i % 26))
-                ws.column_dimensions[col_letra].width = 12
-        
-        # Guardar
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+        if formato != "xlsx":
+            return exportar_asistencias(
+                "c.id_profesor = %s AND a.fecha BETWEEN %s AND %s",
+                (id_profesor, fechaInicio, fechaFin), formato, f"asistencias_profesor_{id_profesor}",
+            )
         
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename=Reporte_Profesor_{id_profesor}.xlsx"}
-        )
+        datos, filename = await consultar_reporte_profesor(id_profesor, fechaInicio, fechaFin)
+        return respuesta_excel(lambda reporte: escribir_reporte_profesor(reporte, datos), filename)
         
     except HTTPException:
         raise
@@ -733,201 +582,102 @@ async def generar_reporte_profesor(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error generando Excel: {str(e)}")
     
+async def consultar_reporte_completo_clase(id_clase: int, avance=None):
+    """Consultas del reporte completo de una clase; regresa (datos, filename) para escribir_reporte_clase_completo."""
+    # 1️⃣ Info de clase
+    clase = await fetch_one("""
+        SELECT c.id_clase, m.nombre AS materia, g.nombre AS grupo, c.id_grupo, c.id_materia
+        FROM clase c
+        LEFT JOIN materia m ON c.id_materia = m.id_materia
+        LEFT JOIN grupo g ON c.id_grupo = g.id_grupo
+        WHERE c.id_clase = %s AND c.eliminado = 0
+    """, (id_clase,))
+    if not clase:
+        raise HTTPException(status_code=404, detail="Clase no encontrada")
+
+    materia = clase["materia"]
+    grupo = clase["grupo"]
+    id_grupo = clase["id_grupo"]
+    id_materia = clase["id_materia"]
+
+    # 2️⃣ Actividades
+    actividades = await fetch_all("""
+        SELECT id_actividad, titulo
+        FROM actividad
+        WHERE id_clase = %s
+        ORDER BY fecha_entrega ASC
+    """, (id_clase,))
+
+    # 3️⃣ Alumnos
+    alumnos = await fetch_all("""
+        SELECT id_estudiante, nombre, apellido, matricula, no_lista
+        FROM estudiante
+        WHERE id_grupo = %s AND eliminado = 0
+        ORDER BY no_lista
+    """, (id_grupo,))
+    if avance:
+        avance(0.25)
+
+    # 4️⃣ Entregas
+    entregas_map = {}
+    if actividades:
+        actividad_ids = [a["id_actividad"] for a in actividades]
+        placeholders = ','.join(['%s'] * len(actividad_ids))
+        entregas = await fetch_all(f"""
+            SELECT id_estudiante, id_actividad, estado, calificacion
+            FROM actividad_estudiante
+            WHERE id_actividad IN ({placeholders})
+        """, tuple(actividad_ids))
+        for e in entregas:
+            key = f"{e['id_estudiante']}_{e['id_actividad']}"
+            entregas_map[key] = e
+    if avance:
+        avance(0.5)
+
+    # 5️⃣ Asistencias
+    asistencias_query = """
+        SELECT 
+            e.id_estudiante,
+            CONCAT(e.nombre, ' ', e.apellido) AS nombre,
+            e.matricula,
+            a.estado,
+            a.fecha
+        FROM estudiante e
+        JOIN clase c ON c.id_grupo = e.id_grupo AND c.eliminado = 0
+        LEFT JOIN asistencia a ON a.id_estudiante = e.id_estudiante AND a.id_clase = c.id_clase
+        WHERE c.id_grupo = %s AND c.id_materia = %s AND e.eliminado = 0
+        ORDER BY e.no_lista, a.fecha
+    """
+    # Alumnos × fechas (solo días que hubo clase), pivoteado por lotes
+    matrices = await pivotar_lotes(stream_rows(asistencias_query, (id_grupo, id_materia)), None)
+    datos = {
+        "materia": materia,
+        "grupo": grupo,
+        "actividades": actividades,
+        "alumnos": alumnos,
+        "entregas_map": entregas_map,
+        "matriz": matrices.get(None) or MatrizAsistencia.vacia(),
+    }
+    return datos, f"ClaseCompleto_{grupo}_{materia}.xlsx"
+
 @router.get("/excel/clase/completo/{id_clase}")
-async def generar_reporte_completo_clase(id_clase: int):
+@metricas_app.medir_reporte("clase_completo")
+async def generar_reporte_completo_clase(
+    id_clase: int,
+    formato: str = Query("xlsx", pattern=PATRON_FORMATO, description=DESCRIPCION_FORMATO),
+    datos: str = Query("asistencias", pattern="^(asistencias|actividades)$", description="Solo csv/parquet: qué tabla exportar")
+):
     """Genera reporte Excel completo con actividades y asistencias"""
+    if formato != "xlsx":
+        # Un CSV/Parquet es una sola tabla: asistencias o entregas de actividades
+        if datos == "actividades":
+            return exportar_entregas(id_clase, formato, f"clase_completo_{id_clase}_actividades")
+        return exportar_asistencias(FILTRO_GRUPO_MATERIA, (id_clase,), formato, f"clase_completo_{id_clase}_asistencias")
     try:
-        def nombre_hoja_seguro(base: str, sufijo: str, max_len: int = 31) -> str:
-            nombre_base = base[:max_len - len(sufijo) - 1] if len(base) > (max_len - len(sufijo) - 1) else base
-            return f"{nombre_base}-{sufijo}"
+        datos, filename = await consultar_reporte_completo_clase(id_clase)
 
-        # 1️⃣ Info de clase
-        clase = await fetch_one("""
-            SELECT c.id_clase, m.nombre AS materia, g.nombre AS grupo, c.id_grupo, c.id_materia
-            FROM clase c
-            LEFT JOIN materia m ON c.id_materia = m.id_materia
-            LEFT JOIN grupo g ON c.id_grupo = g.id_grupo
-            WHERE c.id_clase = %s AND c.eliminado = 0
-        """, (id_clase,))
-        if not clase:
-            raise HTTPException(status_code=404, detail="Clase no encontrada")
-
-        materia = clase["materia"]
-        grupo = clase["grupo"]
-        id_grupo = clase["id_grupo"]
-        id_materia = clase["id_materia"]
-
-        # 2️⃣ Actividades
-        actividades = await fetch_all("""
-            SELECT id_actividad, titulo
-            FROM actividad
-            WHERE id_clase = %s
-            ORDER BY fecha_entrega ASC
-        """, (id_clase,))
-
-        # 3️⃣ Alumnos
-        alumnos = await fetch_all("""
-            SELECT id_estudiante, nombre, apellido, matricula, no_lista
-            FROM estudiante
-            WHERE id_grupo = %s AND eliminado = 0
-            ORDER BY no_lista
-        """, (id_grupo,))
-
-        # 4️⃣ Entregas
-        entregas_map = {}
-        if actividades:
-            actividad_ids = [a["id_actividad"] for a in actividades]
-            placeholders = ','.join(['%s'] * len(actividad_ids))
-            entregas = await fetch_all(f"""
-                SELECT id_estudiante, id_actividad, estado, calificacion
-                FROM actividad_estudiante
-                WHERE id_actividad IN ({placeholders})
-            """, tuple(actividad_ids))
-            for e in entregas:
-                key = f"{e['id_estudiante']}_{e['id_actividad']}"
-                entregas_map[key] = e
-
-        # 5️⃣ Crear workbook y hoja ACTIVIDADES
-        wb = Workbook()
-        ws_act = wb.active
-        ws_act.title = nombre_hoja_seguro(f"{materia}-{grupo}", "Act")
-
-        header_act = ["No Lista", "Matrícula", "Nombre", "Grupo"]
-        for act in actividades:
-            header_act.append(act["titulo"])
-            header_act.append(f"Calificación - {act['titulo']}")
-        ws_act.append(header_act)
-        for cell in ws_act[1]:
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-
-        # Rellenar datos y colores de estado
-        for alumno in alumnos:
-            row_data = [
-                alumno["no_lista"],
-                alumno["matricula"],
-                f"{alumno['apellido']} {alumno['nombre']}",
-                grupo
-            ]
-            for act in actividades:
-                key = f"{alumno['id_estudiante']}_{act['id_actividad']}"
-                entrega = entregas_map.get(key)
-                estado = entrega["estado"] if entrega else "pendiente"
-                calificacion = entrega["calificacion"] if entrega and entrega.get("calificacion") is not None else 0
-                row_data.append(estado)
-                row_data.append(calificacion)
-            ws_act.append(row_data)
-
-        # Aplicar colores a celdas de estado
-        for row in ws_act.iter_rows(min_row=2, min_col=5, max_col=4 + len(actividades)*2):
-            for idx, cell in enumerate(row):
-                if idx % 2 == 0:  # solo columnas de estado
-                    estado_val = str(cell.value).lower()
-                    if estado_val == "entregado":
-                        cell.fill = COLOR_ENTREGADO
-                    elif estado_val == "pendiente":
-                        cell.fill = COLOR_PENDIENTE
-                    elif estado_val == "no entregado":
-                        cell.fill = COLOR_NO_ENTREGADO
-                    cell.alignment = Alignment(horizontal="center", vertical="center")
-                    cell.font = Font(bold=True)
-
-        # Ajustar ancho columnas
-        for col in ws_act.columns:
-            ws_act.column_dimensions[col[0].column_letter].width = 20
-
-        # ===== HOJA ASISTENCIAS =====
-        ws_asis = wb.create_sheet(nombre_hoja_seguro(f"{materia}-{grupo}", "Asis"))
-
-        # Obtener asistencias
-        asistencias_query = """
-            SELECT 
-                e.id_estudiante,
-                CONCAT(e.nombre, ' ', e.apellido) AS nombre,
-                e.matricula,
-                a.estado,
-                a.fecha
-            FROM estudiante e
-            JOIN clase c ON c.id_grupo = e.id_grupo AND c.eliminado = 0
-            LEFT JOIN asistencia a ON a.id_estudiante = e.id_estudiante AND a.id_clase = c.id_clase
-            WHERE c.id_grupo = %s AND c.id_materia = %s AND e.eliminado = 0
-            ORDER BY e.no_lista, a.fecha
-        """
-        resultado = await fetch_all(asistencias_query, (id_grupo, id_materia))
-
-        # Fechas únicas de asistencia (solo días que hubo clase)
-        fechas_unicas = sorted(list({formato_fecha(r["fecha"]) for r in resultado if r["fecha"]}))
-
-        # Agrupar por estudiante
-        estudiantes_map = {}
-        for row in resultado:
-            id_est = row["id_estudiante"]
-            if id_est not in estudiantes_map:
-                estudiantes_map[id_est] = {
-                    "nombre": row["nombre"],
-                    "matricula": row["matricula"],
-                    "estados": {}
-                }
-            if row["fecha"]:
-                fecha_str = formato_fecha(row["fecha"])
-                estudiantes_map[id_est]["estados"][fecha_str] = row["estado"]
-
-        # Encabezados
-        encabezados = ["Nombre", "Matrícula", "Grupo", "Materia"] + fechas_unicas + ["TOTAL P", "TOTAL A", "TOTAL J"]
-        ws_asis.append(encabezados)
-        for cell in ws_asis[1]:
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-
-        # Llenar filas y conteos
-        for est in estudiantes_map.values():
-            fila = [
-                est["nombre"],
-                est["matricula"],
-                grupo,
-                materia
-            ]
-            total_P = total_A = total_J = 0
-            for f in fechas_unicas:
-                estado = est["estados"].get(f)
-                letra = (
-                    "P" if estado == "presente" else
-                    "A" if estado == "ausente" else
-                    "J" if estado == "justificante" else "-"
-                )
-                fila.append(letra)
-                if letra == "P": total_P += 1
-                elif letra == "A": total_A += 1
-                elif letra == "J": total_J += 1
-            fila.extend([total_P, total_A, total_J])
-            ws_asis.append(fila)
-
-        # Colorear celdas
-        color_map = {"P": COLOR_PRESENTE, "A": COLOR_AUSENTE, "J": COLOR_JUSTIFICANTE}
-        for row in ws_asis.iter_rows(min_row=2, min_col=5):
-            for cell in row:
-                letra = str(cell.value).upper()
-                if letra in color_map:
-                    cell.fill = color_map[letra]
-                    cell.alignment = Alignment(horizontal="center")
-                    cell.font = Font(bold=True)
-
-        # Ajustar ancho columnas
-        for col in ws_asis.columns:
-            max_len = max(len(str(c.value)) if c.value else 0 for c in col)
-            ws_asis.column_dimensions[col[0].column_letter].width = max(12, max_len + 2)
-
-        # Guardar y enviar Excel
-        buffer = io.BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        filename = f"ClaseCompleto_{grupo}_{materia}.xlsx"
-
-        return StreamingResponse(
-            buffer,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        # Enviar Excel
+        return respuesta_excel(lambda reporte: escribir_reporte_clase_completo(reporte, datos), filename)
 
     except Exception as e:
         traceback.print_exc()
@@ -935,103 +685,54 @@ async def generar_reporte_completo_clase(id_clase: int):
 
 
 
+async def consultar_reporte_profesor_completo(id_profesor: int, avance=None):
+    """Consultas del reporte de curso completo de un profesor; regresa (datos, filename)."""
+    # Definir siempre las fechas
+    fechaInicio = INICIO_CURSO
+    fechaFin = obtener_fecha_hora_cdmx()["fecha"].strftime("%Y-%m-%d")
+    print(f"Generando reporte para profesor {id_profesor}, fechas {fechaInicio} a {fechaFin}")
+
+    # 1️⃣ Obtener clases del profesor
+    clases_query = """
+        SELECT c.id_clase, c.nombre_clase, m.nombre AS materia, g.nombre AS grupo, c.id_grupo
+        FROM clase c
+        LEFT JOIN materia m ON c.id_materia = m.id_materia
+        LEFT JOIN grupo g ON c.id_grupo = g.id_grupo
+        WHERE c.id_profesor = %s AND c.eliminado = 0
+    """
+    clases = await fetch_all(clases_query, (id_profesor,))
+    if not clases:
+        raise HTTPException(status_code=404, detail="El profesor no tiene clases asignadas.")
+
+    # 2️⃣ Alumnos y asistencias de todas las clases en dos consultas (el libro
+    # se arma después, en un hilo o en otro proceso)
+    estudiantes_por_grupo = await consultar_estudiantes_grupos(c["id_grupo"] for c in clases)
+    if avance:
+        avance(0.5)
+    matrices = await consultar_asistencias_clases([c["id_clase"] for c in clases], fechaInicio, fechaFin)
+
+    hojas = [
+        (limpiar_nombre_hoja(f"{clase['materia']} - {clase['grupo']}"), estudiantes_por_grupo[clase["id_grupo"]], clase["id_clase"])
+        for clase in clases
+    ]
+    return {"hojas": hojas, "matrices": matrices}, f"Reporte_Profesor_{id_profesor}.xlsx"
+
 @router.get("/excel/profesor/completo/{id_profesor}")
-async def reporte_asistencias_profesor(id_profesor: int):
+@metricas_app.medir_reporte("profesor_completo")
+async def reporte_asistencias_profesor(
+    id_profesor: int,
+    formato: str = Query("xlsx", pattern=PATRON_FORMATO, description=DESCRIPCION_FORMATO)
+):
+    if formato != "xlsx":
+        return exportar_asistencias(
+            "c.id_profesor = %s AND a.fecha BETWEEN %s AND %s",
+            (id_profesor, INICIO_CURSO, obtener_fecha_hora_cdmx()["fecha"]), formato, f"asistencias_profesor_{id_profesor}_curso",
+        )
     try:
-        # Definir siempre las fechas
-        fechaInicio = "2025-08-04"  # inicio de curso
-        fechaFin = obtener_fecha_hora_cdmx()["fecha"].strftime("%Y-%m-%d")
-        print(f"Generando reporte para profesor {id_profesor}, fechas {fechaInicio} a {fechaFin}")
-
-        # 1️⃣ Obtener clases del profesor
-        clases_query = """
-            SELECT c.id_clase, c.nombre_clase, m.nombre AS materia, g.nombre AS grupo
-            FROM clase c
-            LEFT JOIN materia m ON c.id_materia = m.id_materia
-            LEFT JOIN grupo g ON c.id_grupo = g.id_grupo
-            WHERE c.id_profesor = %s AND c.eliminado = 0
-        """
-        clases = await fetch_all(clases_query, (id_profesor,))
-        if not clases:
-            raise HTTPException(status_code=404, detail="El profesor no tiene clases asignadas.")
-
-        # 2️⃣ Crear workbook
-        wb = Workbook()
-        wb.remove(wb.active)  # quitar hoja por defecto
-
-        for clase in clases:
-            nombre_hoja = limpiar_nombre_hoja(f"{clase['materia']} - {clase['grupo']}")
-            sheet = wb.create_sheet(nombre_hoja)
-
-            # 2.1 Obtener estudiantes del grupo
-            estudiantes_query = """
-                SELECT e.id_estudiante, e.nombre, e.apellido, e.matricula, e.no_lista, g.nombre AS grupo
-                FROM estudiante e
-                JOIN grupo g ON e.id_grupo = g.id_grupo
-                WHERE e.id_grupo = (SELECT id_grupo FROM clase WHERE id_clase = %s AND eliminado = 0)
-                  AND e.eliminado = 0 AND g.eliminado = 0
-                ORDER BY e.no_lista
-            """
-            estudiantes = await fetch_all(estudiantes_query, (clase['id_clase'],))
-
-            # 2.2 Obtener asistencias del rango
-            asistencias_query = """
-                SELECT a.id_estudiante, a.fecha, a.estado
-                FROM asistencia a
-                WHERE a.id_clase = %s AND a.fecha BETWEEN %s AND %s
-            """
-            asistencias = await fetch_all(asistencias_query, (clase['id_clase'], fechaInicio, fechaFin))
-
-            # 2.3 Fechas únicas de asistencia
-            fechas = sorted(list({formato_fecha(a['fecha']) for a in asistencias}))
-
-            # 2.4 Cabecera
-            header = ["No Lista", "Matrícula", "Nombre", "Grupo"] + fechas
-            sheet.append(header)
-            for cell in sheet[1]:
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal="center")
-
-            # 2.5 Filas de estudiantes
-            for est in estudiantes:
-                row = [
-                    est['no_lista'],
-                    est['matricula'],
-                    f"{est['nombre']} {est['apellido']}",
-                    est['grupo']
-                ]
-                for f in fechas:
-                    a = next((x for x in asistencias if x['id_estudiante'] == est['id_estudiante'] and formato_fecha(x['fecha']) == f), None)
-                    row.append(a['estado'] if a else "—")
-                sheet.append(row)
-
-            # 2.6 Colorear celdas
-            for r in sheet.iter_rows(min_row=2, min_col=5):
-                for cell in r:
-                    if cell.value:
-                        val = str(cell.value).lower()
-                        if val == "presente":
-                            cell.fill = COLOR_PRESENTE
-                        elif val == "ausente":
-                            cell.fill = COLOR_AUSENTE
-                        elif val == "justificante":
-                            cell.fill = COLOR_JUSTIFICANTE
-
-            # 2.7 Ajustar ancho de columnas
-            for col in sheet.columns:
-                max_length = max(len(str(cell.value or "")) for cell in col)
-                sheet.column_dimensions[col[0].column_letter].width = max(15, max_length)
+        datos, filename = await consultar_reporte_profesor_completo(id_profesor)
 
         # 3️⃣ Enviar Excel
-        stream = io.BytesIO()
-        wb.save(stream)
-        stream.seek(0)
-
-        return StreamingResponse(
-            stream,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename=Reporte_Profesor_{id_profesor}.xlsx"}
-        )
+        return respuesta_excel(lambda reporte: escribir_reporte_profesor_completo(reporte, datos), filename)
 
     except Exception as e:
         print("❌ ERROR DETALLADO:", e)
@@ -1039,8 +740,77 @@ async def reporte_asistencias_profesor(id_profesor: int):
         raise HTTPException(status_code=500, detail=f"Error generando reporte: {str(e)}")
 
 
+# ==================== TRABAJOS EN SEGUNDO PLANO ====================
+# Los mismos reportes de arriba, pero generados en la cola de
+# utils/trabajos_reportes.py: el POST regresa un id, el progreso se
+# consulta con GET /trabajos/{id} y el archivo se descarga al terminar.
+
+@router.post("/trabajos/profesor/{id_profesor}")
+async def trabajo_reporte_profesor(
+    id_profesor: int,
+    fechaInicio: Optional[str] = Query("2025-08-04"),
+    fechaFin: Optional[str] = Query(None)
+):
+    """Encola el reporte de todas las clases de un profesor"""
+    if not fechaFin:
+        fechaFin = obtener_fecha_hora_cdmx()["fecha"].strftime("%Y-%m-%d")
+    trabajo = cola_reportes.encolar(
+        "profesor",
+        {"id_profesor": id_profesor, "fechaInicio": fechaInicio, "fechaFin": fechaFin},
+        lambda avance: consultar_reporte_profesor(id_profesor, fechaInicio, fechaFin, avance),
+        "utils.hojas_reportes:escribir_reporte_profesor",
+    )
+    return trabajo.a_dict()
+
+@router.post("/trabajos/profesor/completo/{id_profesor}")
+async def trabajo_reporte_profesor_completo(id_profesor: int):
+    """Encola el reporte de curso completo de un profesor"""
+    trabajo = cola_reportes.encolar(
+        "profesor_completo",
+        {"id_profesor": id_profesor},
+        lambda avance: consultar_reporte_profesor_completo(id_profesor, avance),
+        "utils.hojas_reportes:escribir_reporte_profesor_completo",
+    )
+    return trabajo.a_dict()
+
+@router.post("/trabajos/clase/completo/{id_clase}")
+async def trabajo_reporte_completo_clase(id_clase: int):
+    """Encola el reporte completo (actividades y asistencias) de una clase"""
+    trabajo = cola_reportes.encolar(
+        "clase_completo",
+        {"id_clase": id_clase},
+        lambda avance: consultar_reporte_completo_clase(id_clase, avance),
+        "utils.hojas_reportes:escribir_reporte_clase_completo",
+    )
+    return trabajo.a_dict()
+
+@router.get("/trabajos/{id_trabajo}")
+async def estado_trabajo_reporte(id_trabajo: str):
+    """Estado y progreso (0-100) de un reporte encolado"""
+    trabajo = cola_reportes.obtener(id_trabajo)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o ya expiró")
+    return trabajo.a_dict()
+
+@router.get("/trabajos/{id_trabajo}/archivo")
+async def descargar_trabajo_reporte(id_trabajo: str):
+    """Descarga el Excel de un trabajo terminado"""
+    trabajo = cola_reportes.obtener(id_trabajo)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o ya expiró")
+    if not trabajo.disponible:
+        raise HTTPException(status_code=409, detail=f"El reporte no está listo (estado: {trabajo.estado})")
+    return FileResponse(trabajo.ruta, media_type=MEDIA_TYPE_XLSX, filename=trabajo.filename)
+
+
 @router.get("/alumnos/clase/{id_clase}/excel")
-async def exportar_excel_alumnos_clase(id_clase: int):
+@metricas_app.medir_reporte("alumnos_clase")
+async def exportar_excel_alumnos_clase(
+    id_clase: int,
+    formato: str = Query("xlsx", pattern=PATRON_FORMATO, description=DESCRIPCION_FORMATO)
+):
+    if formato != "xlsx":
+        return exportar_asistencias(FILTRO_GRUPO_MATERIA, (id_clase,), formato, f"asistencias_clase_{id_clase}")
     try:
         # 1️⃣ Obtener info de grupo y materia de la clase
         clase_info_query = """
@@ -1078,87 +848,45 @@ async def exportar_excel_alumnos_clase(id_clase: int):
             WHERE c.id_grupo = %s AND c.id_materia = %s AND e.eliminado = 0
             ORDER BY e.nombre, e.apellido, a.fecha
         """
-        resultado = await fetch_all(asistencias_query, (id_grupo, id_materia))
-
-        # 3️⃣ Extraer fechas únicas
-        fechas_unicas = sorted(
-            list({formato_fecha(r["fecha"]) for r in resultado if r["fecha"]})
-        )
-
-        # 4️⃣ Agrupar por estudiante
-        estudiantes_map = {}
-        for row in resultado:
-            id_est = row["id_estudiante"]
-            if id_est not in estudiantes_map:
-                estudiantes_map[id_est] = {
-                    "nombre": row["nombre"],
-                    "matricula": row["matricula"],
-                    "estados": {}
-                }
-            if row["fecha"]:
-                fecha_str = formato_fecha(row["fecha"])
-                estudiantes_map[id_est]["estados"][fecha_str] = row["estado"]
-
-        # 5️⃣ Crear workbook y worksheet
-        wb = Workbook()
-        ws = wb.active
-        ws.title = limpiar_nombre_hoja(f"Asistencias_{nombre_grupo}")
-
-        # 6️⃣ Encabezados
-        encabezados = ["Nombre", "Matrícula", "Grupo", "Materia"] + fechas_unicas
-        ws.append(encabezados)
-
-        # 7️⃣ Agregar filas con datos
-        for est in estudiantes_map.values():
-            fila = [
-                est["nombre"],
-                est["matricula"],
-                nombre_grupo,
-                nombre_materia,
-            ]
-            for f in fechas_unicas:
-                estado = est["estados"].get(f)
-                letra = (
-                    "P" if estado == "presente" else
-                    "A" if estado == "ausente" else
-                    "J" if estado == "justificante" else "A"
-                )
-                fila.append(letra)
-            ws.append(fila)
-
-        # 8️⃣ Estilo de encabezado
-        header_font = Font(bold=True)
-        for cell in ws[1]:
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-
-        # 9️⃣ Colorear celdas según estado
-        color_map = {"P": COLOR_PRESENTE, "A": COLOR_AUSENTE, "J": COLOR_JUSTIFICANTE}
-        for row in ws.iter_rows(min_row=2, min_col=5):
-            for cell in row:
-                letra = str(cell.value).upper()
-                if letra in color_map:
-                    cell.fill = color_map[letra]
-                    cell.alignment = Alignment(horizontal="center")
-                    cell.font = Font(bold=True)
-
-        # 10️⃣ Ajustar ancho de columnas
-        for col in ws.columns:
-            max_len = max(len(str(c.value)) if c.value else 0 for c in col)
-            ws.column_dimensions[col[0].column_letter].width = max(12, max_len + 2)
-
-        # 11️⃣ Enviar archivo Excel como respuesta
-        buffer = io.BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
+        # 3️⃣ Alumnos × fechas únicas, pivoteado conforme llegan los lotes
+        matrices = await pivotar_lotes(stream_rows(asistencias_query, (id_grupo, id_materia)), None)
+        matriz = matrices.get(None) or MatrizAsistencia.vacia()
+
+        estilo_letra = {"P": "presente_negrita", "A": "ausente_negrita", "J": "justificante_negrita"}
+
+        def construir(reporte: ReporteExcel):
+            fechas_unicas = matriz.fechas
+            # Sin registro cuenta como ausente
+            letras = matriz.mapear(lambda estado: LETRA_ESTADO.get(estado, "A"))
+            estilos_letra = matriz.mapear(lambda estado: estilo_letra[LETRA_ESTADO.get(estado, "A")])
+
+            # 5️⃣ Encabezados y anchos estimados con los datos
+            encabezados = ["Nombre", "Matrícula", "Grupo", "Materia"] + fechas_unicas
+            estudiantes = list(matriz.alumnos.values())
+            anchos = [
+                estimar_ancho([encabezados[0]] + [e["nombre"] for e in estudiantes], minimo=12),
+                estimar_ancho([encabezados[1]] + [e["matricula"] for e in estudiantes], minimo=12),
+                estimar_ancho([encabezados[2], nombre_grupo], minimo=12),
+                estimar_ancho([encabezados[3], nombre_materia], minimo=12),
+            ] + [estimar_ancho([f], minimo=12) for f in fechas_unicas]
+            ws = reporte.hoja(limpiar_nombre_hoja(f"Asistencias_{nombre_grupo}"), anchos)
+            ws.encabezado(encabezados, "encabezado_vc")
+
+            # 6️⃣ Agregar filas con datos (letras coloreadas)
+            for id_est, est in matriz:
+                fila = [
+                    est["nombre"],
+                    est["matricula"],
+                    nombre_grupo,
+                    nombre_materia,
+                ]
+                fila.extend(letras.fila(id_est))
+                ws.fila(fila, [None] * 4 + estilos_letra.fila(id_est))
 
+        # 7️⃣ Enviar archivo Excel como respuesta
         filename = f"Asistencias_{nombre_grupo}_{nombre_materia}.xlsx"
 
-        return StreamingResponse(
-            buffer,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        return respuesta_excel(construir, filename)
 
     except Exception as e:
         print("❌ ERROR exportando Excel:", e)
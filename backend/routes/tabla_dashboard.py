@@ -1,5 +1,5 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
-from typing import Dict
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Response
+from typing import Dict, Optional
 import asyncio
 import logging
 import json
@@ -7,34 +7,42 @@ from datetime import datetime
 from zoneinfo import ZoneInfo 
 from config.db import fetch_all
 from routes.ws_manager_tabla import tabla_manager
+from routes.ws_conexion import escuchar
+from utils.snapshot_tabla import snapshots_tabla
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.websocket("/ws/tabla/{id_clase}")
-async def websocket_tabla(websocket: WebSocket, id_clase: int):
+async def websocket_tabla(websocket: WebSocket, id_clase: int, since: Optional[str] = None):
     """
     WebSocket para tabla dinámica - Versión optimizada
+
+    Con ?since=<epoca>:<version> (reconexión) solo se mandan los cambios que
+    el cliente se perdió; si ya no están en el historial, o la época es de
+    otro arranque u otro worker, se manda la tabla completa.
     """
     # ✅ El manager ya llama a accept(), no lo llamamos aquí
-    await tabla_manager.connect(websocket, id_clase)
+    conexion = await tabla_manager.connect(websocket, id_clase)
     logger.info(f"✅ Cliente conectado a clase {id_clase}. Total: {len(tabla_manager.active_connections.get(id_clase, []))}")
     
     try:
-        # Enviar datos iniciales
-        datos_iniciales = await obtener_datos_tabla_completos(id_clase)
-        await websocket.send_text(json.dumps(datos_iniciales, ensure_ascii=False))
-        logger.info(f"📤 Datos iniciales enviados a clase {id_clase}")
+        if since is not None and tabla_manager.reanudar(websocket, id_clase, since):
+            logger.info(f"⏩ Clase {id_clase}: reconexión desde {since}, solo cambios")
+        else:
+            # Enviar datos iniciales (desde la foto en memoria, ya serializada)
+            snapshot = await snapshots_tabla.obtener(id_clase, construir_datos_tabla)
+            tabla_manager.enviar_tabla(websocket, snapshot.texto())
+            logger.info(f"📤 Datos iniciales enviados a clase {id_clase} (v{snapshot.version})")
+        
+        async def al_mensaje(data: str):
+            # El cliente detectó un hueco de versiones: se le manda la tabla otra vez
+            if data == "snapshot":
+                snapshot = await snapshots_tabla.obtener(id_clase, construir_datos_tabla)
+                tabla_manager.enviar_tabla(websocket, snapshot.texto())
         
-        # ✅ LOOP SIMPLE SIN TIMEOUT - Mantiene conexión abierta
-        while True:
-            # Recibir cualquier mensaje del cliente
-            data = await websocket.receive_text()
-            
-            # Responder a pings (keep-alive)
-            if data == "ping":
-                await websocket.send_text("pong")
-                logger.debug(f"🏓 Ping/Pong con clase {id_clase}")
+        # Recibe hasta que el cliente cierre; "ping" se contesta con "pong"
+        await escuchar(websocket, conexion, al_mensaje)
                 
     except WebSocketDisconnect:
         logger.info(f"🔌 Cliente desconectado de clase {id_clase}")
@@ -48,6 +56,18 @@ async def websocket_tabla(websocket: WebSocket, id_clase: int):
 async def obtener_datos_tabla_completos(id_clase: int) -> Dict:
     """
     Obtiene toda la información de la clase con estudiantes y actividades
+
+    Se sirve desde la foto en memoria (utils/snapshot_tabla.py); solo se
+    consulta MySQL la primera vez del día o tras una invalidación.
+    """
+    snapshot = await snapshots_tabla.obtener(id_clase, construir_datos_tabla)
+    return snapshot.a_dict()
+
+
+async def construir_datos_tabla(id_clase: int) -> Dict:
+    """
+    Arma la tabla de la clase desde MySQL (actividades de hoy, estudiantes
+    con su asistencia y estados de entrega)
     """
     # ✅ CAMBIO 1: Obtener fecha/hora actual en zona horaria de México
     ahora_cdmx = datetime.now(ZoneInfo("America/Mexico_City"))
@@ -147,28 +167,22 @@ async def obtener_datos_tabla_completos(id_clase: int) -> Dict:
     estados_dict = {}
     if actividades:
         actividad_ids = [act['id_actividad'] for act in actividades]
-        estudiante_ids = [est['id_estudiante'] for est in estudiantes]
         
-        # Una sola query para obtener TODOS los estados
+        # Una sola query para obtener TODOS los estados (las actividades ya son
+        # de esta clase; los alumnos que no estén en la tabla se ignoran abajo)
         placeholders_act = ','.join(['%s'] * len(actividad_ids))
-        placeholders_est = ','.join(['%s'] * len(estudiante_ids))
         
         query_estados = f"""
             SELECT id_actividad, id_estudiante, estado
             FROM actividad_estudiante
             WHERE id_actividad IN ({placeholders_act})
-                AND id_estudiante IN ({placeholders_est})
         """
         
-        estados = await fetch_all(
-            query_estados, 
-            tuple(actividad_ids + estudiante_ids)
-        )
+        estados = await fetch_all(query_estados, tuple(actividad_ids))
         
         # Crear diccionario de estados para acceso rápido
         for estado in estados:
-            key = f"{estado['id_estudiante']}_{estado['id_actividad']}"
-            estados_dict[key] = estado['estado']
+            estados_dict[(estado['id_estudiante'], estado['id_actividad'])] = estado['estado']
         
         logger.debug(f"📊 {len(estados)} estados de actividades obtenidos en 1 query")
     
@@ -180,8 +194,7 @@ async def obtener_datos_tabla_completos(id_clase: int) -> Dict:
         
         # Buscar estado de cada actividad en el diccionario
         for actividad in actividades:
-            key = f"{estudiante['id_estudiante']}_{actividad['id_actividad']}"
-            estado = estados_dict.get(key, 'pendiente')
+            estado = estados_dict.get((estudiante['id_estudiante'], actividad['id_actividad']), 'pendiente')
             est_data['actividades'][str(actividad['id_actividad'])] = estado
         
         estudiantes_completos.append(est_data)
@@ -218,9 +231,10 @@ async def obtener_datos_api(id_clase: int):
     Endpoint REST para cargar datos iniciales
     """
     try:
-        datos = await obtener_datos_tabla_completos(id_clase)
-        logger.info(f"✅ API devolvió datos para clase {id_clase}")
-        return datos
+        snapshot = await snapshots_tabla.obtener(id_clase, construir_datos_tabla)
+        logger.info(f"✅ API devolvió datos para clase {id_clase} (v{snapshot.version})")
+        # JSON ya serializado en la foto: no se vuelve a codificar por petición
+        return Response(content=snapshot.texto(), media_type="application/json")
         
     except Exception as e:
         logger.error(f"❌ Error obteniendo datos: {e}")
@@ -243,7 +257,7 @@ async def notificar_asistencia(id_clase: int, id_estudiante: int, estado: str, h
             "hora": hora
         }
     }
-    await tabla_manager.broadcast(json.dumps(mensaje, ensure_ascii=False), id_clase)
+    tabla_manager.publicar(mensaje, id_clase)
     logger.info(f"📢 Asistencia notificada: clase {id_clase}, estudiante {id_estudiante} → {estado}")
 
 
@@ -0,0 +1,279 @@
+"""
+Cola de salida por conexión WebSocket.
+
+Cada socket tiene su propia cola acotada y una tarea escritora que la
+vacía; los handlers de las peticiones solo encolan y regresan. Si un
+navegador se atrasa y su cola se llena se aplica la política de
+desborde (WS_POLITICA_DESBORDE):
+
+- "coalescer" (default): junta los cambios pendientes en un solo
+  {"tipo": "lote", "cambios": [...]} donde el último estado de cada
+  alumno/actividad reemplaza a los anteriores.
+- "descartar_antiguo": tira el mensaje más viejo.
+- "desconectar": cierra el socket; el cliente reconecta y recibe la
+  tabla completa.
+
+Un cliente que tarda más de WS_TIMEOUT_ENVIO segundos en recibir un
+frame se expulsa. La tabla completa que se manda al conectar
+(encolar_inicial) puede ser grande para una conexión móvil lenta: tiene
+su propio límite, WS_TIMEOUT_ENVIO_INICIAL (0 = sin límite), para no
+expulsar al cliente una y otra vez en cada reconexión.
+
+Recepción: escuchar() atiende lo que manda el cliente con un receive()
+bloqueante, sin timers por socket. Los sockets muertos los detecta el
+ping/pong de protocolo de uvicorn (--ws-ping-interval/--ws-ping-timeout)
+y receive() regresa el cierre en cuanto pasa, así que un cliente que
+solo escucha puede quedarse conectado indefinidamente. Opcionalmente
+(WS_TIMEOUT_INACTIVO > 0, apagado por defecto) una sola tarea para todas
+las conexiones cierra las que llevan ese tiempo sin mandar nada; solo
+tiene sentido si todos los clientes mandan "ping" de aplicación, como
+los de este repo (cada 30s).
+"""
+
+import asyncio
+import json
+import os
+import time
+import weakref
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from fastapi import WebSocket
+
+TAMANO_COLA = int(os.getenv("WS_TAMANO_COLA", "64"))
+POLITICA_DESBORDE = os.getenv("WS_POLITICA_DESBORDE", "coalescer")
+# Segundos máximos para entregar un mensaje a un socket antes de expulsarlo
+TIMEOUT_ENVIO = float(os.getenv("WS_TIMEOUT_ENVIO", "2"))
+# Lo mismo para la tabla completa inicial (0 = sin límite)
+TIMEOUT_ENVIO_INICIAL = float(os.getenv("WS_TIMEOUT_ENVIO_INICIAL", "30"))
+# Segundos sin recibir nada del cliente antes de cerrarlo (0 = nunca, default)
+TIMEOUT_INACTIVO = float(os.getenv("WS_TIMEOUT_INACTIVO", "0"))
+
+POLITICAS = ("coalescer", "descartar_antiguo", "desconectar")
+if POLITICA_DESBORDE not in POLITICAS:
+    print(f"⚠️ WS_POLITICA_DESBORDE inválida ({POLITICA_DESBORDE}), se usa 'coalescer'")
+    POLITICA_DESBORDE = "coalescer"
+
+
+class MensajeInicial(str):
+    """Texto de la tabla completa: se envía con TIMEOUT_ENVIO_INICIAL."""
+
+
+class ConexionWS:
+    """Socket + cola de salida acotada + tarea escritora."""
+
+    def __init__(self, websocket: WebSocket, etiqueta: str, al_expulsar: Callable[[WebSocket], None]):
+        self.websocket = websocket
+        self.etiqueta = etiqueta
+        self.pendientes: Deque[str] = deque()
+        self.cerrada = False
+        self.descartados = 0
+        self.coalescidos = 0
+        self.ultima_actividad = time.monotonic()
+        self._al_expulsar = al_expulsar
+        self._evento = asyncio.Event()
+        self._tarea: Optional[asyncio.Task] = asyncio.create_task(self._escritor())
+        _registrar_para_barrido(self)
+
+    def encolar(self, message: str) -> bool:
+        """Deja el mensaje en la cola; nunca espera al socket."""
+        if self.cerrada:
+            return False
+
+        if len(self.pendientes) >= TAMANO_COLA:
+            if POLITICA_DESBORDE == "desconectar":
+                print(f"🚫 Cola llena ({TAMANO_COLA}) en {self.etiqueta}, se desconecta")
+                self.expulsar(1013)
+                return False
+            if POLITICA_DESBORDE == "coalescer":
+                antes = len(self.pendientes)
+                self.pendientes = deque(coalescer_mensajes(list(self.pendientes)))
+                self.coalescidos += antes - len(self.pendientes)
+            # Si coalescer no bastó (o la política es descartar), sale el más viejo
+            while len(self.pendientes) >= TAMANO_COLA:
+                self.pendientes.popleft()
+                self.descartados += 1
+
+        self.pendientes.append(message)
+        self._evento.set()
+        return True
+
+    def encolar_inicial(self, message: str) -> bool:
+        """Como encolar(), para la tabla completa (límite de envío más amplio)."""
+        return self.encolar(MensajeInicial(message))
+
+    def cancelar(self):
+        """Detiene el escritor (el socket ya se cerró o se va a cerrar)."""
+        self.cerrada = True
+        self.pendientes.clear()
+        if self._tarea and self._tarea is not asyncio.current_task():
+            self._tarea.cancel()
+        self._tarea = None
+
+    async def _escritor(self):
+        try:
+            while True:
+                while not self.pendientes:
+                    self._evento.clear()
+                    await self._evento.wait()
+                message = self.pendientes.popleft()
+                limite = TIMEOUT_ENVIO
+                if isinstance(message, MensajeInicial):
+                    limite = TIMEOUT_ENVIO_INICIAL or None
+                await asyncio.wait_for(self.websocket.send_text(message), timeout=limite)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            print(f"🐢 Cliente lento en {self.etiqueta} (> {limite}s), se expulsa")
+            self.expulsar(1013)
+        except Exception as e:
+            print(f"❌ Error enviando a cliente de {self.etiqueta}: {e}")
+            self.expulsar(1011)
+
+    def expulsar(self, code: int):
+        """Cierra el socket y lo saca del manager."""
+        if self.cerrada:
+            return
+        self.cancelar()
+        self._al_expulsar(self.websocket)
+        asyncio.create_task(self._cerrar(code))
+
+    async def _cerrar(self, code: int):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), timeout=TIMEOUT_ENVIO)
+        except Exception:
+            pass
+
+
+async def escuchar(
+    websocket: WebSocket,
+    conexion: ConexionWS,
+    al_mensaje: Optional[Callable[[str], Optional[Awaitable]]] = None,
+):
+    """
+    Atiende al cliente hasta que se desconecta.
+
+    Responde "ping" con "pong" (por la cola, para respetar el orden) y pasa
+    cualquier otro texto a al_mensaje.
+    """
+    while True:
+        mensaje = await websocket.receive()
+        if mensaje["type"] == "websocket.disconnect":
+            return
+        conexion.ultima_actividad = time.monotonic()
+        texto = mensaje.get("text")
+        if texto is None:
+            continue
+        if texto == "ping":
+            conexion.encolar("pong")
+        elif al_mensaje is not None:
+            resultado = al_mensaje(texto)
+            if asyncio.iscoroutine(resultado):
+                await resultado
+
+
+# ===============================
+# 📌 BARRIDO DE INACTIVOS
+# ===============================
+_conexiones_vivas: "weakref.WeakSet[ConexionWS]" = weakref.WeakSet()
+_tarea_barrido: Optional[asyncio.Task] = None
+
+
+def _registrar_para_barrido(conexion: ConexionWS):
+    global _tarea_barrido
+    if TIMEOUT_INACTIVO <= 0:
+        return
+    _conexiones_vivas.add(conexion)
+    if _tarea_barrido is None or _tarea_barrido.done():
+        _tarea_barrido = asyncio.create_task(_barrer_inactivos())
+
+
+async def _barrer_inactivos():
+    """Una sola tarea para todos los sockets: cierra los que no dan señales de vida."""
+    while _conexiones_vivas:
+        await asyncio.sleep(TIMEOUT_INACTIVO / 3)
+        limite = time.monotonic() - TIMEOUT_INACTIVO
+        for conexion in list(_conexiones_vivas):
+            if conexion.cerrada:
+                _conexiones_vivas.discard(conexion)
+            elif conexion.ultima_actividad < limite:
+                print(f"💤 Cliente de {conexion.etiqueta} inactivo > {TIMEOUT_INACTIVO:.0f}s, se cierra")
+                conexion.expulsar(1001)
+
+
+def coalescer_mensajes(mensajes: List[str]) -> List[str]:
+    """
+    Junta mensajes de estado consecutivos en frames {"tipo": "lote"}.
+
+    Se agrupan los eventos con data.id_estudiante (asistencia, entrega_*),
+    incluyendo los que ya venían en un lote; el último de cada
+    (tipo, alumno, actividad) gana. Cualquier otro mensaje (tabla inicial,
+    nueva_actividad, pong...) se respeta en su lugar y corta el grupo.
+    """
+    resultado: List[str] = []
+    grupo: Dict[tuple, Dict] = {}
+    # Rango de versiones que cubre el grupo: la base del primero y la versión del último
+    versiones: List[int] = []
+    epoca: List[str] = []
+
+    def cerrar_grupo():
+        if grupo:
+            resultado.append(armar_frame(list(grupo.values()), tuple(versiones) or None, epoca[0] if epoca else None))
+        grupo.clear()
+        versiones.clear()
+        epoca.clear()
+
+    for texto in mensajes:
+        try:
+            mensaje = json.loads(texto)
+        except ValueError:
+            mensaje = None
+        if not isinstance(mensaje, dict):
+            cerrar_grupo()
+            resultado.append(texto)
+            continue
+
+        cambios = mensaje.get("cambios") if mensaje.get("tipo") == "lote" else [mensaje]
+        if not isinstance(cambios, list) or not all(clave_cambio(c) for c in cambios):
+            cerrar_grupo()
+            resultado.append(texto)
+            continue
+        for cambio in cambios:
+            cambio = {k: v for k, v in cambio.items() if k not in ("version_base", "version", "epoca")}
+            grupo[clave_cambio(cambio)] = cambio
+        if "version" in mensaje:
+            if "epoca" in mensaje and not epoca:
+                epoca.append(mensaje["epoca"])
+            if versiones:
+                versiones[1] = mensaje["version"]
+            else:
+                versiones.extend((mensaje.get("version_base", mensaje["version"]), mensaje["version"]))
+
+    cerrar_grupo()
+    return resultado
+
+
+def armar_frame(cambios: List[Dict], versiones: Optional[tuple] = None, epoca: Optional[str] = None) -> str:
+    """
+    Un solo cambio se manda tal cual; varios van en un frame "lote".
+
+    versiones = (version_base, version) de la tabla de la clase, si se conoce,
+    y epoca la del proceso que las numeró (ver utils/snapshot_tabla.py).
+    """
+    if len(cambios) == 1:
+        frame = dict(cambios[0])
+    else:
+        frame = {"tipo": "lote", "cambios": cambios}
+    if versiones:
+        frame["version_base"], frame["version"] = versiones
+        if epoca is not None:
+            frame["epoca"] = epoca
+    return json.dumps(frame, ensure_ascii=False)
+
+
+def clave_cambio(cambio) -> Optional[tuple]:
+    """(tipo, id_estudiante, id_actividad) de un cambio de estado; None si no lo es."""
+    data = cambio.get("data") if isinstance(cambio, dict) else None
+    if not isinstance(data, dict) or data.get("id_estudiante") is None:
+        return None
+    return (cambio.get("tipo"), data["id_estudiante"], data.get("id_actividad"))
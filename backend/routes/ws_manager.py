@@ -1,33 +1,43 @@
-from typing import List
+from typing import Dict, List
 from fastapi import WebSocket
 
+from routes.ws_conexion import ConexionWS
+from utils.bus_ws import bus_ws
+
 class ConnectionManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
+        # Cola de salida de cada socket (ver routes/ws_conexion.py)
+        self.colas: Dict[WebSocket, ConexionWS] = {}
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket) -> ConexionWS:
         await websocket.accept()
         self.active_connections.append(websocket)
+        conexion = self.colas[websocket] = ConexionWS(websocket, "dashboard general", self.disconnect)
         print(f"✅ Cliente conectado. Total: {len(self.active_connections)}")
+        return conexion
 
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+        conexion = self.colas.pop(websocket, None)
+        if conexion:
+            conexion.cancelar()
         print(f"❌ Cliente desconectado. Total: {len(self.active_connections)}")
 
     async def broadcast(self, message: str):
+        """Publica en el bus para que llegue a los clientes de todos los workers."""
+        bus_ws.publicar("general", {"texto": message})
+
+    def _recibir_bus(self, datos: Dict):
+        """Solo encola; la tarea escritora de cada socket hace el envío."""
+        message = datos["texto"]
         print(f"📡 Broadcasting a {len(self.active_connections)} clientes: {message[:100]}...")
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                print(f"Error enviando a cliente: {e}")
-                disconnected.append(connection)
-        
-        # Limpia conexiones muertas
-        for conn in disconnected:
-            self.disconnect(conn)
+        for connection in list(self.active_connections):
+            conexion = self.colas.get(connection)
+            if conexion:
+                conexion.encolar(message)
 
 # Instancia global
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
+bus_ws.suscribir("general", manager._recibir_bus)
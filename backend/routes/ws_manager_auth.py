@@ -7,6 +7,8 @@ from typing import Dict
 import logging
 import json
 
+from utils.bus_ws import bus_ws
+
 logger = logging.getLogger(__name__)
 
 
@@ -60,13 +62,23 @@ class AuthConnectionManager:
         """
         Notifica al navegador que el login fue exitoso.
         
+        Si el navegador está conectado a otro worker el aviso se manda por
+        el bus (utils/bus_ws.py) y lo entrega ese worker.
+        
         Args:
             session_id: ID de la sesión
             datos: Información del login (id_profesor, id_clase, etc.)
             
         Returns:
-            bool: True si se notificó exitosamente, False si no hay conexión
+            bool: True si se notificó exitosamente en este worker
         """
+        if session_id not in self.active_connections and bus_ws.distribuido:
+            logger.info(f"📡 Sesión {session_id} no está en este worker, se avisa por el bus")
+            bus_ws.publicar("auth", {"session_id": session_id, "evento": "login_exitoso", "datos": datos})
+            return False
+        return await self._notificar_login_local(session_id, datos)
+    
+    async def _notificar_login_local(self, session_id: str, datos: dict) -> bool:
         logger.info(f"📤 Intentando notificar login exitoso a: {session_id}")
         logger.info(f"📊 Conexiones disponibles: {list(self.active_connections.keys())}")
         
@@ -116,8 +128,14 @@ class AuthConnectionManager:
             mensaje: Mensaje de error a mostrar
             
         Returns:
-            bool: True si se notificó exitosamente
+            bool: True si se notificó exitosamente en este worker
         """
+        if session_id not in self.active_connections and bus_ws.distribuido:
+            bus_ws.publicar("auth", {"session_id": session_id, "evento": "error", "mensaje": mensaje})
+            return False
+        return await self._notificar_error_local(session_id, mensaje)
+    
+    async def _notificar_error_local(self, session_id: str, mensaje: str) -> bool:
         logger.warning(f"⚠️ Notificando error a {session_id}: {mensaje}")
         
         if session_id not in self.active_connections:
@@ -140,6 +158,16 @@ class AuthConnectionManager:
             self.disconnect(session_id)
             return False
     
+    async def _recibir_bus(self, datos: dict):
+        """Aviso publicado por otro worker: solo aplica si la sesión está aquí."""
+        session_id = datos["session_id"]
+        if session_id not in self.active_connections:
+            return
+        if datos["evento"] == "login_exitoso":
+            await self._notificar_login_local(session_id, datos["datos"])
+        else:
+            await self._notificar_error_local(session_id, datos["mensaje"])
+    
     def get_active_sessions_count(self) -> int:
         """
         Retorna el número de sesiones activas.
@@ -163,4 +191,5 @@ class AuthConnectionManager:
 
 
 # Instancia global del manager
-auth_manager = AuthConnectionManager()
\ No newline at end of file
+auth_manager = AuthConnectionManager()
+bus_ws.suscribir("auth", auth_manager._recibir_bus)
\ No newline at end of file
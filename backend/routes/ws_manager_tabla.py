@@ -1,59 +1,214 @@
 from fastapi import WebSocket
-from typing import Dict, List
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import asyncio
 import json
+import os
+
+from routes.ws_conexion import ConexionWS, armar_frame, clave_cambio, coalescer_mensajes
+from utils.snapshot_tabla import snapshots_tabla
+from utils.bus_ws import bus_ws
+
+# Ventana (ms) en la que se juntan los cambios de una clase antes de mandarlos
+VENTANA_COALESCENCIA = float(os.getenv("WS_VENTANA_COALESCENCIA_MS", "150")) / 1000
+# Eventos recientes que se guardan por clase para reanudar con ?since=<epoca>:<version>
+TAMANO_HISTORIAL = int(os.getenv("WS_TAMANO_HISTORIAL", "500"))
 
 class TableConnectionManager:
     """Manager de WebSockets para dashboards de tabla dinámica"""
     def __init__(self):
         self.active_connections: Dict[int, List[WebSocket]] = {}
+        # Cola de salida de cada socket (ver routes/ws_conexion.py)
+        self.colas: Dict[WebSocket, ConexionWS] = {}
+        # Cambios de cada clase esperando a que cierre su ventana
+        self._pendientes: Dict[int, Dict[tuple, Dict]] = {}
+        # (versión antes del primer cambio pendiente, versión tras el último) por clase
+        self._versiones: Dict[int, List[int]] = {}
+        self._temporizadores: Dict[int, asyncio.Task] = {}
+        # Buffer circular por clase: (version_base, version, mensaje)
+        self._historial: Dict[int, Deque[Tuple[int, int, Dict]]] = {}
+        self.expulsados = 0
+        self.metricas = {"cambios_recibidos": 0, "frames_enviados": 0, "reanudaciones": 0, "tablas_completas": 0}
 
-    async def connect(self, websocket: WebSocket, id_clase: int):
+    async def connect(self, websocket: WebSocket, id_clase: int) -> ConexionWS:
         """Aceptar conexión y asignarla al id_clase correspondiente"""
         await websocket.accept()
         if id_clase not in self.active_connections:
             self.active_connections[id_clase] = []
         self.active_connections[id_clase].append(websocket)
+        conexion = self.colas[websocket] = ConexionWS(
+            websocket, f"clase {id_clase}", lambda ws: self._expulsar(ws, id_clase)
+        )
         print(f"✅ Cliente conectado a clase {id_clase}. Total: {len(self.active_connections[id_clase])}")
+        return conexion
 
     def disconnect(self, websocket: WebSocket, id_clase: int):
         """Remover conexión de un id_clase específico"""
         if id_clase in self.active_connections and websocket in self.active_connections[id_clase]:
             self.active_connections[id_clase].remove(websocket)
+        conexion = self.colas.pop(websocket, None)
+        if conexion:
+            conexion.cancelar()
         print(f"❌ Cliente desconectado de clase {id_clase}. Total: {len(self.active_connections.get(id_clase, []))}")
 
+    def _expulsar(self, websocket: WebSocket, id_clase: int):
+        self.expulsados += 1
+        self.disconnect(websocket, id_clase)
+
+    def enviar(self, websocket: WebSocket, message: str):
+        """Encolar un mensaje para un solo socket (cambios de una reanudación)"""
+        conexion = self.colas.get(websocket)
+        if conexion:
+            conexion.encolar(message)
+
+    def enviar_tabla(self, websocket: WebSocket, texto: str):
+        """Encolar la tabla completa (con el límite de envío de la tabla inicial)"""
+        conexion = self.colas.get(websocket)
+        if conexion:
+            conexion.encolar_inicial(texto)
+
+    def reanudar(self, websocket: WebSocket, id_clase: int, since: str) -> bool:
+        """
+        Encolar al socket solo los cambios posteriores a `since`
+        ("<epoca>:<version>", como los frames).
+
+        Regresa False si la época no es la de este proceso (el servidor se
+        reinició o la reconexión cayó en otro worker) o si el hueco ya no
+        está en el historial: hay que mandarle la tabla completa.
+        """
+        epoca, _, texto_version = since.rpartition(":")
+        if epoca != snapshots_tabla.epoca or not texto_version.isdigit():
+            self.metricas["tablas_completas"] += 1
+            return False
+        since = int(texto_version)
+        version = snapshots_tabla.version(id_clase)
+        historial = self._historial.get(id_clase)
+        if since > version or (since < version and (not historial or historial[0][0] > since)):
+            self.metricas["tablas_completas"] += 1
+            return False
+
+        textos = [
+            json.dumps({**mensaje, "version_base": base, "version": v, "epoca": snapshots_tabla.epoca}, ensure_ascii=False)
+            for base, v, mensaje in (historial or ())
+            if v > since
+        ]
+        for texto in coalescer_mensajes(textos):
+            self.enviar(websocket, texto)
+        self.metricas["reanudaciones"] += 1
+        print(f"⏩ Cliente de clase {id_clase} reanudado desde {epoca}:v{since} ({len(textos)} cambio(s))")
+        return True
+
     async def broadcast(self, message: str, id_clase: int):
         """
         Enviar mensaje (string JSON) solo a los clientes conectados a esta clase
-        
+
+        Los cambios de asistencia/entregas se juntan por clase durante
+        VENTANA_COALESCENCIA y salen en un solo frame "lote"; los demás
+        mensajes salen de inmediato (después de lo que estaba pendiente).
+
         Args:
             message: String JSON con el mensaje a enviar
             id_clase: ID de la clase
         """
-        if id_clase not in self.active_connections:
+        # Parsear el JSON una sola vez
+        try:
+            mensaje = json.loads(message)
+        except Exception:
+            mensaje = None
+
+        if isinstance(mensaje, dict):
+            self.publicar(mensaje, id_clase)
+        else:
+            bus_ws.publicar("tabla", {"id_clase": id_clase, "texto": message})
+
+    def publicar(self, mensaje: Dict, id_clase: int):
+        """
+        Publicar un mensaje (dict, sin serializar) a los dashboards de la clase,
+        en este worker y en los demás (ver utils/bus_ws.py).
+        """
+        bus_ws.publicar("tabla", {"id_clase": id_clase, "mensaje": mensaje})
+
+    def _recibir_bus(self, datos: Dict):
+        """Mensaje del bus (de este worker o de otro) para los sockets locales."""
+        id_clase = datos["id_clase"]
+        if "mensaje" in datos:
+            self._publicar_local(datos["mensaje"], id_clase)
+            return
+        if not self.active_connections.get(id_clase):
             print(f"⚠️ No hay conexiones activas para clase {id_clase}")
             return
-        
-        disconnected = []
-        
-        for connection in self.active_connections[id_clase]:
-            try:
-                await connection.send_text(message)
-                
-                # Log del tipo de mensaje (parsear el JSON solo para logging)
-                try:
-                    mensaje_dict = json.loads(message)
-                    tipo = mensaje_dict.get('tipo', 'desconocido')
-                    print(f"📤 Mensaje '{tipo}' enviado a clase {id_clase}")
-                except:
-                    print(f"📤 Mensaje enviado a clase {id_clase}")
-                    
-            except Exception as e:
-                print(f"❌ Error enviando a cliente de clase {id_clase}: {e}")
-                disconnected.append(connection)
-        
-        # Limpiar conexiones rotas
-        for conn in disconnected:
-            self.disconnect(conn, id_clase)
+        self._vaciar(id_clase)
+        self._enviar_a_clase(datos["texto"], id_clase, 'desconocido')
+
+    def _publicar_local(self, mensaje: Dict, id_clase: int):
+        """
+        Entregar un mensaje a los dashboards de la clase conectados a este worker.
+
+        Los cambios de estado entran a la ventana de su clase; si el mismo
+        alumno/actividad cambia dos veces en la ventana solo sale el último.
+        Cualquier otro mensaje vacía primero lo pendiente para respetar el orden.
+
+        Antes de difundirlo se aplica a la foto en memoria de la tabla, aunque
+        no haya nadie conectado.
+        """
+        base, version = snapshots_tabla.aplicar(id_clase, mensaje)
+        historial = self._historial.get(id_clase)
+        if historial is None:
+            historial = self._historial[id_clase] = deque(maxlen=TAMANO_HISTORIAL)
+        historial.append((base, version, mensaje))
+        if not self.active_connections.get(id_clase):
+            return
+
+        if not _es_coalescible(mensaje):
+            self._vaciar(id_clase)
+            texto = json.dumps(
+                {**mensaje, "version_base": base, "version": version, "epoca": snapshots_tabla.epoca}, ensure_ascii=False
+            )
+            self._enviar_a_clase(texto, id_clase, mensaje.get('tipo', 'desconocido'))
+            return
+
+        cambios = mensaje["cambios"] if mensaje.get("tipo") == "lote" else [mensaje]
+        self._versiones.setdefault(id_clase, [base, version])[1] = version
+        pendientes = self._pendientes.setdefault(id_clase, {})
+        for cambio in cambios:
+            pendientes[clave_cambio(cambio)] = cambio
+        self.metricas["cambios_recibidos"] += len(cambios)
+
+        if VENTANA_COALESCENCIA <= 0:
+            self._vaciar(id_clase)
+        elif id_clase not in self._temporizadores:
+            self._temporizadores[id_clase] = asyncio.create_task(self._vaciar_despues(id_clase))
+
+    async def _vaciar_despues(self, id_clase: int):
+        await asyncio.sleep(VENTANA_COALESCENCIA)
+        self._temporizadores.pop(id_clase, None)
+        self._vaciar(id_clase)
+
+    def _vaciar(self, id_clase: int):
+        """Mandar ya los cambios pendientes de la clase en un solo frame."""
+        temporizador: Optional[asyncio.Task] = self._temporizadores.pop(id_clase, None)
+        if temporizador and temporizador is not asyncio.current_task():
+            temporizador.cancel()
+        pendientes = self._pendientes.pop(id_clase, None)
+        versiones = self._versiones.pop(id_clase, None)
+        if not pendientes:
+            return
+        cambios = list(pendientes.values())
+        tipo = "lote" if len(cambios) > 1 else cambios[0].get("tipo", "desconocido")
+        self._enviar_a_clase(armar_frame(cambios, tuple(versiones), snapshots_tabla.epoca), id_clase, tipo)
+
+    def _enviar_a_clase(self, message: str, id_clase: int, tipo: str):
+        """Solo encola en la cola de cada socket; las tareas escritoras hacen el envío."""
+        conexiones = self.active_connections.get(id_clase, [])
+        encolados = sum(1 for ws in list(conexiones) if ws in self.colas and self.colas[ws].encolar(message))
+        self.metricas["frames_enviados"] += 1
+        print(f"📤 Mensaje '{tipo}' encolado para {encolados} cliente(s) de clase {id_clase}")
+
+
+def _es_coalescible(mensaje: Dict) -> bool:
+    cambios = mensaje.get("cambios") if mensaje.get("tipo") == "lote" else [mensaje]
+    return isinstance(cambios, list) and all(clave_cambio(c) for c in cambios)
 
 # Instancia global
-tabla_manager = TableConnectionManager()
\ No newline at end of file
+tabla_manager = TableConnectionManager()
+bus_ws.suscribir("tabla", tabla_manager._recibir_bus)
@@ -0,0 +1,233 @@
+"""
+Analítica de calificaciones de actividades con NumPy
+(/api/estadisticas/clases-actividades/...).
+
+El resumen de una clase hacía cinco consultas, pasaba todas las
+calificaciones a una lista y las contaba con tres sum(1 for c in ...).
+Aquí se lee una sola vez cada actividad con sus entregas (de una clase
+o de todas las clases de un profesor) y se guardan como arreglos:
+
+- por fila (actividad × alumno): actividad, estado y calificación (NaN si no tiene)
+- por actividad: id, clase, título y valor máximo
+
+De ahí salen con operaciones vectorizadas (bincount, percentile,
+histogram) los totales, el estado de las entregas, la distribución, los
+percentiles, un histograma en porcentaje del valor máximo y las medias y
+tasas de entrega por actividad. resumir() acepta un subconjunto de
+clases, así el resumen de profesor arma el de cada clase sin volver a
+consultar.
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config.db import stream_rows
+
+ESTADOS_ENTREGA = ("pendiente", "entregado", "no_entregado")
+PERCENTILES = (10, 25, 50, 75, 90)
+# Bordes del histograma en porcentaje del valor máximo de la actividad
+BORDES_HISTOGRAMA = np.arange(0, 101, 10)
+
+# Código de estado: su posición en ESTADOS_ENTREGA; otro o NULL = OTRO_ESTADO
+OTRO_ESTADO = len(ESTADOS_ENTREGA)
+_CODIGO_ESTADO = {estado: i for i, estado in enumerate(ESTADOS_ENTREGA)}
+
+CONSULTA_CALIFICACIONES = """
+    SELECT a.id_actividad, a.id_clase, a.titulo, a.valor_maximo, ae.id_estudiante, ae.estado, ae.calificacion
+    FROM actividad a
+    LEFT JOIN actividad_estudiante ae ON ae.id_actividad = a.id_actividad
+    WHERE {filtro}
+    ORDER BY a.id_clase, a.id_actividad
+"""
+
+FILTRO_CLASE = "a.id_clase = %s"
+FILTRO_PROFESOR = "a.id_clase IN (SELECT id_clase FROM clase WHERE id_profesor = %s AND eliminado = 0)"
+
+
+class CalificacionesActividades:
+    """Actividades y entregas como arreglos (ver el docstring del módulo)."""
+
+    def __init__(self):
+        self.ids: List[int] = []
+        self.clases: List[int] = []
+        self.titulos: List[str] = []
+        self.valores_maximos: List[Optional[float]] = []
+        self._posicion: Dict[int, int] = {}
+        self._actividad: List[int] = []
+        self._estado: List[int] = []
+        self._calificacion: List[float] = []
+        # Arreglos (terminar())
+        self.actividad_fila = self.estado_fila = self.calificacion_fila = None
+        self.clase_actividad = self.valor_maximo_actividad = None
+
+    def agregar(self, filas: Sequence[tuple]) -> "CalificacionesActividades":
+        posicion, a_act, a_est, a_cal = self._posicion, self._actividad.append, self._estado.append, self._calificacion.append
+        codigo = _CODIGO_ESTADO.get
+        for id_actividad, id_clase, titulo, valor_maximo, id_estudiante, estado, calificacion in filas:
+            pos = posicion.get(id_actividad)
+            if pos is None:
+                pos = posicion[id_actividad] = len(self.ids)
+                self.ids.append(id_actividad)
+                self.clases.append(id_clase)
+                self.titulos.append(titulo)
+                self.valores_maximos.append(float(valor_maximo) if valor_maximo is not None else np.nan)
+            if id_estudiante is None:
+                continue  # actividad sin entregas (LEFT JOIN)
+            a_act(pos)
+            a_est(codigo(estado, OTRO_ESTADO))
+            a_cal(float(calificacion) if calificacion is not None else np.nan)
+        return self
+
+    def terminar(self) -> "CalificacionesActividades":
+        self.actividad_fila = np.asarray(self._actividad, dtype=np.int64)
+        self.estado_fila = np.asarray(self._estado, dtype=np.int64)
+        self.calificacion_fila = np.asarray(self._calificacion, dtype=np.float64)
+        self.clase_actividad = np.asarray(self.clases, dtype=np.int64)
+        self.valor_maximo_actividad = np.asarray(self.valores_maximos, dtype=np.float64)
+        self._actividad, self._estado, self._calificacion = [], [], []
+        return self
+
+
+async def cargar_calificaciones(filtro: str, params) -> CalificacionesActividades:
+    """Lee actividades y entregas por lotes (FILTRO_CLASE o FILTRO_PROFESOR)."""
+    datos = CalificacionesActividades()
+    async for lote in stream_rows(CONSULTA_CALIFICACIONES.format(filtro=filtro), params, dict_rows=False):
+        datos.agregar(lote)
+    return datos.terminar()
+
+
+def _numero(valor) -> Optional[float]:
+    return None if valor is None or np.isnan(valor) else round(float(valor), 2)
+
+
+def _entero(valor) -> Optional[int]:
+    return None if valor is None or np.isnan(valor) else int(valor)
+
+
+def _por_titulo(titulos: List[str], actividades: np.ndarray, *columnas: np.ndarray):
+    """Suma columnas por actividad agrupando por título (como GROUP BY a.titulo), en orden de aparición."""
+    if not actividades.size:
+        return [], [np.zeros(0) for _ in columnas]
+    nombres = [titulos[i] for i in actividades.tolist()]
+    unicos, primera, inverso = np.unique(nombres, return_index=True, return_inverse=True)
+    orden = np.argsort(primera, kind="stable")
+    sumas = [np.bincount(inverso, weights=c[actividades], minlength=len(unicos))[orden] for c in columnas]
+    return [str(unicos[i]) for i in orden.tolist()], sumas
+
+
+def _mayor_menor(nombres: List[str], valores: np.ndarray, validos: np.ndarray):
+    """(nombre con el mayor valor, nombre con el menor) entre los válidos; empates en orden de aparición."""
+    candidatos = np.flatnonzero(validos)
+    if not candidatos.size:
+        return None, None
+    orden = candidatos[np.argsort(-valores[candidatos], kind="stable")]
+    return nombres[orden[0]], nombres[orden[-1]]
+
+
+def resumir(datos: CalificacionesActividades, clases: Optional[Sequence[int]] = None) -> Dict:
+    """Resumen de las actividades de esas clases (todas si no se dan)."""
+    if clases is None:
+        actividades = np.arange(len(datos.ids))
+    else:
+        actividades = np.flatnonzero(np.isin(datos.clase_actividad, list(clases)))
+    n = len(datos.ids)
+    incluidas = np.zeros(n, dtype=bool)
+    incluidas[actividades] = True
+    filas = incluidas[datos.actividad_fila]
+
+    act = datos.actividad_fila[filas]
+    estado = datos.estado_fila[filas]
+    calif = datos.calificacion_fila[filas]
+    calificada = ~np.isnan(calif)
+    valores_maximos = datos.valor_maximo_actividad
+
+    # 🔹 Estado de entregas
+    conteo_estados = np.bincount(estado, minlength=OTRO_ESTADO + 1)
+
+    # 🔹 Por actividad (vectorizado con bincount sobre el código de actividad)
+    con_entrega = np.bincount(act, minlength=n)
+    entregados = np.bincount(act[estado == _CODIGO_ESTADO["entregado"]], minlength=n)
+    calificadas = np.bincount(act[calificada], minlength=n)
+    sumas = np.bincount(act[calificada], weights=calif[calificada], minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        medias = np.where(calificadas > 0, sumas / np.maximum(calificadas, 1), np.nan)
+        tasas = np.where(con_entrega > 0, entregados / np.maximum(con_entrega, 1) * 100, np.nan)
+
+    por_actividad = [
+        {
+            "id_actividad": datos.ids[i],
+            "titulo": datos.titulos[i],
+            "valor_maximo": _entero(valores_maximos[i]),
+            "entregados": int(entregados[i]),
+            "registros": int(con_entrega[i]),
+            "tasa_entrega": _numero(tasas[i]),
+            "calificadas": int(calificadas[i]),
+            "promedio": _numero(medias[i]),
+            "promedio_porcentaje": _numero(medias[i] / valores_maximos[i] * 100) if valores_maximos[i] else None,
+        }
+        for i in actividades.tolist()
+    ]
+
+    # 🔹 Calificaciones
+    notas = calif[calificada]
+    if notas.size:
+        promedio = float(notas.mean())
+        distribucion = {
+            "0-5": int((notas <= 5).sum()),
+            "6-7": int(((notas >= 6) & (notas <= 7)).sum()),
+            "8-10": int((notas >= 8).sum()),
+        }
+        estadisticas = {
+            "cantidad": int(notas.size),
+            "minimo": _numero(notas.min()),
+            "maximo": _numero(notas.max()),
+            "mediana": _numero(np.median(notas)),
+            "desviacion": _numero(notas.std()),
+            "percentiles": {f"p{p}": _numero(v) for p, v in zip(PERCENTILES, np.percentile(notas, PERCENTILES))},
+        }
+        # Histograma en % del valor máximo (comparable entre actividades)
+        maximos = valores_maximos[act[calificada]]
+        validas = maximos > 0
+        porcentajes = np.clip(notas[validas] / maximos[validas] * 100, 0, 100)
+        conteos_histograma = np.histogram(porcentajes, bins=BORDES_HISTOGRAMA)[0].tolist()
+    else:
+        promedio = 0
+        distribucion = {"0-5": 0, "6-7": 0, "8-10": 0}
+        estadisticas = {"cantidad": 0, "minimo": None, "maximo": None, "mediana": None, "desviacion": None,
+                        "percentiles": {f"p{p}": None for p in PERCENTILES}}
+        conteos_histograma = [0] * (len(BORDES_HISTOGRAMA) - 1)
+
+    # 🔹 Más/menos entregada y mayor/menor promedio (agrupadas por título)
+    titulos, (entregados_titulo, sumas_titulo, calificadas_titulo) = _por_titulo(
+        datos.titulos, actividades, entregados, sumas, calificadas
+    )
+    mas_entregada, menos_entregada = _mayor_menor(titulos, entregados_titulo, entregados_titulo > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        medias_titulo = sumas_titulo / calificadas_titulo
+    mayor_promedio, menor_promedio = _mayor_menor(titulos, medias_titulo, calificadas_titulo > 0)
+
+    maximos_incluidos = valores_maximos[actividades]
+    return {
+        "totales": {
+            "actividades": int(actividades.size),
+            "valor_maximo_promedio": _entero(np.nanmax(maximos_incluidos)) if np.any(~np.isnan(maximos_incluidos)) else None,
+        },
+        "estado_entregas": {estado: int(conteo_estados[i]) for i, estado in enumerate(ESTADOS_ENTREGA)},
+        "calificaciones": {
+            "promedio_general": round(promedio, 2),
+            "distribucion": distribucion,
+            "estadisticas": estadisticas,
+            "histograma_porcentaje": {
+                "bordes": BORDES_HISTOGRAMA.tolist(),
+                "conteos": conteos_histograma,
+            },
+        },
+        "mejores_peores": {
+            "mas_entregada": mas_entregada,
+            "menos_entregada": menos_entregada,
+            "mayor_promedio": mayor_promedio,
+            "menor_promedio": menor_promedio,
+        },
+        "por_actividad": por_actividad,
+    }
@@ -0,0 +1,319 @@
+"""
+Bus de difusión entre workers para los WebSockets.
+
+manager, tabla_manager y auth_manager viven en la memoria de cada
+proceso: con uvicorn --workers N un escaneo atendido por el worker A no
+llegaba a un dashboard conectado al worker B. Ahora los managers no
+difunden directo: publican en este bus y cada worker entrega a sus
+propios sockets lo que recibe.
+
+Las cachés en memoria (utils/cache_roster.py, utils/snapshot_tabla.py,
+utils/cache_estadisticas.py) publican aquí también sus invalidaciones,
+cada una en su canal, para que todos los workers descarten lo mismo.
+
+Backends (WS_BUS):
+
+- "local" (default): un solo proceso, la entrega es inmediata.
+- "unix": broker en un socket Unix (WS_BUS_SOCKET). No hay que levantar
+  nada aparte: el primer worker que toma el candado del archivo
+  <socket>.lock abre el broker y todos (él incluido) se conectan como
+  clientes. Si ese worker muere otro toma el candado al reconectar.
+- "redis": PUBLISH/SUBSCRIBE sobre un servidor que hable el protocolo de
+  Redis (WS_BUS_REDIS_URL), sin depender de la librería redis.
+
+En los backends de varios procesos lo propio se entrega localmente al
+publicar y los mensajes que regresan con el mismo origen se ignoran. Si
+el transporte está caído el mensaje solo llega a los sockets locales.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import uuid
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+BACKEND_BUS = os.getenv("WS_BUS", "local")
+SOCKET_BUS = os.getenv("WS_BUS_SOCKET", "/tmp/control_actividades_bus.sock")
+REDIS_URL = os.getenv("WS_BUS_REDIS_URL", "redis://127.0.0.1:6379/0")
+CANAL_REDIS = os.getenv("WS_BUS_CANAL", "control_actividades:ws")
+ESPERA_RECONEXION = 2
+
+
+class BusLocal:
+    """Entrega en el mismo proceso; base de los demás backends."""
+
+    distribuido = False
+
+    def __init__(self):
+        self.origen = uuid.uuid4().hex
+        self._suscriptores: Dict[str, List[Callable]] = {}
+        self.metricas = {"publicados": 0, "recibidos": 0, "sin_transporte": 0}
+
+    # ===============================
+    # 📌 CICLO DE VIDA
+    # ===============================
+    async def iniciar(self):
+        pass
+
+    async def detener(self):
+        pass
+
+    # ===============================
+    # 📌 PUBLICAR / SUSCRIBIR
+    # ===============================
+    def suscribir(self, canal: str, handler: Callable[[Dict], None]):
+        """handler recibe el mensaje; si es async se agenda como tarea."""
+        self._suscriptores.setdefault(canal, []).append(handler)
+
+    def publicar(self, canal: str, mensaje: Dict, local: bool = True):
+        """
+        Entrega local inmediata y, si aplica, envío a los demás workers.
+        Con local=False solo se envía a los demás (quien publica ya lo aplicó).
+        """
+        self.metricas["publicados"] += 1
+        if local:
+            self._entregar(canal, mensaje)
+        if self.distribuido:
+            linea = json.dumps({"origen": self.origen, "canal": canal, "mensaje": mensaje}, ensure_ascii=False, default=str)
+            if not self._enviar(linea):
+                self.metricas["sin_transporte"] += 1
+
+    def _entregar(self, canal: str, mensaje: Dict):
+        for handler in self._suscriptores.get(canal, []):
+            try:
+                resultado = handler(mensaje)
+                if asyncio.iscoroutine(resultado):
+                    asyncio.create_task(resultado)
+            except Exception as e:
+                logger.error(f"❌ Error entregando mensaje del canal '{canal}': {e}")
+
+    def _recibir(self, linea: str):
+        """Mensaje de otro worker."""
+        try:
+            sobre = json.loads(linea)
+        except ValueError:
+            return
+        if sobre.get("origen") == self.origen:
+            return
+        self.metricas["recibidos"] += 1
+        self._entregar(sobre["canal"], sobre["mensaje"])
+
+    def _enviar(self, linea: str) -> bool:
+        return True
+
+    def obtener_metricas(self) -> Dict:
+        return {"backend": BACKEND_BUS, "distribuido": self.distribuido, **self.metricas}
+
+
+class BusUnix(BusLocal):
+    """Broker en socket Unix elegido por candado de archivo; una línea JSON por mensaje."""
+
+    distribuido = True
+
+    def __init__(self, ruta: str = SOCKET_BUS):
+        super().__init__()
+        self.ruta = ruta
+        self._candado = None
+        self._servidor: Optional[asyncio.AbstractServer] = None
+        self._clientes_broker: List[asyncio.StreamWriter] = []
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    async def iniciar(self):
+        self._tarea = asyncio.create_task(self._mantener_conexion())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+        if self._writer:
+            self._writer.close()
+        if self._servidor:
+            self._servidor.close()
+            for w in self._clientes_broker:
+                w.close()
+        if self._candado:
+            self._candado.close()
+
+    def _enviar(self, linea: str) -> bool:
+        if self._writer is None or self._writer.is_closing():
+            return False
+        self._writer.write(linea.encode("utf-8") + b"\n")
+        return True
+
+    async def _mantener_conexion(self):
+        while True:
+            try:
+                await self._quizas_ser_broker()
+                reader, self._writer = await asyncio.open_unix_connection(self.ruta, limit=2 ** 22)
+                logger.info(f"🔗 Bus WS conectado a {self.ruta}")
+                while True:
+                    linea = await reader.readline()
+                    if not linea:
+                        break
+                    self._recibir(linea.decode("utf-8"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Bus WS sin conexión ({e}), reintentando en {ESPERA_RECONEXION}s")
+            self._writer = None
+            await asyncio.sleep(ESPERA_RECONEXION)
+
+    async def _quizas_ser_broker(self):
+        """Si nadie tiene el candado, este worker abre el broker."""
+        if self._servidor is not None:
+            return
+        candado = open(self.ruta + ".lock", "w")
+        try:
+            fcntl.flock(candado, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            candado.close()
+            return
+        self._candado = candado
+        if os.path.exists(self.ruta):
+            os.unlink(self.ruta)
+        self._servidor = await asyncio.start_unix_server(self._atender_cliente, path=self.ruta, limit=2 ** 22)
+        logger.info(f"📡 Broker del bus WS escuchando en {self.ruta} (pid {os.getpid()})")
+
+    async def _atender_cliente(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clientes_broker.append(writer)
+        try:
+            while True:
+                linea = await reader.readline()
+                if not linea:
+                    break
+                for otro in list(self._clientes_broker):
+                    if otro is not writer and not otro.is_closing():
+                        otro.write(linea)
+        except asyncio.CancelledError:
+            # El worker se está apagando
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Cliente del broker desconectado: {e}")
+        finally:
+            self._clientes_broker.remove(writer)
+            writer.close()
+
+
+class BusRedis(BusLocal):
+    """PUBLISH/SUBSCRIBE con el protocolo RESP de Redis sobre asyncio streams."""
+
+    distribuido = True
+
+    def __init__(self, url: str = REDIS_URL, canal: str = CANAL_REDIS):
+        super().__init__()
+        partes = urlparse(url)
+        self.host = partes.hostname or "127.0.0.1"
+        self.puerto = partes.port or 6379
+        self.password = partes.password
+        self.canal = canal
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._tareas: List[asyncio.Task] = []
+
+    async def iniciar(self):
+        self._tareas = [
+            asyncio.create_task(self._mantener_publicador()),
+            asyncio.create_task(self._mantener_suscripcion()),
+        ]
+
+    async def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        if self._writer:
+            self._writer.close()
+
+    def _enviar(self, linea: str) -> bool:
+        if self._writer is None or self._writer.is_closing():
+            return False
+        self._writer.write(_comando_resp("PUBLISH", self.canal, linea))
+        return True
+
+    async def _conectar(self):
+        reader, writer = await asyncio.open_connection(self.host, self.puerto, limit=2 ** 22)
+        if self.password:
+            writer.write(_comando_resp("AUTH", self.password))
+            await _leer_resp(reader)
+        return reader, writer
+
+    async def _mantener_publicador(self):
+        while True:
+            try:
+                reader, self._writer = await self._conectar()
+                # Las respuestas de PUBLISH (número de suscriptores) se descartan
+                while True:
+                    await _leer_resp(reader)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Bus WS (redis) sin publicador ({e}), reintentando en {ESPERA_RECONEXION}s")
+            self._writer = None
+            await asyncio.sleep(ESPERA_RECONEXION)
+
+    async def _mantener_suscripcion(self):
+        while True:
+            try:
+                reader, writer = await self._conectar()
+                writer.write(_comando_resp("SUBSCRIBE", self.canal))
+                logger.info(f"🔗 Bus WS suscrito a {self.canal} en {self.host}:{self.puerto}")
+                while True:
+                    respuesta = await _leer_resp(reader)
+                    if isinstance(respuesta, list) and len(respuesta) == 3 and respuesta[0] == b"message":
+                        self._recibir(respuesta[2].decode("utf-8"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Bus WS (redis) sin suscripción ({e}), reintentando en {ESPERA_RECONEXION}s")
+            await asyncio.sleep(ESPERA_RECONEXION)
+
+
+def _comando_resp(*partes: str) -> bytes:
+    salida = [f"*{len(partes)}\r\n".encode()]
+    for parte in partes:
+        datos = parte.encode("utf-8")
+        salida.append(f"${len(datos)}\r\n".encode() + datos + b"\r\n")
+    return b"".join(salida)
+
+
+async def _leer_resp(reader: asyncio.StreamReader):
+    linea = await reader.readline()
+    if not linea:
+        raise ConnectionError("conexión cerrada")
+    tipo, resto = linea[:1], linea[1:-2]
+    if tipo == b"+":
+        return resto
+    if tipo == b"-":
+        raise ConnectionError(resto.decode())
+    if tipo == b":":
+        return int(resto)
+    if tipo == b"$":
+        largo = int(resto)
+        if largo < 0:
+            return None
+        datos = await reader.readexactly(largo + 2)
+        return datos[:-2]
+    if tipo == b"*":
+        return [await _leer_resp(reader) for _ in range(int(resto))]
+    raise ConnectionError(f"respuesta RESP inesperada: {linea!r}")
+
+
+def _crear_bus() -> BusLocal:
+    if BACKEND_BUS == "unix":
+        return BusUnix()
+    if BACKEND_BUS == "redis":
+        return BusRedis()
+    if BACKEND_BUS != "local":
+        logger.warning(f"⚠️ WS_BUS desconocido ({BACKEND_BUS}), se usa 'local'")
+    return BusLocal()
+
+
+# Instancia global
+bus_ws = _crear_bus()
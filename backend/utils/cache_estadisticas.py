@@ -0,0 +1,255 @@
+"""
+Caché en memoria de los endpoints de resumen de estadísticas y
+asistencias.
+
+El panel de Streamlit (frontend/pages/panel.py) vuelve a pedir
+/asistencias/resumen, /asistencias/por-clase y /asistencias/resumen-general
+en cada interacción con un widget, y los tableros de estadísticas hacen
+lo mismo con sus endpoints. Entre dos escrituras de asistencia la
+respuesta no cambia, así que se guarda:
+
+- Clave: endpoint + parámetros + fecha de hoy (nada sobrevive a la
+  medianoche).
+- Alcance: de qué depende la respuesta (clase, grupo, turno, fecha o un
+  rango desde/hasta). Lo que no se da no limita: un alcance vacío
+  depende de cualquier asistencia.
+- Vigencia: ESTADISTICAS_CACHE_TTL segundos como máximo.
+- Una sola consulta por clave: si llegan varias peticiones con la misma
+  clave mientras se calcula, esperan el mismo cálculo.
+
+Invalidación: resumen_asistencia.marcar() (llamado después de cada
+escritura de asistencia) avisa con invalidar_asistencia(id_clase, fecha)
+y se descartan solo las entradas cuyo alcance incluye esa clase y ese
+día. Las que leen el resumen diario se descartan otra vez cuando el
+worker termina de recalcular el día. El grupo y su nombre (para el
+turno) salen del roster en memoria; si la clase no está cargada se
+descartan las de todos los grupos de ese día.
+
+Cada entrada guarda además la versión del roster de su alcance
+(roster_cache.version con su clase y/o grupo): un justificante o una
+restauración en la papelera solo descartan las entradas de esa clase o
+ese grupo (y las que no tienen ni clase ni grupo); una importación, que
+invalida todo el roster, las descarta todas.
+
+Las invalidaciones se publican en utils/bus_ws.py: con varios workers
+cada uno descarta lo suyo aunque la escritura la haya atendido otro.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.bus_ws import bus_ws
+from utils.cache_roster import roster_cache
+from utils.fecha import obtener_fecha_hora_cdmx
+
+logger = logging.getLogger(__name__)
+
+TTL = float(os.getenv("ESTADISTICAS_CACHE_TTL", "60"))
+MAX_ENTRADAS = int(os.getenv("ESTADISTICAS_CACHE_MAX", "512"))
+ACTIVA = os.getenv("ESTADISTICAS_CACHE", "1") == "1"
+
+Alcance = Dict[str, Any]
+
+
+def _afectada(alcance: Alcance, id_clase, id_grupo, nombre_grupo, fecha) -> bool:
+    """Si una asistencia (clase, grupo, día) puede cambiar una respuesta con ese alcance; None = desconocido."""
+    if id_clase is not None and alcance.get("clase") not in (None, id_clase):
+        return False
+    if id_grupo is not None and alcance.get("grupo") not in (None, id_grupo):
+        return False
+    # El turno se filtra con g.nombre LIKE '%M%' / '%V%'
+    if nombre_grupo is not None and alcance.get("turno") and alcance["turno"].upper() not in nombre_grupo.upper():
+        return False
+    if fecha is not None:
+        if alcance.get("fecha") not in (None, fecha):
+            return False
+        if alcance.get("desde") and fecha < alcance["desde"]:
+            return False
+        if alcance.get("hasta") and fecha > alcance["hasta"]:
+            return False
+    return True
+
+
+def _version_roster(alcance: Alcance, id_grupo: Optional[int]) -> Tuple[int, ...]:
+    """Versión del roster de lo que cubre el alcance (todo el roster si no tiene clase ni grupo)."""
+    return roster_cache.version(alcance.get("clase"), id_grupo)
+
+
+def _grupo_del_alcance(alcance: Alcance) -> Optional[int]:
+    """Grupo con el que se pide la versión: el del alcance o el de su clase (None si no se conoce)."""
+    if alcance.get("grupo") is not None:
+        return alcance["grupo"]
+    if alcance.get("clase") is not None:
+        return roster_cache.grupo_de(alcance["clase"])
+    return None
+
+
+class EntradaCache:
+    __slots__ = ("valor", "alcance", "vence", "id_grupo", "version_roster")
+
+    def __init__(self, valor, alcance: Alcance, vence: float, id_grupo: Optional[int], version_roster: Tuple[int, ...]):
+        self.valor = valor
+        self.alcance = alcance
+        self.vence = vence
+        # Se compara con los mismos argumentos con los que se guardó
+        self.id_grupo = id_grupo
+        self.version_roster = version_roster
+
+    def vigente(self) -> bool:
+        return self.vence > time.monotonic() and self.version_roster == _version_roster(self.alcance, self.id_grupo)
+
+
+class CacheEstadisticas:
+    """Respuestas por clave con vigencia, cálculo compartido e invalidación por alcance."""
+
+    def __init__(self):
+        self._entradas: Dict[Tuple, EntradaCache] = {}
+        # Clave -> (alcance, tarea) de los cálculos en curso
+        self._calculando: Dict[Tuple, Tuple[Alcance, asyncio.Task]] = {}
+        # Cálculos que quedaron viejos por una invalidación mientras corrían
+        self._viejos: set = set()
+        self.metricas = {"aciertos": 0, "fallos": 0, "compartidas": 0, "invalidadas": 0, "expiradas": 0}
+
+    # ===============================
+    # 📌 CONSULTA
+    # ===============================
+    async def obtener(self, clave: Tuple, calcular: Callable[[], Awaitable], alcance: Alcance, ttl: Optional[float] = None):
+        """Respuesta guardada para la clave o el resultado de calcular() (una vez por clave a la vez)."""
+        entrada = self._entradas.get(clave)
+        if entrada is not None:
+            if entrada.vigente():
+                self.metricas["aciertos"] += 1
+                return entrada.valor
+            self.metricas["expiradas"] += 1
+            self._entradas.pop(clave, None)
+
+        en_curso = self._calculando.get(clave)
+        if en_curso is not None:
+            self.metricas["compartidas"] += 1
+            return await asyncio.shield(en_curso[1])
+
+        self.metricas["fallos"] += 1
+        tarea = asyncio.create_task(self._calcular(clave, calcular, alcance, TTL if ttl is None else ttl))
+        self._calculando[clave] = (alcance, tarea)
+        # Si todos los que esperaban se cancelaron, que el error no quede sin leer
+        tarea.add_done_callback(lambda t: t.cancelled() or t.exception())
+        # shield: si una petición se cancela, las demás que esperan siguen
+        return await asyncio.shield(tarea)
+
+    async def _calcular(self, clave: Tuple, calcular: Callable[[], Awaitable], alcance: Alcance, ttl: float):
+        id_grupo = _grupo_del_alcance(alcance)
+        version = _version_roster(alcance, id_grupo)
+        try:
+            valor = await calcular()
+        finally:
+            self._calculando.pop(clave, None)
+            viejo = clave in self._viejos
+            self._viejos.discard(clave)
+        if viejo or version != _version_roster(alcance, id_grupo):
+            # Cambió algo mientras se consultaba: se regresa pero no se guarda
+            return valor
+        self._guardar(clave, EntradaCache(valor, alcance, time.monotonic() + ttl, id_grupo, version))
+        return valor
+
+    def _guardar(self, clave: Tuple, entrada: EntradaCache):
+        self._entradas.pop(clave, None)
+        if len(self._entradas) >= MAX_ENTRADAS:
+            # La más antigua (los dict conservan el orden de inserción)
+            self._entradas.pop(next(iter(self._entradas)))
+        self._entradas[clave] = entrada
+
+    def cachear(self, alcance: Optional[Callable[..., Alcance]] = None, ttl: Optional[float] = None):
+        """
+        Decorador para endpoints. alcance recibe los mismos parámetros que
+        el endpoint y regresa su alcance, p. ej.:
+
+            @router.get("/grupo/{id_grupo}")
+            @cache_estadisticas.cachear(lambda id_grupo, **_: {"grupo": id_grupo})
+            async def estadisticas_grupo(id_grupo: int, ...):
+        """
+        def decorador(funcion):
+            nombre = f"{funcion.__module__}.{funcion.__qualname__}"
+
+            @functools.wraps(funcion)
+            async def envoltura(*args, **kwargs):
+                if not ACTIVA:
+                    return await funcion(*args, **kwargs)
+                ambito = alcance(*args, **kwargs) if alcance else {}
+                ambito = {k: v for k, v in ambito.items() if v is not None}
+                hoy = obtener_fecha_hora_cdmx()["fecha"].strftime("%Y-%m-%d")
+                clave = (nombre, hoy, args, tuple(sorted(kwargs.items())))
+                return await self.obtener(clave, lambda: funcion(*args, **kwargs), ambito, ttl)
+
+            return envoltura
+        return decorador
+
+    # ===============================
+    # 📌 INVALIDACIÓN
+    # ===============================
+    def invalidar_asistencia(self, id_clase: Optional[int], fecha):
+        """Descarta lo que depende de la asistencia de esa clase en ese día (None = cualquiera), en todos los workers."""
+        id_grupo = nombre_grupo = None
+        if id_clase is not None:
+            roster = roster_cache.en_memoria(id_clase)
+            if roster is not None:
+                id_grupo, nombre_grupo = roster.id_grupo, roster.grupo
+        datos = {
+            "id_clase": id_clase,
+            "fecha": str(fecha) if fecha is not None else None,
+            "id_grupo": id_grupo,
+            "grupo": nombre_grupo,
+        }
+        self._invalidar_local(datos)
+        bus_ws.publicar("estadisticas", datos, local=False)
+
+    def invalidar(self):
+        """Descarta todo, en todos los workers."""
+        self._invalidar_local({"todo": True})
+        bus_ws.publicar("estadisticas", {"todo": True}, local=False)
+
+    def _invalidar_local(self, datos: Dict):
+        """Aplica una invalidación de este worker o de otro (ver utils/bus_ws.py)."""
+        if datos.get("todo"):
+            self._invalidar_todo()
+            return
+        id_clase, fecha = datos.get("id_clase"), datos.get("fecha")
+        id_grupo, nombre_grupo = datos.get("id_grupo"), datos.get("grupo")
+        if id_clase is not None and id_grupo is None:
+            # El worker que publicó no tenía el roster; quizá este sí
+            roster = roster_cache.en_memoria(id_clase)
+            if roster is not None:
+                id_grupo, nombre_grupo = roster.id_grupo, roster.grupo
+
+        afectadas = [
+            clave for clave, entrada in self._entradas.items()
+            if _afectada(entrada.alcance, id_clase, id_grupo, nombre_grupo, fecha)
+        ]
+        for clave in afectadas:
+            del self._entradas[clave]
+        for clave, (alcance, _tarea) in self._calculando.items():
+            if _afectada(alcance, id_clase, id_grupo, nombre_grupo, fecha):
+                self._viejos.add(clave)
+        self.metricas["invalidadas"] += len(afectadas)
+
+    def _invalidar_todo(self):
+        self.metricas["invalidadas"] += len(self._entradas)
+        self._entradas.clear()
+        self._viejos.update(self._calculando)
+
+    def obtener_metricas(self) -> Dict:
+        return {
+            "activa": ACTIVA,
+            "ttl_s": TTL,
+            "entradas": len(self._entradas),
+            "calculando": len(self._calculando),
+            **self.metricas,
+        }
+
+
+# Instancia global
+cache_estadisticas = CacheEstadisticas()
+bus_ws.suscribir("estadisticas", cache_estadisticas._invalidar_local)
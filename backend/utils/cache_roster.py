@@ -0,0 +1,439 @@
+"""
+Caché en memoria del roster de cada clase para validar escaneos.
+
+Cada escaneo (asistencia por QR, asistencia-qr y entrega de actividad)
+resolvía matrícula -> id_estudiante, nombre de grupo -> id_grupo y
+clase -> grupo contra MySQL. Aquí se guarda, por id_clase:
+
+- id_grupo y los nombres de grupo y materia de la clase
+- matrícula -> (id_estudiante, nombre, apellido) de los alumnos vivos
+- el estado de asistencia de hoy de cada alumno
+
+Con el roster en memoria un escaneo ya no necesita ninguna lectura,
+solo la escritura.
+
+Calentamiento: una tarea revisa horario_clase cada minuto y carga, en
+una sola consulta, los rosters de las clases cuya ventana de horario
+está por abrir. Si llega un escaneo de una clase que no está cargada se
+carga en ese momento (una sola vez aunque lleguen varios a la vez).
+
+Invalidación: el importador y la papelera llaman a invalidar() cuando
+cambian alumnos, grupos o clases; la invalidación se publica en
+utils/bus_ws.py y se aplica en todos los workers. Cada invalidación sube la versión de
+lo que toca (una clase, un grupo o todo); version() la expone para que
+otras cachés descarten solo lo afectado. Si una invalidación de esa
+clase o su grupo llega mientras se carga, se vuelve a consultar.
+
+Estados de hoy: registrar_estado()/registrar_estados() los anotan solo
+después de que la fila está en la BD (con write-behind, al escribir el
+lote; una fila descartada nunca se anota) y los publican en el mismo
+canal "roster", para que un re-escaneo en otro worker no se tome por
+duplicado con un estado viejo.
+
+Una matrícula que no está en el roster lo recarga (puede ser un alta
+reciente), pero como mucho una vez cada ROSTER_RECARGA_MIN_S segundos
+por clase: un QR ajeno o de un alumno dado de baja no dispara una
+consulta por escaneo.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.db import fetch_all
+from utils.bus_ws import bus_ws
+from utils.fecha import obtener_fecha_hora_cdmx
+
+logger = logging.getLogger(__name__)
+
+# Minutos antes de hora_inicio en que se precarga el roster de la clase
+ANTICIPACION_MIN = 10
+INTERVALO_CALENTAMIENTO = 60
+RECARGA_MIN_S = float(os.getenv("ROSTER_RECARGA_MIN_S", "30"))
+# Cargas seguidas si una invalidación de la clase llega a media consulta
+INTENTOS_CARGA = 3
+
+
+class RosterClase:
+    """Roster de una clase para la fecha en que se cargó."""
+
+    def __init__(self, id_clase: int, id_grupo: int, grupo: str, materia: str, fecha: str):
+        self.id_clase = id_clase
+        self.id_grupo = id_grupo
+        self.grupo = grupo
+        self.materia = materia
+        self.fecha = fecha
+        self.cargado = time.monotonic()
+        # matrícula -> {"id_estudiante", "nombre", "apellido"}
+        self.alumnos: Dict[str, Dict] = {}
+        # id_estudiante -> estado de asistencia de hoy
+        self.estados: Dict[int, str] = {}
+
+    def grupo_coincide(self, grupo_texto: str) -> bool:
+        return self.grupo.lower() == grupo_texto.strip().lower()
+
+
+class RosterCache:
+    """Rosters por id_clase, con precarga por horario e invalidación explícita."""
+
+    def __init__(self):
+        self._rosters: Dict[int, RosterClase] = {}
+        self._cargando: Dict[int, asyncio.Task] = {}
+        # Versiones: cualquier invalidación / todo / por clase / por grupo
+        self._generacion = 0
+        self._generacion_total = 0
+        self._por_clase: Dict[int, int] = {}
+        self._por_grupo: Dict[int, int] = {}
+        # Invalidaciones de clases, sumadas por grupo (para lo que depende de todo el grupo)
+        self._clases_del_grupo: Dict[int, int] = {}
+        # Invalidaciones de grupo (para clases de grupo desconocido) y de
+        # clases de grupo desconocido (para los grupos)
+        self._cualquier_grupo = 0
+        self._clase_sin_grupo = 0
+        # id_clase -> id_grupo visto en cargas y en el horario
+        self._grupo_de_clase: Dict[int, int] = {}
+        # Horario de hoy: (fecha, [(id_clase, id_grupo, hora_inicio, hora_fin)])
+        self._horario: Tuple[Optional[str], List[Tuple]] = (None, [])
+        self._tarea: Optional[asyncio.Task] = None
+        self.metricas = {"aciertos": 0, "fallos": 0, "cargas": 0, "invalidaciones": 0, "recargas_evitadas": 0}
+
+    # ===============================
+    # 📌 CICLO DE VIDA
+    # ===============================
+    def iniciar(self):
+        """Arranca la tarea de precarga por horario."""
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._calentar_periodicamente())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    # ===============================
+    # 📌 CONSULTA
+    # ===============================
+    async def obtener(self, id_clase: int) -> Optional[RosterClase]:
+        """Roster de hoy para la clase; lo carga si no está en memoria."""
+        hoy = _hoy()
+        roster = self._rosters.get(id_clase)
+        if roster is not None and roster.fecha == hoy:
+            self.metricas["aciertos"] += 1
+            return roster
+
+        self.metricas["fallos"] += 1
+        tarea = self._cargando.get(id_clase)
+        if tarea is None:
+            tarea = asyncio.create_task(self._cargar([id_clase], hoy))
+            self._cargando[id_clase] = tarea
+            tarea.add_done_callback(lambda _t: self._cargando.pop(id_clase, None))
+        cargados = await asyncio.shield(tarea)
+        return self._rosters.get(id_clase) or cargados.get(id_clase)
+
+    async def obtener_varios(self, clases: Iterable[int]) -> Dict[int, RosterClase]:
+        """Rosters de varias clases; las que faltan se cargan juntas en una sola consulta."""
+        hoy = _hoy()
+        clases = set(clases)
+        faltantes = sorted(
+            c for c in clases
+            if c not in self._rosters or self._rosters[c].fecha != hoy
+        )
+        self.metricas["aciertos"] += len(clases) - len(faltantes)
+        self.metricas["fallos"] += len(faltantes)
+        cargados = await self._cargar(faltantes, hoy) if faltantes else {}
+        return {c: self._rosters.get(c) or cargados[c] for c in clases if c in self._rosters or c in cargados}
+
+    async def buscar_alumno(self, id_clase: int, matricula: str) -> Tuple[Optional[RosterClase], Optional[Dict]]:
+        """
+        Busca al alumno en el roster de la clase.
+
+        Si la matrícula no aparece se recarga el roster una vez (puede ser
+        un alumno dado de alta después de cargarlo), salvo que se haya
+        cargado hace menos de RECARGA_MIN_S segundos.
+        """
+        roster = await self.obtener(id_clase)
+        if roster is None:
+            return None, None
+        alumno = roster.alumnos.get(matricula)
+        if alumno is None:
+            if time.monotonic() - roster.cargado < RECARGA_MIN_S:
+                self.metricas["recargas_evitadas"] += 1
+                return roster, None
+            if self._rosters.get(id_clase) is roster:
+                self._rosters.pop(id_clase)
+            roster = await self.obtener(id_clase)
+            alumno = roster.alumnos.get(matricula) if roster else None
+        return roster, alumno
+
+    def clase_activa(self, id_grupo: int, hora) -> Optional[int]:
+        """id_clase del grupo cuyo horario de hoy contiene la hora dada, si ya se conoce."""
+        fecha, horario = self._horario
+        if fecha != _hoy():
+            return None
+        ahora = _como_timedelta(hora)
+        for id_clase, grupo, inicio, fin in horario:
+            if grupo == id_grupo and inicio <= ahora < fin:
+                return id_clase
+        return None
+
+    def en_memoria(self, id_clase: int) -> Optional[RosterClase]:
+        """Roster cargado de la clase (de cualquier día), sin consultar la BD."""
+        return self._rosters.get(id_clase)
+
+    def grupo_de_matricula(self, matricula: str) -> Optional[Tuple[RosterClase, Dict]]:
+        """Roster cargado (de cualquier clase) donde aparece la matrícula."""
+        hoy = _hoy()
+        for roster in self._rosters.values():
+            alumno = roster.alumnos.get(matricula)
+            if alumno is not None and roster.fecha == hoy:
+                return roster, alumno
+        return None
+
+    @property
+    def generacion(self) -> int:
+        """Sube con cada invalidación, de lo que sea."""
+        return self._generacion
+
+    def version(self, id_clase: Optional[int] = None, id_grupo: Optional[int] = None) -> Tuple[int, ...]:
+        """
+        Versión de lo que depende de esa clase y/o grupo: cambia con cada
+        invalidación que pudo afectarlo (si no se da ninguno, con todas).
+        Otras cachés la guardan junto a cada entrada y la comparan con los
+        mismos argumentos; para una clase, el grupo es grupo_de(id_clase)
+        al guardar (None si no se conoce).
+        """
+        if id_clase is None and id_grupo is None:
+            return (self._generacion,)
+        return self._version(id_clase, id_grupo)
+
+    def grupo_de(self, id_clase: int) -> Optional[int]:
+        """id_grupo de la clase si ya se vio en una carga o en el horario."""
+        return self._grupo_de_clase.get(id_clase)
+
+    def _version(self, id_clase: Optional[int], id_grupo: Optional[int]) -> Tuple[int, ...]:
+        if id_clase is not None:
+            # La clase cambia con sus invalidaciones y las de su grupo; sin
+            # saber el grupo, con las de cualquier grupo
+            grupo = self._por_grupo.get(id_grupo, 0) if id_grupo is not None else self._cualquier_grupo
+            return (self._generacion_total, self._por_clase.get(id_clase, 0), grupo)
+        # Todo el grupo: también las invalidaciones de cada una de sus clases
+        return (
+            self._generacion_total,
+            self._por_grupo.get(id_grupo, 0),
+            self._clases_del_grupo.get(id_grupo, 0),
+            self._clase_sin_grupo,
+        )
+
+    # ===============================
+    # 📌 ACTUALIZACIÓN
+    # ===============================
+    def registrar_estado(self, id_clase: int, id_estudiante: int, estado: str, fecha=None):
+        """Refleja en memoria (en todos los workers) una asistencia que ya está en la BD."""
+        self.registrar_estados([(id_clase, id_estudiante, estado, fecha)])
+
+    def registrar_estados(self, filas: Iterable[Tuple]):
+        """Como registrar_estado() para varias filas (id_clase, id_estudiante, estado, fecha); fecha None = hoy."""
+        hoy = _hoy()
+        estados = [[c, e, s] for c, e, s, f in filas if f is None or str(f) == hoy]
+        if not estados:
+            return
+        self._registrar_estados_local(estados)
+        bus_ws.publicar("roster", {"estados": estados}, local=False)
+
+    def _registrar_estados_local(self, estados: List[List]):
+        hoy = _hoy()
+        for id_clase, id_estudiante, estado in estados:
+            roster = self._rosters.get(id_clase)
+            if roster is not None and roster.fecha == hoy:
+                roster.estados[id_estudiante] = estado
+
+    def invalidar(self, id_clase: Optional[int] = None, id_grupo: Optional[int] = None):
+        """
+        Descarta rosters para que se recarguen en el siguiente escaneo.
+
+        Sin argumentos descarta todo (importaciones). Con id_grupo descarta
+        las clases de ese grupo (papelera). Se aplica en todos los workers.
+        """
+        self._invalidar_local(id_clase, id_grupo)
+        bus_ws.publicar("roster", {"id_clase": id_clase, "id_grupo": id_grupo}, local=False)
+
+    def _recibir_bus(self, datos: Dict):
+        """Invalidación o estados publicados por otro worker."""
+        if "estados" in datos:
+            self._registrar_estados_local(datos["estados"])
+            return
+        self._invalidar_local(datos.get("id_clase"), datos.get("id_grupo"))
+
+    def _invalidar_local(self, id_clase: Optional[int], id_grupo: Optional[int]):
+        self._generacion += 1
+        self.metricas["invalidaciones"] += 1
+        if id_clase is None and id_grupo is None:
+            self._generacion_total += 1
+            self._rosters.clear()
+            self._horario = (None, [])
+            return
+        if id_clase is not None:
+            self._por_clase[id_clase] = self._por_clase.get(id_clase, 0) + 1
+            grupo_clase = self._grupo_de_clase.get(id_clase)
+            if grupo_clase is None:
+                self._clase_sin_grupo += 1
+            else:
+                self._clases_del_grupo[grupo_clase] = self._clases_del_grupo.get(grupo_clase, 0) + 1
+        if id_grupo is not None:
+            self._por_grupo[id_grupo] = self._por_grupo.get(id_grupo, 0) + 1
+            self._cualquier_grupo += 1
+        self._rosters = {
+            k: r for k, r in self._rosters.items()
+            if k != id_clase and (id_grupo is None or r.id_grupo != id_grupo)
+        }
+
+    def invalidar_grupos(self, grupos: Iterable[int]):
+        for id_grupo in set(grupos):
+            self.invalidar(id_grupo=id_grupo)
+
+    # ===============================
+    # 📌 CARGA
+    # ===============================
+    async def _cargar(self, clases: List[int], fecha: str) -> Dict[int, RosterClase]:
+        """
+        Carga y guarda los rosters de las clases. Las que reciben una
+        invalidación durante la consulta se vuelven a consultar; si
+        después de INTENTOS_CARGA siguen cambiando se regresan sin
+        guardarse (valen para esta petición, no para la caché).
+        """
+        cargados: Dict[int, RosterClase] = {}
+        pendientes = list(clases)
+        for _intento in range(INTENTOS_CARGA):
+            grupos = {c: self._grupo_de_clase.get(c) for c in pendientes}
+            versiones = {c: self._version(c, grupos[c]) for c in pendientes}
+            nuevos = await self._consultar(pendientes, fecha)
+            cargados.update(nuevos)
+
+            vigentes = [c for c in pendientes if self._version(c, grupos[c]) == versiones[c]]
+            for id_clase in vigentes:
+                if id_clase in nuevos:
+                    self._rosters[id_clase] = nuevos[id_clase]
+                    self._grupo_de_clase[id_clase] = nuevos[id_clase].id_grupo
+                else:
+                    self._rosters.pop(id_clase, None)
+            self.metricas["cargas"] += 1
+            logger.info(f"👥 Roster cargado para {len(nuevos)} clase(s)")
+
+            pendientes = [c for c in pendientes if c not in vigentes]
+            if not pendientes:
+                break
+            # Hubo una invalidación mientras se consultaba: no guardar datos viejos
+            logger.info(f"🔁 Roster invalidado durante la carga, se consulta de nuevo ({len(pendientes)} clase(s))")
+        return cargados
+
+    async def _consultar(self, clases: List[int], fecha: str) -> Dict[int, RosterClase]:
+        marcadores = ", ".join(["%s"] * len(clases))
+        filas = await fetch_all(
+            f"""
+            SELECT
+                c.id_clase, c.id_grupo,
+                g.nombre AS grupo, m.nombre AS materia,
+                e.id_estudiante, e.matricula, e.nombre, e.apellido,
+                a.estado AS estado_actual
+            FROM clase c
+            JOIN grupo g ON g.id_grupo = c.id_grupo AND g.eliminado = 0
+            JOIN materia m ON m.id_materia = c.id_materia
+            LEFT JOIN estudiante e ON e.id_grupo = c.id_grupo AND e.eliminado = 0
+            LEFT JOIN asistencia a ON a.id_estudiante = e.id_estudiante
+                AND a.id_clase = c.id_clase
+                AND a.fecha = %s
+            WHERE c.id_clase IN ({marcadores}) AND c.eliminado = 0
+            """,
+            (fecha, *clases),
+        )
+
+        nuevos: Dict[int, RosterClase] = {}
+        for f in filas:
+            roster = nuevos.get(f["id_clase"])
+            if roster is None:
+                roster = RosterClase(f["id_clase"], f["id_grupo"], f["grupo"], f["materia"], fecha)
+                nuevos[f["id_clase"]] = roster
+            if f["id_estudiante"] is None:
+                continue
+            roster.alumnos[f["matricula"]] = {
+                "id_estudiante": f["id_estudiante"],
+                "nombre": f["nombre"],
+                "apellido": f["apellido"],
+            }
+            if f["estado_actual"]:
+                roster.estados[f["id_estudiante"]] = f["estado_actual"]
+        return nuevos
+
+    async def calentar(self):
+        """Carga los rosters de las clases cuya ventana de horario está abierta."""
+        datos = obtener_fecha_hora_cdmx()
+        hoy = datos["fecha"].strftime("%Y-%m-%d")
+
+        if self._horario[0] != hoy:
+            filas = await fetch_all(
+                """
+                SELECT hc.id_clase, c.id_grupo, hc.hora_inicio, hc.hora_fin
+                FROM horario_clase hc
+                JOIN clase c ON c.id_clase = hc.id_clase AND c.eliminado = 0
+                WHERE hc.dia = %s AND hc.eliminado = 0
+                """,
+                (datos["dia"],),
+            )
+            self._horario = (hoy, [
+                (f["id_clase"], f["id_grupo"], _como_timedelta(f["hora_inicio"]), _como_timedelta(f["hora_fin"]))
+                for f in filas
+            ])
+            self._grupo_de_clase.update((f["id_clase"], f["id_grupo"]) for f in filas)
+            # Rosters de otro día ya no sirven
+            self._rosters = {k: r for k, r in self._rosters.items() if r.fecha == hoy}
+
+        ahora = _como_timedelta(datos["hora"])
+        anticipacion = timedelta(minutes=ANTICIPACION_MIN)
+        por_cargar = sorted({
+            id_clase for id_clase, _g, inicio, fin in self._horario[1]
+            if inicio - anticipacion <= ahora < fin and id_clase not in self._rosters
+        })
+        if por_cargar:
+            await self._cargar(por_cargar, hoy)
+
+    async def _calentar_periodicamente(self):
+        while True:
+            try:
+                await self.calentar()
+            except Exception as e:
+                logger.error(f"❌ Error precargando rosters: {e}")
+            await asyncio.sleep(INTERVALO_CALENTAMIENTO)
+
+    def horario_de_hoy(self) -> List[Tuple[int, int, timedelta, timedelta]]:
+        """(id_clase, id_grupo, hora_inicio, hora_fin) de las clases de hoy; vacío si aún no se lee."""
+        return self._horario[1] if self._horario[0] == _hoy() else []
+
+    def obtener_metricas(self) -> Dict:
+        return {
+            **self.metricas,
+            "clases_en_memoria": len(self._rosters),
+            "alumnos_en_memoria": sum(len(r.alumnos) for r in self._rosters.values()),
+        }
+
+
+def _hoy() -> str:
+    return obtener_fecha_hora_cdmx()["fecha"].strftime("%Y-%m-%d")
+
+
+def _como_timedelta(valor) -> timedelta:
+    """TIME de MySQL llega como timedelta; datetime.time se convierte igual."""
+    if isinstance(valor, timedelta):
+        return valor
+    return timedelta(hours=valor.hour, minutes=valor.minute, seconds=valor.second)
+
+
+# Instancia global
+roster_cache = RosterCache()
+bus_ws.suscribir("roster", roster_cache._recibir_bus)
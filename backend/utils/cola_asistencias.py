@@ -0,0 +1,428 @@
+"""
+Cola de escritura diferida (write-behind) para las asistencias por QR.
+
+A las 7:20 todos los salones escanean a la vez y cada escaneo hacía
+desencriptado + JOINs + INSERT/UPDATE + commit antes de responder al
+celular. Con este modo el endpoint valida contra el roster en memoria
+(utils/cache_roster.py), responde de inmediato y deja la fila en esta cola; un worker de asyncio
+la vacía hacia MySQL en lotes con un solo INSERT ... ON DUPLICATE KEY
+UPDATE de varias filas.
+
+Durabilidad: cada escaneo aceptado se anota primero en un journal local
+(una línea JSON por escaneo, solo se agrega al final). El endpoint
+espera con sincronizar() a que llegue a disco antes de responder; los
+escaneos que llegan mientras tanto comparten el mismo fsync, que corre
+en un hilo. Al terminar un lote se anota una marca {"ack": seq}; al
+arrancar se reproducen las líneas posteriores a la última marca y el
+journal se reescribe (archivo temporal + os.replace) solo con lo
+pendiente, para que una última línea a medias no quede pegada a la
+siguiente que se agregue. Cuando
+la cola queda vacía el journal se trunca para que no crezca sin límite.
+
+Filas que MySQL rechaza (p. ej. la FK de un alumno borrado
+definitivamente): si el lote falla con un error de datos, o falla
+ASISTENCIA_REINTENTOS_LOTE veces seguidas, se escribe fila por fila. Las
+que vuelven a fallar con un error de datos pasan al journal de
+descartadas (ASISTENCIA_DEAD_LETTER_PATH) y salen de la cola para no
+bloquear los escaneos que vienen detrás; se ven en /asistencias/cola/metricas.
+Un error de conexión detiene el recorrido y se reintenta con espera.
+
+Escrituras directas (cambios manuales desde el dashboard, justificantes,
+/qr): antes de tocar la fila llaman a adelantar(alumno, clase, fecha),
+que escribe ya el último escaneo pendiente de esa llave, lo quita de la
+cola y anota {"hechos": [seq, ...]} en el journal (en disco antes de
+seguir). Así la escritura directa encuentra la fila y el flush no la
+pisa después con el escaneo más viejo. La cola es de cada proceso: con
+varios workers solo ve los escaneos que atendió el mismo worker.
+
+Se activa con ASISTENCIA_WRITE_BEHIND=1. Requiere la llave única de
+migrations/002_asistencia_unica.sql: app.py no arranca sin ella.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymysql import err as errores_mysql
+
+from config.db import get_pool
+from utils.cache_roster import roster_cache
+from utils.resumen_asistencia import resumen_asistencia
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ACTIVO = os.getenv("ASISTENCIA_WRITE_BEHIND", "0") == "1"
+JOURNAL_PATH = os.getenv(
+    "ASISTENCIA_JOURNAL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "cola_asistencias.jsonl"),
+)
+JOURNAL_FSYNC = os.getenv("ASISTENCIA_JOURNAL_FSYNC", "1") == "1"
+DEAD_LETTER_PATH = os.getenv(
+    "ASISTENCIA_DEAD_LETTER_PATH",
+    os.path.join(os.path.dirname(JOURNAL_PATH), "cola_asistencias_descartadas.jsonl"),
+)
+REINTENTOS_LOTE = int(os.getenv("ASISTENCIA_REINTENTOS_LOTE", "3"))
+TAMANO_LOTE = int(os.getenv("ASISTENCIA_TAMANO_LOTE", "200"))
+INTERVALO_FLUSH = float(os.getenv("ASISTENCIA_INTERVALO_FLUSH", "0.5"))
+
+# Errores que dependen de la fila y no se arreglan reintentando
+# (FK, datos fuera de rango, registro mal formado en el journal)
+ERRORES_DE_FILA = (errores_mysql.IntegrityError, errores_mysql.DataError, KeyError, TypeError, ValueError)
+
+# Cubetas (ms) del histograma de latencia de flush
+CUBETAS_FLUSH_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+UPSERT_ASISTENCIA = """
+    INSERT INTO asistencia (id_estudiante, id_clase, hora_entrada, estado, fecha)
+    VALUES {valores}
+    ON DUPLICATE KEY UPDATE
+        estado = VALUES(estado),
+        hora_entrada = VALUES(hora_entrada)
+"""
+
+
+def _clave(registro: Dict) -> tuple:
+    return (registro["id_estudiante"], registro["id_clase"], str(registro["fecha"]))
+
+
+class ColaAsistencias:
+    """Cola en memoria + journal en disco + worker que escribe por lotes."""
+
+    def __init__(self, journal_path: str = JOURNAL_PATH, dead_letter_path: str = DEAD_LETTER_PATH):
+        self.journal_path = journal_path
+        self.dead_letter_path = dead_letter_path
+        self.pendientes: List[Dict] = []
+        # (alumno, clase, fecha) -> último registro pendiente de esa llave
+        self._ultimo_pendiente: Dict[tuple, Dict] = {}
+        self._seq = 0
+        self._journal = None
+        # Group commit del fsync: líneas escritas vs. líneas que ya están en disco
+        self._escrito = 0
+        self._en_disco = 0
+        self._fsync: Optional[asyncio.Task] = None
+        self._fallos_seguidos = 0
+        # Un lote a la vez: el worker o adelantar()
+        self._candado = asyncio.Lock()
+        self.descartadas: deque = deque(maxlen=20)
+        self._evento = asyncio.Event()
+        self._tarea: Optional[asyncio.Task] = None
+        self._detenido = False
+        self.metricas = {
+            "encolados": 0,
+            "escritos": 0,
+            "lotes": 0,
+            "errores_flush": 0,
+            "descartadas": 0,
+            "adelantadas": 0,
+            "ultimo_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+            "histograma_flush_ms": {str(c): 0 for c in CUBETAS_FLUSH_MS + ("inf",)},
+        }
+
+    # ===============================
+    # 📌 CICLO DE VIDA
+    # ===============================
+    async def iniciar(self):
+        """Reproduce el journal pendiente y arranca el worker."""
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        os.makedirs(os.path.dirname(self.dead_letter_path), exist_ok=True)
+        recuperados = self._reproducir_journal()
+        self._reescribir_journal()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._detenido = False
+        self._tarea = asyncio.create_task(self._worker())
+        if recuperados:
+            logger.warning(f"♻️ {recuperados} asistencia(s) recuperadas del journal")
+            self._evento.set()
+        logger.info(f"✅ Cola de asistencias iniciada (journal: {self.journal_path})")
+
+    async def detener(self):
+        """Vacía lo pendiente y cierra el journal."""
+        self._detenido = True
+        self._evento.set()
+        if self._tarea:
+            await self._tarea
+            self._tarea = None
+        if self._fsync:
+            await asyncio.shield(self._fsync)
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+        logger.info(f"✅ Cola de asistencias detenida ({len(self.pendientes)} pendientes en journal)")
+
+    # ===============================
+    # 📌 ENCOLAR
+    # ===============================
+    def encolar(self, id_estudiante: int, id_clase: int, estado: str, fecha: str, hora: str):
+        """
+        Anota el escaneo en el journal y lo deja listo para el worker.
+        Antes de confirmar al cliente hay que esperar sincronizar().
+        """
+        self._seq += 1
+        registro = {
+            "seq": self._seq,
+            "id_estudiante": id_estudiante,
+            "id_clase": id_clase,
+            "estado": estado,
+            "fecha": fecha,
+            "hora": hora,
+        }
+        self._escribir_journal(registro)
+        self.pendientes.append(registro)
+        self._ultimo_pendiente[_clave(registro)] = registro
+        self.metricas["encolados"] += 1
+        if len(self.pendientes) >= TAMANO_LOTE:
+            self._evento.set()
+
+    def estado_pendiente(self, id_estudiante: int, id_clase: int, fecha) -> Optional[str]:
+        """Estado del último escaneo de esa llave que sigue en la cola (aún no en la BD)."""
+        registro = self._ultimo_pendiente.get((id_estudiante, id_clase, str(fecha)))
+        return registro["estado"] if registro else None
+
+    def _olvidar(self, registros: List[Dict]):
+        for r in registros:
+            if self._ultimo_pendiente.get(_clave(r)) is r:
+                del self._ultimo_pendiente[_clave(r)]
+
+    async def adelantar(self, id_estudiante: int, id_clase: int, fecha):
+        """
+        Escribe ya lo pendiente de ese alumno en esa clase y fecha, antes de
+        una escritura directa a la misma fila (ver el docstring del módulo).
+        """
+        clave = (id_estudiante, id_clase, str(fecha))
+        if not any(_clave(r) == clave for r in self.pendientes):
+            return
+        async with self._candado:
+            registros = [r for r in self.pendientes if _clave(r) == clave]
+            if not registros:
+                return
+            try:
+                # Los anteriores del mismo alumno quedan pisados por el último
+                await self._escribir_lote(registros[-1:])
+            except ERRORES_DE_FILA as e:
+                await self._descartar(registros[-1], e)
+            hechos = {r["seq"] for r in registros}
+            self.pendientes[:] = [r for r in self.pendientes if r["seq"] not in hechos]
+            self._olvidar(registros)
+            self._escribir_journal({"hechos": sorted(hechos)})
+            self.metricas["adelantadas"] += len(registros)
+        await self.sincronizar()
+
+    # ===============================
+    # 📌 WORKER
+    # ===============================
+    async def _worker(self):
+        espera = INTERVALO_FLUSH
+        while True:
+            try:
+                await asyncio.wait_for(self._evento.wait(), timeout=espera)
+            except asyncio.TimeoutError:
+                pass
+            self._evento.clear()
+
+            while self.pendientes:
+                async with self._candado:
+                    lote = self.pendientes[:TAMANO_LOTE]
+                    if not lote:
+                        # adelantar() se llevó lo que quedaba
+                        break
+                    try:
+                        await self._escribir_lote(lote)
+                        procesadas = len(lote)
+                    except Exception as e:
+                        self.metricas["errores_flush"] += 1
+                        self._fallos_seguidos += 1
+                        logger.error(f"❌ Error escribiendo lote de {len(lote)} asistencias: {e}")
+                        procesadas = 0
+                        if isinstance(e, ERRORES_DE_FILA) or self._fallos_seguidos >= REINTENTOS_LOTE:
+                            procesadas = await self._escribir_por_fila(lote)
+                    if procesadas:
+                        self._olvidar(lote[:procesadas])
+                        del self.pendientes[:procesadas]
+                        self._confirmar_journal(lote[procesadas - 1]["seq"])
+                if procesadas < len(lote):
+                    # Reintento con espera creciente; lo que falta sigue en la cola
+                    espera = min(espera * 2, 30)
+                    break
+                self._fallos_seguidos = 0
+                espera = INTERVALO_FLUSH
+
+            if self._detenido and (not self.pendientes or espera > INTERVALO_FLUSH):
+                return
+
+    async def _escribir_lote(self, lote: List[Dict]):
+        # Si el mismo alumno se escaneó dos veces en el lote, gana el último
+        ultimos: Dict[tuple, Dict] = {}
+        for r in lote:
+            ultimos[_clave(r)] = r
+        filas = list(ultimos.values())
+
+        valores = ", ".join(["(%s, %s, %s, %s, %s)"] * len(filas))
+        params = []
+        for r in filas:
+            params.extend((r["id_estudiante"], r["id_clase"], r["hora"], r["estado"], r["fecha"]))
+
+        inicio = time.perf_counter()
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(UPSERT_ASISTENCIA.format(valores=valores), params)
+                await conn.commit()
+        resumen_asistencia.marcar_varias((r["id_clase"], r["fecha"]) for r in filas)
+        # Hasta ahora el duplicado se revisaba con estado_pendiente()
+        roster_cache.registrar_estados((r["id_clase"], r["id_estudiante"], r["estado"], r["fecha"]) for r in filas)
+        self._registrar_flush((time.perf_counter() - inicio) * 1000, len(filas))
+
+    async def _escribir_por_fila(self, lote: List[Dict]) -> int:
+        """
+        Escribe el lote de una fila a la vez y descarta las que MySQL
+        rechaza. Regresa cuántas del inicio del lote quedaron resueltas
+        (escritas o descartadas); se detiene en el primer error que no es
+        de la fila.
+        """
+        procesadas = 0
+        for registro in lote:
+            try:
+                await self._escribir_lote([registro])
+            except ERRORES_DE_FILA as e:
+                await self._descartar(registro, e)
+            except Exception as e:
+                logger.error(f"❌ Error escribiendo asistencia seq={registro.get('seq')}: {e}")
+                break
+            procesadas += 1
+        return procesadas
+
+    async def _descartar(self, registro: Dict, error: Exception):
+        """Manda la fila al journal de descartadas (en disco antes de quitarla de la cola)."""
+        entrada = {**registro, "error": repr(error), "descartada": datetime.now().isoformat(timespec="seconds")}
+
+        def escribir():
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entrada, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+        await asyncio.to_thread(escribir)
+        self.descartadas.append(entrada)
+        self.metricas["descartadas"] += 1
+        logger.error(f"🗑️ Asistencia descartada (seq={registro.get('seq')}): {error}")
+
+    def _registrar_flush(self, ms: float, filas: int):
+        m = self.metricas
+        m["lotes"] += 1
+        m["escritos"] += filas
+        m["ultimo_flush_ms"] = round(ms, 2)
+        m["max_flush_ms"] = round(max(m["max_flush_ms"], ms), 2)
+        m["total_flush_ms"] += ms
+        cubeta = next((str(c) for c in CUBETAS_FLUSH_MS if ms <= c), "inf")
+        m["histograma_flush_ms"][cubeta] += 1
+        logger.info(f"💾 Lote de {filas} asistencias escrito en {ms:.0f}ms")
+
+    # ===============================
+    # 📌 JOURNAL
+    # ===============================
+    def _escribir_journal(self, entrada: Dict):
+        # Solo al buffer del sistema; el fsync lo hace sincronizar()
+        self._journal.write(json.dumps(entrada) + "\n")
+        self._journal.flush()
+        self._escrito += 1
+
+    async def sincronizar(self):
+        """Espera a que lo encolado hasta ahora esté en disco (un fsync compartido)."""
+        if not JOURNAL_FSYNC:
+            return
+        objetivo = self._escrito
+        while self._en_disco < objetivo:
+            if self._fsync is None:
+                self._fsync = asyncio.create_task(self._fsync_journal())
+            await asyncio.shield(self._fsync)
+
+    async def _fsync_journal(self):
+        hasta = self._escrito
+        try:
+            await asyncio.to_thread(os.fsync, self._journal.fileno())
+            self._en_disco = max(self._en_disco, hasta)
+        finally:
+            self._fsync = None
+
+    def _confirmar_journal(self, seq: int):
+        if not self.pendientes:
+            # Nada pendiente: el journal completo ya está en la BD
+            self._journal.truncate(0)
+            self._journal.seek(0)
+        else:
+            self._escribir_journal({"ack": seq})
+
+    def _reproducir_journal(self) -> int:
+        if not os.path.exists(self.journal_path):
+            return 0
+
+        entradas: List[Dict] = []
+        confirmado = 0
+        hechos = set()
+        with open(self.journal_path, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    entrada = json.loads(linea)
+                except ValueError:
+                    # Última línea a medio escribir si el proceso murió
+                    continue
+                if "ack" in entrada:
+                    confirmado = max(confirmado, entrada["ack"])
+                elif "hechos" in entrada:
+                    hechos.update(entrada["hechos"])
+                else:
+                    entradas.append(entrada)
+
+        self.pendientes = [e for e in entradas if e["seq"] > confirmado and e["seq"] not in hechos]
+        self._ultimo_pendiente = {_clave(e): e for e in self.pendientes}
+        self._seq = max((e["seq"] for e in entradas), default=0)
+        return len(self.pendientes)
+
+    def _reescribir_journal(self):
+        """Deja en el journal solo lo pendiente, sin marcas ni líneas a medias."""
+        temporal = self.journal_path + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            for registro in self.pendientes:
+                f.write(json.dumps(registro) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.journal_path)
+        # El rename también tiene que llegar a disco
+        carpeta = os.open(os.path.dirname(self.journal_path), os.O_RDONLY)
+        try:
+            os.fsync(carpeta)
+        finally:
+            os.close(carpeta)
+
+    # ===============================
+    # 📌 MÉTRICAS
+    # ===============================
+    def obtener_metricas(self) -> Dict:
+        m = self.metricas
+        return {
+            "activo": WRITE_BEHIND_ACTIVO,
+            "profundidad_cola": len(self.pendientes),
+            "encolados": m["encolados"],
+            "escritos": m["escritos"],
+            "lotes": m["lotes"],
+            "errores_flush": m["errores_flush"],
+            "descartadas": m["descartadas"],
+            "adelantadas": m["adelantadas"],
+            "ultimas_descartadas": list(self.descartadas),
+            "dead_letter_path": self.dead_letter_path,
+            "ultimo_flush_ms": m["ultimo_flush_ms"],
+            "max_flush_ms": m["max_flush_ms"],
+            "promedio_flush_ms": round(m["total_flush_ms"] / m["lotes"], 2) if m["lotes"] else 0,
+            "histograma_flush_ms": m["histograma_flush_ms"],
+        }
+
+
+# Instancia global
+cola_asistencias = ColaAsistencias()
@@ -0,0 +1,103 @@
+"""
+Escritura de asistencias (escaneo por QR, /asistencias/lote y /qr).
+
+Con la llave única de migrations/002_asistencia_unica.sql cada escritura
+es un solo INSERT ... ON DUPLICATE KEY UPDATE (de varias filas en los
+lotes). Sin la llave ese INSERT duplicaría filas, así que se vuelve al
+SELECT y luego UPDATE o INSERT, fila por fila en una conexión.
+
+Al arrancar, app.py llama a verificar(): revisa information_schema una
+vez y avisa si falta la migración. La cola write-behind
+(utils/cola_asistencias.py) solo escribe con la llave: sin ella la
+aplicación no arranca con ASISTENCIA_WRITE_BEHIND=1.
+"""
+
+import logging
+from typing import Iterable, Optional, Tuple
+
+from config.db import execute_query, fetch_one, get_pool
+
+logger = logging.getLogger(__name__)
+
+# Algún índice único exactamente sobre (id_estudiante, id_clase, fecha)
+CONSULTA_LLAVE_UNICA = """
+    SELECT index_name
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = 'asistencia' AND non_unique = 0
+    GROUP BY index_name
+    HAVING COUNT(*) = 3
+       AND SUM(column_name IN ('id_estudiante', 'id_clase', 'fecha')) = 3
+    LIMIT 1
+"""
+
+UPSERT = """
+    INSERT INTO asistencia (id_estudiante, id_clase, hora_entrada, estado, fecha)
+    VALUES {valores}
+    ON DUPLICATE KEY UPDATE estado = VALUES(estado), hora_entrada = VALUES(hora_entrada)
+"""
+
+# (id_estudiante, id_clase, estado, fecha, hora)
+Fila = Tuple[int, int, str, object, object]
+
+
+class EscrituraAsistencia:
+    """Upsert de asistencias con o sin la llave única."""
+
+    def __init__(self):
+        self.llave_unica: Optional[bool] = None
+
+    async def verificar(self) -> bool:
+        """Consulta si existe la llave única y lo recuerda para guardar()."""
+        self.llave_unica = await fetch_one(CONSULTA_LLAVE_UNICA) is not None
+        if not self.llave_unica:
+            logger.warning(
+                "⚠️ Falta la llave única de asistencia (migrations/002_asistencia_unica.sql): "
+                "se escribe con SELECT + UPDATE/INSERT"
+            )
+        return self.llave_unica
+
+    async def guardar(self, filas: Iterable[Fila]):
+        """Inserta o actualiza la asistencia de cada (alumno, clase, fecha)."""
+        filas = list(filas)
+        if not filas:
+            return
+        if self.llave_unica is None:
+            await self.verificar()
+
+        if self.llave_unica:
+            params = []
+            for id_estudiante, id_clase, estado, fecha, hora in filas:
+                params.extend((id_estudiante, id_clase, hora, estado, fecha))
+            await execute_query(UPSERT.format(valores=", ".join(["(%s, %s, %s, %s, %s)"] * len(filas))), params)
+            return
+
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            try:
+                async with conn.cursor() as cur:
+                    for id_estudiante, id_clase, estado, fecha, hora in filas:
+                        await cur.execute(
+                            "SELECT id_asistencia FROM asistencia WHERE id_estudiante = %s AND id_clase = %s AND fecha = %s",
+                            (id_estudiante, id_clase, fecha),
+                        )
+                        if await cur.fetchone():
+                            await cur.execute(
+                                """
+                                UPDATE asistencia SET estado = %s, hora_entrada = %s
+                                WHERE id_estudiante = %s AND id_clase = %s AND fecha = %s
+                                """,
+                                (estado, hora, id_estudiante, id_clase, fecha),
+                            )
+                        else:
+                            await cur.execute(
+                                "INSERT INTO asistencia (id_estudiante, id_clase, hora_entrada, estado, fecha) VALUES (%s, %s, %s, %s, %s)",
+                                (id_estudiante, id_clase, hora, estado, fecha),
+                            )
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+
+
+# Instancia global
+escritura_asistencia = EscrituraAsistencia()
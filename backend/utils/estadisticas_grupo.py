@@ -0,0 +1,125 @@
+"""
+Detalle de estadísticas de un grupo (/api/estadisticas/detalle-grupo)
+en una sola consulta.
+
+El endpoint hacía ocho consultas (tres tops, ranking, dos de materias,
+asistencia perfecta y promedios) que volvían a recorrer las mismas filas
+del resumen diario. Ahora CONSULTA_DETALLE_GRUPO trae en un solo viaje:
+
+- 'alumno':  presentes/ausentes/justificantes por alumno (resumen_asistencia_alumno)
+- 'materia': los mismos conteos por materia (resumen_asistencia_clase)
+- 'lista':   los alumnos activos del grupo (para asistencia perfecta,
+             incluye a los que aún no tienen registros)
+
+y derivar_detalle() arma las ocho vistas con NumPy. Los porcentajes se
+redondean como MySQL (división DECIMAL a 4 decimales y ROUND a 1, mitad
+hacia arriba) para que la respuesta sea la misma que con las consultas
+separadas.
+"""
+
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+ESTADOS = ("presentes", "ausentes", "justificantes")
+
+# Solo alumnos activos, igual que el resumen
+CONSULTA_DETALLE_GRUPO = """
+    SELECT 'alumno' AS tipo, e.id_estudiante AS id,
+           CONCAT(e.nombre, ' ', e.apellido) AS nombre,
+           SUM(r.presentes) AS presentes,
+           SUM(r.ausentes) AS ausentes,
+           SUM(r.justificantes) AS justificantes
+    FROM resumen_asistencia_alumno r
+    JOIN estudiante e ON r.id_estudiante = e.id_estudiante
+    WHERE r.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
+    GROUP BY e.id_estudiante, e.nombre, e.apellido
+    UNION ALL
+    SELECT 'materia', m.id_materia, m.nombre,
+           SUM(r.presentes), SUM(r.ausentes), SUM(r.justificantes)
+    FROM resumen_asistencia_clase r
+    JOIN materia m ON r.id_materia = m.id_materia
+    WHERE r.id_grupo = %s
+    GROUP BY m.id_materia, m.nombre
+    UNION ALL
+    SELECT 'lista', e.id_estudiante, CONCAT(e.nombre, ' ', e.apellido), 0, 0, 0
+    FROM estudiante e
+    WHERE e.id_grupo = %s AND e.estado_actual = 'activo' AND e.eliminado = 0
+"""
+
+
+def porcentajes(partes: np.ndarray, totales: np.ndarray) -> np.ndarray:
+    """
+    ROUND(partes/totales*100, 1) de MySQL con enteros: la división se
+    redondea a 4 decimales y luego a 1, ambas mitad hacia arriba. Con
+    total 0 regresa NaN (NULL).
+    """
+    partes = np.asarray(partes, dtype=np.int64)
+    totales = np.asarray(totales, dtype=np.int64)
+    seguros = np.where(totales > 0, totales, 1)
+    diezmilesimas = (partes * 20000 + seguros) // (2 * seguros)
+    decimas = (diezmilesimas + 5) // 10
+    return np.where(totales > 0, decimas / 10, np.nan)
+
+
+def _a_json(valor: float):
+    return None if np.isnan(valor) else float(valor)
+
+
+def _mayores(conteos: np.ndarray, limite: int = None) -> List[int]:
+    """Posiciones con conteo > 0, de mayor a menor (empates en orden de llegada)."""
+    orden = np.argsort(-conteos, kind="stable")
+    orden = orden[conteos[orden] > 0]
+    return orden[:limite].tolist()
+
+
+def derivar_detalle(filas: Sequence[Dict]) -> Dict:
+    """Las ocho vistas del detalle de grupo a partir de las filas de CONSULTA_DETALLE_GRUPO."""
+    por_tipo: Dict[str, List[Dict]] = {"alumno": [], "materia": [], "lista": []}
+    for fila in filas:
+        por_tipo[fila["tipo"]].append(fila)
+
+    alumnos, materias = por_tipo["alumno"], por_tipo["materia"]
+    # Columnas: presentes, ausentes, justificantes
+    conteos = np.array([[int(f[e] or 0) for e in ESTADOS] for f in alumnos], dtype=np.int64).reshape(-1, 3)
+    conteos_materia = np.array([[int(f[e] or 0) for e in ESTADOS] for f in materias], dtype=np.int64).reshape(-1, 3)
+    presentes, ausentes, justificantes = conteos.T
+    totales = conteos.sum(axis=1)
+
+    def top(columna: np.ndarray, alias: str) -> List[Dict]:
+        return [{"nombre": alumnos[i]["nombre"], alias: int(columna[i])} for i in _mayores(columna, 5)]
+
+    # Ranking: alumnos con registros, por porcentaje de asistencia
+    pct = [porcentajes(columna, totales) for columna in (presentes, ausentes, justificantes)]
+    con_registros = np.flatnonzero(totales > 0)
+    ranking = [
+        {
+            "id": alumnos[i]["id"],
+            "nombre": alumnos[i]["nombre"],
+            "asistencias": int(presentes[i]),
+            "faltas": int(ausentes[i]),
+            "justificantes": int(justificantes[i]),
+            "asistencia_porcentaje": _a_json(pct[0][i]),
+            "faltas_porcentaje": _a_json(pct[1][i]),
+            "justificantes_porcentaje": _a_json(pct[2][i]),
+        }
+        for i in con_registros[np.argsort(-pct[0][con_registros], kind="stable")].tolist()
+    ]
+
+    # Asistencia perfecta: alumnos del grupo sin ninguna falta
+    con_faltas = {alumnos[i]["id"] for i in np.flatnonzero(ausentes > 0).tolist()}
+    perfecta = [f["nombre"] for f in por_tipo["lista"] if f["id"] not in con_faltas]
+
+    sumas = conteos.sum(axis=0)
+    promedio = porcentajes(sumas, np.full(3, sumas.sum()))
+
+    return {
+        "topFaltas": top(ausentes, "faltas"),
+        "topAsistencias": top(presentes, "asistencias"),
+        "topJustificantes": top(justificantes, "justificantes"),
+        "ranking": ranking,
+        "materiaMasFaltada": [materias[i]["nombre"] for i in _mayores(conteos_materia[:, 1], 2)],
+        "materiaMasAsistida": next((materias[i]["nombre"] for i in _mayores(conteos_materia[:, 0], 1)), None),
+        "asistenciaPerfecta": perfecta,
+        "promedios": {clave: _a_json(valor) for clave, valor in zip(("asistencia", "faltas", "justificantes"), promedio)},
+    }
@@ -0,0 +1,195 @@
+"""
+Exportación de datos crudos en CSV o Parquet (?formato=csv|parquet en
+los endpoints de routes/reportes.py).
+
+El equipo de datos volvía a parsear los .xlsx de los reportes: el
+formato más lento de generar y el más pesado de descargar. Estos
+formatos salen en "formato largo" (una fila por registro, sin pivotear)
+directo de MySQL:
+
+- La consulta se lee con un cursor del lado del servidor
+  (config.db.cursor_servidor) en lotes de EXPORTAR_LOTE filas; nunca se
+  cargan todas en memoria.
+- Cada lote se escribe y se manda al cliente antes de pedir el
+  siguiente. Si el cliente corta la descarga se cierra la conexión (un
+  cursor a medias no se puede regresar al pool).
+- Parquet usa pyarrow (import perezoso). Los tipos de las columnas
+  salen de la descripción del cursor, así todos los lotes (row groups)
+  comparten el mismo esquema aunque el primero traiga nulos.
+
+Cada descarga ocupa una conexión del pool mientras dura; como mucho
+corren EXPORTAR_CONCURRENTES a la vez.
+"""
+
+import asyncio
+import csv
+import io
+import os
+from decimal import Decimal
+from typing import AsyncIterator, List, Sequence, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pymysql.constants import FIELD_TYPE
+
+from config.db import cursor_servidor
+from utils.metricas_sql import metricas_sql
+
+LOTE = int(os.getenv("EXPORTAR_LOTE", "5000"))
+CONCURRENTES = int(os.getenv("EXPORTAR_CONCURRENTES", "2"))
+
+PATRON_FORMATO = "^(xlsx|csv|parquet)$"
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_ENTEROS = {FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.INT24, FIELD_TYPE.LONGLONG, FIELD_TYPE.YEAR}
+_DECIMALES = {FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE, FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL}
+
+_semaforo = asyncio.Semaphore(CONCURRENTES)
+
+Lote = Tuple[List[str], List[int], Sequence[tuple]]
+
+
+async def _lotes(query: str, params=None) -> AsyncIterator[Lote]:
+    """
+    (columnas, tipos MySQL, filas) por lote. El primero siempre llega
+    (con filas vacías) para tener el encabezado aunque no haya datos.
+    """
+    async with _semaforo:
+        with metricas_sql.medir(query) as medicion:
+            async with cursor_servidor(query, params, dict_rows=False, medicion=medicion) as cur:
+                columnas = [d[0] for d in cur.description]
+                tipos = [d[1] for d in cur.description]
+                # Solo execute/fetchmany cuentan como latencia, no la descarga
+                with medicion.pausa():
+                    yield columnas, tipos, ()
+                while True:
+                    filas = await cur.fetchmany(LOTE)
+                    if not filas:
+                        break
+                    medicion.filas += len(filas)
+                    with medicion.pausa():
+                        yield columnas, tipos, filas
+
+
+# ===============================
+# 📌 CSV
+# ===============================
+async def _trozos_csv(query: str, params) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    async for columnas, _tipos, filas in _lotes(query, params):
+        if not filas:
+            writer.writerow(columnas)
+        writer.writerows(filas)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+# ===============================
+# 📌 PARQUET
+# ===============================
+def _importar_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow, pyarrow.parquet
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Parquet no disponible: falta instalar pyarrow en el servidor")
+
+
+def _tipo_arrow(pa, tipo_mysql: int):
+    if tipo_mysql in _ENTEROS:
+        return pa.int64()
+    if tipo_mysql in _DECIMALES:
+        return pa.float64()
+    if tipo_mysql == FIELD_TYPE.DATE:
+        return pa.date32()
+    if tipo_mysql in (FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP):
+        return pa.timestamp("us")
+    if tipo_mysql == FIELD_TYPE.TIME:
+        # aiomysql regresa TIME como timedelta
+        return pa.duration("us")
+    return pa.string()
+
+
+def _columna(pa, valores, tipo):
+    if pa.types.is_floating(tipo):
+        valores = [float(v) if isinstance(v, Decimal) else v for v in valores]
+    elif pa.types.is_string(tipo):
+        valores = [v if v is None or isinstance(v, str) else str(v) for v in valores]
+    return pa.array(valores, type=tipo)
+
+
+class _SalidaParquet(io.RawIOBase):
+    """Archivo de solo escritura que se vacía por partes; tell() cuenta todo lo escrito."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._posicion = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, datos) -> int:
+        self._buffer += datos
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self) -> int:
+        return self._posicion
+
+    def vaciar(self) -> bytes:
+        datos = bytes(self._buffer)
+        self._buffer.clear()
+        return datos
+
+
+async def _trozos_parquet(query: str, params) -> AsyncIterator[bytes]:
+    pa, pq = _importar_pyarrow()
+    salida = _SalidaParquet()
+    writer = None
+    esquema = None
+    async for columnas, tipos, filas in _lotes(query, params):
+        if writer is None:
+            esquema = pa.schema([(c, _tipo_arrow(pa, t)) for c, t in zip(columnas, tipos)])
+            writer = pq.ParquetWriter(salida, esquema)
+        if filas:
+            # Cada lote es un row group
+            transpuestas = list(zip(*filas))
+            writer.write_batch(pa.record_batch(
+                [_columna(pa, list(valores), campo.type) for valores, campo in zip(transpuestas, esquema)],
+                schema=esquema,
+            ))
+        trozo = salida.vaciar()
+        if trozo:
+            yield trozo
+    if writer is not None:
+        writer.close()
+        yield salida.vaciar()
+
+
+# ===============================
+# 📌 RESPUESTA
+# ===============================
+def respuesta_datos(query: str, params, formato: str, nombre: str) -> StreamingResponse:
+    """
+    StreamingResponse con el resultado de la consulta en CSV o Parquet;
+    nombre es el del archivo sin extensión.
+    """
+    if formato == "parquet":
+        # Falla antes de empezar a mandar el archivo si no hay pyarrow
+        _importar_pyarrow()
+        trozos = _trozos_parquet(query, params)
+    elif formato == "csv":
+        trozos = _trozos_csv(query, params)
+    else:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {formato}")
+    return StreamingResponse(
+        trozos,
+        media_type=MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f"attachment; filename={nombre}.{formato}"},
+    )
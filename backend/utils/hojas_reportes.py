@@ -0,0 +1,179 @@
+"""
+Escritores de los reportes pesados (todas las clases de un profesor y
+el completo de una clase).
+
+Reciben datos ya consultados y escriben sobre un ReporteExcel. No
+importan nada de la base de datos ni de las rutas: los usa tanto el
+endpoint en streaming (en un hilo) como la cola de trabajos de
+utils/trabajos_reportes.py, que los corre en otro proceso.
+
+Firma: escribir_xxx(reporte, datos, avance=None). avance(fraccion)
+recibe de 0 a 1 conforme se escriben las hojas.
+"""
+
+from typing import Callable, Dict, Optional
+
+from utils.pivote_asistencias import LETRA_ESTADO, MatrizAsistencia
+from utils.reporte_excel import ReporteExcel, estilo_estado, estimar_ancho
+
+Avance = Optional[Callable[[float], None]]
+
+
+def _avisar(avance: Avance, hechas: int, total: int):
+    if avance and total:
+        avance(hechas / total)
+
+
+# ==================== PROFESOR (RANGO DE FECHAS) ====================
+def escribir_reporte_profesor(reporte: ReporteExcel, datos: Dict, avance: Avance = None):
+    """
+    datos["hojas"]: (nombre_hoja, aviso, estudiantes, id_clase) por clase;
+    datos["matrices"]: id_clase -> MatrizAsistencia (pivoteadas al consultar).
+    """
+    hojas = datos["hojas"]
+    matrices = datos["matrices"]
+    for i, (nombre_hoja, aviso, estudiantes, id_clase) in enumerate(hojas, start=1):
+        if aviso:
+            reporte.hoja(nombre_hoja).fila([aviso])
+            _avisar(avance, i, len(hojas))
+            continue
+
+        matriz = matrices[id_clase]
+        fechas = matriz.fechas
+        textos = matriz.mapear(lambda estado: estado.capitalize() if estado else "")
+        estilos_celda = matriz.mapear(lambda estado: estilo_estado(estado) or "centrado")
+        hoja = reporte.hoja(nombre_hoja, [10, 15, 30, 10] + [12] * len(fechas))
+        hoja.encabezado(["No Lista", "Matrícula", "Nombre", "Grupo", *fechas])
+
+        # Agregar filas de estudiantes (fechas centradas y coloreadas)
+        for est in estudiantes:
+            row_data = [
+                est["no_lista"],
+                est["matricula"],
+                f"{est['apellido']} {est['nombre']}",
+                est["grupo"]
+            ]
+            row_data.extend(textos.fila(est["id_estudiante"]))
+            hoja.fila(row_data, [None] * 4 + estilos_celda.fila(est["id_estudiante"]))
+        _avisar(avance, i, len(hojas))
+
+
+# ==================== PROFESOR (CURSO COMPLETO) ====================
+def escribir_reporte_profesor_completo(reporte: ReporteExcel, datos: Dict, avance: Avance = None):
+    """
+    datos["hojas"]: (nombre_hoja, estudiantes, id_clase) por clase;
+    datos["matrices"]: id_clase -> MatrizAsistencia (pivoteadas al consultar).
+    """
+    hojas = datos["hojas"]
+    matrices = datos["matrices"]
+    for i, (nombre_hoja, estudiantes, id_clase) in enumerate(hojas, start=1):
+        matriz = matrices.get(id_clase) or MatrizAsistencia.vacia()
+        fechas = matriz.fechas
+        textos = matriz.mapear(lambda estado: "—" if estado is None else estado)
+
+        # Filas de estudiantes
+        filas = []
+        for est in estudiantes:
+            row = [
+                est['no_lista'],
+                est['matricula'],
+                f"{est['nombre']} {est['apellido']}",
+                est['grupo']
+            ]
+            row.extend(textos.fila(est['id_estudiante']))
+            filas.append(row)
+
+        # Cabecera y anchos estimados con los datos
+        header = ["No Lista", "Matrícula", "Nombre", "Grupo"] + fechas
+        anchos = [
+            estimar_ancho([titulo] + [fila[i] for fila in filas], minimo=15, extra=0)
+            for i, titulo in enumerate(header)
+        ]
+        sheet = reporte.hoja(nombre_hoja, anchos)
+        sheet.encabezado(header)
+
+        # Escribir filas con las fechas coloreadas
+        for row in filas:
+            sheet.fila(row, [None] * 4 + [estilo_estado(v, "_relleno") for v in row[4:]])
+        _avisar(avance, i, len(hojas))
+
+
+# ==================== CLASE COMPLETO ====================
+def nombre_hoja_seguro(base: str, sufijo: str, max_len: int = 31) -> str:
+    nombre_base = base[:max_len - len(sufijo) - 1] if len(base) > (max_len - len(sufijo) - 1) else base
+    return f"{nombre_base}-{sufijo}"
+
+
+ESTILO_LETRA = {"P": "presente_negrita", "A": "ausente_negrita", "J": "justificante_negrita"}
+
+
+def escribir_reporte_clase_completo(reporte: ReporteExcel, datos: Dict, avance: Avance = None):
+    """
+    datos: materia, grupo, actividades, alumnos, entregas_map
+    ("{id_estudiante}_{id_actividad}" -> entrega) y matriz (la
+    MatrizAsistencia de la clase; cada alumno con nombre y matricula).
+    """
+    materia = datos["materia"]
+    grupo = datos["grupo"]
+    actividades = datos["actividades"]
+    entregas_map = datos["entregas_map"]
+
+    # ===== HOJA ACTIVIDADES =====
+    ws_act = reporte.hoja(nombre_hoja_seguro(f"{materia}-{grupo}", "Act"), [20] * (4 + len(actividades) * 2))
+
+    header_act = ["No Lista", "Matrícula", "Nombre", "Grupo"]
+    for act in actividades:
+        header_act.append(act["titulo"])
+        header_act.append(f"Calificación - {act['titulo']}")
+    ws_act.encabezado(header_act, "encabezado_vc")
+
+    # Rellenar datos y colores de estado
+    for alumno in datos["alumnos"]:
+        row_data = [
+            alumno["no_lista"],
+            alumno["matricula"],
+            f"{alumno['apellido']} {alumno['nombre']}",
+            grupo
+        ]
+        estilos = [None] * 4
+        for act in actividades:
+            key = f"{alumno['id_estudiante']}_{act['id_actividad']}"
+            entrega = entregas_map.get(key)
+            estado = entrega["estado"] if entrega else "pendiente"
+            calificacion = entrega["calificacion"] if entrega and entrega.get("calificacion") is not None else 0
+            row_data.append(estado)
+            row_data.append(calificacion)
+            estilos.append(estilo_estado(estado, "_negrita") or "estado_negrita")
+            estilos.append(None)
+        ws_act.fila(row_data, estilos)
+    _avisar(avance, 1, 2)
+
+    # ===== HOJA ASISTENCIAS =====
+    matriz = datos["matriz"]
+    fechas_unicas = matriz.fechas
+    estudiantes = list(matriz.alumnos.values())
+    letras = matriz.mapear(lambda estado: LETRA_ESTADO.get(estado, "-"))
+    estilos_letra = matriz.mapear(lambda estado: ESTILO_LETRA.get(LETRA_ESTADO.get(estado)))
+    totales = [matriz.contar(estado) for estado in ("presente", "ausente", "justificante")]
+    encabezados = ["Nombre", "Matrícula", "Grupo", "Materia"] + fechas_unicas + ["TOTAL P", "TOTAL A", "TOTAL J"]
+    anchos = [
+        estimar_ancho([encabezados[0]] + [e["nombre"] for e in estudiantes], minimo=12),
+        estimar_ancho([encabezados[1]] + [e["matricula"] for e in estudiantes], minimo=12),
+        estimar_ancho([encabezados[2], grupo], minimo=12),
+        estimar_ancho([encabezados[3], materia], minimo=12),
+    ] + [estimar_ancho([e], minimo=12) for e in encabezados[4:]]
+    ws_asis = reporte.hoja(nombre_hoja_seguro(f"{materia}-{grupo}", "Asis"), anchos)
+    ws_asis.encabezado(encabezados, "encabezado_vc")
+
+    # Llenar filas y conteos (letras coloreadas)
+    for pos, (id_est, est) in enumerate(matriz):
+        fila = [
+            est["nombre"],
+            est["matricula"],
+            grupo,
+            materia
+        ]
+        fila.extend(letras.fila(id_est))
+        fila.extend(total[pos] for total in totales)
+        ws_asis.fila(fila, [None] * 4 + estilos_letra.fila(id_est))
+    _avisar(avance, 2, 2)
@@ -0,0 +1,165 @@
+"""
+Log estructurado de peticiones HTTP (una línea JSON por petición).
+
+El middleware anterior hacía `await request.body()` en cada petición que
+no fuera GET, lo decodificaba y lo imprimía truncado: un Excel de
+/api/importar o el PDF de un justificante se cargaban completos en
+memoria solo para mostrar 500 caracteres.
+
+Este es un middleware ASGI puro que no materializa el body: deja pasar
+los mensajes de `receive` tal cual a la app y solo copia los primeros
+LOG_PETICIONES_BODY_MAX bytes conforme la app los va leyendo. Los
+multipart y binarios (PDF, Excel, imágenes...) nunca se copian; se anota
+solo su tamaño.
+
+Variables de entorno:
+
+- LOG_PETICIONES_MUESTREO: fracción de peticiones que se registran
+  (default 1.0). Los errores (>= 500) y las lentas
+  (> LOG_PETICIONES_LENTA_MS, default 1000) se registran siempre.
+- LOG_PETICIONES_BODY_MAX: bytes de body que se incluyen (default 500,
+  0 = nunca).
+- LOG_PETICIONES_REDACTAR: llaves (JSON, formulario o query string) cuyo
+  valor se cambia por "***", separadas por comas.
+- LOG_PETICIONES_RUTAS_SIN_BODY: prefijos de ruta cuyo body nunca se
+  registra (default /api/login: ahí viaja la contraseña).
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import time
+from typing import Dict, List
+from urllib.parse import parse_qsl, urlencode
+
+logger = logging.getLogger("peticiones")
+
+MUESTREO = float(os.getenv("LOG_PETICIONES_MUESTREO", "1.0"))
+LENTA_MS = float(os.getenv("LOG_PETICIONES_LENTA_MS", "1000"))
+BODY_MAX = int(os.getenv("LOG_PETICIONES_BODY_MAX", "500"))
+LLAVES_REDACTAR = {
+    llave.strip().lower()
+    for llave in os.getenv(
+        "LOG_PETICIONES_REDACTAR",
+        "contrasena,password,passwd,token,access_token,secret,secreto,authorization,fernet_key",
+    ).split(",")
+    if llave.strip()
+}
+RUTAS_SIN_BODY = [
+    r.strip() for r in os.getenv("LOG_PETICIONES_RUTAS_SIN_BODY", "/api/login").split(",") if r.strip()
+]
+# Tipos de contenido cuyo body se puede mostrar como texto
+TIPOS_TEXTO = ("application/json", "application/x-www-form-urlencoded", "text/")
+REDACTADO = "***"
+
+_RE_JSON_LLAVE = re.compile(r'("(?P<llave>[^"\\]+)"\s*:\s*)("(?:[^"\\]|\\.)*"?|[^,}\]\s\[{"]+)')
+
+
+class MiddlewareLog:
+    """Middleware ASGI: registra cada petición al terminar, sin leer el body por su cuenta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        muestreada = random.random() < MUESTREO
+        encabezados = _encabezados(scope)
+        tipo = encabezados.get("content-type", "")
+        ruta = scope.get("path", "")
+        copiar = (
+            muestreada
+            and BODY_MAX > 0
+            and tipo.startswith(TIPOS_TEXTO)
+            and not any(ruta.startswith(prefijo) for prefijo in RUTAS_SIN_BODY)
+        )
+        fragmentos: List[bytes] = []
+        estado = {"bytes": 0, "copiados": 0, "codigo": 500}
+
+        async def recibir():
+            mensaje = await receive()
+            if mensaje["type"] == "http.request":
+                cuerpo = mensaje.get("body", b"")
+                estado["bytes"] += len(cuerpo)
+                if copiar and estado["copiados"] < BODY_MAX and cuerpo:
+                    # Solo se copia lo que cabe en el log; el mensaje sigue intacto
+                    parte = cuerpo[:BODY_MAX - estado["copiados"]]
+                    fragmentos.append(parte)
+                    estado["copiados"] += len(parte)
+            return mensaje
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["codigo"] = mensaje["status"]
+            await send(mensaje)
+
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, recibir, enviar)
+        finally:
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+            if muestreada or estado["codigo"] >= 500 or duracion_ms > LENTA_MS:
+                registro = {
+                    "ts": round(time.time(), 3),
+                    "metodo": scope.get("method"),
+                    "ruta": ruta,
+                    "estado": estado["codigo"],
+                    "duracion_ms": round(duracion_ms, 1),
+                }
+                if scope.get("query_string"):
+                    registro["query"] = redactar_query(scope["query_string"].decode("latin-1"))
+                if estado["bytes"]:
+                    registro["body_bytes"] = estado["bytes"]
+                    registro["content_type"] = tipo.split(";")[0]
+                if fragmentos:
+                    registro["body"] = redactar_body(b"".join(fragmentos), tipo, estado["bytes"] > estado["copiados"])
+                nivel = logging.WARNING if estado["codigo"] >= 500 or duracion_ms > LENTA_MS else logging.INFO
+                logger.log(nivel, json.dumps(registro, ensure_ascii=False))
+
+
+def _encabezados(scope) -> Dict[str, str]:
+    return {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+
+
+# ===============================
+# 📌 REDACCIÓN
+# ===============================
+def redactar_query(query: str) -> str:
+    pares = parse_qsl(query, keep_blank_values=True)
+    return urlencode([(k, REDACTADO if k.lower() in LLAVES_REDACTAR else v) for k, v in pares], safe="*")
+
+
+def redactar_body(cuerpo: bytes, tipo: str, truncado: bool) -> str:
+    """Body como texto con los valores sensibles cambiados por ***."""
+    texto = cuerpo.decode("utf-8", errors="replace")
+    if tipo.startswith("application/x-www-form-urlencoded"):
+        texto = redactar_query(texto)
+    elif tipo.startswith("application/json"):
+        texto = _redactar_json(texto, truncado)
+    return texto + ("..." if truncado else "")
+
+
+def _redactar_json(texto: str, truncado: bool) -> str:
+    if not truncado:
+        try:
+            return json.dumps(_redactar_valor(json.loads(texto)), ensure_ascii=False)
+        except ValueError:
+            pass
+    # JSON cortado o inválido: se redacta por patrón "llave": valor
+    return _RE_JSON_LLAVE.sub(
+        lambda m: m.group(1) + f'"{REDACTADO}"' if m.group("llave").lower() in LLAVES_REDACTAR else m.group(0),
+        texto,
+    )
+
+
+def _redactar_valor(valor):
+    if isinstance(valor, dict):
+        return {k: REDACTADO if str(k).lower() in LLAVES_REDACTAR else _redactar_valor(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_redactar_valor(v) for v in valor]
+    return valor
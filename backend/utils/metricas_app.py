@@ -0,0 +1,205 @@
+"""
+Métricas de la aplicación en formato de texto de Prometheus (GET /metrics).
+
+Sin depender de prometheus_client: contadores e histogramas en
+diccionarios y un render de texto al momento del scrape.
+
+- Peticiones HTTP por método, ruta (la plantilla, p. ej.
+  /api/tabla/{id_clase}/datos, no la URL) y código: conteo e histograma
+  de duración. Las mide MiddlewareMetricas, un middleware ASGI puro que
+  nunca lee el body.
+- Peticiones en curso.
+- Fallos al desencriptar QR, por endpoint (contar_qr_fallido).
+- Duración de la generación de reportes (medir_reporte).
+- Medidores que se calculan al hacer el scrape (registrar_medidor), como
+  las conexiones WebSocket por clase de tabla_manager.
+
+El scrape solo recorre lo acumulado; no toca la base de datos.
+"""
+
+import functools
+import time
+from typing import Callable, Dict, List, Tuple
+
+# Límites (segundos) de las cubetas; la última es +Inf
+CUBETAS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class HistogramaPrometheus:
+    """Cubetas no acumuladas; se acumulan al renderizar."""
+
+    __slots__ = ("cubetas", "suma", "cuenta")
+
+    def __init__(self):
+        self.cubetas = [0] * (len(CUBETAS_S) + 1)
+        self.suma = 0.0
+        self.cuenta = 0
+
+    def observar(self, segundos: float):
+        self.suma += segundos
+        self.cuenta += 1
+        for i, limite in enumerate(CUBETAS_S):
+            if segundos <= limite:
+                self.cubetas[i] += 1
+                return
+        self.cubetas[-1] += 1
+
+
+class MetricasApp:
+    """Registro de métricas del proceso."""
+
+    def __init__(self):
+        # (método, ruta, código) -> histograma de duración
+        self.peticiones: Dict[Tuple[str, str, str], HistogramaPrometheus] = {}
+        self.en_curso = 0
+        # endpoint -> fallos
+        self.qr_fallidos: Dict[str, int] = {}
+        # nombre del reporte -> histograma de duración
+        self.reportes: Dict[str, HistogramaPrometheus] = {}
+        # nombre -> (ayuda, etiqueta, función que regresa {valor_etiqueta: valor})
+        self._medidores: Dict[str, Tuple[str, str, Callable[[], Dict]]] = {}
+
+    # ===============================
+    # 📌 REGISTRO
+    # ===============================
+    def observar_peticion(self, metodo: str, ruta: str, codigo: int, segundos: float):
+        clave = (metodo, ruta, str(codigo))
+        histograma = self.peticiones.get(clave)
+        if histograma is None:
+            histograma = self.peticiones[clave] = HistogramaPrometheus()
+        histograma.observar(segundos)
+
+    def contar_qr_fallido(self, endpoint: str, cantidad: int = 1):
+        self.qr_fallidos[endpoint] = self.qr_fallidos.get(endpoint, 0) + cantidad
+
+    def observar_reporte(self, reporte: str, segundos: float):
+        histograma = self.reportes.get(reporte)
+        if histograma is None:
+            histograma = self.reportes[reporte] = HistogramaPrometheus()
+        histograma.observar(segundos)
+
+    def medir_reporte(self, reporte: str):
+        """
+        Decorador para endpoints async que generan un reporte.
+
+        Si el endpoint regresa una respuesta en streaming (utils/reporte_excel.py)
+        el tiempo cuenta hasta que se manda el último trozo.
+        """
+        def decorador(funcion):
+            @functools.wraps(funcion)
+            async def envoltura(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    respuesta = await funcion(*args, **kwargs)
+                except Exception:
+                    self.observar_reporte(reporte, time.perf_counter() - inicio)
+                    raise
+                cuerpo = getattr(respuesta, "body_iterator", None)
+                if cuerpo is None:
+                    self.observar_reporte(reporte, time.perf_counter() - inicio)
+                    return respuesta
+
+                async def cuerpo_medido():
+                    try:
+                        async for trozo in cuerpo:
+                            yield trozo
+                    finally:
+                        self.observar_reporte(reporte, time.perf_counter() - inicio)
+
+                respuesta.body_iterator = cuerpo_medido()
+                return respuesta
+            return envoltura
+        return decorador
+
+    def registrar_medidor(self, nombre: str, ayuda: str, etiqueta: str, funcion: Callable[[], Dict]):
+        """Medidor calculado en cada scrape; funcion() -> {valor_etiqueta: valor}."""
+        self._medidores[nombre] = (ayuda, etiqueta, funcion)
+
+    # ===============================
+    # 📌 EXPOSICIÓN
+    # ===============================
+    def exponer(self) -> str:
+        lineas: List[str] = []
+
+        lineas += _encabezado("http_peticion_duracion_segundos", "histogram", "Duración de las peticiones HTTP en segundos")
+        for (metodo, ruta, codigo), histograma in list(self.peticiones.items()):
+            etiquetas = f'metodo="{metodo}",ruta="{_escapar(ruta)}",codigo="{codigo}"'
+            lineas += _lineas_histograma("http_peticion_duracion_segundos", etiquetas, histograma)
+
+        lineas += _encabezado("http_peticiones_en_curso", "gauge", "Peticiones HTTP en proceso")
+        lineas.append(f"http_peticiones_en_curso {self.en_curso}")
+
+        lineas += _encabezado("qr_descifrado_fallido_total", "counter", "QR que no se pudieron desencriptar")
+        for endpoint, total in list(self.qr_fallidos.items()):
+            lineas.append(f'qr_descifrado_fallido_total{{endpoint="{_escapar(endpoint)}"}} {total}')
+
+        lineas += _encabezado("reporte_duracion_segundos", "histogram", "Tiempo de generación de reportes")
+        for reporte, histograma in list(self.reportes.items()):
+            lineas += _lineas_histograma("reporte_duracion_segundos", f'reporte="{_escapar(reporte)}"', histograma)
+
+        for nombre, (ayuda, etiqueta, funcion) in list(self._medidores.items()):
+            lineas += _encabezado(nombre, "gauge", ayuda)
+            try:
+                valores = funcion()
+            except Exception:
+                continue
+            for valor_etiqueta, valor in valores.items():
+                if etiqueta:
+                    lineas.append(f'{nombre}{{{etiqueta}="{_escapar(str(valor_etiqueta))}"}} {valor}')
+                else:
+                    lineas.append(f"{nombre} {valor}")
+
+        return "\n".join(lineas) + "\n"
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI: cuenta y mide cada petición HTTP sin leer el body."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        codigo = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                codigo[0] = mensaje["status"]
+            await send(mensaje)
+
+        metricas_app.en_curso += 1
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            metricas_app.en_curso -= 1
+            # FastAPI deja en el scope la ruta que atendió la petición
+            ruta = getattr(scope.get("route"), "path", None) or "sin_ruta"
+            metricas_app.observar_peticion(scope["method"], ruta, codigo[0], time.perf_counter() - inicio)
+
+
+def _encabezado(nombre: str, tipo: str, ayuda: str) -> List[str]:
+    return [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+
+
+def _lineas_histograma(nombre: str, etiquetas: str, histograma: HistogramaPrometheus) -> List[str]:
+    lineas = []
+    acumulado = 0
+    for limite, cuenta in zip(CUBETAS_S, histograma.cubetas):
+        acumulado += cuenta
+        lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+    lineas.append(f'{nombre}_bucket{{{etiquetas},le="+Inf"}} {histograma.cuenta}')
+    lineas.append(f"{nombre}_sum{{{etiquetas}}} {histograma.suma:.6f}")
+    lineas.append(f"{nombre}_count{{{etiquetas}}} {histograma.cuenta}")
+    return lineas
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Instancia global
+metricas_app = MetricasApp()
@@ -0,0 +1,245 @@
+"""
+Métricas de las consultas que pasan por config/db.py.
+
+fetch_one, fetch_all, execute_query y execute_many miden cada consulta y
+la registran bajo su "huella": el SQL en minúsculas, con los espacios
+colapsados y los literales (%s, números, cadenas, listas IN) cambiados
+por "?". Así las ~150 consultas de routes/ quedan agrupadas aunque
+cambien los parámetros o el tamaño de una lista IN.
+
+Por huella se guarda:
+
+- llamadas, errores y un histograma de latencia (ms) con cubetas fijas,
+  del que salen p50/p95/p99 aproximados
+- filas regresadas (o afectadas, en las escrituras)
+- tiempo esperando una conexión libre del pool
+
+Las lecturas por lotes (config.db.stream_rows, utils/exportar_datos.py)
+marcan con medicion.pausa() el tiempo en que el lote está en manos del
+consumidor (p. ej. una descarga lenta): ese tiempo no cuenta como
+latencia de la consulta.
+
+Las consultas que tardan más de SQL_LENTA_MS (default 500, 0 = nunca) se
+escriben en el log con su huella y se guardan las últimas
+SQL_LENTAS_RECIENTES para consultarlas en /metricas/sql.
+"""
+
+import logging
+import os
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+UMBRAL_LENTA_MS = float(os.getenv("SQL_LENTA_MS", "500"))
+LENTAS_RECIENTES = int(os.getenv("SQL_LENTAS_RECIENTES", "50"))
+# Límites superiores (ms) de las cubetas del histograma; la última es +inf
+CUBETAS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Huellas calculadas por texto de consulta; casi todas son constantes del código
+MAX_HUELLAS_EN_CACHE = 4096
+
+_RE_CADENA = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_RE_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_MARCADOR = re.compile(r"%\(\w+\)s|%s")
+_RE_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+def huella(query: str) -> str:
+    """SQL normalizado: mismo texto para la misma consulta con otros parámetros."""
+    texto = _RE_CADENA.sub("?", query)
+    texto = _RE_MARCADOR.sub("?", texto)
+    texto = _RE_NUMERO.sub("?", texto)
+    texto = _RE_ESPACIOS.sub(" ", texto).strip().lower()
+    return _RE_LISTA.sub("(?+)", texto)
+
+
+class Histograma:
+    """Conteo de duraciones (ms) en las cubetas de CUBETAS_MS."""
+
+    __slots__ = ("cuenta", "total_ms", "max_ms", "cubetas")
+
+    def __init__(self):
+        self.cuenta = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.cubetas = [0] * (len(CUBETAS_MS) + 1)
+
+    def registrar(self, duracion_ms: float):
+        self.cuenta += 1
+        self.total_ms += duracion_ms
+        self.max_ms = max(self.max_ms, duracion_ms)
+        for i, limite in enumerate(CUBETAS_MS):
+            if duracion_ms <= limite:
+                self.cubetas[i] += 1
+                break
+        else:
+            self.cubetas[-1] += 1
+
+    def percentil(self, p: float) -> float:
+        """Límite superior de la cubeta donde cae el percentil p (0-100), sin pasar del máximo."""
+        objetivo = self.cuenta * p / 100
+        acumulado = 0
+        for i, cuenta in enumerate(self.cubetas):
+            acumulado += cuenta
+            if cuenta and acumulado >= objetivo:
+                return min(float(CUBETAS_MS[i]), round(self.max_ms, 1)) if i < len(CUBETAS_MS) else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def a_dict(self) -> Dict:
+        return {
+            "promedio_ms": round(self.total_ms / (self.cuenta or 1), 2),
+            "p50_ms": self.percentil(50),
+            "p95_ms": self.percentil(95),
+            "p99_ms": self.percentil(99),
+            "max_ms": round(self.max_ms, 1),
+            "histograma": {
+                **{f"<={limite}ms": c for limite, c in zip(CUBETAS_MS, self.cubetas)},
+                f">{CUBETAS_MS[-1]}ms": self.cubetas[-1],
+            },
+        }
+
+
+class EstadisticaConsulta:
+    """Acumulados de una huella."""
+
+    __slots__ = ("huella", "llamadas", "errores", "filas", "espera_pool_ms", "latencia")
+
+    def __init__(self, huella_sql: str):
+        self.huella = huella_sql
+        self.llamadas = 0
+        self.errores = 0
+        self.filas = 0
+        self.espera_pool_ms = 0.0
+        self.latencia = Histograma()
+
+    def registrar(self, duracion_ms: float, espera_ms: float, filas: int, error: bool):
+        self.llamadas += 1
+        self.errores += error
+        self.filas += filas
+        self.espera_pool_ms += espera_ms
+        self.latencia.registrar(duracion_ms)
+
+    def a_dict(self) -> Dict:
+        llamadas = self.llamadas or 1
+        return {
+            "huella": self.huella,
+            "llamadas": self.llamadas,
+            "errores": self.errores,
+            "total_ms": round(self.latencia.total_ms, 1),
+            **self.latencia.a_dict(),
+            "filas_promedio": round(self.filas / llamadas, 1),
+            "espera_pool_promedio_ms": round(self.espera_pool_ms / llamadas, 2),
+        }
+
+
+class Medicion:
+    """Lo que dura una consulta; se usa con `with metricas_sql.medir(query)`."""
+
+    __slots__ = ("_registro", "query", "filas", "_inicio", "_conexion", "_pausado")
+
+    def __init__(self, registro: "MetricasSQL", query: str):
+        self._registro = registro
+        self.query = query
+        self.filas = 0
+        self._conexion: Optional[float] = None
+        # Segundos fuera de la consulta (lotes en manos del consumidor)
+        self._pausado = 0.0
+
+    def conexion_obtenida(self):
+        """Marca el fin de la espera por el pool."""
+        self._conexion = time.perf_counter()
+
+    @contextmanager
+    def pausa(self):
+        """No cuenta lo que pase dentro del bloque (p. ej. un yield de un lote)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._pausado += time.perf_counter() - inicio
+
+    def __enter__(self) -> "Medicion":
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo_exc, exc, tb):
+        fin = time.perf_counter()
+        conexion = self._conexion if self._conexion is not None else fin
+        self._registro.registrar(
+            self.query,
+            duracion_ms=(fin - conexion - self._pausado) * 1000,
+            espera_ms=(conexion - self._inicio) * 1000,
+            filas=self.filas,
+            error=tipo_exc is not None,
+        )
+        return False
+
+
+class MetricasSQL:
+    """Estadísticas por huella y registro de consultas lentas."""
+
+    def __init__(self):
+        self._estadisticas: Dict[str, EstadisticaConsulta] = {}
+        self._huellas: Dict[str, str] = {}
+        self.lentas: Deque[Dict] = deque(maxlen=LENTAS_RECIENTES)
+        self.desde = time.time()
+
+    def medir(self, query: str) -> Medicion:
+        return Medicion(self, query)
+
+    def registrar(self, query: str, duracion_ms: float, espera_ms: float, filas: int, error: bool = False):
+        clave = self._huellas.get(query)
+        if clave is None:
+            if len(self._huellas) >= MAX_HUELLAS_EN_CACHE:
+                self._huellas.clear()
+            clave = self._huellas[query] = huella(query)
+
+        estadistica = self._estadisticas.get(clave)
+        if estadistica is None:
+            estadistica = self._estadisticas[clave] = EstadisticaConsulta(clave)
+        estadistica.registrar(duracion_ms, espera_ms, filas, error)
+
+        if UMBRAL_LENTA_MS > 0 and duracion_ms + espera_ms >= UMBRAL_LENTA_MS:
+            logger.warning(
+                f"🐢 Consulta lenta: {duracion_ms:.0f}ms (+{espera_ms:.0f}ms esperando pool), "
+                f"{filas} fila(s): {clave[:300]}"
+            )
+            self.lentas.append({
+                "timestamp": time.time(),
+                "duracion_ms": round(duracion_ms, 1),
+                "espera_pool_ms": round(espera_ms, 1),
+                "filas": filas,
+                "error": error,
+                "huella": clave,
+            })
+
+    def top(self, n: int = 20, orden: str = "total_ms") -> List[Dict]:
+        """Las n huellas con mayor `orden` (total_ms, p95_ms, max_ms, llamadas, espera...)."""
+        filas = [e.a_dict() for e in self._estadisticas.values()]
+        if filas and not isinstance(filas[0].get(orden), (int, float)):
+            orden = "total_ms"
+        filas.sort(key=lambda f: f[orden], reverse=True)
+        return filas[:n]
+
+    def reiniciar(self):
+        self._estadisticas.clear()
+        self.lentas.clear()
+        self.desde = time.time()
+
+    def obtener_metricas(self, n: int = 20, orden: str = "total_ms") -> Dict:
+        return {
+            "desde": self.desde,
+            "huellas": len(self._estadisticas),
+            "llamadas": sum(e.llamadas for e in self._estadisticas.values()),
+            "umbral_lenta_ms": UMBRAL_LENTA_MS,
+            "top": self.top(n, orden),
+            "lentas_recientes": list(self.lentas),
+        }
+
+
+# Instancia global
+metricas_sql = MetricasSQL()
@@ -0,0 +1,205 @@
+"""
+Telemetría y tamaño adaptativo del pool de aiomysql.
+
+En el cambio de clase muchas peticiones esperaban dentro de
+pool.acquire() sin que nada lo mostrara. config/db.py reporta aquí cada
+adquisición; /health y /metricas/pool muestran:
+
+- tamaño, conexiones libres y en uso, mínimo y máximo
+- peticiones esperando una conexión (ahora y el máximo visto)
+- histograma del tiempo de espera en acquire()
+- edad de las conexiones abiertas
+
+Modo adaptativo (DB_POOL_ADAPTATIVO=1): cada DB_POOL_INTERVALO segundos
+se revisa el horario de hoy (el que ya lee roster_cache de horario_clase).
+Si hay clases empezando o terminando dentro de DB_POOL_ANTICIPACION_MIN
+minutos, el objetivo sube a DB_POOL_MIN + DB_POOL_CONEXIONES_POR_CLASE
+por clase (sin pasar de DB_POOL_MAX) y las conexiones se abren antes del
+pico. Cuando llevan DB_POOL_INACTIVO_MIN minutos sin picos y sin esperas,
+el objetivo regresa a DB_POOL_MIN y se cierran solo las conexiones libres
+que sobran.
+
+Solo se usa la API pública de aiomysql: para abrir conexiones se piden
+con acquire() y se regresan con release() (el pool conserva las libres);
+para cerrar las que sobran se toman libres, se cierran y se regresan.
+El minsize del pool no cambia.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+import weakref
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.fecha import obtener_fecha_hora_cdmx
+from utils.metricas_sql import Histograma
+
+logger = logging.getLogger(__name__)
+
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+ADAPTATIVO = os.getenv("DB_POOL_ADAPTATIVO", "0") == "1"
+CONEXIONES_POR_CLASE = float(os.getenv("DB_POOL_CONEXIONES_POR_CLASE", "1"))
+ANTICIPACION_MIN = int(os.getenv("DB_POOL_ANTICIPACION_MIN", "5"))
+INACTIVO_MIN = int(os.getenv("DB_POOL_INACTIVO_MIN", "15"))
+INTERVALO = int(os.getenv("DB_POOL_INTERVALO", "60"))
+
+
+class MonitorPool:
+    """Contadores del pool y tarea de ajuste por horario."""
+
+    def __init__(self):
+        self.esperando = 0
+        self.max_esperando = 0
+        self.adquisiciones = 0
+        self.espera = Histograma()
+        # Conexión -> momento en que se vio por primera vez (≈ cuando se abrió)
+        self._nacimiento: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self.objetivo = POOL_MIN
+        self.clases_en_pico = 0
+        self._ultimo_pico = 0.0
+        self._tarea: Optional[asyncio.Task] = None
+        self.metricas = {"precalentamientos": 0, "reducciones": 0}
+
+    # ===============================
+    # 📌 TELEMETRÍA
+    # ===============================
+    def al_pedir(self):
+        """Una petición empieza a esperar conexión."""
+        self.esperando += 1
+        self.max_esperando = max(self.max_esperando, self.esperando)
+
+    def al_obtener(self, conn, espera_s: Optional[float]):
+        """Terminó la espera; espera_s es None si acquire() falló."""
+        self.esperando -= 1
+        if espera_s is None:
+            return
+        self.adquisiciones += 1
+        self.espera.registrar(espera_s * 1000)
+        if conn not in self._nacimiento:
+            self._nacimiento[conn] = time.monotonic()
+
+    def _edades(self) -> List[float]:
+        ahora = time.monotonic()
+        return [ahora - t for conn, t in list(self._nacimiento.items()) if not conn.closed]
+
+    def obtener_metricas(self, pool) -> Dict:
+        edades = self._edades()
+        datos = {
+            "minimo": pool.minsize if pool else POOL_MIN,
+            "maximo": pool.maxsize if pool else POOL_MAX,
+            "tamano": pool.size if pool else 0,
+            "libres": pool.freesize if pool else 0,
+            "en_uso": (pool.size - pool.freesize) if pool else 0,
+            "esperando": self.esperando,
+            "max_esperando": self.max_esperando,
+            "adquisiciones": self.adquisiciones,
+            "espera_acquire": self.espera.a_dict(),
+            "edad_conexiones_s": {
+                "abiertas": len(edades),
+                "promedio": round(sum(edades) / len(edades), 1) if edades else 0,
+                "max": round(max(edades), 1) if edades else 0,
+            },
+        }
+        if ADAPTATIVO:
+            datos["adaptativo"] = {"objetivo": self.objetivo, "clases_en_pico": self.clases_en_pico, **self.metricas}
+        return datos
+
+    # ===============================
+    # 📌 MODO ADAPTATIVO
+    # ===============================
+    def iniciar(self, obtener_pool: Callable[[], Awaitable], horario: Callable[[], List[Tuple]]):
+        """
+        Arranca la tarea de ajuste si DB_POOL_ADAPTATIVO=1.
+
+        horario() regresa las clases de hoy como (id_clase, id_grupo,
+        hora_inicio, hora_fin) con las horas en timedelta.
+        """
+        if ADAPTATIVO and self._tarea is None:
+            self._tarea = asyncio.create_task(self._ajustar_periodicamente(obtener_pool, horario))
+            logger.info(f"📈 Pool adaptativo activo ({POOL_MIN}-{POOL_MAX} conexiones)")
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    async def _ajustar_periodicamente(self, obtener_pool, horario):
+        while True:
+            try:
+                await self.ajustar(await obtener_pool(), horario())
+            except Exception as e:
+                logger.error(f"❌ Error ajustando el pool: {e}")
+            await asyncio.sleep(INTERVALO)
+
+    async def ajustar(self, pool, clases: List[Tuple]):
+        """Sube el mínimo antes de un cambio de clase y lo baja en horas tranquilas."""
+        ahora = _ahora_como_timedelta()
+        margen = timedelta(minutes=ANTICIPACION_MIN)
+        en_pico = {
+            id_clase for id_clase, _g, inicio, fin in clases
+            if abs(inicio - ahora) <= margen or abs(fin - ahora) <= margen
+        }
+        self.clases_en_pico = len(en_pico)
+
+        if en_pico:
+            self._ultimo_pico = time.monotonic()
+            self.objetivo = min(POOL_MAX, POOL_MIN + math.ceil(len(en_pico) * CONEXIONES_POR_CLASE))
+            if self.objetivo > pool.size and self.esperando == 0:
+                await self._precalentar(pool, self.objetivo)
+            return
+
+        tranquilo = time.monotonic() - self._ultimo_pico >= INACTIVO_MIN * 60
+        if tranquilo and self.esperando == 0 and pool.size > POOL_MIN:
+            self.objetivo = POOL_MIN
+            await self._reducir(pool, pool.size - POOL_MIN)
+
+    async def _precalentar(self, pool, objetivo: int):
+        # acquire() abre una conexión nueva cuando no hay libres: se toman
+        # las libres y las que faltan, y se regresan todas. Se hace aquí,
+        # fuera de cualquier petición, para que el pico ya las encuentre abiertas.
+        antes = pool.size
+        tomadas = []
+        try:
+            for _ in range(pool.freesize + objetivo - antes):
+                if self.esperando:
+                    # Llegaron peticiones: no se les quitan conexiones
+                    break
+                tomadas.append(await pool.acquire())
+        finally:
+            for conn in tomadas:
+                pool.release(conn)
+        self.metricas["precalentamientos"] += 1
+        logger.info(f"📈 Pool precalentado: {antes} -> {pool.size} conexiones ({self.clases_en_pico} clase(s) en cambio)")
+
+    async def _reducir(self, pool, sobrantes: int):
+        # Solo libres (acquire() con libres no abre ninguna); las que están
+        # en uso siguen abiertas. Una conexión cerrada que se regresa sale del pool.
+        cerradas = 0
+        while cerradas < sobrantes and pool.freesize > 0:
+            conn = await pool.acquire()
+            try:
+                await conn.ensure_closed()
+            except Exception:
+                conn.close()
+            pool.release(conn)
+            cerradas += 1
+        if cerradas:
+            self.metricas["reducciones"] += 1
+            logger.info(f"📉 Pool reducido a {pool.size} conexiones ({cerradas} libre(s) cerradas, mínimo {POOL_MIN})")
+
+
+def _ahora_como_timedelta() -> timedelta:
+    hora = obtener_fecha_hora_cdmx()["hora"]
+    return timedelta(hours=hora.hour, minutes=hora.minute, seconds=hora.second)
+
+
+# Instancia global
+monitor_pool = MonitorPool()
@@ -0,0 +1,243 @@
+"""
+Motor de pivote de asistencias: alumnos como filas, fechas como columnas.
+
+Todos los reportes de cuadrícula (routes/reportes.py y el Excel de
+routes/asistencias.py) pasan por aquí:
+
+1. Las filas (id, fecha, estado) se recorren una sola vez para
+   convertir alumno, fecha, estado y, si se pide, clase a códigos
+   enteros (cada fecha distinta se formatea una sola vez).
+2. Con NumPy se arma una matriz densa de códigos de estado
+   (alumnos × fechas) por grupo de filas: una asignación con índices,
+   sin ciclos por celda.
+3. Los escritores piden la matriz ya convertida a lo que necesitan
+   (mapear(): texto, letra, estilo...). La función se evalúa una vez
+   por estado distinto, no por celda.
+
+pivotar_por() pivotea varias clases de una sola consulta, así los
+reportes de profesor consultan una vez para todas sus clases.
+pivotar_lotes() hace lo mismo conforme llegan los lotes de
+config.db.stream_rows: de cada fila solo se guardan sus códigos (y la
+primera de cada alumno), no el dict completo.
+"""
+
+from array import array
+from datetime import datetime
+from typing import Any, AsyncIterable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Estado -> letra de los reportes que muestran P/A/J
+LETRA_ESTADO = {"presente": "P", "ausente": "A", "justificante": "J"}
+
+# Código 0 = sin registro
+SIN_REGISTRO = 0
+
+
+def formato_fecha(fecha):
+    """Convierte fecha a string YYYY-MM-DD"""
+    if isinstance(fecha, datetime):
+        return fecha.strftime("%Y-%m-%d")
+    elif isinstance(fecha, str):
+        return fecha
+    return str(fecha)
+
+
+class VistaMatriz:
+    """La matriz convertida con una función; fila(id) regresa una lista lista para escribir."""
+
+    __slots__ = ("_matriz", "_valores", "_vacio")
+
+    def __init__(self, matriz: "MatrizAsistencia", valores: np.ndarray, vacio):
+        self._matriz = matriz
+        self._valores = valores
+        self._vacio = vacio
+
+    def fila(self, id_alumno) -> List:
+        pos = self._matriz.posicion.get(id_alumno)
+        if pos is None:
+            return [self._vacio] * len(self._matriz.fechas)
+        return self._valores[pos].tolist()
+
+
+class MatrizAsistencia:
+    """
+    Alumnos × fechas como códigos de estado.
+
+    codigos[i, j] es el índice en `estados` del estado de ids[i] en
+    fechas[j] (0 = sin registro). alumnos[id] es la primera fila de
+    origen del alumno (nombre, matrícula...).
+    """
+
+    __slots__ = ("fechas", "ids", "posicion", "alumnos", "codigos", "estados")
+
+    def __init__(self, fechas: List[str], ids: List, alumnos: Dict[Any, Dict], codigos: np.ndarray, estados: List):
+        self.fechas = fechas
+        self.ids = ids
+        self.posicion = {id_alumno: i for i, id_alumno in enumerate(ids)}
+        self.alumnos = alumnos
+        self.codigos = codigos
+        self.estados = estados
+
+    @classmethod
+    def vacia(cls, fechas: Sequence[str] = ()) -> "MatrizAsistencia":
+        return cls(list(fechas), [], {}, np.zeros((0, len(fechas)), dtype=np.int16), [None])
+
+    def mapear(self, funcion: Callable[[Optional[str]], Any]) -> VistaMatriz:
+        """Aplica funcion(estado) a toda la matriz (una llamada por estado distinto)."""
+        tabla = np.empty(len(self.estados), dtype=object)
+        tabla[:] = [funcion(estado) for estado in self.estados]
+        return VistaMatriz(self, tabla[self.codigos], tabla[SIN_REGISTRO])
+
+    def fila(self, id_alumno) -> List[Optional[str]]:
+        """Estados del alumno alineados con fechas (None donde no hay registro)."""
+        pos = self.posicion.get(id_alumno)
+        if pos is None:
+            return [None] * len(self.fechas)
+        return [self.estados[c] for c in self.codigos[pos].tolist()]
+
+    def contar(self, estado: str) -> List[int]:
+        """Cuántas fechas tiene cada alumno (en el orden de ids) con ese estado."""
+        if estado not in self.estados:
+            return [0] * len(self.ids)
+        return (self.codigos == self.estados.index(estado)).sum(axis=1).tolist()
+
+    def __iter__(self) -> Iterator[Tuple[Any, Dict]]:
+        """(id, datos del alumno) en el orden en que aparecieron."""
+        for id_alumno in self.ids:
+            yield id_alumno, self.alumnos[id_alumno]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class AcumuladorPivote:
+    """
+    Junta filas por lotes (p. ej. de config.db.stream_rows) guardando solo
+    sus códigos y la primera fila de cada alumno; matrices() arma el mismo
+    resultado que pivotar_por() sin tener todas las filas en memoria.
+    """
+
+    def __init__(self, campo_grupo: Optional[str] = None, campo_id: str = "id_estudiante"):
+        self.campo_grupo = campo_grupo
+        self.campo_id = campo_id
+        # Valor -> código, en orden de aparición
+        self._grupos: Dict = {} if campo_grupo else {None: 0}
+        self._ids: Dict = {}
+        self._estados: Dict = {None: SIN_REGISTRO}
+        self._fechas: Dict = {}
+        self._codigos = {campo: array("q") for campo in ("grupo", "id", "estado", "fecha")}
+        # (código de grupo, código de alumno) -> primera fila del alumno
+        self._primeras: Dict[Tuple[int, int], Dict] = {}
+
+    def agregar(self, filas: Iterable[Dict]) -> "AcumuladorPivote":
+        grupos, ids, estados, fechas = self._grupos, self._ids, self._estados, self._fechas
+        a_grupo, a_id, a_estado, a_fecha = (self._codigos[c].append for c in ("grupo", "id", "estado", "fecha"))
+        primera = self._primeras.setdefault
+        campo_grupo, campo_id = self.campo_grupo, self.campo_id
+        for f in filas:
+            g = grupos.setdefault(f[campo_grupo], len(grupos)) if campo_grupo else 0
+            i = ids.setdefault(f[campo_id], len(ids))
+            a_grupo(g)
+            a_id(i)
+            a_estado(estados.setdefault(f["estado"], len(estados)))
+            a_fecha(fechas.setdefault(f["fecha"], len(fechas)))
+            primera((g, i), f)
+        return self
+
+    def __len__(self) -> int:
+        return len(self._codigos["id"])
+
+    def matrices(self, fechas: Optional[Sequence[str]] = None) -> Dict[Any, MatrizAsistencia]:
+        """Una matriz por grupo (ver pivotar_por)."""
+        if not len(self):
+            return {}
+        grupos_codigo, ids_codigo, estados_codigo, fechas_crudas_codigo = (
+            np.asarray(self._codigos[c], dtype=np.int64) for c in ("grupo", "id", "estado", "fecha")
+        )
+        grupos, ids, estados = list(self._grupos), list(self._ids), list(self._estados)
+
+        # Fechas: texto una vez por valor distinto; el código es su columna
+        # en `columnas` (ordenadas) y -1 si no hay fecha o queda fuera
+        textos = [formato_fecha(f) if f else None for f in self._fechas]
+        columnas = list(fechas) if fechas is not None else sorted({t for t in textos if t is not None})
+        columna_de = {fecha: j for j, fecha in enumerate(columnas)}
+        traduccion = np.array([columna_de.get(t, -1) if t is not None else -1 for t in textos], dtype=np.int64)
+        fechas_codigo = traduccion[fechas_crudas_codigo]
+
+        # Una matriz por grupo (orden estable: las filas conservan su orden)
+        orden = np.argsort(grupos_codigo, kind="stable")
+        cortes = np.flatnonzero(np.diff(grupos_codigo[orden])) + 1
+        matrices: Dict[Any, MatrizAsistencia] = {}
+        for indices in np.split(orden, cortes):
+            codigo_grupo = int(grupos_codigo[indices[0]])
+
+            # Alumnos en orden de aparición dentro del grupo
+            ids_grupo = ids_codigo[indices]
+            unicos, primera = np.unique(ids_grupo, return_index=True)
+            ids_orden = unicos[np.argsort(primera)]
+            renglon_de = np.full(len(ids), -1, dtype=np.int64)
+            renglon_de[ids_orden] = np.arange(len(ids_orden))
+            renglones = renglon_de[ids_grupo]
+
+            # Columnas del grupo: las fijas o solo las fechas que tiene
+            columnas_grupo = fechas_codigo[indices]
+            if fechas is None:
+                presentes = np.unique(columnas_grupo[columnas_grupo >= 0])
+                columna_local = np.full(len(columnas), -1, dtype=np.int64)
+                columna_local[presentes] = np.arange(len(presentes))
+                columnas_grupo = np.where(columnas_grupo >= 0, columna_local[columnas_grupo], -1)
+                nombres_columnas = [columnas[j] for j in presentes.tolist()]
+            else:
+                nombres_columnas = columnas
+
+            codigos = np.zeros((len(ids_orden), len(nombres_columnas)), dtype=np.int16)
+            validas = columnas_grupo >= 0
+            codigos[renglones[validas], columnas_grupo[validas]] = estados_codigo[indices][validas]
+
+            ids_orden = ids_orden.tolist()
+            alumnos = {ids[c]: self._primeras[(codigo_grupo, c)] for c in ids_orden}
+            matrices[grupos[codigo_grupo]] = MatrizAsistencia(nombres_columnas, [ids[c] for c in ids_orden], alumnos, codigos, estados)
+
+        return matrices
+
+
+def pivotar_por(
+    filas: Iterable[Dict],
+    campo_grupo: Optional[str],
+    fechas: Optional[Sequence[str]] = None,
+    campo_id: str = "id_estudiante",
+) -> Dict[Any, MatrizAsistencia]:
+    """
+    Una matriz por valor de campo_grupo (p. ej. id_clase), en el orden
+    en que aparecen, todas con una sola pasada por las filas.
+
+    fechas: columnas fijas (p. ej. un rango); si no se dan, cada matriz
+    tiene las fechas distintas de sus filas, ordenadas. Las filas sin
+    fecha (LEFT JOIN sin asistencia) solo registran al alumno; las de
+    fechas fuera de las columnas se ignoran.
+    """
+    return AcumuladorPivote(campo_grupo, campo_id).agregar(filas).matrices(fechas)
+
+
+def pivotar_asistencias(
+    filas: Iterable[Dict],
+    fechas: Optional[Sequence[str]] = None,
+    campo_id: str = "id_estudiante",
+) -> MatrizAsistencia:
+    """Matriz de un solo grupo de filas (una clase)."""
+    matrices = pivotar_por(filas, None, fechas, campo_id)
+    return matrices[None] if matrices else MatrizAsistencia.vacia(fechas or ())
+
+
+async def pivotar_lotes(
+    lotes: AsyncIterable[List[Dict]],
+    campo_grupo: Optional[str],
+    fechas: Optional[Sequence[str]] = None,
+    campo_id: str = "id_estudiante",
+) -> Dict[Any, MatrizAsistencia]:
+    """pivotar_por() sobre lotes que llegan de config.db.stream_rows."""
+    acumulador = AcumuladorPivote(campo_grupo, campo_id)
+    async for lote in lotes:
+        acumulador.agregar(lote)
+    return acumulador.matrices(fechas)
@@ -0,0 +1,272 @@
+"""
+Escritor de reportes Excel en streaming (openpyxl en modo write-only).
+
+Antes cada endpoint de routes/reportes.py armaba un Workbook completo en
+memoria, estilizaba celda por celda, recorría todas las celdas para
+calcular anchos y guardaba en un BytesIO: un reporte de semestre de un
+profesor ocupaba decenas de MB por petición.
+
+Con ReporteExcel:
+
+- Las hojas son write-only: cada fila se escribe al archivo temporal de
+  su hoja en cuanto se agrega y no se guarda como objetos Cell.
+- Los estilos se registran una vez como NamedStyle y las celdas solo
+  los referencian por nombre.
+- Los anchos se fijan antes de escribir, estimados con los datos
+  (estimar_ancho) en lugar de recorrer la hoja terminada.
+
+respuesta_excel() corre la construcción y el guardado en un hilo y manda
+el .xlsx a la StreamingResponse en trozos de TAMANO_TROZO conforme el zip
+se va escribiendo. La memoria pico no depende de fechas × alumnos.
+
+Los hilos salen de un pool propio de REPORTES_EXCEL_HILOS (no del
+executor por defecto, que usan asyncio.to_thread y el desencriptado de
+lotes): una descarga ocupa un solo hilo, el que escribe, y los trozos
+pasan al event loop por una asyncio.Queue. Si hay más descargas que
+hilos, las demás esperan turno.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+from fastapi.responses import StreamingResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+from openpyxl.utils import get_column_letter
+
+logger = logging.getLogger(__name__)
+
+TAMANO_TROZO = 64 * 1024
+HILOS_EXCEL = int(os.getenv("REPORTES_EXCEL_HILOS", "4"))
+# Trozos en espera por descarga antes de que el hilo escritor se detenga
+TROZOS_EN_COLA = 8
+
+_ejecutor_excel = concurrent.futures.ThreadPoolExecutor(max_workers=HILOS_EXCEL, thread_name_prefix="excel")
+MEDIA_TYPE_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Muestra máxima de valores por columna para estimar su ancho
+MUESTRA_ANCHO = 500
+
+
+def _relleno(color: str) -> PatternFill:
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+VERDE = _relleno("90EE90")
+ROJO = _relleno("FF7F7F")
+AMARILLO = _relleno("FFFF99")
+CENTRADO = Alignment(horizontal="center")
+CENTRADO_VERTICAL = Alignment(horizontal="center", vertical="center")
+NEGRITA = Font(bold=True)
+
+# Estilos disponibles para los reportes: nombre -> (font, fill, alignment)
+ESTILOS: Dict[str, tuple] = {
+    "encabezado": (NEGRITA, None, CENTRADO),
+    "encabezado_vc": (NEGRITA, None, CENTRADO_VERTICAL),
+    "centrado": (None, None, CENTRADO),
+    "negrita": (NEGRITA, None, None),
+    # Asistencia
+    "presente": (None, VERDE, CENTRADO),
+    "ausente": (None, ROJO, CENTRADO),
+    "justificante": (None, AMARILLO, CENTRADO),
+    "presente_relleno": (None, VERDE, None),
+    "ausente_relleno": (None, ROJO, None),
+    "justificante_relleno": (None, AMARILLO, None),
+    "presente_negrita": (NEGRITA, VERDE, CENTRADO),
+    "ausente_negrita": (NEGRITA, ROJO, CENTRADO),
+    "justificante_negrita": (NEGRITA, AMARILLO, CENTRADO),
+    # Entregas
+    "entregado": (None, VERDE, CENTRADO),
+    "pendiente": (None, AMARILLO, CENTRADO),
+    "no_entregado": (None, ROJO, CENTRADO),
+    "entregado_negrita": (NEGRITA, VERDE, CENTRADO_VERTICAL),
+    "pendiente_negrita": (NEGRITA, AMARILLO, CENTRADO_VERTICAL),
+    "no_entregado_negrita": (NEGRITA, ROJO, CENTRADO_VERTICAL),
+    "estado_negrita": (NEGRITA, None, CENTRADO_VERTICAL),
+}
+
+
+def estilo_estado(estado: Optional[str], sufijo: str = "") -> Optional[str]:
+    """Nombre del estilo para un estado de asistencia/entrega (o None si no tiene color)."""
+    if not estado:
+        return None
+    nombre = str(estado).strip().lower().replace(" ", "_") + sufijo
+    return nombre if nombre in ESTILOS else None
+
+
+def estimar_ancho(valores: Iterable, minimo: float = 8, maximo: float = 60, extra: float = 2) -> float:
+    """Ancho de columna a partir del texto más largo de una muestra de los valores."""
+    largo = 0
+    for i, valor in enumerate(valores):
+        if i >= MUESTRA_ANCHO:
+            break
+        if valor is not None:
+            largo = max(largo, len(str(valor)))
+    return max(minimo, min(maximo, largo + extra))
+
+
+class HojaStream:
+    """Hoja write-only: las filas se escriben en cuanto se agregan."""
+
+    def __init__(self, reporte: "ReporteExcel", titulo: str, anchos: Sequence[float] = ()):
+        self._reporte = reporte
+        self.ws = reporte.wb.create_sheet(titulo)
+        # En write-only los anchos deben fijarse antes de la primera fila
+        for i, ancho in enumerate(anchos, start=1):
+            if ancho:
+                self.ws.column_dimensions[get_column_letter(i)].width = ancho
+        self.filas = 0
+
+    def fila(self, valores: Sequence, estilos: Optional[Sequence[Optional[str]]] = None):
+        """Agrega una fila; estilos[i] es el nombre del estilo de la columna i (o None)."""
+        if estilos:
+            celdas = []
+            for valor, estilo in zip(valores, estilos):
+                if estilo is None:
+                    celdas.append(valor)
+                else:
+                    celdas.append(self._reporte.celda(self.ws, valor, estilo))
+            celdas.extend(valores[len(estilos):])
+            self.ws.append(celdas)
+        else:
+            self.ws.append(list(valores))
+        self.filas += 1
+
+    def encabezado(self, valores: Sequence, estilo: str = "encabezado"):
+        self.fila(valores, [estilo] * len(valores))
+
+
+class ReporteExcel:
+    """Libro write-only con estilos registrados una sola vez."""
+
+    def __init__(self):
+        self.wb = Workbook(write_only=True)
+        self._estilos_registrados: set = set()
+
+    def hoja(self, titulo: str, anchos: Sequence[float] = ()) -> HojaStream:
+        return HojaStream(self, titulo, anchos)
+
+    def celda(self, ws, valor, estilo: str) -> WriteOnlyCell:
+        if estilo not in self._estilos_registrados:
+            font, fill, alignment = ESTILOS[estilo]
+            named = NamedStyle(name=estilo)
+            if font is not None:
+                named.font = font
+            if fill is not None:
+                named.fill = fill
+            if alignment is not None:
+                named.alignment = alignment
+            self.wb.add_named_style(named)
+            self._estilos_registrados.add(estilo)
+        cell = WriteOnlyCell(ws, value=valor)
+        cell.style = estilo
+        return cell
+
+    def guardar(self, destino):
+        self.wb.save(destino)
+
+
+def _poner_desde_hilo(cola: asyncio.Queue, loop: asyncio.AbstractEventLoop, cancelado: threading.Event, item) -> bool:
+    """Pone el item en la cola del event loop; espera lugar. False si la descarga se canceló."""
+    futuro = asyncio.run_coroutine_threadsafe(cola.put(item), loop)
+    while True:
+        try:
+            futuro.result(timeout=1)
+            return True
+        except concurrent.futures.TimeoutError:
+            if cancelado.is_set():
+                futuro.cancel()
+                return False
+
+
+class _SalidaPorTrozos:
+    """Archivo de solo escritura (sin seek) que entrega el zip en trozos a una cola."""
+
+    def __init__(self, cola: asyncio.Queue, loop: asyncio.AbstractEventLoop, cancelado: threading.Event):
+        self._cola = cola
+        self._loop = loop
+        self._cancelado = cancelado
+        self._buffer = bytearray()
+
+    def write(self, datos) -> int:
+        self._buffer += datos
+        if len(self._buffer) >= TAMANO_TROZO:
+            self._entregar()
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def cerrar(self):
+        if self._buffer:
+            self._entregar()
+
+    def _entregar(self):
+        trozo = bytes(self._buffer)
+        self._buffer.clear()
+        if self._cancelado.is_set() or not _poner_desde_hilo(self._cola, self._loop, self._cancelado, trozo):
+            raise ConnectionAbortedError("el cliente cerró la descarga")
+
+
+async def _trozos_excel(construir: Optional[Callable[[ReporteExcel], None]], reporte: Optional[ReporteExcel] = None):
+    cola: asyncio.Queue = asyncio.Queue(maxsize=TROZOS_EN_COLA)
+    cancelado = threading.Event()
+    loop = asyncio.get_running_loop()
+
+    def producir():
+        try:
+            if cancelado.is_set():
+                return  # el cliente se fue mientras esperaba hilo
+            libro = reporte or ReporteExcel()
+            if construir:
+                construir(libro)
+            salida = _SalidaPorTrozos(cola, loop, cancelado)
+            libro.guardar(salida)
+            salida.cerrar()
+        except Exception as e:
+            if not cancelado.is_set():
+                logger.error(f"❌ Error escribiendo Excel: {e}", exc_info=True)
+                _poner_desde_hilo(cola, loop, cancelado, e)
+        finally:
+            _poner_desde_hilo(cola, loop, cancelado, None)
+
+    productor = loop.run_in_executor(_ejecutor_excel, producir)
+    try:
+        while True:
+            trozo = await cola.get()
+            if trozo is None:
+                break
+            if isinstance(trozo, Exception):
+                raise trozo
+            yield trozo
+    finally:
+        cancelado.set()
+        # Liberar al productor si quedó esperando lugar en la cola
+        while not productor.done():
+            while not cola.empty():
+                cola.get_nowait()
+            await asyncio.sleep(0.05)
+
+
+def respuesta_excel(
+    construir: Optional[Callable[[ReporteExcel], None]],
+    filename: str,
+    reporte: Optional[ReporteExcel] = None,
+) -> StreamingResponse:
+    """
+    StreamingResponse que construye el libro con `construir(reporte)` en un
+    hilo y manda el .xlsx conforme se escribe.
+
+    `construir` solo debe usar datos ya consultados (corre fuera del event loop).
+    Si las filas ya se escribieron en `reporte` (p. ej. lote por lote desde
+    config.db.stream_rows), construir puede ser None y solo se guarda.
+    """
+    return StreamingResponse(
+        _trozos_excel(construir, reporte),
+        media_type=MEDIA_TYPE_XLSX,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
@@ -0,0 +1,278 @@
+"""
+Resumen diario de asistencias (tablas de migrations/003_resumen_asistencia.sql).
+
+Las estadísticas de grupo, materias, tendencia y clases de hoy volvían a
+sumar con SUM(CASE ...) todas las filas de asistencia desde el inicio del
+ciclo. Ahora leen resumen_asistencia_clase (clase × día) y
+resumen_asistencia_alumno (alumno × grupo × día), que este módulo
+mantiene al día:
+
+1. Cada escritura de asistencia llama a marcar(id_clase, fecha). No toca
+   la BD: solo anota la (clase, día) como pendiente (y descarta lo que
+   dependa de ella en utils/cache_estadisticas.py).
+2. Un worker recalcula cada RESUMEN_INTERVALO segundos los días
+   pendientes. Por día: las filas de esas clases y las de sus grupos, con
+   DELETE + INSERT ... SELECT en una transacción (un día de un grupo son
+   unos cientos de filas de asistencia).
+3. Una reconciliación nocturna (RESUMEN_HORA_RECONCILIACION, hora de
+   CDMX) recalcula todos los días. Lo que cambia los conteos sin pasar
+   por marcar() (bajas de alumnos, clases borradas o cambiadas de grupo,
+   importaciones) llama a reconciliar(), que la adelanta.
+
+Con varios workers cada uno corre este worker, pero la reconciliación
+recalcula toda la BD, así que basta con que la haga uno: se toma
+GET_LOCK('resumen_asistencia_reconciliacion', 0) durante la pasada. Si
+otro worker ya lo tiene, la nocturna se salta y una pedida con
+reconciliar() se reintenta en la siguiente vuelta (la del otro pudo
+empezar antes del cambio). Por eso reconciliar() no se publica en
+utils/bus_ws.py: el worker que atendió el cambio es suficiente.
+
+Las estadísticas pueden ir hasta RESUMEN_INTERVALO segundos detrás de
+la tabla asistencia.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Set
+
+from config.db import get_pool
+from utils.cache_estadisticas import cache_estadisticas
+from utils.fecha import CDMX, obtener_fecha_hora_cdmx
+
+logger = logging.getLogger(__name__)
+
+INTERVALO = float(os.getenv("RESUMEN_INTERVALO", "2"))
+HORA_RECONCILIACION = os.getenv("RESUMEN_HORA_RECONCILIACION", "03:00")
+# Candado de MySQL para que solo un worker reconcilie a la vez
+CANDADO_RECONCILIACION = "resumen_asistencia_reconciliacion"
+
+CONTEOS = """
+    SUM(CASE WHEN a.estado = 'presente' THEN 1 ELSE 0 END),
+    SUM(CASE WHEN a.estado = 'ausente' THEN 1 ELSE 0 END),
+    SUM(CASE WHEN a.estado = 'justificante' THEN 1 ELSE 0 END)
+"""
+
+# Solo alumnos activos de clases no eliminadas, como las estadísticas
+ORIGEN = """
+    FROM asistencia a
+    JOIN clase c ON a.id_clase = c.id_clase AND c.eliminado = 0
+    JOIN estudiante e ON a.id_estudiante = e.id_estudiante AND e.estado_actual = 'activo' AND e.eliminado = 0
+    WHERE a.fecha = %s {filtro}
+"""
+
+RECALCULAR_CLASE = f"""
+    INSERT INTO resumen_asistencia_clase (fecha, id_clase, id_grupo, id_materia, presentes, ausentes, justificantes)
+    SELECT a.fecha, c.id_clase, c.id_grupo, c.id_materia, {CONTEOS}
+    {ORIGEN}
+    GROUP BY a.fecha, c.id_clase, c.id_grupo, c.id_materia
+"""
+
+RECALCULAR_ALUMNO = f"""
+    INSERT INTO resumen_asistencia_alumno (fecha, id_grupo, id_estudiante, presentes, ausentes, justificantes)
+    SELECT a.fecha, c.id_grupo, a.id_estudiante, {CONTEOS}
+    {ORIGEN}
+    GROUP BY a.fecha, c.id_grupo, a.id_estudiante
+"""
+
+# Días con asistencias o con resumen (para borrar los que ya no tienen filas)
+DIAS = """
+    SELECT fecha FROM asistencia GROUP BY fecha
+    UNION
+    SELECT fecha FROM resumen_asistencia_clase GROUP BY fecha
+"""
+
+
+def _en(columna: str, ids) -> str:
+    return f"AND {columna} IN ({','.join(['%s'] * len(ids))})"
+
+
+def _grupos_de(columna: str, ids) -> str:
+    return f"AND {columna} IN (SELECT id_grupo FROM clase WHERE id_clase IN ({','.join(['%s'] * len(ids))}))"
+
+
+class ResumenAsistencia:
+    """Días pendientes en memoria + worker que recalcula el resumen."""
+
+    def __init__(self):
+        # fecha -> clases por recalcular (None = el día completo)
+        self._pendientes: Dict[str, Optional[Set[int]]] = {}
+        self._reconciliar = False
+        self._proxima_reconciliacion = 0.0
+        self._tarea: Optional[asyncio.Task] = None
+        self.metricas = {
+            "marcadas": 0,
+            "dias_recalculados": 0,
+            "reconciliaciones": 0,
+            "reconciliaciones_omitidas": 0,
+            "errores": 0,
+            "ultimo_recalculo_ms": 0.0,
+            "ultima_reconciliacion": None,
+            "ultima_reconciliacion_ms": 0.0,
+        }
+
+    # ===============================
+    # 📌 CICLO DE VIDA
+    # ===============================
+    def iniciar(self):
+        # Lo marcado antes de un reinicio se perdió: hoy se recalcula completo
+        self._pendientes[str(obtener_fecha_hora_cdmx()["fecha"])] = None
+        self._proxima_reconciliacion = self._siguiente_reconciliacion()
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._worker())
+        logger.info(f"📊 Resumen de asistencias activo (cada {INTERVALO:g}s, reconciliación {HORA_RECONCILIACION})")
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        # Lo último que se marcó (p. ej. el vaciado final de cola_asistencias)
+        try:
+            await self._procesar()
+        except Exception as e:
+            logger.error(f"❌ Error recalculando resumen al detener: {e}")
+
+    # ===============================
+    # 📌 MARCAR
+    # ===============================
+    def marcar(self, id_clase: int, fecha):
+        """Anota que cambió alguna asistencia de la clase en ese día."""
+        clases = self._pendientes.setdefault(str(fecha), set())
+        if clases is not None:
+            clases.add(id_clase)
+        self.metricas["marcadas"] += 1
+        # Lo que lee la tabla asistencia ya cambió
+        cache_estadisticas.invalidar_asistencia(id_clase, fecha)
+
+    def marcar_varias(self, claves: Iterable):
+        """marcar() para pares (id_clase, fecha), una vez por par distinto."""
+        for id_clase, fecha in {(id_clase, str(fecha)) for id_clase, fecha in claves}:
+            self.marcar(id_clase, fecha)
+
+    def reconciliar(self):
+        """Pide recalcular todos los días en la siguiente vuelta del worker."""
+        self._reconciliar = True
+
+    # ===============================
+    # 📌 WORKER
+    # ===============================
+    async def _worker(self):
+        while True:
+            await asyncio.sleep(INTERVALO)
+            try:
+                if self._reconciliar or time.time() >= self._proxima_reconciliacion:
+                    await self._reconciliar_todo()
+                await self._procesar()
+            except Exception as e:
+                self.metricas["errores"] += 1
+                logger.error(f"❌ Error actualizando resumen de asistencias: {e}")
+
+    async def _procesar(self):
+        if not self._pendientes:
+            return
+        pendientes, self._pendientes = self._pendientes, {}
+        inicio = time.perf_counter()
+        pool = await get_pool()
+        try:
+            while pendientes:
+                fecha, clases = next(iter(pendientes.items()))
+                async with pool.acquire() as conn:
+                    await self._recalcular_dia(conn, fecha, clases)
+                del pendientes[fecha]
+                # Y ahora lo que lee el resumen
+                for id_clase in clases if clases is not None else (None,):
+                    cache_estadisticas.invalidar_asistencia(id_clase, fecha)
+                self.metricas["dias_recalculados"] += 1
+        finally:
+            # Lo que no se alcanzó a recalcular regresa a pendientes
+            for fecha, clases in pendientes.items():
+                actuales = self._pendientes.get(fecha, set())
+                if clases is None or actuales is None:
+                    self._pendientes[fecha] = None
+                else:
+                    self._pendientes[fecha] = actuales | clases
+        self.metricas["ultimo_recalculo_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+
+    async def _recalcular_dia(self, conn, fecha: str, clases: Optional[Set[int]]):
+        """Reemplaza el resumen del día (de esas clases y sus grupos) en una transacción."""
+        if clases is None:
+            filtro_clase = filtro_grupo = borrar_clase = borrar_grupo = ""
+            ids = ()
+        else:
+            ids = tuple(clases)
+            filtro_clase, borrar_clase = _en("c.id_clase", ids), _en("id_clase", ids)
+            filtro_grupo, borrar_grupo = _grupos_de("c.id_grupo", ids), _grupos_de("id_grupo", ids)
+        try:
+            await conn.begin()
+            async with conn.cursor() as cur:
+                await cur.execute(f"DELETE FROM resumen_asistencia_clase WHERE fecha = %s {borrar_clase}", (fecha, *ids))
+                await cur.execute(RECALCULAR_CLASE.format(filtro=filtro_clase), (fecha, *ids))
+                await cur.execute(f"DELETE FROM resumen_asistencia_alumno WHERE fecha = %s {borrar_grupo}", (fecha, *ids))
+                await cur.execute(RECALCULAR_ALUMNO.format(filtro=filtro_grupo), (fecha, *ids))
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+    async def _reconciliar_todo(self):
+        """Recalcula todos los días con asistencias (o con resumen), si ningún otro worker lo está haciendo."""
+        pool = await get_pool()
+        # El candado vive en esta conexión: se queda apartada toda la pasada
+        async with pool.acquire() as conn_candado:
+            async with conn_candado.cursor() as cur:
+                await cur.execute("SELECT GET_LOCK(%s, 0)", (CANDADO_RECONCILIACION,))
+                (obtenido,) = await cur.fetchone()
+            if obtenido != 1:
+                if not self._reconciliar:
+                    # La nocturna ya la está haciendo otro worker
+                    self._proxima_reconciliacion = self._siguiente_reconciliacion()
+                    self.metricas["reconciliaciones_omitidas"] += 1
+                    logger.info("📊 Otro worker está reconciliando el resumen de asistencias; se omite")
+                return
+            try:
+                self._reconciliar = False
+                self._proxima_reconciliacion = self._siguiente_reconciliacion()
+                inicio = time.perf_counter()
+                async with pool.acquire() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute(DIAS)
+                        dias = [str(fila[0]) for fila in await cur.fetchall()]
+                for fecha in dias:
+                    self._pendientes[fecha] = None
+                await self._procesar()
+            finally:
+                async with conn_candado.cursor() as cur:
+                    await cur.execute("SELECT RELEASE_LOCK(%s)", (CANDADO_RECONCILIACION,))
+        ms = (time.perf_counter() - inicio) * 1000
+        self.metricas["reconciliaciones"] += 1
+        self.metricas["ultima_reconciliacion"] = datetime.now(CDMX).isoformat(timespec="seconds")
+        self.metricas["ultima_reconciliacion_ms"] = round(ms, 2)
+        logger.info(f"📊 Resumen de asistencias reconciliado: {len(dias)} día(s) en {ms:.0f}ms")
+
+    @staticmethod
+    def _siguiente_reconciliacion() -> float:
+        horas, minutos = (int(x) for x in HORA_RECONCILIACION.split(":"))
+        ahora = datetime.now(CDMX)
+        siguiente = ahora.replace(hour=horas, minute=minutos, second=0, microsecond=0)
+        if siguiente <= ahora:
+            siguiente += timedelta(days=1)
+        return siguiente.timestamp()
+
+    def obtener_metricas(self) -> Dict:
+        return {
+            "intervalo_s": INTERVALO,
+            "dias_pendientes": len(self._pendientes),
+            "proxima_reconciliacion": datetime.fromtimestamp(self._proxima_reconciliacion, CDMX).isoformat(timespec="seconds")
+            if self._proxima_reconciliacion else None,
+            **self.metricas,
+        }
+
+
+# Instancia global
+resumen_asistencia = ResumenAsistencia()
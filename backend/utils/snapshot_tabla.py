@@ -0,0 +1,242 @@
+"""
+Foto en memoria de la tabla dinámica de cada clase (/ws/tabla/{id_clase}).
+
+Antes cada conexión nueva al WebSocket y cada GET /api/tabla/{id}/datos
+volvía a armar la tabla completa con cuatro consultas. Ahora la tabla
+se arma una vez al día por clase y después se parcha en memoria con los
+mismos eventos que se difunden a los dashboards (asistencia,
+entrega_actualizada, nueva_actividad), que pasan todos por
+tabla_manager.publicar().
+
+Cada cambio aplicado sube el número de versión de la clase; los frames
+que salen por el WebSocket llevan "version_base" y "version" para que el
+cliente sepa si se perdió algo y pida la tabla de nuevo. Los números son
+de este proceso: también llevan "epoca", un id que cambia en cada
+arranque y es distinto en cada worker. Versiones de otra época no se
+comparan (el cliente recibe la tabla completa).
+
+La foto se descarta cuando cambia el día, cuando se invalida el roster
+de la clase o de su grupo (importaciones, papelera, justificantes; ver
+roster_cache.version()) o cuando se edita/borra una actividad.
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.bus_ws import bus_ws
+from utils.cache_roster import roster_cache
+from utils.cola_asistencias import cola_asistencias
+from utils.fecha import obtener_fecha_hora_cdmx
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotClase:
+    """Tabla de una clase para una fecha, indexada por id_estudiante."""
+
+    def __init__(self, datos: Dict, version: int, id_grupo: Optional[int], version_roster: Tuple[int, ...], epoca: str):
+        self.fecha = datos["fecha_actual"]
+        self.epoca = epoca
+        # Versión del roster de la clase con la que se armó
+        self.id_grupo = id_grupo
+        self.version_roster = version_roster
+        self.version = version
+        self.clase = datos["clase"]
+        self.actividades: List[Dict] = list(datos["actividades"])
+        self.estudiantes: Dict[int, Dict] = {e["id_estudiante"]: e for e in datos["estudiantes"]}
+        self._texto: Optional[str] = None
+
+    def aplicar(self, cambio: Dict) -> bool:
+        """Parcha la tabla con un evento; regresa si cambió algo."""
+        tipo = cambio.get("tipo")
+        data = cambio.get("data") or {}
+
+        if tipo == "asistencia":
+            est = self.estudiantes.get(data.get("id_estudiante"))
+            if est is None:
+                return False
+            est["asistencia"] = data["estado"]
+            if "hora" in data:
+                est["hora_entrada"] = data["hora"] or ""
+        elif tipo == "entrega_actualizada":
+            est = self.estudiantes.get(data.get("id_estudiante"))
+            id_actividad = str(data.get("id_actividad"))
+            if est is None or id_actividad not in est["actividades"]:
+                return False
+            est["actividades"][id_actividad] = data["estado"]
+        elif tipo == "nueva_actividad":
+            if any(a["id"] == data["id"] for a in self.actividades):
+                return False
+            # Mismo orden que la consulta (fecha_creacion DESC): la nueva va primero
+            self.actividades.insert(0, {
+                "id": data["id"],
+                "nombre": data["nombre"],
+                "tipo": data["tipo"],
+                "fecha": data.get("fecha"),
+                "valor": data.get("valor"),
+            })
+            for est in self.estudiantes.values():
+                est["actividades"][str(data["id"])] = "pendiente"
+        else:
+            return False
+
+        self._texto = None
+        return True
+
+    def fijar_version(self, version: int):
+        self.version = version
+        self._texto = None
+
+    def a_dict(self) -> Dict:
+        return {
+            "tipo": "datos_iniciales",
+            "epoca": self.epoca,
+            "version": self.version,
+            "clase": self.clase,
+            "actividades": self.actividades,
+            "estudiantes": list(self.estudiantes.values()),
+            "fecha_actual": self.fecha,
+        }
+
+    def texto(self) -> str:
+        """JSON de la tabla; se serializa una sola vez por versión."""
+        if self._texto is None:
+            self._texto = json.dumps(self.a_dict(), ensure_ascii=False, default=str)
+        return self._texto
+
+
+class SnapshotsTabla:
+    """Fotos por id_clase, construidas una vez y parchadas con los eventos."""
+
+    def __init__(self):
+        self._snapshots: Dict[int, SnapshotClase] = {}
+        self._construyendo: Dict[int, asyncio.Task] = {}
+        # Eventos que llegan mientras se construye la foto; se re-aplican al terminar
+        self._eventos_en_construccion: Dict[int, List[Dict]] = {}
+        # La versión sobrevive a las reconstrucciones para que nunca retroceda;
+        # la época distingue las versiones de este proceso de las de otro
+        self._versiones: Dict[int, int] = {}
+        self.epoca = uuid.uuid4().hex[:12]
+        self.metricas = {"aciertos": 0, "construcciones": 0, "parches": 0, "invalidaciones": 0}
+
+    # ===============================
+    # 📌 CONSULTA
+    # ===============================
+    async def obtener(self, id_clase: int, construir: Callable[[int], Awaitable[Dict]]) -> SnapshotClase:
+        """Foto vigente de la clase; la construye con `construir` si no la hay."""
+        snapshot = self._snapshots.get(id_clase)
+        if snapshot is not None and self._vigente(id_clase, snapshot):
+            self.metricas["aciertos"] += 1
+            return snapshot
+
+        tarea = self._construyendo.get(id_clase)
+        if tarea is None:
+            tarea = asyncio.create_task(self._construir(id_clase, construir))
+            self._construyendo[id_clase] = tarea
+            tarea.add_done_callback(lambda _t: self._construyendo.pop(id_clase, None))
+        return await asyncio.shield(tarea)
+
+    def version(self, id_clase: int) -> int:
+        return self._versiones.get(id_clase, 0)
+
+    # ===============================
+    # 📌 ACTUALIZACIÓN
+    # ===============================
+    def aplicar(self, id_clase: int, mensaje: Dict) -> Tuple[int, int]:
+        """
+        Aplica un evento (o un "lote") a la foto de la clase.
+
+        Regresa (version_base, version): la versión antes y después del
+        evento. La versión sube aunque la foto no esté en memoria, así
+        los clientes siempre ven números crecientes.
+        """
+        cambios = mensaje.get("cambios", []) if mensaje.get("tipo") == "lote" else [mensaje]
+        base = self._versiones.get(id_clase, 0)
+
+        if id_clase in self._construyendo:
+            self._eventos_en_construccion.setdefault(id_clase, []).extend(cambios)
+
+        snapshot = self._snapshots.get(id_clase)
+        for cambio in cambios:
+            if snapshot is not None and snapshot.aplicar(cambio):
+                self.metricas["parches"] += 1
+
+        version = base + 1
+        self._versiones[id_clase] = version
+        if snapshot is not None:
+            snapshot.fijar_version(version)
+        return base, version
+
+    def invalidar(self, id_clase: Optional[int] = None):
+        """Descarta la foto de una clase (o todas) para reconstruirla al pedirla, en todos los workers."""
+        self._invalidar_local({"id_clase": id_clase})
+        bus_ws.publicar("snapshots_tabla", {"id_clase": id_clase}, local=False)
+
+    def invalidar_actividad(self, id_actividad: int):
+        """Descarta las fotos que muestran la actividad (se editó o se borró), en todos los workers."""
+        self._invalidar_local({"id_actividad": id_actividad})
+        bus_ws.publicar("snapshots_tabla", {"id_actividad": id_actividad}, local=False)
+
+    def _invalidar_local(self, datos: Dict):
+        """Aplica una invalidación de este worker o de otro (ver utils/bus_ws.py)."""
+        if datos.get("id_actividad") is not None:
+            clases = [
+                id_clase for id_clase, snapshot in self._snapshots.items()
+                if any(a["id"] == datos["id_actividad"] for a in snapshot.actividades)
+            ]
+        else:
+            clases = [datos.get("id_clase")]
+        for id_clase in clases:
+            self.metricas["invalidaciones"] += 1
+            if id_clase is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(id_clase, None)
+
+    # ===============================
+    # 📌 CONSTRUCCIÓN
+    # ===============================
+    async def _construir(self, id_clase: int, construir: Callable[[int], Awaitable[Dict]]) -> SnapshotClase:
+        id_grupo = roster_cache.grupo_de(id_clase)
+        version_roster = roster_cache.version(id_clase, id_grupo)
+        self._eventos_en_construccion.setdefault(id_clase, [])
+        try:
+            datos = await construir(id_clase)
+        finally:
+            eventos = self._eventos_en_construccion.pop(id_clase, [])
+
+        snapshot = SnapshotClase(datos, self._versiones.get(id_clase, 0), id_grupo, version_roster, self.epoca)
+        _aplicar_pendientes_write_behind(snapshot, id_clase)
+        # Lo que llegó mientras corrían las consultas puede no estar en ellas
+        for cambio in eventos:
+            snapshot.aplicar(cambio)
+
+        self._snapshots[id_clase] = snapshot
+        self.metricas["construcciones"] += 1
+        logger.info(f"🗂️ Tabla de clase {id_clase} en memoria (v{snapshot.version}, {len(snapshot.estudiantes)} estudiantes)")
+        return snapshot
+
+    def _vigente(self, id_clase: int, snapshot: SnapshotClase) -> bool:
+        hoy = obtener_fecha_hora_cdmx()["fecha"].strftime("%Y-%m-%d")
+        return snapshot.fecha == hoy and snapshot.version_roster == roster_cache.version(id_clase, snapshot.id_grupo)
+
+    def obtener_metricas(self) -> Dict:
+        return {**self.metricas, "clases_en_memoria": len(self._snapshots)}
+
+
+def _aplicar_pendientes_write_behind(snapshot: SnapshotClase, id_clase: int):
+    """Asistencias aceptadas que la cola aún no escribe en MySQL."""
+    for r in cola_asistencias.pendientes:
+        if r["id_clase"] == id_clase and r["fecha"] == snapshot.fecha:
+            snapshot.aplicar({
+                "tipo": "asistencia",
+                "data": {"id_estudiante": r["id_estudiante"], "estado": r["estado"], "hora": r["hora"]},
+            })
+
+
+# Instancia global
+snapshots_tabla = SnapshotsTabla()
+bus_ws.suscribir("snapshots_tabla", snapshots_tabla._invalidar_local)
@@ -0,0 +1,385 @@
+"""
+Cola de trabajos para los reportes pesados, con archivos descargables.
+
+El reporte de todas las clases de un profesor (y los "completos") se
+generaban dentro de la petición: el frontend esperaba con un timeout de
+60 s y un semestre completo no siempre alcanzaba. Con esta cola:
+
+1. POST /api/reportes/trabajos/... registra el trabajo y regresa su id.
+   Si ya hay uno idéntico (mismo tipo y parámetros) en curso, se regresa
+   ese mismo en lugar de generar otro.
+2. Las consultas corren en el event loop (aiomysql) y el libro se escribe
+   en un pool de procesos (REPORTES_PROCESOS), así el trabajo de CPU de
+   openpyxl no frena a las demás peticiones.
+3. GET /api/reportes/trabajos/{id} muestra el estado y el progreso. El
+   proceso que escribe deja su avance en un archivo junto al reporte.
+4. GET /api/reportes/trabajos/{id}/archivo descarga el .xlsx. Los
+   archivos viven en REPORTES_DIR y se borran REPORTES_TTL_MIN minutos
+   después de terminar.
+
+El worker que recibió el POST genera el reporte y deja el estado del
+trabajo en <id>.json junto al .xlsx (se escribe con otro nombre y se
+renombra en cada cambio de estado). Con uvicorn --workers N, el GET de
+estado y el de descarga pueden llegar a cualquier worker: si el id no
+es de ese proceso, obtener() lee el .json (y el .avance para el
+progreso) de REPORTES_DIR.
+
+En REPORTES_DIR solo se borran archivos de esta cola (<id>.xlsx, <id>.json
+y sus .avance/.parcial). Los que no pertenecen a un trabajo de este proceso
+(de una ejecución anterior o de otro worker) se borran solo cuando
+llevan más de REPORTES_TTL_MIN minutos sin modificarse, así no se toca
+lo que otro worker está escribiendo o aún puede descargarse.
+"""
+
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.metricas_app import metricas_app
+from utils.reporte_excel import ReporteExcel
+
+logger = logging.getLogger(__name__)
+
+REPORTES_DIR = os.getenv(
+    "REPORTES_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "reportes"),
+)
+PROCESOS = int(os.getenv("REPORTES_PROCESOS", "2"))
+TTL_MIN = int(os.getenv("REPORTES_TTL_MIN", "30"))
+INTERVALO_LIMPIEZA = 60
+
+# Parte del progreso que corresponde a las consultas; el resto es escribir
+PESO_CONSULTA = 40
+EXTENSION_AVANCE = ".avance"
+EXTENSION_PARCIAL = ".parcial"
+EXTENSION_METADATOS = ".json"
+ID_TRABAJO = re.compile(r"^[0-9a-f]{32}$")
+# Los únicos archivos que crea esta cola en REPORTES_DIR
+ARCHIVO_TRABAJO = re.compile(r"^[0-9a-f]{32}\.(xlsx(\.avance|\.parcial)?|json(\.parcial)?)$")
+
+EN_COLA = "en_cola"
+CONSULTANDO = "consultando"
+GENERANDO = "generando"
+LISTO = "listo"
+ERROR = "error"
+
+# consultar(avance) -> (datos, filename)
+Consulta = Callable[[Callable[[float], None]], Awaitable[Tuple[Any, str]]]
+
+
+def _generar_en_proceso(escritor: str, datos, ruta: str) -> int:
+    """
+    Corre en el pool de procesos: escribe el libro con `escritor`
+    ("modulo:funcion") y lo deja en `ruta`. Regresa el tamaño en bytes.
+    """
+    nombre_modulo, nombre_funcion = escritor.split(":")
+    escribir = getattr(importlib.import_module(nombre_modulo), nombre_funcion)
+    ultimo = [-1]
+
+    def avance(fraccion: float):
+        porcentaje = int(fraccion * 100)
+        if porcentaje != ultimo[0]:
+            ultimo[0] = porcentaje
+            with open(ruta + EXTENSION_AVANCE, "w") as f:
+                f.write(str(porcentaje))
+
+    reporte = ReporteExcel()
+    escribir(reporte, datos, avance)
+    # Se guarda con otro nombre y se renombra: nunca se descarga un zip a medias
+    reporte.guardar(ruta + EXTENSION_PARCIAL)
+    os.replace(ruta + EXTENSION_PARCIAL, ruta)
+    return os.path.getsize(ruta)
+
+
+class TrabajoReporte:
+    """Estado de un reporte en la cola."""
+
+    def __init__(self, tipo: str, parametros: Dict, directorio: str):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.parametros = parametros
+        self.ruta = os.path.join(directorio, f"{self.id}.xlsx")
+        self.estado = EN_COLA
+        self.progreso = 0
+        self.error: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.tamano = 0
+        self.solicitudes = 1
+        self.creado = time.time()
+        self.terminado: Optional[float] = None
+        self.expira: Optional[float] = None
+
+    @property
+    def disponible(self) -> bool:
+        return self.estado == LISTO and os.path.exists(self.ruta)
+
+    @property
+    def ruta_metadatos(self) -> str:
+        return os.path.join(os.path.dirname(self.ruta), self.id + EXTENSION_METADATOS)
+
+    @classmethod
+    def desde_dict(cls, datos: Dict, directorio: str) -> "TrabajoReporte":
+        """Trabajo de otro worker, leído de su <id>.json."""
+        trabajo = cls.__new__(cls)
+        trabajo.id = datos["id_trabajo"]
+        trabajo.tipo = datos["tipo"]
+        trabajo.parametros = datos["parametros"]
+        trabajo.ruta = os.path.join(directorio, f"{trabajo.id}.xlsx")
+        trabajo.estado = datos["estado"]
+        trabajo.progreso = datos["progreso"]
+        trabajo.error = datos["error"]
+        trabajo.filename = datos["filename"]
+        trabajo.tamano = datos["tamano_bytes"]
+        trabajo.solicitudes = datos["solicitudes"]
+        trabajo.creado = datos["creado"]
+        trabajo.terminado = datos["terminado"]
+        trabajo.expira = datos["expira"]
+        return trabajo
+
+    def a_dict(self) -> Dict:
+        return {
+            "id_trabajo": self.id,
+            "tipo": self.tipo,
+            "parametros": self.parametros,
+            "estado": self.estado,
+            "progreso": self.progreso,
+            "error": self.error,
+            "filename": self.filename,
+            "tamano_bytes": self.tamano,
+            "solicitudes": self.solicitudes,
+            "creado": self.creado,
+            "terminado": self.terminado,
+            "expira": self.expira,
+        }
+
+
+class ColaReportes:
+    """Trabajos en memoria + pool de procesos + limpieza de archivos vencidos."""
+
+    def __init__(self, directorio: str = REPORTES_DIR, procesos: int = PROCESOS):
+        self.directorio = directorio
+        self.procesos = procesos
+        self.trabajos: Dict[str, TrabajoReporte] = {}
+        # (tipo, parámetros) -> id del trabajo en curso
+        self._en_curso: Dict[Tuple, str] = {}
+        self._tareas: Dict[str, asyncio.Task] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._semaforo: Optional[asyncio.Semaphore] = None
+        self._tarea_limpieza: Optional[asyncio.Task] = None
+        self.metricas = {"creados": 0, "reutilizados": 0, "listos": 0, "errores": 0, "expirados": 0}
+
+    # ===============================
+    # 📌 CICLO DE VIDA
+    # ===============================
+    async def iniciar(self):
+        os.makedirs(self.directorio, exist_ok=True)
+        borrados = self._borrar_huerfanos()
+        if borrados:
+            logger.info(f"🧹 {borrados} archivo(s) de reportes anteriores borrados")
+        self._semaforo = asyncio.Semaphore(self.procesos)
+        self._tarea_limpieza = asyncio.create_task(self._limpiar_periodicamente())
+        logger.info(f"📄 Cola de reportes activa ({self.procesos} proceso(s), TTL {TTL_MIN} min)")
+
+    async def detener(self):
+        if self._tarea_limpieza:
+            self._tarea_limpieza.cancel()
+            try:
+                await self._tarea_limpieza
+            except asyncio.CancelledError:
+                pass
+            self._tarea_limpieza = None
+        for tarea in list(self._tareas.values()):
+            tarea.cancel()
+        if self._tareas:
+            await asyncio.gather(*self._tareas.values(), return_exceptions=True)
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: los procesos no heredan el event loop ni el pool de MySQL
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    # ===============================
+    # 📌 TRABAJOS
+    # ===============================
+    def encolar(self, tipo: str, parametros: Dict, consultar: Consulta, escritor: str) -> TrabajoReporte:
+        """
+        Registra un reporte. consultar(avance) hace las consultas y regresa
+        (datos, filename); escritor es "modulo:funcion" de utils/hojas_reportes.py.
+        """
+        clave = (tipo, tuple(sorted(parametros.items())))
+        id_existente = self._en_curso.get(clave)
+        if id_existente and id_existente in self.trabajos:
+            trabajo = self.trabajos[id_existente]
+            trabajo.solicitudes += 1
+            self.metricas["reutilizados"] += 1
+            return trabajo
+
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.procesos)
+        trabajo = TrabajoReporte(tipo, parametros, self.directorio)
+        self.trabajos[trabajo.id] = trabajo
+        self._guardar_metadatos(trabajo)
+        self._en_curso[clave] = trabajo.id
+        self._tareas[trabajo.id] = asyncio.create_task(self._ejecutar(trabajo, clave, consultar, escritor))
+        self.metricas["creados"] += 1
+        return trabajo
+
+    def obtener(self, id_trabajo: str) -> Optional[TrabajoReporte]:
+        """Trabajo de este proceso o, si no, el que otro worker dejó en REPORTES_DIR."""
+        trabajo = self.trabajos.get(id_trabajo) or self._leer_metadatos(id_trabajo)
+        if trabajo and trabajo.estado == GENERANDO:
+            trabajo.progreso = PESO_CONSULTA + int((99 - PESO_CONSULTA) * self._leer_avance(trabajo) / 100)
+        return trabajo
+
+    async def _ejecutar(self, trabajo: TrabajoReporte, clave: Tuple, consultar: Consulta, escritor: str):
+        inicio = time.perf_counter()
+
+        def avance_consulta(fraccion: float):
+            progreso = int(PESO_CONSULTA * fraccion)
+            if progreso != trabajo.progreso:
+                trabajo.progreso = progreso
+                self._guardar_metadatos(trabajo)
+
+        try:
+            async with self._semaforo:
+                trabajo.estado = CONSULTANDO
+                self._guardar_metadatos(trabajo)
+                datos, trabajo.filename = await consultar(avance_consulta)
+
+                trabajo.estado = GENERANDO
+                trabajo.progreso = PESO_CONSULTA
+                self._guardar_metadatos(trabajo)
+                os.makedirs(self.directorio, exist_ok=True)
+                loop = asyncio.get_running_loop()
+                trabajo.tamano = await loop.run_in_executor(
+                    self._obtener_pool(), _generar_en_proceso, escritor, datos, trabajo.ruta
+                )
+
+            trabajo.estado = LISTO
+            trabajo.progreso = 100
+            self.metricas["listos"] += 1
+            logger.info(f"📄 Reporte {trabajo.tipo} listo ({trabajo.id}, {trabajo.tamano} bytes)")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # Un proceso murió (p. ej. por memoria): se crea otro pool en el siguiente trabajo
+                self._pool = None
+            trabajo.estado = ERROR
+            trabajo.error = str(getattr(e, "detail", None) or e)
+            self.metricas["errores"] += 1
+            logger.error(f"❌ Error generando reporte {trabajo.tipo} ({trabajo.id}): {e}", exc_info=True)
+        finally:
+            if self._en_curso.get(clave) == trabajo.id:
+                del self._en_curso[clave]
+            self._tareas.pop(trabajo.id, None)
+            self._borrar(trabajo.ruta + EXTENSION_AVANCE)
+            self._borrar(trabajo.ruta + EXTENSION_PARCIAL)
+            trabajo.terminado = time.time()
+            trabajo.expira = trabajo.terminado + TTL_MIN * 60
+            self._guardar_metadatos(trabajo)
+            metricas_app.observar_reporte(f"{trabajo.tipo}_trabajo", time.perf_counter() - inicio)
+
+    def _guardar_metadatos(self, trabajo: TrabajoReporte):
+        """Escribe <id>.json con otro nombre y lo renombra: nunca se lee a medias."""
+        try:
+            with open(trabajo.ruta_metadatos + EXTENSION_PARCIAL, "w", encoding="utf-8") as f:
+                json.dump(trabajo.a_dict(), f, ensure_ascii=False, default=str)
+            os.replace(trabajo.ruta_metadatos + EXTENSION_PARCIAL, trabajo.ruta_metadatos)
+        except OSError as e:
+            logger.error(f"❌ No se pudo guardar el estado del reporte {trabajo.id}: {e}")
+
+    def _leer_metadatos(self, id_trabajo: str) -> Optional[TrabajoReporte]:
+        if not ID_TRABAJO.match(id_trabajo):
+            return None
+        try:
+            with open(os.path.join(self.directorio, id_trabajo + EXTENSION_METADATOS), encoding="utf-8") as f:
+                trabajo = TrabajoReporte.desde_dict(json.load(f), self.directorio)
+        except (OSError, ValueError, KeyError):
+            return None
+        if trabajo.expira is not None and trabajo.expira <= time.time():
+            return None
+        return trabajo
+
+    def _leer_avance(self, trabajo: TrabajoReporte) -> int:
+        try:
+            with open(trabajo.ruta + EXTENSION_AVANCE) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    # ===============================
+    # 📌 LIMPIEZA
+    # ===============================
+    async def _limpiar_periodicamente(self):
+        while True:
+            await asyncio.sleep(INTERVALO_LIMPIEZA)
+            try:
+                self.limpiar()
+                self._borrar_huerfanos()
+            except Exception as e:
+                logger.error(f"❌ Error limpiando reportes: {e}")
+
+    def limpiar(self) -> int:
+        """Quita los trabajos terminados cuyo TTL ya venció (y sus archivos)."""
+        ahora = time.time()
+        vencidos = [t for t in self.trabajos.values() if t.expira is not None and t.expira <= ahora]
+        for trabajo in vencidos:
+            self._borrar(trabajo.ruta)
+            self._borrar(trabajo.ruta_metadatos)
+            del self.trabajos[trabajo.id]
+        self.metricas["expirados"] += len(vencidos)
+        return len(vencidos)
+
+    def _borrar_huerfanos(self) -> int:
+        """
+        Borra archivos de la cola sin trabajo en este proceso (ejecución
+        anterior, otro worker) que ya pasaron el TTL sin modificarse.
+        """
+        propios = set(self.trabajos)
+        limite = time.time() - TTL_MIN * 60
+        borrados = 0
+        for nombre in os.listdir(self.directorio):
+            if not ARCHIVO_TRABAJO.match(nombre) or nombre.split(".", 1)[0] in propios:
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+                    borrados += 1
+            except OSError:
+                pass
+        return borrados
+
+    @staticmethod
+    def _borrar(ruta: str):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+    def obtener_metricas(self) -> Dict:
+        por_estado: Dict[str, int] = {}
+        for trabajo in self.trabajos.values():
+            por_estado[trabajo.estado] = por_estado.get(trabajo.estado, 0) + 1
+        return {"procesos": self.procesos, "ttl_min": TTL_MIN, "por_estado": por_estado, **self.metricas}
+
+
+# Instancia global
+cola_reportes = ColaReportes()
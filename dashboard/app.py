@@ -355,6 +355,11 @@ if st.session_state.get("login_exitoso"):
             const actividades = datosIniciales.actividades;
             const estudiantesMap = new Map();
             datosIniciales.estudiantes.forEach(est => estudiantesMap.set(est.id_estudiante, est));
+            // Versión de la tabla que tenemos; el servidor la sube con cada cambio.
+            // Solo se compara dentro de la misma época (arranque/worker del servidor)
+            let versionActual = datosIniciales.version || 0;
+            let epocaActual = datosIniciales.epoca || null;
+            let esperandoTabla = false;
             
             document.getElementById('nombre-materia').textContent = claseInfo.materia;
             document.getElementById('nombre-grupo').textContent = claseInfo.grupo;
@@ -428,29 +433,31 @@ if st.session_state.get("login_exitoso"):
             
             renderizarTabla();
             
-            let ws = new WebSocket('wss://control-actividades.onrender.com/ws/tabla/{id_clase}');
-            console.log("📡 Intentando conectar WebSocket...");
             const wsStatus = document.getElementById('ws-status');
+            let ws;
             
-            ws.onopen = () => {{
-                console.log("✅ WebSocket conectado correctamente al servidor");
-                wsStatus.textContent = '🟢 Conectado';
-                wsStatus.classList.remove('disconnected');
-            }};
+            function conectarWebSocket() {{
+                // Al reconectar se manda la última versión que tenemos: el servidor
+                // solo reenvía los cambios perdidos (o la tabla completa si ya no los tiene)
+                const since = epocaActual ? `?since=${{epocaActual}}:${{versionActual}}` : '';
+                ws = new WebSocket(`wss://control-actividades.onrender.com/ws/tabla/{id_clase}${{since}}`);
+                console.log("📡 Intentando conectar WebSocket...");
             
-            ws.onmessage = (event) => {{
-                console.log("📩 Mensaje recibido del servidor:", event.data);
-                try {{
-                    const mensaje = JSON.parse(event.data);
-                    console.log("🧩 Tipo de mensaje:", mensaje.tipo, "→", mensaje.data);
-                    
+                ws.onopen = () => {{
+                    console.log("✅ WebSocket conectado correctamente al servidor");
+                    wsStatus.textContent = '🟢 Conectado';
+                    wsStatus.classList.remove('disconnected');
+                }};
+            
+                // Aplica un cambio al estado local; regresa qué hay que re-renderizar
+                function aplicarCambio(mensaje) {{
                     if (mensaje.tipo === 'asistencia') {{
                         const est = estudiantesMap.get(mensaje.data.id_estudiante);
                         if (est) {{
                             est.asistencia = mensaje.data.estado;
-                            est.hora_entrada = mensaje.data.hora || '';
+                            if ('hora' in mensaje.data) est.hora_entrada = mensaje.data.hora || '';
                             console.log(`✅ Actualizando fila de ${{est.nombre_completo}} → ${{est.asistencia}}`);
-                            renderizarTabla();
+                            return 'tabla';
                         }}
                     }}
                     else if (mensaje.tipo === 'entrega_actualizada') {{
@@ -459,7 +466,7 @@ if st.session_state.get("login_exitoso"):
                             if (!est.actividades) est.actividades = {{}};
                             est.actividades[String(mensaje.data.id_actividad)] = mensaje.data.estado;
                             console.log(`📘 Actividad ${{mensaje.data.id_actividad}} actualizada para ${{est.nombre_completo}} → ${{mensaje.data.estado}}`);
-                            renderizarTabla();
+                            return 'tabla';
                         }}
                     }}
                             // También manejar entregas duplicadas (aunque no cambie nada)
@@ -469,38 +476,104 @@ if st.session_state.get("login_exitoso"):
                     }}
                     else if (mensaje.tipo === 'nueva_actividad') {{
                         console.log("🆕 Nueva actividad detectada:", mensaje.data);
-                        
+                    
                         actividades.push({{
                             id: mensaje.data.id,
                             nombre: mensaje.data.nombre,
                             tipo: mensaje.data.tipo
                         }});
-                        
+                    
                         estudiantesMap.forEach((est) => {{
                             if (!est.actividades) est.actividades = {{}};
                             est.actividades[String(mensaje.data.id)] = 'pendiente';
                         }});
-                        
-                        renderizarTablaCompleta();
-                        
+                    
                         console.log(`✅ Nueva columna agregada: "${{mensaje.data.nombre}}" (ID: ${{mensaje.data.id}})`);
+                        return 'completa';
                     }}
-                }} catch(e) {{
-                    console.error("❌ Error procesando mensaje WebSocket:", e);
+                    return null;
                 }}
-            }};
             
-            ws.onerror = (e) => {{
-                console.error("❌ Error en WebSocket:", e);
-                wsStatus.textContent = '🔴 Error';
-                wsStatus.classList.add('disconnected');
-            }};
+                ws.onmessage = (event) => {{
+                    console.log("📩 Mensaje recibido del servidor:", event.data);
+                    if (event.data === 'pong') return;
+                    try {{
+                        const mensaje = JSON.parse(event.data);
+                        console.log("🧩 Tipo de mensaje:", mensaje.tipo, "→", mensaje.data);
+                    
+                        // Tabla completa (al conectar o tras pedirla): reemplaza el estado local
+                        if (mensaje.tipo === 'datos_iniciales') {{
+                            actividades.length = 0;
+                            mensaje.actividades.forEach(a => actividades.push(a));
+                            estudiantesMap.clear();
+                            mensaje.estudiantes.forEach(est => estudiantesMap.set(est.id_estudiante, est));
+                            versionActual = mensaje.version || 0;
+                            epocaActual = mensaje.epoca || null;
+                            esperandoTabla = false;
+                            renderizarTablaCompleta();
+                            return;
+                        }}
+                    
+                        if (mensaje.version !== undefined) {{
+                            // Otra época: las versiones no se pueden comparar, pedir la tabla
+                            if (mensaje.epoca !== epocaActual) {{
+                                if (!esperandoTabla) {{
+                                    console.warn(`⚠️ Época ${{epocaActual}} → ${{mensaje.epoca}}, pidiendo tabla completa`);
+                                    esperandoTabla = true;
+                                    ws.send('snapshot');
+                                }}
+                                return;
+                            }}
+                            // Ya incluido en la tabla que tenemos
+                            if (mensaje.version <= versionActual) return;
+                            // Hueco de versiones: se perdió algo, pedir la tabla otra vez
+                            if (esperandoTabla) return;
+                            if (mensaje.version_base > versionActual) {{
+                                console.warn(`⚠️ Versión ${{versionActual}} → ${{mensaje.version_base}}, pidiendo tabla completa`);
+                                esperandoTabla = true;
+                                ws.send('snapshot');
+                                return;
+                            }}
+                            versionActual = mensaje.version;
+                        }}
+                    
+                        // Un lote trae varios cambios: se aplican todos y se renderiza una vez
+                        const cambios = mensaje.tipo === 'lote' ? mensaje.cambios : [mensaje];
+                        let render = null;
+                        cambios.forEach(c => {{
+                            const r = aplicarCambio(c);
+                            if (r === 'completa' || (r && !render)) render = r;
+                        }});
+                    
+                        if (render === 'completa') renderizarTablaCompleta();
+                        else if (render === 'tabla') renderizarTabla();
+                    }} catch(e) {{
+                        console.error("❌ Error procesando mensaje WebSocket:", e);
+                    }}
+                }};
             
-            ws.onclose = (e) => {{
-                console.warn("🔌 WebSocket cerrado:", e);
-                wsStatus.textContent = '🔴 Desconectado';
-                wsStatus.classList.add('disconnected');
-            }};
+                ws.onerror = (e) => {{
+                    console.error("❌ Error en WebSocket:", e);
+                    wsStatus.textContent = '🔴 Error';
+                    wsStatus.classList.add('disconnected');
+                }};
+            
+                ws.onclose = (e) => {{
+                    console.warn("🔌 WebSocket cerrado:", e);
+                    wsStatus.textContent = '🔴 Desconectado';
+                    wsStatus.classList.add('disconnected');
+                    esperandoTabla = false;
+                    console.log("⏰ Reconectando en 3 segundos...");
+                    setTimeout(conectarWebSocket, 3000);
+                }};
+            }}
+            
+            conectarWebSocket();
+            
+            // Señal de vida (por si el servidor corre con WS_TIMEOUT_INACTIVO > 0)
+            setInterval(() => {{
+                if (ws && ws.readyState === WebSocket.OPEN) ws.send('ping');
+            }}, 30000);
         </script>
     </body>
     </html>
@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import base64
+import time
 from datetime import datetime, date
 from pathlib import Path
 
@@ -204,6 +205,65 @@ def descargar_excel(url: str, params: dict = None):
     except Exception as e:
         st.error(f"❌ Error inesperado: {str(e)}")
 
+def descargar_excel_trabajo(url_trabajo: str, params: dict = None, espera_max: int = 900):
+    """
+    Reportes pesados: el servidor los genera en segundo plano. Se encola el
+    trabajo, se consulta su progreso y al terminar se descarga el archivo.
+    """
+    try:
+        response = requests.post(url_trabajo, params=params, timeout=15)
+        if response.status_code != 200:
+            error_msg = response.json().get("detail", response.text) if response.text else "Error desconocido"
+            st.error(f"❌ Error del servidor: {error_msg}")
+            return
+        trabajo = response.json()
+        
+        barra = st.progress(0, text="⏳ Reporte en cola...")
+        etiquetas = {
+            "en_cola": "⏳ Reporte en cola...",
+            "consultando": "🔎 Consultando datos...",
+            "generando": "📝 Generando Excel...",
+        }
+        inicio = time.time()
+        while trabajo["estado"] not in ("listo", "error"):
+            if time.time() - inicio > espera_max:
+                st.error("❌ El reporte tardó demasiado. Intenta de nuevo en unos minutos.")
+                return
+            time.sleep(1)
+            response = requests.get(f"{API_BASE}/trabajos/{trabajo['id_trabajo']}", timeout=15)
+            if response.status_code != 200:
+                st.error("❌ Se perdió el trabajo del reporte. Intenta de nuevo.")
+                return
+            trabajo = response.json()
+            barra.progress(trabajo["progreso"], text=etiquetas.get(trabajo["estado"], "⏳ Procesando..."))
+        
+        if trabajo["estado"] == "error":
+            barra.empty()
+            st.error(f"❌ Error del servidor: {trabajo['error']}")
+            return
+        
+        barra.progress(100, text="✅ Reporte listo")
+        response = requests.get(f"{API_BASE}/trabajos/{trabajo['id_trabajo']}/archivo", timeout=60)
+        if response.status_code != 200:
+            st.error("❌ No se pudo descargar el reporte. Intenta de nuevo.")
+            return
+        
+        st.success("✅ Reporte generado correctamente")
+        st.download_button(
+            label="⬇️ Descargar Excel",
+            data=response.content,
+            file_name=trabajo.get("filename") or "reporte.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            key=f"download_{datetime.now().timestamp()}",
+            use_container_width=True
+        )
+    except requests.exceptions.ConnectionError:
+        st.error("❌ No se pudo conectar con el servidor. Verifica que FastAPI esté corriendo en localhost:8000")
+    except requests.exceptions.Timeout:
+        st.error("❌ El servidor no respondió a tiempo. Intenta de nuevo.")
+    except Exception as e:
+        st.error(f"❌ Error inesperado: {str(e)}")
+
 # ---------- SECCIÓN DE REPORTES ----------
 st.subheader("📋 Generar Reportes")
 
@@ -407,7 +467,8 @@ with tabs[4]:
                     "fechaInicio": fecha_inicio.strftime("%Y-%m-%d"),
                     "fechaFin": fecha_fin.strftime("%Y-%m-%d")
                 }
-                descargar_excel(f"{API_BASE}/excel/profesor/{id_profesor}", params)
+                # Todas las clases del profesor: se genera en segundo plano
+                descargar_excel_trabajo(f"{API_BASE}/trabajos/profesor/{id_profesor}", params)
     else:
         st.warning("⚠️ No se pudieron cargar los profesores. Verifica la conexión con el servidor.")
     
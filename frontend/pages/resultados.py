@@ -662,10 +662,13 @@ function connectWebSocket() {{
         }};
         
         ws.onmessage = function(event) {{
+            if (event.data === 'pong') return;
             try {{
                 const data = JSON.parse(event.data);
                 console.log('📩 Mensaje recibido:', data);
-                updateSlideData(data);
+                // Si el servidor juntó varios cambios llegan en un solo lote
+                const cambios = data.tipo === 'lote' ? data.cambios : [data];
+                cambios.forEach(updateSlideData);
             }} catch (error) {{
                 console.error('❌ Error parseando mensaje:', error);
             }}
@@ -689,6 +692,11 @@ function connectWebSocket() {{
     }}
 }}
 
+// Señal de vida (por si el servidor corre con WS_TIMEOUT_INACTIVO > 0)
+setInterval(() => {{
+    if (ws && ws.readyState === WebSocket.OPEN) ws.send('ping');
+}}, 30000);
+
 function updateSlideData(data) {{
     const idClase = data.id_clase;
     const estado = data.estado;
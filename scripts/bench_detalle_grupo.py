@@ -0,0 +1,297 @@
+"""
+Benchmark de /api/estadisticas/detalle-grupo: ocho consultas contra una
+sola (utils/estadisticas_grupo.py).
+
+Sin BD (por defecto) arma un resumen diario sintético de un grupo y
+simula el servidor: cada consulta recorre las filas del grupo en Python
+y cada viaje a la BD cuesta --rtt-ms. Con --mysql corre las consultas
+reales contra la BD del .env (un grupo existente con --grupo). En ambos
+modos revisa que la respuesta sea la misma.
+
+Uso (desde la raíz del repo):
+    python scripts/bench_detalle_grupo.py
+    python scripts/bench_detalle_grupo.py --alumnos 45 --materias 9 --dias 120 --rtt-ms 5
+    python scripts/bench_detalle_grupo.py --mysql --grupo 3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from utils.estadisticas_grupo import CONSULTA_DETALLE_GRUPO, derivar_detalle  # noqa: E402
+
+TOTAL = "(r.presentes + r.ausentes + r.justificantes)"
+ACTIVO = "e.estado_actual = 'activo' AND e.eliminado = 0"
+
+
+def _top(columna, alias):
+    return f"""
+        SELECT CONCAT(e.nombre, ' ', e.apellido) AS nombre, CAST(SUM(r.{columna}) AS UNSIGNED) AS {alias}
+        FROM resumen_asistencia_alumno r JOIN estudiante e ON r.id_estudiante = e.id_estudiante
+        WHERE r.id_grupo = %s AND {ACTIVO}
+        GROUP BY e.id_estudiante, e.nombre, e.apellido HAVING {alias} > 0 ORDER BY {alias} DESC LIMIT 5
+    """
+
+
+# Las ocho consultas anteriores: (clave, sql, cuántas veces va id_grupo, fetch_one)
+CONSULTAS_ANTERIORES = [
+    ("topFaltas", _top("ausentes", "faltas"), 1, False),
+    ("topAsistencias", _top("presentes", "asistencias"), 1, False),
+    ("topJustificantes", _top("justificantes", "justificantes"), 1, False),
+    ("ranking", f"""
+        SELECT e.id_estudiante AS id, CONCAT(e.nombre, ' ', e.apellido) AS nombre,
+               SUM(r.presentes) AS asistencias, SUM(r.ausentes) AS faltas, SUM(r.justificantes) AS justificantes,
+               ROUND(SUM(r.presentes)/SUM({TOTAL})*100,1) AS asistencia_porcentaje,
+               ROUND(SUM(r.ausentes)/SUM({TOTAL})*100,1) AS faltas_porcentaje,
+               ROUND(SUM(r.justificantes)/SUM({TOTAL})*100,1) AS justificantes_porcentaje
+        FROM resumen_asistencia_alumno r JOIN estudiante e ON r.id_estudiante = e.id_estudiante
+        WHERE r.id_grupo = %s AND {ACTIVO}
+        GROUP BY e.id_estudiante, e.nombre, e.apellido HAVING SUM({TOTAL}) > 0 ORDER BY asistencia_porcentaje DESC
+    """, 1, False),
+    ("materiaMasFaltada", """
+        SELECT m.nombre, CAST(SUM(r.ausentes) AS UNSIGNED) AS total
+        FROM resumen_asistencia_clase r JOIN materia m ON r.id_materia = m.id_materia
+        WHERE r.id_grupo = %s GROUP BY m.id_materia, m.nombre HAVING total > 0 ORDER BY total DESC LIMIT 2
+    """, 1, False),
+    ("materiaMasAsistida", """
+        SELECT m.nombre
+        FROM resumen_asistencia_clase r JOIN materia m ON r.id_materia = m.id_materia
+        WHERE r.id_grupo = %s GROUP BY m.id_materia, m.nombre
+        HAVING SUM(r.presentes) > 0 ORDER BY SUM(r.presentes) DESC LIMIT 1
+    """, 1, False),
+    ("asistenciaPerfecta", f"""
+        SELECT CONCAT(e.nombre, ' ', e.apellido) AS nombre FROM estudiante e
+        WHERE e.id_grupo = %s AND {ACTIVO} AND NOT EXISTS (
+            SELECT 1 FROM resumen_asistencia_alumno r
+            WHERE r.id_estudiante = e.id_estudiante AND r.id_grupo = %s AND r.ausentes > 0
+        )
+    """, 2, False),
+    ("promedios", f"""
+        SELECT ROUND(SUM(r.presentes)/SUM({TOTAL})*100,1) AS asistencia,
+               ROUND(SUM(r.ausentes)/SUM({TOTAL})*100,1) AS faltas,
+               ROUND(SUM(r.justificantes)/SUM({TOTAL})*100,1) AS justificantes
+        FROM resumen_asistencia_alumno r JOIN estudiante e ON r.id_estudiante = e.id_estudiante
+        WHERE r.id_grupo = %s AND {ACTIVO}
+    """, 1, True),
+]
+
+
+def armar_respuesta(resultados):
+    """Respuesta del endpoint anterior con los resultados de las ocho consultas."""
+    return {
+        "topFaltas": resultados["topFaltas"],
+        "topAsistencias": resultados["topAsistencias"],
+        "topJustificantes": resultados["topJustificantes"],
+        "ranking": resultados["ranking"],
+        "materiaMasFaltada": [r["nombre"] for r in resultados["materiaMasFaltada"]],
+        "materiaMasAsistida": resultados["materiaMasAsistida"][0]["nombre"] if resultados["materiaMasAsistida"] else None,
+        "asistenciaPerfecta": [r["nombre"] for r in resultados["asistenciaPerfecta"]],
+        "promedios": resultados["promedios"] or {"asistencia": 0, "faltas": 0, "justificantes": 0},
+    }
+
+
+def normalizar(respuesta):
+    """Como la serializa FastAPI (Decimal -> número)."""
+    return json.loads(json.dumps(respuesta, default=float))
+
+
+# ===============================
+# 📌 SERVIDOR SIMULADO
+# ===============================
+def resumen_sintetico(alumnos: int, materias: int, dias: int):
+    random.seed(11)
+    inicio = date(2025, 8, 4)
+    lista = [{"id": i, "nombre": f"Alumno {i:03d}"} for i in range(1, alumnos + 1)]
+    nombres_materia = {m: f"Materia {m}" for m in range(1, materias + 1)}
+    por_alumno, por_materia = [], []
+    for d in range(dias):
+        fecha = inicio + timedelta(days=d)
+        dia_materias = random.sample(sorted(nombres_materia), min(materias, 5))
+        conteo_dia = defaultdict(lambda: [0, 0, 0])
+        for m in dia_materias:
+            conteo_clase = [0, 0, 0]
+            for a in lista:
+                estado = random.choices((0, 1, 2), weights=(90, 7, 3))[0]
+                conteo_clase[estado] += 1
+                conteo_dia[a["id"]][estado] += 1
+            por_materia.append((fecha, m, *conteo_clase))
+        por_alumno.extend((fecha, id_alumno, *c) for id_alumno, c in conteo_dia.items())
+    # Un alumno nuevo sin registros (cuenta en asistencia perfecta)
+    lista.append({"id": alumnos + 1, "nombre": "Alumno nuevo"})
+    return lista, nombres_materia, por_alumno, por_materia
+
+
+def _pct(parte, total):
+    """ROUND(parte/total*100, 1) de MySQL con DECIMAL."""
+    if not total:
+        return None
+    cociente = (Decimal(parte) / Decimal(total)).quantize(Decimal("0.0001"), ROUND_HALF_UP)
+    return (cociente * 100).quantize(Decimal("0.1"), ROUND_HALF_UP)
+
+
+class ServidorSimulado:
+    """Contesta las consultas del benchmark recorriendo el resumen como lo haría MySQL."""
+
+    def __init__(self, datos, rtt: float):
+        self.lista, self.materias, self.por_alumno, self.por_materia = datos
+        self.nombre = {a["id"]: a["nombre"] for a in self.lista}
+        self.rtt = rtt
+        self.viajes = 0
+
+    def _sumas_alumno(self):
+        sumas = {}
+        for _fecha, id_alumno, p, a, j in self.por_alumno:
+            s = sumas.setdefault(id_alumno, [0, 0, 0])
+            s[0] += p
+            s[1] += a
+            s[2] += j
+        return sumas
+
+    def _sumas_materia(self):
+        sumas = {}
+        for _fecha, id_materia, p, a, j in self.por_materia:
+            s = sumas.setdefault(id_materia, [0, 0, 0])
+            s[0] += p
+            s[1] += a
+            s[2] += j
+        return sumas
+
+    def _ejecutar(self, clave):
+        if clave in ("topFaltas", "topAsistencias", "topJustificantes"):
+            columna, alias = {"topFaltas": (1, "faltas"), "topAsistencias": (0, "asistencias"),
+                              "topJustificantes": (2, "justificantes")}[clave]
+            filas = [(self.nombre[i], s[columna]) for i, s in self._sumas_alumno().items() if s[columna] > 0]
+            filas.sort(key=lambda f: -f[1])
+            return [{"nombre": n, alias: v} for n, v in filas[:5]]
+        if clave == "ranking":
+            filas = [
+                {"id": i, "nombre": self.nombre[i], "asistencias": Decimal(p), "faltas": Decimal(a),
+                 "justificantes": Decimal(j), "asistencia_porcentaje": _pct(p, p + a + j),
+                 "faltas_porcentaje": _pct(a, p + a + j), "justificantes_porcentaje": _pct(j, p + a + j)}
+                for i, (p, a, j) in self._sumas_alumno().items() if p + a + j > 0
+            ]
+            return sorted(filas, key=lambda f: -f["asistencia_porcentaje"])
+        if clave in ("materiaMasFaltada", "materiaMasAsistida"):
+            columna, limite = (1, 2) if clave == "materiaMasFaltada" else (0, 1)
+            filas = [(self.materias[m], s[columna]) for m, s in self._sumas_materia().items() if s[columna] > 0]
+            filas.sort(key=lambda f: -f[1])
+            return [{"nombre": n} for n, _ in filas[:limite]]
+        if clave == "asistenciaPerfecta":
+            con_faltas = {i for _f, i, _p, a, _j in self.por_alumno if a > 0}
+            return [{"nombre": a["nombre"]} for a in self.lista if a["id"] not in con_faltas]
+        if clave == "promedios":
+            p, a, j = (sum(fila[k] for fila in self.por_alumno) for k in (2, 3, 4))
+            return {"asistencia": _pct(p, p + a + j), "faltas": _pct(a, p + a + j), "justificantes": _pct(j, p + a + j)}
+        if clave == "detalle":
+            filas = [{"tipo": "alumno", "id": i, "nombre": self.nombre[i], "presentes": Decimal(p),
+                      "ausentes": Decimal(a), "justificantes": Decimal(j)}
+                     for i, (p, a, j) in self._sumas_alumno().items()]
+            filas += [{"tipo": "materia", "id": m, "nombre": self.materias[m], "presentes": Decimal(p),
+                       "ausentes": Decimal(a), "justificantes": Decimal(j)}
+                      for m, (p, a, j) in self._sumas_materia().items()]
+            filas += [{"tipo": "lista", "id": a["id"], "nombre": a["nombre"], "presentes": Decimal(0),
+                       "ausentes": Decimal(0), "justificantes": Decimal(0)} for a in self.lista]
+            return filas
+        raise ValueError(clave)
+
+    async def consultar(self, clave):
+        self.viajes += 1
+        await asyncio.sleep(self.rtt)
+        return self._ejecutar(clave)
+
+
+async def anterior_simulado(servidor: ServidorSimulado):
+    resultados = {}
+    for clave, *_ in CONSULTAS_ANTERIORES:
+        resultados[clave] = await servidor.consultar(clave)
+    return armar_respuesta(resultados)
+
+
+async def nuevo_simulado(servidor: ServidorSimulado):
+    return derivar_detalle(await servidor.consultar("detalle"))
+
+
+# ===============================
+# 📌 MYSQL
+# ===============================
+async def anterior_mysql(id_grupo: int):
+    from config.db import fetch_all, fetch_one
+    resultados = {}
+    for clave, sql, veces, uno in CONSULTAS_ANTERIORES:
+        resultados[clave] = await (fetch_one if uno else fetch_all)(sql, (id_grupo,) * veces)
+    return armar_respuesta(resultados)
+
+
+async def nuevo_mysql(id_grupo: int):
+    from config.db import fetch_all
+    return derivar_detalle(await fetch_all(CONSULTA_DETALLE_GRUPO, (id_grupo,) * 3))
+
+
+async def medir(funcion, argumento, repeticiones: int):
+    mejor = float("inf")
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = await funcion(argumento)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+def comparar(t_anterior, r_anterior, t_nuevo, r_nuevo):
+    # El orden de los empates no está definido en SQL: se comparan ya ordenados
+    def sin_empates(respuesta):
+        respuesta = normalizar(respuesta)
+        for clave in ("topFaltas", "topAsistencias", "topJustificantes", "ranking"):
+            respuesta[clave] = sorted(respuesta[clave], key=lambda f: json.dumps(f, sort_keys=True))
+        respuesta["asistenciaPerfecta"] = sorted(respuesta["asistenciaPerfecta"])
+        return respuesta
+
+    if sin_empates(r_anterior) != sin_empates(r_nuevo):
+        print("❌ Las respuestas no coinciden")
+        sys.exit(1)
+    print(f"   anterior (8 consultas): {t_anterior * 1000:8.1f} ms")
+    print(f"   una consulta:           {t_nuevo * 1000:8.1f} ms")
+    print(f"✅ Misma respuesta, {t_anterior / t_nuevo:.1f}x más rápido")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alumnos", type=int, default=40)
+    parser.add_argument("--materias", type=int, default=8)
+    parser.add_argument("--dias", type=int, default=100)
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="costo de cada viaje a la BD simulada")
+    parser.add_argument("--repeticiones", type=int, default=5, help="se toma la mejor")
+    parser.add_argument("--mysql", action="store_true", help="usar la BD del .env en vez de la simulada")
+    parser.add_argument("--grupo", type=int, default=1, help="id_grupo para --mysql")
+    args = parser.parse_args()
+
+    if args.mysql:
+        from config.db import close_db_pool, init_db_pool
+        await init_db_pool()
+        try:
+            print(f"📊 MySQL, grupo {args.grupo}")
+            t_anterior, r_anterior = await medir(anterior_mysql, args.grupo, args.repeticiones)
+            t_nuevo, r_nuevo = await medir(nuevo_mysql, args.grupo, args.repeticiones)
+        finally:
+            await close_db_pool()
+    else:
+        servidor = ServidorSimulado(resumen_sintetico(args.alumnos, args.materias, args.dias), args.rtt_ms / 1000)
+        print(f"📊 Simulado: {args.alumnos} alumnos × {args.materias} materias × {args.dias} días, "
+              f"{len(servidor.por_alumno) + len(servidor.por_materia)} filas de resumen, RTT {args.rtt_ms:g} ms")
+        t_anterior, r_anterior = await medir(anterior_simulado, servidor, args.repeticiones)
+        t_nuevo, r_nuevo = await medir(nuevo_simulado, servidor, args.repeticiones)
+
+    comparar(t_anterior, r_anterior, t_nuevo, r_nuevo)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""
+Benchmark del pivote alumnos × fechas del reporte de curso completo de
+un profesor, con un semestre sintético.
+
+Compara la búsqueda anterior (next(...) sobre todas las asistencias por
+cada alumno y cada fecha) contra utils/pivote_asistencias.py.
+
+Uso (desde la raíz del repo):
+    python scripts/bench_pivote_asistencias.py
+    python scripts/bench_pivote_asistencias.py --clases 6 --alumnos 40 --fechas 90
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from utils.pivote_asistencias import formato_fecha, pivotar_asistencias  # noqa: E402
+
+ESTADOS = ("presente", "ausente", "justificante")
+
+
+def semestre_sintetico(clases: int, alumnos: int, fechas: int):
+    """Por clase: (estudiantes, asistencias) como las regresa la BD."""
+    random.seed(7)
+    inicio = date(2025, 8, 4)
+    dias = [inicio + timedelta(days=i) for i in range(fechas)]
+    hojas = []
+    for c in range(clases):
+        estudiantes = [{"id_estudiante": c * 1000 + i} for i in range(alumnos)]
+        asistencias = [
+            {"id_estudiante": e["id_estudiante"], "fecha": d, "estado": random.choice(ESTADOS)}
+            for d in dias
+            for e in estudiantes
+            if random.random() < 0.95  # algunos días sin registro
+        ]
+        hojas.append((estudiantes, asistencias))
+    return hojas
+
+
+def pivote_anterior(estudiantes, asistencias):
+    fechas = sorted(list({formato_fecha(a['fecha']) for a in asistencias}))
+    filas = []
+    for est in estudiantes:
+        row = []
+        for f in fechas:
+            a = next((x for x in asistencias if x['id_estudiante'] == est['id_estudiante'] and formato_fecha(x['fecha']) == f), None)
+            row.append(a['estado'] if a else "—")
+        filas.append(row)
+    return fechas, filas
+
+
+def pivote_nuevo(estudiantes, asistencias):
+    matriz = pivotar_asistencias(asistencias)
+    filas = [
+        ["—" if estado is None else estado for estado in matriz.fila(est['id_estudiante'])]
+        for est in estudiantes
+    ]
+    return matriz.fechas, filas
+
+
+def medir(funcion, hojas, repeticiones: int):
+    mejor = float("inf")
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = [funcion(estudiantes, asistencias) for estudiantes, asistencias in hojas]
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clases", type=int, default=6)
+    parser.add_argument("--alumnos", type=int, default=40)
+    parser.add_argument("--fechas", type=int, default=90)
+    parser.add_argument("--repeticiones", type=int, default=3, help="repeticiones del pivote nuevo (se toma la mejor)")
+    args = parser.parse_args()
+
+    hojas = semestre_sintetico(args.clases, args.alumnos, args.fechas)
+    filas = sum(len(a) for _, a in hojas)
+    print(f"📊 {args.clases} clase(s) × {args.alumnos} alumnos × {args.fechas} fechas = {filas} asistencias")
+
+    t_anterior, r_anterior = medir(pivote_anterior, hojas, 1)
+    t_nuevo, r_nuevo = medir(pivote_nuevo, hojas, args.repeticiones)
+
+    if r_anterior != r_nuevo:
+        print("❌ Los resultados no coinciden")
+        sys.exit(1)
+
+    print(f"   anterior (next por celda): {t_anterior * 1000:10.1f} ms")
+    print(f"   pivote en una pasada:      {t_nuevo * 1000:10.1f} ms")
+    print(f"✅ Mismo resultado, {t_anterior / t_nuevo:.0f}x más rápido")
+
+
+if __name__ == "__main__":
+    main()
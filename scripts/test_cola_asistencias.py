@@ -0,0 +1,166 @@
+"""
+Prueba de la cola write-behind (backend/utils/cola_asistencias.py):
+escaneo → cambio manual → flush. El cambio manual tiene que encontrar la
+fila del escaneo y el flush no lo debe pisar con el escaneo más viejo.
+
+Sin BD (por defecto) la tabla asistencia es un dict en memoria. Con
+--mysql corre contra la BD del .env con un alumno y una clase existentes
+(--estudiante, --clase); al final deja la fila de hoy como estaba.
+
+Uso (desde la raíz del repo):
+    python scripts/test_cola_asistencias.py
+    python scripts/test_cola_asistencias.py --mysql --estudiante 12 --clase 3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import utils.cola_asistencias as modulo_cola  # noqa: E402
+from utils.cola_asistencias import ColaAsistencias  # noqa: E402
+
+
+class TablaEnMemoria:
+    """Lo mínimo de la tabla asistencia que usan la cola y el cambio manual."""
+
+    def __init__(self):
+        self.filas = {}
+
+    # Pool/conexión/cursor de aiomysql, solo para el upsert de la cola
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    @asynccontextmanager
+    async def cursor(self):
+        yield self
+
+    async def execute(self, _sql, params):
+        for i in range(0, len(params), 5):
+            id_estudiante, id_clase, hora, estado, fecha = params[i:i + 5]
+            self.filas[(id_estudiante, id_clase, str(fecha))] = {"estado": estado, "hora_entrada": hora}
+
+    async def commit(self):
+        pass
+
+    async def leer(self, id_estudiante, id_clase, fecha):
+        return self.filas.get((id_estudiante, id_clase, str(fecha)))
+
+    async def cambiar(self, id_estudiante, id_clase, fecha, estado):
+        self.filas[(id_estudiante, id_clase, str(fecha))]["estado"] = estado
+
+    async def restaurar(self):
+        pass
+
+
+class TablaMySQL:
+    def __init__(self, id_estudiante, id_clase, fecha):
+        from config.db import execute_query, fetch_one
+        self.execute_query, self.fetch_one = execute_query, fetch_one
+        self.llave = (id_estudiante, id_clase, fecha)
+        self.antes = None
+
+    async def preparar(self):
+        self.antes = await self.leer(*self.llave)
+
+    async def leer(self, id_estudiante, id_clase, fecha):
+        return await self.fetch_one(
+            "SELECT estado, hora_entrada FROM asistencia WHERE id_estudiante = %s AND id_clase = %s AND fecha = %s",
+            (id_estudiante, id_clase, fecha),
+        )
+
+    async def cambiar(self, id_estudiante, id_clase, fecha, estado):
+        await self.execute_query(
+            "UPDATE asistencia SET estado = %s WHERE id_estudiante = %s AND id_clase = %s AND fecha = %s",
+            (estado, id_estudiante, id_clase, fecha),
+        )
+
+    async def restaurar(self):
+        if self.antes is None:
+            await self.execute_query(
+                "DELETE FROM asistencia WHERE id_estudiante = %s AND id_clase = %s AND fecha = %s", self.llave
+            )
+        else:
+            await self.execute_query(
+                "UPDATE asistencia SET estado = %s, hora_entrada = %s WHERE id_estudiante = %s AND id_clase = %s AND fecha = %s",
+                (self.antes["estado"], self.antes["hora_entrada"], *self.llave),
+            )
+
+
+async def probar(tabla, id_estudiante: int, id_clase: int, fecha: date) -> bool:
+    ok = True
+    with tempfile.TemporaryDirectory() as carpeta:
+        journal = os.path.join(carpeta, "cola.jsonl")
+        cola = ColaAsistencias(journal, os.path.join(carpeta, "descartadas.jsonl"))
+        await cola.iniciar()
+
+        # 1. Escaneo: queda en la cola, todavía no en la tabla
+        cola.encolar(id_estudiante, id_clase, "presente", str(fecha), "07:20:00")
+        await cola.sincronizar()
+
+        # 2. Cambio manual, como /asistencias/actualizar-estado
+        await cola.adelantar(id_estudiante, id_clase, fecha)
+        fila = await tabla.leer(id_estudiante, id_clase, fecha)
+        if fila is None:
+            print("❌ El cambio manual no encontró la fila del escaneo")
+            ok = False
+        else:
+            await tabla.cambiar(id_estudiante, id_clase, fecha, "justificante")
+
+        # 3. Flush
+        await cola.detener()
+        fila = await tabla.leer(id_estudiante, id_clase, fecha)
+        estado = fila["estado"] if fila else None
+        if estado != "justificante":
+            print(f"❌ Después del flush el estado es {estado!r}, se esperaba 'justificante'")
+            ok = False
+
+        # 4. Al reiniciar no se vuelve a escribir el escaneo
+        cola = ColaAsistencias(journal, os.path.join(carpeta, "descartadas.jsonl"))
+        await cola.iniciar()
+        if cola.pendientes:
+            print(f"❌ El journal reprodujo {len(cola.pendientes)} escaneo(s) ya escritos")
+            ok = False
+        await cola.detener()
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mysql", action="store_true", help="usar la BD del .env")
+    parser.add_argument("--estudiante", type=int, default=1)
+    parser.add_argument("--clase", type=int, default=1)
+    args = parser.parse_args()
+
+    fecha = date.today()
+    if args.mysql:
+        from config.db import close_db_pool, init_db_pool
+        await init_db_pool()
+        tabla = TablaMySQL(args.estudiante, args.clase, fecha)
+        await tabla.preparar()
+    else:
+        tabla = TablaEnMemoria()
+
+        async def pool_en_memoria():
+            return tabla
+        modulo_cola.get_pool = pool_en_memoria
+
+    try:
+        ok = await probar(tabla, args.estudiante, args.clase, fecha)
+    finally:
+        await tabla.restaurar()
+        if args.mysql:
+            await close_db_pool()
+
+    print("✅ escaneo → cambio manual → flush: el cambio manual se conserva" if ok else "❌ Falló")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,17 +1,39 @@
+import os
+import threading
+
 import websocket
 
+# Si el servidor corre con WS_TIMEOUT_INACTIVO > 0 cierra los sockets que
+# no mandan nada en ese tiempo; los pings de protocolo no cuentan, hay que
+# mandar el texto "ping" (el servidor contesta "pong")
+INTERVALO_PING = float(os.getenv("WS_INTERVALO_PING", "30"))
+
+def mandar_pings(ws, detener):
+    while not detener.wait(INTERVALO_PING):
+        try:
+            ws.send("ping")
+        except websocket.WebSocketConnectionClosedException:
+            return
+
 def on_open(ws):
     print("Conectado al WebSocket!")
     # envía un mensaje de prueba al servidor
     ws.send("Hola servidor!")
+    threading.Thread(target=mandar_pings, args=(ws, ws.detener_pings), daemon=True).start()
 
 def on_message(ws, msg):
     print("Mensaje recibido:", msg)
 
+def on_close(ws, codigo, motivo):
+    ws.detener_pings.set()
+    print("Conexión cerrada:", codigo, motivo)
+
 ws = websocket.WebSocketApp(
     "ws://127.0.0.1:8000/api/clases/ws/attendances",
     on_open=on_open,
-    on_message=on_message
+    on_message=on_message,
+    on_close=on_close
 )
+ws.detener_pings = threading.Event()
 
-ws.run_forever()
\ No newline at end of file
+ws.run_forever()